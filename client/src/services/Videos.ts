@@ -168,6 +168,7 @@ export const IRecordedProgramDefault: IRecordedProgram = {
 export interface IRecordedPrograms {
     total: number;
     recorded_programs: IRecordedProgram[];
+    next_cursor?: string | null;
 }
 
 /** 過去ログコメントを表すインターフェース */
@@ -195,9 +196,10 @@ class Videos {
      * @param order ソート順序 ('desc' or 'asc' or 'ids')
      * @param page ページ番号
      * @param ids 録画番組の ID のリスト
+     * @param cursor 前のページの next_cursor (指定時は page の代わりにカーソルの続きから取得する)
      * @returns 録画番組一覧情報 or 録画番組一覧情報の取得に失敗した場合は null
      */
-    static async fetchVideos(order: 'desc' | 'asc' | 'ids' = 'desc', page: number = 1, ids: number[] | null = null): Promise<IRecordedPrograms | null> {
+    static async fetchVideos(order: 'desc' | 'asc' | 'ids' = 'desc', page: number = 1, ids: number[] | null = null, cursor: string | null = null): Promise<IRecordedPrograms | null> {
 
         // API リクエストを実行
         const response = await APIClient.get<IRecordedPrograms>('/videos', {
@@ -205,6 +207,7 @@ class Videos {
                 order,
                 page,
                 ids,
+                cursor,
             },
             // 録画番組の ID のリストを FastAPI が受け付ける &ids=1&ids=2&ids=3&... の形式にエンコードする
             // ref: https://github.com/axios/axios/issues/5058#issuecomment-1272107602
@@ -1041,7 +1041,9 @@ class PlayerController {
                 if (this.player === null) return;
                 const api_quality = PlayerUtils.extractVideoAPIQualityFromDPlayer(this.player);
                 const session_id = PlayerUtils.extractSessionIdFromDPlayer(this.player);
-                await APIClient.put(`${Utils.api_base_url}/streams/video/${player_store.recorded_program.id}/${api_quality}/keep-alive?session_id=${session_id}`);
+                // 現在の再生位置も送信し、サーバー側で再生位置から先のセグメントを先読みしてエンコードさせる
+                const current_time = this.player.video.currentTime;
+                await APIClient.put(`${Utils.api_base_url}/streams/video/${player_store.recorded_program.id}/${api_quality}/keep-alive?session_id=${session_id}&current_time=${current_time}`);
             }, 5 * 1000);
         }
 
@@ -11,7 +11,7 @@ import Utils, { PlayerUtils } from '@/utils';
 /** ライブストリームステータス API から受信するイベントのインターフェイス */
 interface ILiveStreamStatusEvent {
     // 現在のライブストリームのステータス
-    status: 'Offline' | 'Standby' | 'ONAir' | 'Idling' | 'Restart';
+    status: 'Offline' | 'Standby' | 'ONAir' | 'Idling' | 'Restart' | 'Warm';
     // 現在のライブストリームのステータス詳細
     detail: string;
     // ライブストリームの開始時刻 (UNIX タイムスタンプ)
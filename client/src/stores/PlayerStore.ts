@@ -150,7 +150,7 @@ const usePlayerStore = defineStore('player', {
 
         // ライブ視聴: 現在のライブストリームのステータス
         // 既定で null (未視聴) とする
-        live_stream_status: null as 'Offline' | 'Standby' | 'ONAir' | 'Idling' | 'Restart' | null,
+        live_stream_status: null as 'Offline' | 'Standby' | 'ONAir' | 'Idling' | 'Restart' | 'Warm' | null,
 
         // ライブ視聴: ニコニコ実況への接続に失敗した際のエラーメッセージ
         // null のとき、エラーは発生していないとみなす
@@ -41,8 +41,13 @@ from app.routers import (
     VideoStreamsRouter,
 )
 from app.streams.LiveStream import LiveStream
+from app.streams.LiveTunerPrewarmer import LiveTunerPrewarmer
+from app.utils.ChannelLogoCache import ChannelLogoCache
+from app.utils.edcb import NotifyUpdate
+from app.utils.edcb.EDCBNotifyWatcher import EDCBNotifyWatcher
 from app.utils.edcb.EDCBTuner import EDCBTuner
 from app.utils.FastAPITaskUtil import repeat_every
+from app.utils.HTTPClientPool import HTTPClientPool
 
 
 # もし Config() の実行時に AssertionError が発生した場合は、LoadConfig() を実行してサーバー設定データをロードする
@@ -219,6 +224,13 @@ recorded_scan_task: RecordedScanTask | None = None
 async def Startup():
     global recorded_scan_task
 
+    # EDCB の更新通知の監視を開始する (EDCB バックエンドのみ)
+    ## 予約一覧などの応答のキャッシュは、更新通知を監視できている間だけ有効になる
+    ## EDCB は EPG の取得時に局ロゴを保存するため、EPG データの更新通知を受け取ったら局ロゴのインデックスも取得し直す
+    if CONFIG.general.backend == 'EDCB':
+        EDCBNotifyWatcher.addListener(NotifyUpdate.EPGDATA, ChannelLogoCache.invalidateEDCBLogoIndex)
+        EDCBNotifyWatcher.start()
+
     # チャンネル情報を更新
     await Channel.update()
 
@@ -259,6 +271,12 @@ async def UpdateChannelAndProgram():
 async def UpdateChannelJikkyoStatus():
     await Channel.updateJikkyoStatus()
 
+# 1分に1回、事前起動ポリシーに従ってチューナーを Warm 状態で事前に起動する (または解放する)
+@app.on_event('startup')
+@repeat_every(seconds=1 * 60, logger=logging.logger)
+async def UpdateWarmLiveStreams():
+    await LiveTunerPrewarmer.update()
+
 # サーバーの終了時に実行する
 cleanup = False
 @app.on_event('shutdown')
@@ -277,6 +295,7 @@ async def Shutdown():
     # 全てのチューナーインスタンスを終了する (EDCB バックエンドのみ)
     if CONFIG.general.backend == 'EDCB':
         await EDCBTuner.closeAll()
+        await EDCBNotifyWatcher.stop()
 
     # 録画フォルダ監視タスクを停止
     global recorded_scan_task
@@ -284,6 +303,9 @@ async def Shutdown():
         await recorded_scan_task.stop()
         recorded_scan_task = None
 
+    # 上流サーバーごとに使い回している HTTP クライアントを閉じる
+    await HTTPClientPool.closeAll()
+
 # shutdown イベントが発火しない場合も想定し、アプリケーションの終了時に Shutdown() が確実に呼ばれるように
 # atexit は同期関数しか実行できないので、asyncio.run() でくるむ
 atexit.register(asyncio.run, Shutdown())
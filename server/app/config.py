@@ -22,6 +22,7 @@ from pydantic import (
     ValidationError,
     ValidationInfo,
     confloat,
+    conint,
     field_validator,
 )
 from pydantic_core import Url
@@ -30,6 +31,7 @@ from app.constants import (
     API_REQUEST_HEADERS,
     BASE_DIR,
     LIBRARY_PATH,
+    QUALITY_TYPES,
 )
 from app.utils.TSInformation import TerrestrialRegion
 
@@ -335,11 +337,16 @@ class _ServerSettingsServer(BaseModel):
 class _ServerSettingsTV(BaseModel):
     preferred_terrestrial_region: TerrestrialRegion | None = None
     max_alive_time: PositiveInt = 10
+    multi_rendition_qualities: list[QUALITY_TYPES] = []
+    prewarm_channels: list[str] = []
+    prewarm_channel_count: Annotated[int, conint(ge=0)] = 0
+    prewarm_hours: list[Annotated[int, conint(ge=0, le=23)]] = []
     debug_mode_ts_path: FilePath | None = None
 
 class _ServerSettingsVideo(BaseModel):
     recorded_folders: list[DirectoryPath] = []
     exclude_scan_paths: list[str] = []
+    segment_cache_max_size: Annotated[float, confloat(ge=0.0)] = 10.0
 
 class _ServerSettingsCapture(BaseModel):
     upload_folders: list[DirectoryPath] = []
@@ -8,7 +8,6 @@ from pathlib import Path
 from typing import Any, Literal
 from zoneinfo import ZoneInfo
 
-import httpx
 from cryptography.fernet import Fernet
 from passlib.context import CryptContext
 from pydantic import BaseModel, PositiveInt
@@ -33,6 +32,12 @@ DATA_DIR = BASE_DIR / 'data'
 ACCOUNT_ICON_DIR = DATA_DIR / 'account-icons'
 ## サムネイル画像があるディレクトリ
 THUMBNAILS_DIR = DATA_DIR / 'thumbnails'
+## EDCB / Mirakurun から取得した局ロゴのキャッシュがあるディレクトリ
+LOGO_CACHE_DIR = DATA_DIR / 'logo-cache'
+## エンコード済みの HLS セグメントのキャッシュがあるディレクトリ
+VIDEO_SEGMENT_CACHE_DIR = DATA_DIR / 'video-segments'
+## 録画フォルダの一括スキャン時に、変更のない録画ファイルを高速に判定するための stat インデックスのパス
+RECORDED_SCAN_STAT_INDEX_PATH = DATA_DIR / 'recorded_scan_stat_index.json'
 ## サーバー終了時に再起動が必要なことを伝えるロックファイルのパス
 RESTART_REQUIRED_LOCK_PATH = DATA_DIR / 'restart_required.lock'
 
@@ -400,14 +405,3 @@ PASSWORD_CONTEXT = CryptContext(
 API_REQUEST_HEADERS: dict[str, str] = {
     'User-Agent': f'KonomiTV/{VERSION}',
 }
-
-# KonomiTV で利用する httpx.AsyncClient の設定
-## httpx.AsyncClient 自体は一度使ったら再利用できないので、httpx.AsyncClient を返す関数にしている
-HTTPX_CLIENT = lambda: httpx.AsyncClient(
-    # KonomiTV の User-Agent を指定
-    headers = API_REQUEST_HEADERS,
-    # リダイレクトを追跡する
-    follow_redirects = True,
-    # 3 秒応答がない場合はタイムアウトする
-    timeout = 3.0,
-)
@@ -0,0 +1,599 @@
+
+# Type Hints を指定できるように
+# ref: https://stackoverflow.com/a/33533514/17124142
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Coroutine, Iterator
+from typing import Any, ClassVar
+
+import anyio
+import av
+import numpy as np
+from biim.mpeg2ts import ts
+from numpy.typing import NDArray
+
+from app import logging, schemas
+from app.config import Config, LoadConfig
+from app.metadata.CMSectionsDetector import CMSectionsDetector
+from app.metadata.KeyFrameAnalyzer import KeyFrameAnalyzer
+from app.metadata.ThumbnailGenerator import ThumbnailGenerator
+from app.utils.TSKeyFrameIndexer import TSKeyFrameIndexer
+
+
+class TSReadPassConsumer(ABC):
+    """
+    BackgroundAnalysisPipeline が録画ファイルを先頭から1回読み込む間に、読み込んだデータを順に受け取って解析するコンシューマーの抽象基底クラス
+    """
+
+    # 処理時間のログに表示するステージ名
+    name: ClassVar[str] = 'consumer'
+
+
+    @abstractmethod
+    def feed(self, data: bytes, data_offset: int) -> None:
+        """
+        録画ファイルから読み込んだデータを受け取って解析する
+
+        Args:
+            data (bytes): TS パケット境界に揃ったデータ
+            data_offset (int): data の先頭のファイル内の位置
+        """
+
+
+    @abstractmethod
+    def finish(self) -> None:
+        """
+        録画ファイルを末尾まで読み込んだ後に呼び出され、解析を完了させる
+        """
+
+
+class KeyFrameIndexConsumer(TSReadPassConsumer):
+    """
+    TSKeyFrameIndexer でキーフレームの位置と DTS を取得するコンシューマー
+    TSKeyFrameIndexer が PAT / PMT から取得した映像ストリームの PID とコーデックは、他のコンシューマーからも参照される
+    """
+
+    name: ClassVar[str] = 'keyframe_index'
+
+
+    def __init__(self, file_path: str) -> None:
+        """
+        キーフレームの位置と DTS を取得するコンシューマーを初期化する
+
+        Args:
+            file_path (str): 解析対象の MPEG-TS 形式の録画ファイルのパス
+        """
+
+        self.indexer = TSKeyFrameIndexer(file_path)
+        self.key_frames: list[schemas.KeyFrame] = []
+
+
+    def feed(self, data: bytes, data_offset: int) -> None:
+        self.key_frames.extend(self.indexer.feed(data, data_offset))
+
+
+    def finish(self) -> None:
+        self.key_frames.extend(self.indexer.finish())
+
+
+class IntraFrameDecodeConsumer(TSReadPassConsumer):
+    """
+    シークバー用サムネイルの各タイルの位置 (候補オフセット) に最初に現れる I フレームだけをデコードするコンシューマー
+    映像 PES の DTS で候補オフセットに達したかを判定し、達してから I フレームが得られるまでの間の映像データだけをデコーダーに渡す
+    PyAV で候補オフセットごとにシークする方式と異なり、録画ファイルを読み直さずに済む
+    """
+
+    name: ClassVar[str] = 'intra_frame_decode'
+
+
+    def __init__(self, key_frame_indexer: TSKeyFrameIndexer, candidate_offsets: list[float]) -> None:
+        """
+        候補オフセットの I フレームをデコードするコンシューマーを初期化する
+
+        Args:
+            key_frame_indexer (TSKeyFrameIndexer): 映像ストリームの PID とコーデックを参照する TSKeyFrameIndexer
+            candidate_offsets (list[float]): 各候補フレームの抽出開始位置 (秒) のリスト
+        """
+
+        self.key_frame_indexer = key_frame_indexer
+
+        # 候補オフセットを 90kHz 単位に変換したもの
+        self._target_ticks = [round(offset * 90000) for offset in candidate_offsets]
+
+        # 候補オフセットごとにデコードしたフレーム (SCORING_SCALE の BGR 配列、まだデコードできていない場合は None)
+        self._frames: list[NDArray[np.uint8] | None] = [None] * len(candidate_offsets)
+
+        # 次にデコードする候補オフセットのインデックス
+        self._next_target_index = 0
+
+        # 最初の映像 PES の DTS と、最後に見つかった映像 PES の先頭からの経過時間 (90kHz)
+        self._first_timestamp: int | None = None
+        self._last_elapsed_ticks = 0
+
+        # デコード中のデコーダー (候補オフセットに達してから I フレームが得られるまでの間のみ存在する)
+        self._decoder: av.CodecContext | None = None
+
+
+    def feed(self, data: bytes, data_offset: int) -> None:
+
+        # 映像ストリームの PID がまだ判明していないか、すべての候補オフセットのフレームをデコードし終えた
+        video_pid = self.key_frame_indexer.video_pid
+        if video_pid is None or self._next_target_index >= len(self._target_ticks):
+            return
+
+        # 映像ストリームの TS パケットと、そのうち PES の先頭を含む TS パケットの位置を一括で算出する
+        packet_count = len(data) // ts.PACKET_SIZE
+        packets = np.frombuffer(data, dtype=np.uint8, count=packet_count * ts.PACKET_SIZE).reshape(packet_count, ts.PACKET_SIZE)
+        pids = ((packets[:, 1].astype(np.uint16) & 0x1F) << 8) | packets[:, 2]
+        video_packet_indexes = np.flatnonzero(pids == video_pid)
+        if len(video_packet_indexes) == 0:
+            return
+        pes_start_positions = np.flatnonzero((packets[video_packet_indexes, 1] & 0x40) != 0)
+
+        # デコード中であれば、前のブロックから続く PES の残りをデコーダーに渡す
+        continuation_end = int(pes_start_positions[0]) if len(pes_start_positions) > 0 else len(video_packet_indexes)
+        if self._decoder is not None:
+            self.__decodePacketRange(data, video_packet_indexes, 0, continuation_end)
+
+        for position_index, start_position in enumerate(pes_start_positions):
+            if self._next_target_index >= len(self._target_ticks):
+                return
+            start_position = int(start_position)
+            next_start_position = int(pes_start_positions[position_index + 1]) \
+                if position_index + 1 < len(pes_start_positions) else len(video_packet_indexes)
+
+            # PES ヘッダーの DTS から、次の候補オフセットに達していればデコードを開始する
+            elapsed_ticks = self.__getElapsedTicks(data, int(video_packet_indexes[start_position]) * ts.PACKET_SIZE)
+            if elapsed_ticks is not None:
+                self._last_elapsed_ticks = elapsed_ticks
+                if self._decoder is None and elapsed_ticks >= self._target_ticks[self._next_target_index]:
+                    video_codec = self.key_frame_indexer.video_codec
+                    assert video_codec is not None
+                    self._decoder = av.CodecContext.create(TSKeyFrameIndexer.DECODER_NAMES[video_codec], 'r')
+                    # I フレームのみデコードする設定（FFmpeg の -skip_frame nointra 相当）
+                    self._decoder.skip_frame = 'NONINTRA'
+
+            if self._decoder is not None:
+                self.__decodePacketRange(data, video_packet_indexes, start_position, next_start_position)
+
+
+    def finish(self) -> None:
+
+        # デコーダー内に残っているフレームを取り出す
+        if self._decoder is not None:
+            try:
+                for packet in self._decoder.parse(None):
+                    self.__decodePacket(packet)
+                    if self._decoder is None:
+                        break
+                if self._decoder is not None:
+                    self.__decodePacket(None)
+            except av.FFmpegError:
+                pass
+            self._decoder = None
+
+
+    def getFrames(self) -> list[NDArray[np.uint8]]:
+        """
+        候補オフセットごとにデコードしたフレームを取得する
+        デコードできなかったフレームは黒画像で代替する
+
+        Returns:
+            list[NDArray[np.uint8]]: 全フレームの BGR 配列リスト (SCORING_SCALE)
+        """
+
+        scoring_width, scoring_height = ThumbnailGenerator.SCORING_SCALE
+        return [
+            frame if frame is not None else np.zeros((scoring_height, scoring_width, 3), dtype=np.uint8)
+            for frame in self._frames
+        ]
+
+
+    def getMissingFrameCount(self) -> int:
+        """
+        デコードできなかった候補オフセットの数を取得する
+
+        Returns:
+            int: デコードできなかった候補オフセットの数
+        """
+
+        return sum(1 for frame in self._frames if frame is None)
+
+
+    def __getElapsedTicks(self, data: bytes, packet_offset: int) -> int | None:
+        """
+        映像 PES の先頭を含む TS パケットから DTS (なければ PTS) を取得し、最初の映像 PES からの経過時間に変換する
+
+        Args:
+            data (bytes): TS パケットを含むデータ
+            packet_offset (int): data 内の TS パケットの位置
+
+        Returns:
+            int | None: 最初の映像 PES からの経過時間 (90kHz) (PES ヘッダーからタイムスタンプを取得できなかった場合は None)
+        """
+
+        payload_start, payload_end, _ = TSKeyFrameIndexer.getPayloadRange(data, packet_offset)
+        if payload_end - payload_start < 9 or data[payload_start:payload_start + 3] != b'\x00\x00\x01':
+            return None
+        if payload_start + 9 + data[payload_start + 8] > payload_end:
+            return None
+        pts_dts_flags = (data[payload_start + 7] & 0xC0) >> 6
+        if pts_dts_flags == 0b11:
+            timestamp = TSKeyFrameIndexer.parseTimestamp(data, payload_start + 14)
+        elif pts_dts_flags == 0b10:
+            timestamp = TSKeyFrameIndexer.parseTimestamp(data, payload_start + 9)
+        else:
+            return None
+
+        # 33bit ラップアラウンドしても経過時間が単調増加となるよう、最初の映像 PES の DTS との差を 33bit の範囲で求める
+        if self._first_timestamp is None:
+            self._first_timestamp = timestamp
+        return (timestamp - self._first_timestamp) % ts.PCR_CYCLE
+
+
+    def __decodePacketRange(self, data: bytes, video_packet_indexes: NDArray[np.intp], begin: int, end: int) -> None:
+        """
+        映像ストリームの TS パケットのペイロードから PES ヘッダーを取り除き、映像データとしてデコーダーに渡す
+
+        Args:
+            data (bytes): TS パケットを含むデータ
+            video_packet_indexes (NDArray[np.intp]): data 内の映像ストリームの TS パケットのインデックス
+            begin (int): デコーダーに渡す最初の video_packet_indexes 上の位置
+            end (int): デコーダーに渡す最後の video_packet_indexes 上の位置 (この位置は含まない)
+        """
+
+        chunks: list[bytes] = []
+        for packet_index in video_packet_indexes[begin:end]:
+            es_range = TSKeyFrameIndexer.getElementaryStreamRange(data, int(packet_index) * ts.PACKET_SIZE)
+            if es_range is not None:
+                chunks.append(data[es_range[0]:es_range[1]])
+
+        assert self._decoder is not None
+        try:
+            for packet in self._decoder.parse(b''.join(chunks)):
+                self.__decodePacket(packet)
+                if self._decoder is None:
+                    return
+        except av.FFmpegError as ex:
+            # 壊れた映像データが含まれていた場合は、次の PES からデコードを続ける
+            logging.debug(f'{self.key_frame_indexer.file_path}: Failed to decode video data. ({ex})')
+
+
+    def __decodePacket(self, packet: av.Packet | None) -> None:
+        """
+        デコーダーに映像データを渡し、I フレームが得られたら次の候補オフセットのフレームとして保存する
+
+        Args:
+            packet (av.Packet | None): デコーダーに渡すパケット (None の場合はデコーダー内に残っているフレームを取り出す)
+        """
+
+        assert self._decoder is not None
+        for frame in self._decoder.decode(packet):
+            if not isinstance(frame, av.VideoFrame):
+                continue
+            self._frames[self._next_target_index] = ThumbnailGenerator.convertToScoringImage(frame)
+            self._next_target_index += 1
+
+            # 候補オフセットの間隔が GOP より短く次の候補オフセットも既に過ぎている場合は、続けて次の I フレームをデコードする
+            ## そうでなければデコーダーを破棄し、次の候補オフセットに達するまで映像データを読み飛ばす
+            if self._next_target_index >= len(self._target_ticks) or \
+               self._target_ticks[self._next_target_index] > self._last_elapsed_ticks:
+                self._decoder = None
+                return
+
+
+class BackgroundAnalysisPipeline:
+    """
+    録画ファイルのバックグラウンド解析 (キーフレーム解析・CM 区間検出・サムネイル生成) をまとめて実行するクラス
+    MPEG-TS 形式の録画ファイルは先頭から1回だけシーケンシャルに読み込み、読み込んだデータをキーフレーム解析 (PAT / PMT の取得を含む) と
+    サムネイル用の I フレームのデコードの各コンシューマーに分配する
+    各解析が別々に録画ファイルを読み込むと、同じファイルを何度も読み直す上に HDD のシークが頻発してスループットが大きく落ちるため
+    """
+
+    # 1回に読み取るサイズ (バイト)
+    ## TS パケット 40000 個分 (7.52MB)
+    READ_SIZE: ClassVar[int] = ts.PACKET_SIZE * 40000
+
+    # 解析中に先読みしておくブロックの最大数
+    ## 解析の間も読み込みスレッドでディスクからの読み込みを進め、ディスクを遊ばせないようにする
+    READ_AHEAD_BLOCKS: ClassVar[int] = 4
+
+
+    def __init__(
+        self,
+        recorded_program: schemas.RecordedProgram,
+        analyze_key_frames: bool = True,
+        detect_cm_sections: bool = True,
+        generate_thumbnails: bool = True,
+    ) -> None:
+        """
+        録画ファイルのバックグラウンド解析をまとめて実行するクラスを初期化する
+
+        Args:
+            recorded_program (schemas.RecordedProgram): 解析対象の録画番組情報
+            analyze_key_frames (bool): キーフレーム解析を行うかどうか
+            detect_cm_sections (bool): CM 区間検出を行うかどうか
+            generate_thumbnails (bool): サムネイル生成を行うかどうか
+        """
+
+        self.recorded_program = recorded_program
+        self.file_path = anyio.Path(recorded_program.recorded_video.file_path)
+        self.analyze_key_frames = analyze_key_frames
+        self.detect_cm_sections = detect_cm_sections
+        self.generate_thumbnails = generate_thumbnails
+
+
+    async def runAndSave(self) -> None:
+        """
+        録画ファイルのバックグラウンド解析を実行し、結果をデータベースに保存する
+        MPEG-TS 形式の録画ファイルのキーフレーム解析では録画ファイル全体を読み込む必要があるため、サムネイル生成もその読み込みに相乗りさせる
+        それ以外の場合は、従来通り各解析を個別に実行する
+        """
+
+        recorded_video = self.recorded_program.recorded_video
+        tasks: list[Coroutine[Any, Any, None]] = []
+
+        # CM 区間検出は録画ファイル自体は読み込まないため、並行して実行する
+        if self.detect_cm_sections is True:
+            tasks.append(CMSectionsDetector(self.file_path, recorded_video.duration).detectAndSave())
+
+        if recorded_video.container_format == 'MPEG-TS' and self.analyze_key_frames is True:
+            tasks.append(self.__analyzeInSinglePass())
+        else:
+            if self.analyze_key_frames is True:
+                tasks.append(KeyFrameAnalyzer(self.file_path, recorded_video.container_format).analyzeAndSave())
+            if self.generate_thumbnails is True:
+                tasks.append(ThumbnailGenerator.fromRecordedProgram(self.recorded_program).generateAndSave())
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+    async def __analyzeInSinglePass(self) -> None:
+        """
+        MPEG-TS 形式の録画ファイルを1回だけ読み込み、キーフレーム解析とサムネイル生成を同時に行って結果を保存する
+        """
+
+        start_time = time.time()
+        logging.info(f'{self.file_path}: Analyzing keyframes and thumbnails in a single read pass...')
+
+        try:
+            thumbnail_generator = ThumbnailGenerator.fromRecordedProgram(self.recorded_program) if self.generate_thumbnails is True else None
+
+            # 録画ファイルの読み込み・解析・フレームのデコード・サムネイルの保存はすべて CPU-bound のため、サブプロセス内で完結させる
+            ## 親プロセスへのフレーム配列転送を避け、メモリ使用量とコピーコストを抑制する
+            loop = asyncio.get_running_loop()
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                key_frames, is_thumbnail_generated, stage_times = await loop.run_in_executor(
+                    executor,
+                    self._runReadPass,
+                    thumbnail_generator,
+                )
+
+            # キーフレーム情報を DB に保存
+            if key_frames is not None:
+                await KeyFrameAnalyzer(self.file_path, 'MPEG-TS').saveKeyFrames(key_frames)
+
+            # サムネイル情報を DB に保存
+            if thumbnail_generator is not None:
+                if is_thumbnail_generated is True:
+                    await thumbnail_generator.saveThumbnailInfoToDB()
+                # 1回の読み込みの間にフレームをデコードできなかった場合は、保存済みのキーフレーム情報を使って録画ファイルから生成し直す
+                elif is_thumbnail_generated is None:
+                    logging.warning(f'{self.file_path}: Falling back to generating thumbnails from the recorded file.')
+                    await thumbnail_generator.generateAndSave()
+                else:
+                    logging.error(f'{self.file_path}: Failed to generate thumbnails in subprocess.')
+
+            stage_times_text = ' / '.join(f'{name}: {seconds:.2f} sec' for name, seconds in stage_times.items())
+            logging.info(
+                f'{self.file_path}: Single-pass analysis completed. '
+                f'({len(key_frames) if key_frames is not None else 0} keyframes found / {stage_times_text} / '
+                f'Total: {time.time() - start_time:.2f} sec)'
+            )
+
+        except Exception as ex:
+            logging.error(f'{self.file_path}: Error in single-pass analysis:', exc_info=ex)
+
+
+    def _runReadPass(
+        self,
+        thumbnail_generator: ThumbnailGenerator | None,
+    ) -> tuple[list[schemas.KeyFrame] | None, bool | None, dict[str, float]]:
+        """
+        サブプロセス内で録画ファイルを先頭から1回だけ読み込み、各コンシューマーに分配してキーフレーム解析とサムネイル生成を行う
+        ProcessPoolExecutor で実行されるエントリーポイントなので、あえて prefix のアンダースコアは1つとしている
+        (別プロセスで実行されるため、__ を付けるとマングリングにより正常に実行できない)
+
+        Args:
+            thumbnail_generator (ThumbnailGenerator | None): サムネイルを生成する場合は ThumbnailGenerator
+
+        Returns:
+            tuple[list[schemas.KeyFrame] | None, bool | None, dict[str, float]]:
+                - キーフレーム情報 (解析に失敗した場合は None)
+                - サムネイルを生成・保存できたかどうか (フレームのデコード中にエラーが発生し、サムネイルを生成しなかった場合は None)
+                - ステージごとの処理時間 (秒)
+        """
+
+        # もし Config() の実行時に AssertionError が発生した場合は、LoadConfig() を実行してサーバー設定データをロードする
+        ## ProcessPoolExecutor で実行した場合、自動リロードモード時にグローバル変数が引き継がれないことがあるため
+        try:
+            Config()
+        except AssertionError:
+            LoadConfig(bypass_validation=True)
+
+        # コンシューマーを登録する
+        ## IntraFrameDecodeConsumer は KeyFrameIndexConsumer が PMT から取得した映像ストリームの PID を参照するため、必ず後に登録する
+        key_frame_consumer = KeyFrameIndexConsumer(str(self.file_path))
+        consumers: list[TSReadPassConsumer] = [key_frame_consumer]
+        candidate_offsets: list[float] = []
+        intra_frame_consumer: IntraFrameDecodeConsumer | None = None
+        if thumbnail_generator is not None:
+            candidate_offsets = thumbnail_generator.calculateCandidateOffsets()
+            intra_frame_consumer = IntraFrameDecodeConsumer(key_frame_consumer.indexer, candidate_offsets)
+            consumers.append(intra_frame_consumer)
+
+        # 録画ファイルを先頭から読み込み、TS パケット境界に揃えたデータを各コンシューマーに順に渡す
+        ## read には、解析がディスクからの読み込みを待っていた時間が入る
+        stage_times: dict[str, float] = {'read': 0.0}
+        for consumer in consumers:
+            stage_times[consumer.name] = 0.0
+
+        def RunConsumer(consumer: TSReadPassConsumer, block: tuple[bytes, int] | None) -> None:
+            """
+            コンシューマーにデータを渡し (block が None の場合は解析を完了させ)、処理時間を加算する
+            キーフレーム解析以外のコンシューマーで例外が発生した場合は、そのコンシューマーを取り除いて解析を続ける
+            (サムネイル用のフレームのデコードに失敗しても、キーフレーム情報は保存できるようにする)
+            """
+            consumer_start_time = time.monotonic()
+            try:
+                if block is not None:
+                    consumer.feed(*block)
+                else:
+                    consumer.finish()
+            except Exception as ex:
+                if consumer is key_frame_consumer:
+                    raise
+                logging.error(f'{self.file_path}: Error in {consumer.name} consumer. Skipping it:', exc_info=ex)
+                consumers.remove(consumer)
+            finally:
+                stage_times[consumer.name] += time.monotonic() - consumer_start_time
+
+        for block in self.__iterAlignedBlocks(stage_times):
+            for consumer in list(consumers):
+                RunConsumer(consumer, block)
+        for consumer in list(consumers):
+            RunConsumer(consumer, None)
+
+        # キーフレーム情報を取得する
+        key_frames: list[schemas.KeyFrame] | None = key_frame_consumer.key_frames
+        if key_frame_consumer.indexer.video_pid is None:
+            logging.error(f'{self.file_path}: No video stream found in PMT.')
+            return None, False, stage_times
+        if not key_frames:
+            logging.error(f'{self.file_path}: No keyframes found in the video.')
+            key_frames = None
+
+        # デコードしたフレームからサムネイルを生成・保存する
+        ## フレームのデコード中にエラーが発生した場合は None を返し、呼び出し元で録画ファイルからサムネイルを生成し直させる
+        is_thumbnail_generated: bool | None = False
+        if thumbnail_generator is not None and intra_frame_consumer is not None:
+            if intra_frame_consumer not in consumers:
+                is_thumbnail_generated = None
+            else:
+                missing_frame_count = intra_frame_consumer.getMissingFrameCount()
+                if missing_frame_count > 0:
+                    logging.warning(f'{self.file_path}: Failed to extract {missing_frame_count} frames. Using black images.')
+                thumbnail_start_time = time.monotonic()
+                try:
+                    is_thumbnail_generated = thumbnail_generator.generateAndSaveThumbnails(
+                        candidate_offsets,
+                        thumbnail_generator.tile_rows,
+                        intra_frame_consumer.getFrames(),
+                    )
+                except Exception as ex:
+                    logging.error(f'{self.file_path}: Error generating thumbnails:', exc_info=ex)
+                stage_times['thumbnail'] = time.monotonic() - thumbnail_start_time
+
+        return key_frames, is_thumbnail_generated, stage_times
+
+
+    def __iterAlignedBlocks(self, stage_times: dict[str, float]) -> Iterator[tuple[bytes, int]]:
+        """
+        録画ファイルを先頭から READ_SIZE ずつ読み込み、TS パケット境界に揃ったデータを順に返す
+        読み込みは別スレッドで先読みしながら行い、同期がずれている部分は取り除かれる
+
+        Args:
+            stage_times (dict[str, float]): 読み込みを待っていた時間を read に加算するステージごとの処理時間
+
+        Yields:
+            tuple[bytes, int]: TS パケット境界に揃ったデータと、その先頭のファイル内の位置
+        """
+
+        block_queue: queue.Queue[bytes | Exception | None] = queue.Queue(maxsize=self.READ_AHEAD_BLOCKS)
+        stop_event = threading.Event()
+
+        def PutBlock(item: bytes | Exception | None) -> bool:
+            """ 読み込みが中断されるまで、キューに空きができるのを待ってから追加する """
+            while not stop_event.is_set():
+                try:
+                    block_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def ReadBlocks() -> None:
+            """ 録画ファイルを先頭から読み込み、キューに追加し続ける """
+            try:
+                with open(str(self.file_path), 'rb') as file:
+                    # OS にシーケンシャルに読み込むことを伝え、先読みを積極的に行わせる
+                    if hasattr(os, 'posix_fadvise'):
+                        os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    while True:
+                        data = file.read(self.READ_SIZE)
+                        if len(data) == 0 or PutBlock(data) is False:
+                            break
+                PutBlock(None)
+            except Exception as ex:
+                PutBlock(ex)
+
+        read_thread = threading.Thread(target=ReadBlocks, daemon=True)
+        read_thread.start()
+        try:
+            buffer = b''
+            buffer_offset = 0
+            is_synced = False
+            while True:
+
+                # 読み込みスレッドから次のブロックを受け取る
+                wait_start_time = time.monotonic()
+                item = block_queue.get()
+                stage_times['read'] += time.monotonic() - wait_start_time
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                buffer = buffer + item if len(buffer) > 0 else item
+
+                while len(buffer) >= ts.PACKET_SIZE:
+
+                    # TS パケット境界を探す
+                    if is_synced is False:
+                        sync_offset = TSKeyFrameIndexer.findSyncOffset(buffer, 0)
+                        if sync_offset is None:
+                            buffer_offset += len(buffer)
+                            buffer = b''
+                            break
+                        buffer = buffer[sync_offset:]
+                        buffer_offset += sync_offset
+                        is_synced = True
+
+                    # 同期バイトがずれている TS パケットがあれば、その直前までを TS パケット境界に揃ったデータとする
+                    packet_count = len(buffer) // ts.PACKET_SIZE
+                    packets = np.frombuffer(buffer, dtype=np.uint8, count=packet_count * ts.PACKET_SIZE).reshape(packet_count, ts.PACKET_SIZE)
+                    is_packet_synced = packets[:, 0] == ts.SYNC_BYTE[0]
+                    aligned_packet_count = packet_count if bool(is_packet_synced.all()) else int(np.argmin(is_packet_synced))
+                    aligned_length = aligned_packet_count * ts.PACKET_SIZE
+                    if aligned_length > 0:
+                        yield (buffer if aligned_length == len(buffer) else buffer[:aligned_length]), buffer_offset
+
+                    # 同期がずれている場合は、次の TS パケット境界を探し直す
+                    ## TS パケット境界に揃っていない残りのデータは、次のブロックと結合してから処理する
+                    buffer = buffer[aligned_length + (1 if aligned_packet_count < packet_count else 0):]
+                    buffer_offset += aligned_length + (1 if aligned_packet_count < packet_count else 0)
+                    if aligned_packet_count == packet_count:
+                        break
+                    is_synced = False
+
+        finally:
+            # 読み込みスレッドを終了させる
+            stop_event.set()
+            read_thread.join()
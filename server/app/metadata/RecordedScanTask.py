@@ -3,9 +3,13 @@ from __future__ import annotations
 
 import asyncio
 import concurrent.futures
+import json
+import os
 import pathlib
+import time
 from dataclasses import dataclass
 from datetime import datetime
+from stat import S_ISDIR
 from typing import ClassVar, Literal, cast
 
 import anyio
@@ -15,9 +19,8 @@ from watchfiles import Change, awatch
 
 from app import logging, schemas
 from app.config import Config
-from app.constants import JST, THUMBNAILS_DIR
-from app.metadata.CMSectionsDetector import CMSectionsDetector
-from app.metadata.KeyFrameAnalyzer import KeyFrameAnalyzer
+from app.constants import JST, RECORDED_SCAN_STAT_INDEX_PATH, THUMBNAILS_DIR
+from app.metadata.BackgroundAnalysisPipeline import BackgroundAnalysisPipeline
 from app.metadata.MetadataAnalyzer import MetadataAnalyzer
 from app.metadata.ThumbnailGenerator import ThumbnailGenerator
 from app.models.Channel import Channel
@@ -92,6 +95,19 @@ class RecordedScanTask:
     # 継続更新を強制的に完了とする時間 (秒)
     CONTINUOUS_UPDATE_MAX_SECONDS: ClassVar[int] = 86400  # 24時間
 
+    # 一括スキャン時に録画ファイルを並行して処理するワーカー数の、メタデータ解析プロセス数に対する倍率
+    ## ファイルの基本情報が前回と一致してメタデータ解析が不要なファイルは、解析待ちのファイルに詰まらずに処理されるよう多めに確保する
+    BATCH_SCAN_WORKERS_PER_PROCESS: ClassVar[int] = 2
+
+    # 一括スキャン時に1つのトランザクションでまとめて DB に保存する最大レコード数
+    BATCH_SCAN_SAVE_SIZE: ClassVar[int] = 50
+
+    # 一括スキャンの進捗をログに出力する間隔 (秒)
+    BATCH_SCAN_PROGRESS_INTERVAL: ClassVar[int] = 30
+
+    # 一括スキャンの stat インデックスの形式のバージョン
+    STAT_INDEX_VERSION: ClassVar[int] = 1
+
     # 既知のハッシュ衝突が発生しうる file_hash の集合
     KNOWN_COLLISION_FILE_HASHES: ClassVar[set[str]] = {
         'd1dd210d6b1312cb342b56d02bd5e651',
@@ -138,6 +154,14 @@ class RecordedScanTask:
         # バックグラウンドタスクの状態管理
         self._background_tasks: dict[anyio.Path, asyncio.Task[None]] = {}
 
+        # メタデータ解析に使うプロセスプール
+        ## 録画ファイルごとにプロセスを起動・終了するとオーバーヘッドが大きいため、初回の解析時に作成してサーバーの終了まで使い回す
+        self._metadata_executor: concurrent.futures.ProcessPoolExecutor | None = None
+
+        # 一括スキャン中に DB への保存を待っているメタデータ解析結果のキュー
+        ## 一括スキャン中のみ作成され、複数の録画ファイルの解析結果をまとめて1つのトランザクションで保存する
+        self._metadata_save_queue: asyncio.Queue[tuple[schemas.RecordedProgram, RecordedVideo | None, asyncio.Future[None]]] | None = None
+
         # シンボリックリンクの元パスと実体パスのマッピング
         self._symlink_path_map: dict[str, str] = {}
         self._symlink_path_map_lock = asyncio.Lock()
@@ -186,6 +210,12 @@ class RecordedScanTask:
                 pass
             self._task = None
 
+        # メタデータ解析用のプロセスプールを終了する
+        ## さもなければサーバーの終了後もプロセスが残り続けてゾンビプロセス化し、メモリリークを引き起こしてしまう
+        if self._metadata_executor is not None:
+            self._metadata_executor.shutdown(wait=False, cancel_futures=True)
+            self._metadata_executor = None
+
 
     async def run(self) -> None:
         """
@@ -230,7 +260,7 @@ class RecordedScanTask:
         self._is_batch_scan_running = True
 
         # 現在登録されている全ての RecordedVideo レコードの情報をキャッシュ
-        ## すべての情報をキャッシュすると key_frames フィールドのデータ量が大きすぎてメモリとディスク I/O を大量に食うため、
+        ## すべての情報をキャッシュすると key_frames_data フィールドのデータ量が大きすぎてメモリとディスク I/O を大量に食うため、
         ## 必要最低限の情報のみをキャッシュする
         logging.info('Gathering all recorded video records...')
         all_video_rows = await RecordedVideo.all().values(
@@ -270,6 +300,8 @@ class RecordedScanTask:
         logging.info('Checking for duplicate recorded video records...')
         duplicates_found = False
         total_deleted_count = 0
+        ## キャッシュしている録画番組の総数は、トランザクションのコミット後に削除したレコード数だけ減らす
+        deleted_record_total = 0
         async with transactions.in_transaction():
             for index, (file_path, videos) in enumerate(videos_by_path.items(), start=1):
                 if len(videos) > 1:
@@ -283,7 +315,7 @@ class RecordedScanTask:
                     for video_to_delete in videos[1:]:
                         try:
                             # RecordedProgram を削除 (CASCADE により RecordedVideo も削除される)
-                            await RecordedProgram.filter(id=video_to_delete.recorded_program_id).delete()
+                            deleted_record_total += await RecordedProgram.filter(id=video_to_delete.recorded_program_id).delete()
                             logging.info(
                                 f'{file_path}: Deleted duplicate record. [deleted recorded_program_id: {video_to_delete.recorded_program_id}] '
                                 f'[kept recorded_program_id: {latest_video.recorded_program_id}]'
@@ -302,6 +334,7 @@ class RecordedScanTask:
                 if index % 50 == 0:
                     # 重複チェックがループを占有し続けないよう適宜制御を返す
                     await asyncio.sleep(0)
+        RecordedProgram.adjustTotalCount(-deleted_record_total)
         if duplicates_found:
             logging.info(f'Duplicate record cleanup finished. Total {total_deleted_count} duplicate records were deleted.')
         else:
@@ -309,13 +342,21 @@ class RecordedScanTask:
 
         # 現在登録されている全ての RecordedVideo レコードをキャッシュ
         ## 重複削除処理で保持すると判断されたレコードのみを使う
+        ## 既存レコードのファイルパスもシンボリックリンクを解決して正規化する
+        ## レコードごとにスレッドを往復しないよう、まとめてスレッドプール上で解決する
         existing_db_recorded_videos: dict[anyio.Path, RecordedVideoSummary] = {}
-        for video in videos_to_keep:
-            # 既存レコードのファイルパスもシンボリックリンクを解決して正規化する
-            canonical_path = await self.resolveRecordedPath(anyio.Path(video.file_path))
-            video.file_path = str(canonical_path)
+        canonical_path_strs = await asyncio.to_thread(self.__resolveRecordedPathsSync, [video.file_path for video in videos_to_keep])
+        for video, canonical_path_str in zip(videos_to_keep, canonical_path_strs):
+            video.file_path = canonical_path_str
             existing_db_recorded_videos[anyio.Path(video.file_path)] = video
 
+        # 前回の一括スキャン時に保存した stat インデックスを読み込む
+        stat_index = await asyncio.to_thread(self.__loadStatIndex)
+        new_stat_index: dict[str, list[str | int]] = {}
+        ## stat インデックスに載っていなかった (または stat が変化していた) ファイルの、元のパス → (実体パス, stat) のマッピング
+        ## 一括スキャン完了後、Recorded 状態で DB に保存されていることを確認できたものだけを新しい stat インデックスに追加する
+        stat_index_candidates: dict[str, tuple[str, os.stat_result]] = {}
+
         # スキャン対象から除外するフォルダ
         # 空文字列は全パスにマッチしてしまうため除外する
         exclude_scan_paths = [
@@ -325,42 +366,25 @@ class RecordedScanTask:
         ]
 
         # 各録画フォルダをスキャン
+        ## 見つかった録画ファイルはキューに積み、複数のワーカーで並行して処理する
+        ## メタデータ解析の同時実行数は ProcessLimiter (全体) と DriveIOLimiter (HDD ごと) で制限される
         logging.info('Scanning recorded folders...')
         processed_canonical_paths: set[str] = set()
-        for folder in self.recorded_folders:
-            async for file_path in folder.rglob('*'):
+        worker_count = ProcessLimiter.getMaxConcurrency() * self.BATCH_SCAN_WORKERS_PER_PROCESS
+        scan_queue: asyncio.Queue[tuple[anyio.Path, anyio.Path] | None] = asyncio.Queue(maxsize=worker_count * 4)
+        scan_start_time = time.monotonic()
+        processed_file_count = 0
+        unchanged_file_count = 0
+        saved_record_count = 0
+
+        async def ScanWorker() -> None:
+            nonlocal processed_file_count
+            while True:
+                item = await scan_queue.get()
+                if item is None:
+                    return
+                canonical_path, file_path = item
                 try:
-                    # Mac の metadata ファイルをスキップ
-                    if file_path.name.startswith('._'):
-                        continue
-                    # 除外パターンのチェック（シンボリックリンク解決前）
-                    original_path_str = str(file_path)
-                    original_path_for_match = self.__normalizePathForPrefixMatch(original_path_str)
-                    if any(original_path_for_match.startswith(pattern) for pattern in exclude_scan_paths) is True:
-                        continue
-                    # シンボリックリンクを含むパスは実体に解決して処理する
-                    canonical_path = await self.resolveRecordedPath(file_path)
-                    canonical_path_str = str(canonical_path)
-                    # 除外パターンのチェック（シンボリックリンク解決後）
-                    # 空文字列は全パスにマッチしてしまうため除外する
-                    canonical_path_for_match = self.__normalizePathForPrefixMatch(canonical_path_str)
-                    if any(canonical_path_for_match.startswith(pattern) for pattern in exclude_scan_paths) is True:
-                        continue
-                    # シンボリックリンクのマッピングを更新する
-                    await self.__updateSymlinkMapping(original_path_str, canonical_path_str)
-                    if await canonical_path.is_dir():
-                        continue
-                    # 対象拡張子のファイル以外をスキップ
-                    if canonical_path.suffix.lower() not in self.SCAN_TARGET_EXTENSIONS:
-                        continue
-                    # 録画ファイルが確実に存在することを確認する
-                    ## 環境次第では、稀に glob で取得したファイルが既に存在しなくなっているケースがある
-                    if not await self.isFileExists(canonical_path):
-                        continue
-                    if canonical_path_str in processed_canonical_paths:
-                        continue
-                    processed_canonical_paths.add(canonical_path_str)
-
                     # 見つかったファイルを処理
                     await self.processRecordedFile(
                         file_path = canonical_path,
@@ -369,21 +393,181 @@ class RecordedScanTask:
                     )
                 except Exception as ex:
                     logging.error(f'{file_path}: Failed to process recorded file:', exc_info=ex)
+                processed_file_count += 1
+
+        async def MetadataSaveWriter(save_queue: asyncio.Queue[tuple[schemas.RecordedProgram, RecordedVideo | None, asyncio.Future[None]]]) -> None:
+            nonlocal saved_record_count
+            while True:
+                # キューに溜まっている解析結果を最大 BATCH_SCAN_SAVE_SIZE 件までまとめて取り出す
+                items = [await save_queue.get()]
+                while len(items) < self.BATCH_SCAN_SAVE_SIZE and not save_queue.empty():
+                    items.append(save_queue.get_nowait())
+                try:
+                    # まとめて1つのトランザクションで保存する
+                    ## キャッシュしている録画番組の総数は、トランザクションのコミット後に新規作成したレコード数だけ増やす
+                    ## (ロールバックされて1件ずつ保存し直した場合に二重に数えないようにする)
+                    created_record_count = 0
+                    async with transactions.in_transaction():
+                        for recorded_program, existing_db_recorded_video, _ in items:
+                            if await self.__saveRecordedMetadataToDB(recorded_program, existing_db_recorded_video) is True:
+                                created_record_count += 1
+                    RecordedProgram.adjustTotalCount(created_record_count)
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_result(None)
+                except Exception as ex:
+                    # 1件でも保存に失敗するとトランザクション全体がロールバックされるため、1件ずつ保存し直す
+                    logging.warning(f'Failed to save {len(items)} records in a batch. Retrying one by one...', exc_info=ex)
+                    for recorded_program, existing_db_recorded_video, future in items:
+                        try:
+                            if await self.__saveRecordedMetadataToDB(recorded_program, existing_db_recorded_video) is True:
+                                RecordedProgram.adjustTotalCount(1)
+                            if not future.done():
+                                future.set_result(None)
+                        except Exception as ex_item:
+                            if not future.done():
+                                future.set_exception(ex_item)
+                saved_record_count += len(items)
+
+        async def ProgressReporter() -> None:
+            while True:
+                await asyncio.sleep(self.BATCH_SCAN_PROGRESS_INTERVAL)
+                elapsed_time = time.monotonic() - scan_start_time
+                logging.info(
+                    f'Batch scan progress: {processed_file_count} / {len(processed_canonical_paths)} files processed, '
+                    f'{saved_record_count} records saved. ({processed_file_count / elapsed_time:.1f} files/sec)'
+                )
+
+        self._metadata_save_queue = asyncio.Queue()
+        scan_workers = [asyncio.create_task(ScanWorker()) for _ in range(worker_count)]
+        metadata_save_writer = asyncio.create_task(MetadataSaveWriter(self._metadata_save_queue))
+        progress_reporter = asyncio.create_task(ProgressReporter())
+        try:
+            for folder in self.recorded_folders:
+                # 録画フォルダ以下のファイル一覧と各ファイルの stat をまとめて取得する
+                ## 1ファイルごとにスレッドを往復すると数万ファイルの走査に数分かかるため、走査全体をスレッドプール上で行う
+                scanned_files = await asyncio.to_thread(self.__listFilesSync, pathlib.Path(str(folder)))
+                for index, (original_path_str, file_stat) in enumerate(scanned_files, start=1):
+                    if index % 100 == 0:
+                        # 走査がイベントループを占有し続けないよう適宜制御を返す
+                        await asyncio.sleep(0)
+                    file_path = anyio.Path(original_path_str)
+                    try:
+                        # Mac の metadata ファイルをスキップ
+                        if file_path.name.startswith('._'):
+                            continue
+                        # 除外パターンのチェック（シンボリックリンク解決前）
+                        original_path_for_match = self.__normalizePathForPrefixMatch(original_path_str)
+                        if any(original_path_for_match.startswith(pattern) for pattern in exclude_scan_paths) is True:
+                            continue
+                        # 走査中に削除されたファイルや壊れたシンボリックリンクをスキップ
+                        if file_stat is None:
+                            continue
+
+                        # stat インデックスと DB のサマリーから、前回のスキャン以降変更されていないファイルを判定する
+                        ## 実体パスは前回解決したものを使い、ファイルのオープンやシンボリックリンクの解決は一切行わない
+                        unchanged_canonical_path_str = self.__getUnchangedCanonicalPath(
+                            stat_index.get(original_path_str), file_stat, existing_db_recorded_videos,
+                        )
+                        if unchanged_canonical_path_str is not None:
+                            canonical_path_for_match = self.__normalizePathForPrefixMatch(unchanged_canonical_path_str)
+                            if any(canonical_path_for_match.startswith(pattern) for pattern in exclude_scan_paths) is True:
+                                continue
+                            await self.__updateSymlinkMapping(original_path_str, unchanged_canonical_path_str)
+                            if unchanged_canonical_path_str in processed_canonical_paths:
+                                continue
+                            processed_canonical_paths.add(unchanged_canonical_path_str)
+                            # 存在しない録画ファイルとして削除されないよう、既存レコードのサマリーから取り除く
+                            existing_db_recorded_videos.pop(anyio.Path(unchanged_canonical_path_str), None)
+                            new_stat_index[original_path_str] = stat_index[original_path_str]
+                            unchanged_file_count += 1
+                            continue
+
+                        # シンボリックリンクを含むパスは実体に解決して処理する
+                        canonical_path = await self.resolveRecordedPath(file_path)
+                        canonical_path_str = str(canonical_path)
+                        # 除外パターンのチェック（シンボリックリンク解決後）
+                        # 空文字列は全パスにマッチしてしまうため除外する
+                        canonical_path_for_match = self.__normalizePathForPrefixMatch(canonical_path_str)
+                        if any(canonical_path_for_match.startswith(pattern) for pattern in exclude_scan_paths) is True:
+                            continue
+                        # シンボリックリンクのマッピングを更新する
+                        await self.__updateSymlinkMapping(original_path_str, canonical_path_str)
+                        # 対象拡張子のファイル以外をスキップ
+                        if canonical_path.suffix.lower() not in self.SCAN_TARGET_EXTENSIONS:
+                            continue
+                        # 録画ファイルが確実に存在することを確認する
+                        ## 環境次第では、稀に glob で取得したファイルが既に存在しなくなっているケースがある
+                        if not await self.isFileExists(canonical_path):
+                            continue
+                        if canonical_path_str in processed_canonical_paths:
+                            continue
+                        processed_canonical_paths.add(canonical_path_str)
+                        stat_index_candidates[original_path_str] = (canonical_path_str, file_stat)
+
+                        # 見つかったファイルをワーカーに渡す
+                        ## キューが一杯の場合は、ワーカーの処理が進むまでフォルダの走査を待つ
+                        await scan_queue.put((canonical_path, file_path))
+                    except Exception as ex:
+                        logging.error(f'{file_path}: Failed to process recorded file:', exc_info=ex)
+
+            # すべてのワーカーに終了を通知し、処理中のファイルが完了するまで待つ
+            for _ in scan_workers:
+                await scan_queue.put(None)
+            ## 各ワーカーは解析結果の DB への保存が完了するまで待つため、この時点で保存待ちの解析結果は残っていない
+            await asyncio.gather(*scan_workers)
+        finally:
+            for scan_worker in scan_workers:
+                scan_worker.cancel()
+            progress_reporter.cancel()
+            metadata_save_writer.cancel()
+            self._metadata_save_queue = None
+
+        elapsed_time = time.monotonic() - scan_start_time
+        logging.info(
+            f'Scanned {unchanged_file_count + processed_file_count} files ({unchanged_file_count} unchanged) '
+            f'and saved {saved_record_count} records. '
+            f'({elapsed_time:.1f} sec / {(unchanged_file_count + processed_file_count) / max(elapsed_time, 0.001):.1f} files/sec)'
+        )
+
+        # 新しい stat インデックスを保存する
+        ## 今回処理したファイルのうち、Recorded 状態で DB に保存されていて、スキャン時の stat と一致するものだけを追加する
+        if len(stat_index_candidates) > 0:
+            recorded_video_rows = await RecordedVideo.filter(status='Recorded').values(
+                'file_path',
+                'file_size',
+                'file_created_at',
+                'file_modified_at',
+            )
+            recorded_video_rows_by_path = {row['file_path']: row for row in recorded_video_rows}
+            for original_path_str, (canonical_path_str, file_stat) in stat_index_candidates.items():
+                row = recorded_video_rows_by_path.get(canonical_path_str)
+                if (row is not None and
+                    row['file_size'] == file_stat.st_size and
+                    row['file_created_at'] == datetime.fromtimestamp(file_stat.st_ctime, tz=JST) and
+                    row['file_modified_at'] == datetime.fromtimestamp(file_stat.st_mtime, tz=JST)):
+                    new_stat_index[original_path_str] = [
+                        canonical_path_str, file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns,
+                    ]
+        await asyncio.to_thread(self.__saveStatIndex, new_stat_index)
 
         # 存在しない録画ファイルに対応するレコードを一括削除
         ## トランザクション配下に入れることでパフォーマンスが向上する
         logging.info('Deleting records for non-existent files...')
+        ## キャッシュしている録画番組の総数は、トランザクションのコミット後に削除したレコード数だけ減らす
+        deleted_record_total = 0
         async with transactions.in_transaction():
             for index, (file_path, existing_recorded_video_summary) in enumerate(existing_db_recorded_videos.items(), start=1):
                 # ファイルの存在確認を非同期に行う
                 if not await self.isFileExists(file_path):
                     # RecordedVideo の親テーブルである RecordedProgram を削除すると、
                     # CASCADE 制約により RecordedVideo も同時に削除される (Channel は親テーブルにあたるため削除されない)
-                    await RecordedProgram.filter(id=existing_recorded_video_summary.recorded_program_id).delete()
+                    deleted_record_total += await RecordedProgram.filter(id=existing_recorded_video_summary.recorded_program_id).delete()
                     logging.info(f'{file_path}: Deleted record for non-existent file.')
                 if index % 50 == 0:
                     # 既存レコードの走査が長時間化しないよう適宜制御を返す
                     await asyncio.sleep(0)
+        RecordedProgram.adjustTotalCount(-deleted_record_total)
 
         # DB に存在する全ての RecordedVideo レコードのハッシュを取得
         logging.info('Gathering all recorded video hashes...')
@@ -424,7 +608,7 @@ class RecordedScanTask:
 
         # かつてのバグで RecordedVideo.file_hash が衝突している録画ファイルのメタデータを再解析する
         ## トランザクション配下に入れることでパフォーマンスが向上する
-        ## メモリ使用量を抑えるため、key_frames などの大きなフィールドは取得せず、必要最低限のフィールドのみを取得する
+        ## メモリ使用量を抑えるため、key_frames_data などの大きなフィールドは取得せず、必要最低限のフィールドのみを取得する
         ## ref: https://github.com/tsukumijima/KonomiTV/commit/92e8630f41b6440ebd10defa5fdde1489ac7376a
         async with transactions.in_transaction():
             collision_video_rows = await RecordedVideo.filter(
@@ -462,6 +646,10 @@ class RecordedScanTask:
                     except Exception as ex:
                         logging.error(f'{file_path}: Failed to reanalyze known hash collision file:', exc_info=ex)
 
+        # 録画番組の総数のキャッシュを実際の件数に揃える
+        ## 追加・削除のたびに増減させているが、トランザクションのロールバックなどで実際の件数とずれる可能性がある
+        await RecordedProgram.refreshTotalCount()
+
         logging.info('Batch scan of recording folders has been completed.')
         self._is_batch_scan_running = False
 
@@ -610,15 +798,9 @@ class RecordedScanTask:
                         # 録画開始前にファイルアロケーションを行う録画予約ソフトでは、録画中も表面上ファイルサイズが変化しない問題への対処
                         pass
 
-                # ProcessPoolExecutor を使い、別プロセス上でメタデータを解析
-                ## メタデータ解析処理は実装上同期 I/O で実装されており、また CPU-bound な処理のため、別プロセスで実行している
-                ## with 文で括ることで、with 文を抜けたときに ProcessPoolExecutor がクリーンアップされるようにする
-                ## さもなければサーバーの終了後もプロセスが残り続けてゾンビプロセス化し、メモリリークを引き起こしてしまう
-                loop = asyncio.get_running_loop()
-                analyzer = MetadataAnalyzer(pathlib.Path(str(file_path)))  # anyio.Path -> pathlib.Path に変換
+                # 別プロセス上でメタデータを解析
                 try:
-                    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
-                        recorded_program = await loop.run_in_executor(executor, analyzer.analyze)
+                    recorded_program = await self.__analyzeMetadata(file_path)
                     if recorded_program is None:
                         logging.error(f'{file_path}: Failed to analyze metadata.')
                         # メタデータ解析に失敗したがこの時点ですでに DB にエントリが存在している場合は、UI から判別できるようステータスを更新する
@@ -687,7 +869,7 @@ class RecordedScanTask:
 
                 # DB に永続化
                 # メタデータ解析後の最新のデータベース情報を使う
-                await self.__saveRecordedMetadataToDB(recorded_program, existing_db_recorded_video_after_analyze)
+                await self.__saveRecordedMetadata(recorded_program, existing_db_recorded_video_after_analyze)
                 logging.info(f'{file_path}: {"Updated" if existing_db_recorded_video_after_analyze else "Saved"} metadata to DB. (status: {recorded_program.recorded_video.status})')
 
                 # wait_background_analysis が True の場合のみ、バックグラウンド解析タスクが完了するまで待つ
@@ -704,6 +886,137 @@ class RecordedScanTask:
                         self._file_locks.pop(file_path, None)
 
 
+    @classmethod
+    def __listFilesSync(cls, folder: pathlib.Path) -> list[tuple[str, os.stat_result | None]]:
+        """
+        録画フォルダ以下のファイルのパスと stat を取得する (同期関数)
+        ディレクトリ (シンボリックリンク先がディレクトリのものも含む) と、スキャン対象の拡張子ではない通常のファイルは除外する
+        (シンボリックリンクは実体の拡張子で判定するため、拡張子に関わらず含める)
+
+        Args:
+            folder (pathlib.Path): 録画フォルダのパス
+
+        Returns:
+            list[tuple[str, os.stat_result | None]]: ファイルのパスと、シンボリックリンクを辿った stat の組のリスト (stat の取得に失敗した場合は None)
+        """
+
+        files: list[tuple[str, os.stat_result | None]] = []
+        for file_path in folder.rglob('*'):
+            try:
+                if file_path.suffix.lower() not in cls.SCAN_TARGET_EXTENSIONS and not file_path.is_symlink():
+                    continue
+                file_stat = os.stat(file_path)
+            except OSError:
+                # 壊れたシンボリックリンクや走査中に削除されたファイルなど
+                files.append((str(file_path), None))
+                continue
+            if S_ISDIR(file_stat.st_mode):
+                continue
+            files.append((str(file_path), file_stat))
+        return files
+
+
+    @staticmethod
+    def __resolveRecordedPathsSync(file_path_strs: list[str]) -> list[str]:
+        """
+        複数のファイルパスのシンボリックリンクをまとめて解決する (同期関数)
+        解決に失敗したファイルパスは元のパスのまま返す
+
+        Args:
+            file_path_strs (list[str]): ファイルパスのリスト
+
+        Returns:
+            list[str]: シンボリックリンクを解決したファイルパスのリスト
+        """
+
+        canonical_path_strs: list[str] = []
+        for file_path_str in file_path_strs:
+            try:
+                canonical_path_strs.append(str(pathlib.Path(file_path_str).resolve()))
+            except (OSError, RuntimeError) as ex:
+                logging.warning(f'{file_path_str}: Failed to resolve symlink. Using original path:', exc_info=ex)
+                canonical_path_strs.append(file_path_str)
+        return canonical_path_strs
+
+
+    @staticmethod
+    def __getUnchangedCanonicalPath(
+        stat_index_entry: list[str | int] | None,
+        file_stat: os.stat_result | None,
+        existing_db_recorded_videos: dict[anyio.Path, RecordedVideoSummary],
+    ) -> str | None:
+        """
+        stat インデックスと DB のサマリーを突き合わせ、前回のスキャン以降変更されていない録画ファイルの実体パスを返す
+        デバイス ID・inode 番号・ファイルサイズ・最終更新日時が stat インデックスと一致し、かつ DB のサマリーとも
+        ファイルの基本情報が一致する Recorded 状態のファイルのみを変更なしとみなす
+
+        Args:
+            stat_index_entry (list[str | int] | None): stat インデックスのエントリ ([実体パス, st_dev, st_ino, st_size, st_mtime_ns])
+            file_stat (os.stat_result | None): 今回のスキャンで取得した stat
+            existing_db_recorded_videos (dict[anyio.Path, RecordedVideoSummary]): 既に DB に永続化されている録画ファイルパスと RecordedVideo のサマリーデータのマッピング
+
+        Returns:
+            str | None: 変更されていない場合はその実体パス、変更されている可能性がある場合は None
+        """
+
+        if stat_index_entry is None or file_stat is None:
+            return None
+        if stat_index_entry[1:] != [file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns]:
+            return None
+        canonical_path_str = cast(str, stat_index_entry[0])
+        summary = existing_db_recorded_videos.get(anyio.Path(canonical_path_str))
+        if (summary is None or
+            summary.status != 'Recorded' or
+            summary.file_size != file_stat.st_size or
+            summary.file_created_at != datetime.fromtimestamp(file_stat.st_ctime, tz=JST) or
+            summary.file_modified_at != datetime.fromtimestamp(file_stat.st_mtime, tz=JST)):
+            return None
+        return canonical_path_str
+
+
+    @staticmethod
+    def __loadStatIndex() -> dict[str, list[str | int]]:
+        """
+        前回の一括スキャン時に保存した stat インデックスを読み込む (同期関数)
+        stat インデックスが存在しないか壊れている場合は空の辞書を返す (すべてのファイルが通常通り処理される)
+
+        Returns:
+            dict[str, list[str | int]]: 録画ファイルの元のパス → [実体パス, st_dev, st_ino, st_size, st_mtime_ns] のマッピング
+        """
+
+        try:
+            with open(RECORDED_SCAN_STAT_INDEX_PATH, encoding='utf-8') as file:
+                stat_index = json.load(file)
+            if stat_index.get('version') != RecordedScanTask.STAT_INDEX_VERSION:
+                return {}
+            return cast(dict[str, list[str | int]], stat_index['files'])
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, AttributeError) as ex:
+            logging.warning('Failed to load the stat index of recorded files. Ignoring...', exc_info=ex)
+            return {}
+
+
+    @staticmethod
+    def __saveStatIndex(stat_index: dict[str, list[str | int]]) -> None:
+        """
+        stat インデックスを保存する (同期関数)
+
+        Args:
+            stat_index (dict[str, list[str | int]]): 録画ファイルの元のパス → [実体パス, st_dev, st_ino, st_size, st_mtime_ns] のマッピング
+        """
+
+        # 書き込み途中のファイルを読み込まないよう、一時ファイルに書き込んでからリネームする
+        temp_path = RECORDED_SCAN_STAT_INDEX_PATH.with_suffix('.tmp')
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump({'version': RecordedScanTask.STAT_INDEX_VERSION, 'files': stat_index}, file, ensure_ascii=False)
+            os.replace(temp_path, RECORDED_SCAN_STAT_INDEX_PATH)
+        except OSError as ex:
+            logging.warning('Failed to save the stat index of recorded files:', exc_info=ex)
+            temp_path.unlink(missing_ok=True)
+
+
     @staticmethod
     async def isFileExists(file_path: anyio.Path) -> bool:
         """
@@ -779,18 +1092,77 @@ class RecordedScanTask:
                 self._symlink_path_map[original_path_str] = canonical_path_str
 
 
+    async def __analyzeMetadata(self, file_path: anyio.Path) -> schemas.RecordedProgram | None:
+        """
+        プロセスプール上で録画ファイルのメタデータを解析する
+        メタデータ解析処理は実装上同期 I/O で実装されており、また CPU-bound な処理のため、別プロセスで実行している
+        同時実行数は ProcessLimiter で全体の、DriveIOLimiter で HDD ごとの上限が設けられる
+
+        Args:
+            file_path (anyio.Path): 解析対象の録画ファイルのパス
+
+        Returns:
+            schemas.RecordedProgram | None: 録画番組情報 (解析に失敗した場合は None)
+        """
+
+        analyzer = MetadataAnalyzer(pathlib.Path(str(file_path)))  # anyio.Path -> pathlib.Path に変換
+        async with ProcessLimiter.getSemaphore('MetadataAnalyzer'):
+            async with DriveIOLimiter.getSemaphore(file_path, 'MetadataAnalyzer'):
+                # プロセスプールがまだ作成されていなければ作成する
+                if self._metadata_executor is None:
+                    self._metadata_executor = concurrent.futures.ProcessPoolExecutor(max_workers=ProcessLimiter.getMaxConcurrency())
+                executor = self._metadata_executor
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(executor, analyzer.analyze)
+                except concurrent.futures.BrokenExecutor:
+                    # ワーカープロセスが異常終了した場合はプロセスプールが使えなくなるため、次回の解析時に作り直す
+                    logging.warning(f'{file_path}: Metadata analyzer process pool is broken. Recreating...')
+                    if self._metadata_executor is executor:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        self._metadata_executor = None
+                    raise
+
+
+    async def __saveRecordedMetadata(
+        self,
+        recorded_program: schemas.RecordedProgram,
+        existing_db_recorded_video: RecordedVideo | None,
+    ) -> None:
+        """
+        録画ファイルのメタデータ解析結果を DB に保存する
+        一括スキャン中は保存待ちのキューに積み、他の録画ファイルの解析結果とまとめて1つのトランザクションで保存されるまで待つ
+
+        Args:
+            recorded_program (schemas.RecordedProgram): 保存する録画番組情報
+            existing_db_recorded_video (RecordedVideo | None): 既に DB に永続化されている録画ファイルの RecordedVideo レコード
+        """
+
+        if self._metadata_save_queue is None:
+            if await self.__saveRecordedMetadataToDB(recorded_program, existing_db_recorded_video) is True:
+                RecordedProgram.adjustTotalCount(1)
+            return
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        await self._metadata_save_queue.put((recorded_program, existing_db_recorded_video, future))
+        await future
+
+
     @staticmethod
     async def __saveRecordedMetadataToDB(
         recorded_program: schemas.RecordedProgram,
         existing_db_recorded_video: RecordedVideo | None,
-    ) -> None:
+    ) -> bool:
         """
         録画ファイルのメタデータ解析結果を DB に保存する
         既存レコードがある場合は更新し、ない場合は新規作成する
+        外側のトランザクション配下で呼ばれることがあるため、キャッシュしている録画番組の総数は呼び出し元でコミット後に増やすこと
 
         Args:
             recorded_program (schemas.RecordedProgram): 保存する録画番組情報
             existing_db_recorded_video (RecordedVideo | None): 既に DB に永続化されている録画ファイルの RecordedVideo レコード
+
+        Returns:
+            bool: 録画番組のレコードを新規作成したかどうか
         """
 
         # トランザクション配下に入れることでパフォーマンスが向上する
@@ -848,6 +1220,7 @@ class RecordedScanTask:
             db_recorded_program.primary_audio_language = recorded_program.primary_audio_language
             db_recorded_program.secondary_audio_type = recorded_program.secondary_audio_type
             db_recorded_program.secondary_audio_language = recorded_program.secondary_audio_language
+            ## 検索用の全文検索インデックス (recorded_programs_fts) は DB のトリガーで同じトランザクション内で更新される
             await db_recorded_program.save()
 
             # RecordedVideo の保存または更新
@@ -885,6 +1258,8 @@ class RecordedScanTask:
             db_recorded_video.cm_sections = None
             await db_recorded_video.save()
 
+        return existing_db_recorded_video is None
+
 
     async def __runBackgroundAnalysis(self, recorded_program: schemas.RecordedProgram) -> None:
         """
@@ -892,7 +1267,7 @@ class RecordedScanTask:
         - キーフレーム解析
         - サムネイル生成
         - CM区間検出
-        など、時間のかかる処理を非同期に同時実行する
+        など、時間のかかる処理を BackgroundAnalysisPipeline でまとめて実行する
 
         Args:
             recorded_program (schemas.RecordedProgram): 解析対象の録画番組情報
@@ -907,14 +1282,9 @@ class RecordedScanTask:
             async with ProcessLimiter.getSemaphore('RecordedScanTask'):
                 # DriveIOLimiter で同一 HDD に対してのバックグラウンドタスクの同時実行数を原則1セッションに制限
                 async with DriveIOLimiter.getSemaphore(file_path):
-                    await asyncio.gather(
-                        # 録画ファイルのキーフレーム情報を解析し DB に保存
-                        KeyFrameAnalyzer(file_path, recorded_program.recorded_video.container_format).analyzeAndSave(),
-                        # 録画ファイルの CM 区間を検出し DB に保存
-                        CMSectionsDetector(file_path, recorded_program.recorded_video.duration).detectAndSave(),
-                        # シークバー用サムネイルとリスト表示用の代表サムネイルの両方を生成
-                        ThumbnailGenerator.fromRecordedProgram(recorded_program).generateAndSave(),
-                    )
+                    # 録画ファイルのキーフレーム情報の解析・CM 区間の検出・シークバー用サムネイルと代表サムネイルの生成を行い DB に保存
+                    ## MPEG-TS 形式の録画ファイルは、キーフレーム解析とサムネイル生成で録画ファイルを1回だけ読み込むように処理される
+                    await BackgroundAnalysisPipeline(recorded_program).runAndSave()
             logging.info(f'{file_path}: Background analysis task completed.')
 
         except Exception as ex:
@@ -947,7 +1317,7 @@ class RecordedScanTask:
 
         # thumbnail_info が未設定の録画済みファイルを一括取得
         ## マイグレーション処理では RecordedVideo の情報のみで十分なため、RecordedProgram は取得しない
-        ## メモリ使用量を抑えるため、key_frames などの大きなフィールドは取得せず、必要最低限のフィールドのみを取得する
+        ## メモリ使用量を抑えるため、key_frames_data などの大きなフィールドは取得せず、必要最低限のフィールドのみを取得する
         target_video_rows = await RecordedVideo.filter(status='Recorded', thumbnail_info=None).values(
             'id',
             'file_path',
@@ -1214,6 +1584,7 @@ class RecordedScanTask:
                     # RecordedVideo の親テーブルである RecordedProgram を削除すると、
                     # CASCADE 制約により RecordedVideo も同時に削除される (Channel は親テーブルにあたるため削除されない)
                     await db_recorded_video.recorded_program.delete()
+                    RecordedProgram.adjustTotalCount(-1)
                     logging.info(f'{file_path}: Deleted record for removed file.')
 
             except Exception as ex:
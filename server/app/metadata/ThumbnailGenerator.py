@@ -4,17 +4,19 @@ from __future__ import annotations
 import asyncio
 import concurrent.futures
 import math
+import os
 import pathlib
 import random
 import subprocess
 import time
-from typing import ClassVar, Literal, cast
+from typing import BinaryIO, ClassVar, Literal, cast
 
 import anyio
 import av
 import cv2
 import numpy as np
 import typer
+from biim.mpeg2ts import ts
 from numpy.typing import NDArray
 from tortoise import Tortoise
 
@@ -22,6 +24,7 @@ from app import logging, schemas
 from app.config import Config, LoadConfig
 from app.constants import DATABASE_CONFIG, LIBRARY_PATH, STATIC_DIR, THUMBNAILS_DIR
 from app.models.RecordedVideo import RecordedVideo
+from app.utils.TSKeyFrameIndexer import TSKeyFrameIndexer
 
 
 class ThumbnailGenerator:
@@ -46,6 +49,10 @@ class ThumbnailGenerator:
     WEBP_MAX_SIZE: ClassVar[int] = 16383  # WebP の最大サイズ制限 (px)
     FFMPEG_TIMEOUT: ClassVar[int] = 300  # FFmpeg サブプロセスのタイムアウト時間 (秒)
 
+    # キーフレーム情報を使ったフレーム抽出の設定
+    KEY_FRAME_READ_SIZE: ClassVar[int] = ts.PACKET_SIZE * 1024  # キーフレームの映像データを読み込む際の1回の読み取りサイズ (TS パケット 1024 個分)
+    MAX_KEY_FRAME_SIZE: ClassVar[int] = 16 * 1024 * 1024  # 1つのキーフレームの映像データとして読み込む最大サイズ (バイト)
+
     # サムネイル情報のバージョン
     THUMBNAIL_INFO_VERSION: ClassVar[int] = 1
 
@@ -326,7 +333,7 @@ class ThumbnailGenerator:
         さらに候補区間内のフレームから最も良い1枚を選び、代表サムネイルとして出力する
 
         処理フロー:
-        1. サブプロセス内で PyAV でフレーム抽出 + スコアリング
+        1. サブプロセス内で PyAV でフレーム抽出 + スコアリング (キーフレーム情報が解析済みの場合は、キーフレームの位置から直接デコードする)
         2. サブプロセス内で代表サムネイルを保存
         3. サブプロセス内でタイル画像を生成・保存
         """
@@ -341,7 +348,14 @@ class ThumbnailGenerator:
                 await thumbnails_dir.mkdir(parents=True, exist_ok=True)
 
             # 1. 候補オフセットを計算
-            candidate_offsets = self.__calculateCandidateOffsets()
+            candidate_offsets = self.calculateCandidateOffsets()
+
+            # MPEG-TS 形式でキーフレーム情報が解析済みの場合は、フレーム抽出に利用する
+            key_frames: NDArray[np.int64] | None = None
+            if self.container_format == 'MPEG-TS':
+                db_recorded_video = await RecordedVideo.get_or_none(file_path=str(self.file_path))
+                if db_recorded_video is not None and db_recorded_video.has_key_frames:
+                    key_frames = db_recorded_video.key_frames
 
             # 2. フレーム抽出 + タイル画像生成・保存 + 代表サムネイル保存をサブプロセス内で完結させる
             ## 親プロセスへのフレーム配列転送を避け、メモリ使用量とコピーコストを抑制する
@@ -349,9 +363,11 @@ class ThumbnailGenerator:
             with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
                 success = await loop.run_in_executor(
                     executor,
-                    self._generateAndSaveThumbnails,
+                    self.generateAndSaveThumbnails,
                     candidate_offsets,
                     self.tile_rows,
+                    None,
+                    key_frames,
                 )
 
             if not success:
@@ -359,7 +375,7 @@ class ThumbnailGenerator:
                 return
 
             # 3. サムネイル情報を DB に保存
-            await self.__saveThumbnailInfoToDB()
+            await self.saveThumbnailInfoToDB()
 
             logging.info(f'{self.file_path}: Thumbnail generation completed. (Total: {time.time() - start_time:.2f} sec)')
             logging.debug(f'Thumbnail tile -> {self.seekbar_thumbnails_tile_path.name}')
@@ -478,7 +494,7 @@ class ThumbnailGenerator:
         return (tile_interval_sec, tile_cols, tile_rows, total_tiles, tile_image_width, tile_image_height)
 
 
-    def __calculateCandidateOffsets(self) -> list[float]:
+    def calculateCandidateOffsets(self) -> list[float]:
         """
         動画の長さと tile_interval_sec から、各候補フレームの抽出開始位置（秒）のリストを算出する
 
@@ -498,20 +514,25 @@ class ThumbnailGenerator:
         return candidate_offsets
 
 
-    def _generateAndSaveThumbnails(
+    def generateAndSaveThumbnails(
         self,
         candidate_offsets: list[float],
         tile_rows: int,
+        extracted_frames: list[NDArray[np.uint8]] | None = None,
+        key_frames: NDArray[np.int64] | None = None,
     ) -> bool:
         """
         サブプロセス内でフレーム抽出・スコアリング・タイル生成・代表サムネイル保存まで行う
         PyAV (FFmpeg) によるデコードや OpenCV での画像処理が CPU-bound のため、ProcessPoolExecutor 上で実行する
-        ProcessPoolExecutor で実行されるエントリーポイントなので、あえて prefix のアンダースコアは1つとしている
-        (別プロセスで実行されるため、__ を付けるとマングリングにより正常に実行できない)
+        ProcessPoolExecutor で実行されるエントリーポイントであり、BackgroundAnalysisPipeline からも直接呼び出されるため public メソッドとしている
 
         Args:
             candidate_offsets (list[float]): 抽出するフレームのタイムスタンプ (秒) のリスト
             tile_rows (int): タイルの行数
+            extracted_frames (list[NDArray[np.uint8]] | None): 抽出済みのフレームの BGR 配列リスト (SCORING_SCALE)
+                (BackgroundAnalysisPipeline で抽出済みの場合に指定する、None の場合は PyAV で録画ファイルから抽出する)
+            key_frames (NDArray[np.int64] | None): 録画ファイルのキーフレーム情報 (RecordedVideo.key_frames)
+                (MPEG-TS 形式の録画ファイルで指定された場合、各候補オフセットの直前のキーフレームの位置から直接デコードする)
 
         Returns:
             bool: 成功時は True、失敗時は False
@@ -525,7 +546,7 @@ class ThumbnailGenerator:
             LoadConfig(bypass_validation=True)
 
         # 1. PyAV でフレーム抽出を実行し、候補区間内のフレームをスコアリングして最良フレームを特定する
-        result = self.__extractAndScoreFrames(candidate_offsets)
+        result = self.__extractAndScoreFrames(candidate_offsets, extracted_frames, key_frames)
         if result is None:
             logging.error(f'{self.file_path}: Failed to extract and score frames.')
             return False
@@ -563,12 +584,16 @@ class ThumbnailGenerator:
     def __extractAndScoreFrames(
         self,
         candidate_offsets: list[float],
+        extracted_frames: list[NDArray[np.uint8]] | None = None,
+        key_frames: NDArray[np.int64] | None = None,
     ) -> tuple[list[NDArray[np.uint8]], int | None] | None:
         """
         PyAV でフレーム抽出し、候補区間内のフレームをスコアリングして最良フレームを特定する
 
         Args:
             candidate_offsets (list[float]): 抽出するフレームのタイムスタンプ (秒) のリスト
+            extracted_frames (list[NDArray[np.uint8]] | None): 抽出済みのフレームの BGR 配列リスト (指定時はフレーム抽出を省略する)
+            key_frames (NDArray[np.int64] | None): 録画ファイルのキーフレーム情報 (指定時はキーフレームの位置から直接デコードする)
 
         Returns:
             tuple[list[NDArray[np.uint8]], int | None] | None:
@@ -578,113 +603,19 @@ class ThumbnailGenerator:
         """
 
         try:
-            start_time_frame_extraction = time.time()
-
-            # 結果を格納するリスト
-            scoring_width, scoring_height = self.SCORING_SCALE
-            bgr_frames: list[NDArray[np.uint8]] = []
-
-            # MPEG-TS の場合は format を明示的に指定
-            format_name = 'mpegts' if self.container_format == 'MPEG-TS' else None
-
-            # シーケンシャルにフレームを抽出（HDD への負荷を考慮）
-            container = av.open(str(self.file_path), format=format_name)
-            # PyAV で video stream が存在しない場合は、明示的にエラーとして扱う
-            if len(container.streams.video) == 0:
-                logging.error(f'{self.file_path}: No video stream found in ThumbnailGenerator.')
-                raise ValueError('No video stream found in ThumbnailGenerator.')
-            video_stream = container.streams.video[0]
-            try:
-                # コンテナは 1 回だけ開き、各フレーム抽出で seek を繰り返す
-                ## MPEG-TS でも実測で問題なければ再オープンを避けられるため、まずは 1 回オープンで検証する
-                # I フレームのみデコードする設定（FFmpeg の -skip_frame nointra 相当）
-                video_stream.codec_context.skip_frame = 'NONINTRA'
-
-                for i, offset_sec in enumerate(candidate_offsets):
-                    try:
-                        # 指定位置にシーク
-                        # MPEG-TS では start_time が 0 から始まらないことがあるため、start_time を考慮する必要がある
-                        # start_time は pts 単位（90kHz クロックで表現された開始位置）なので、
-                        # offset_sec を pts 単位に変換してから start_time を加算する
-                        if video_stream.time_base is None:
-                            # time_base が None の場合はコンテナ形式に応じてフォールバックする
-                            if self.container_format == 'MPEG-TS':
-                                time_base = 1 / 90000
-                                logging.warning(f'{self.file_path}: time_base is None in ThumbnailGenerator, using fallback: {time_base}')
-                            else:
-                                logging.error(f'{self.file_path}: time_base is None in ThumbnailGenerator for non-TS container.')
-                                raise ValueError('time_base is None in ThumbnailGenerator for non-TS container.')
-                        else:
-                            time_base = float(video_stream.time_base)
-                        start_time = video_stream.start_time if video_stream.start_time else 0
-                        target_ts = int(start_time + offset_sec / time_base)
-                        container.seek(target_ts, backward=True, any_frame=False, stream=video_stream)
-
-                        # seek 後のデコーダ内部状態を初期化し、前回のデコード状態を引きずらないようにする
-                        video_stream.codec_context.flush_buffers()
-
-                        # シーク後、最初のフレームを取得
-                        frame: av.VideoFrame | None = None
-                        for packet in container.demux(video_stream):
-                            for decoded_frame in packet.decode():
-                                frame = cast(av.VideoFrame, decoded_frame)
-                                break
-                            if frame is not None:
-                                break
-
-                        if frame is None:
-                            # フレームが取得できなかった場合は黒画像を使用
-                            logging.warning(f'{self.file_path}: Failed to extract frame at {offset_sec:.2f}s. Using black image.')
-                            black_frame = np.zeros((scoring_height, scoring_width, 3), dtype=np.uint8)
-                            bgr_frames.append(black_frame)
-                            continue
-
-                        # フレームを numpy 配列に変換
-                        img_rgb = frame.to_ndarray(format='rgb24')
-
-                        # リサイズを実行
-                        ## 1440x1080 から一気に 480x270 まで縮小するため INTER_AREA を使う
-                        img_resized = cv2.resize(img_rgb, (scoring_width, scoring_height), interpolation=cv2.INTER_AREA)
-
-                        # RGB から OpenCV 向けの BGR に変換して bgr_frames に追加する
-                        img_bgr = cast(NDArray[np.uint8], cv2.cvtColor(img_resized, cv2.COLOR_RGB2BGR))
-                        bgr_frames.append(img_bgr)
-
-                        # 進捗ログ（50フレームごと）
-                        if (i + 1) % 50 == 0:
-                            logging.debug(f'{self.file_path}: Extracted {i + 1}/{len(candidate_offsets)} frames')
-
-                    except Exception as ex:
-                        # 個別のフレーム抽出エラーは警告にとどめ、黒画像で代替
-                        logging.warning(
-                            f'{self.file_path}: Error extracting frame at {offset_sec:.2f}s.',
-                            exc_info=ex,
-                        )
-                        black_frame = np.zeros((scoring_height, scoring_width, 3), dtype=np.uint8)
-                        bgr_frames.append(black_frame)
-
-                        # 一時的なデマルチプレクサの不調を想定し、念のためコンテナを再オープンして継続
-                        try:
-                            container.close()
-                        except Exception as close_ex:
-                            logging.warning(
-                                f'{self.file_path}: Failed to close container after error.',
-                                exc_info=close_ex,
-                            )
-                        try:
-                            container = av.open(str(self.file_path), format=format_name)
-                            video_stream = container.streams.video[0]
-                            video_stream.codec_context.skip_frame = 'NONINTRA'
-                        except Exception as reopen_ex:
-                            logging.error(
-                                f'{self.file_path}: Failed to reopen container after error.',
-                                exc_info=reopen_ex,
-                            )
-                            return None
-            finally:
-                container.close()
-
-            logging.info(f'{self.file_path}: All {len(bgr_frames)} frames extraction completed. ({time.time() - start_time_frame_extraction:.2f} sec)')
+            # フレームが抽出済みでなければ、PyAV で録画ファイルからフレームを抽出する
+            ## キーフレーム情報を使った抽出に失敗した場合は、タイムスタンプでシークする従来の方法で抽出し直す
+            if extracted_frames is not None:
+                bgr_frames = extracted_frames
+            else:
+                result = None
+                if key_frames is not None and len(key_frames) > 0 and self.container_format == 'MPEG-TS':
+                    result = self.__extractFramesByKeyFrames(candidate_offsets, key_frames)
+                if result is None:
+                    result = self.__extractFrames(candidate_offsets)
+                if result is None:
+                    return None
+                bgr_frames = result
 
             # ========== スコアリング処理 ==========
 
@@ -753,6 +684,295 @@ class ThumbnailGenerator:
             return None
 
 
+    def __extractFrames(self, candidate_offsets: list[float]) -> list[NDArray[np.uint8]] | None:
+        """
+        PyAV で録画ファイルの各候補オフセットにシークし、I フレームを1枚ずつ抽出する
+        抽出に失敗したフレームは黒画像で代替される
+
+        Args:
+            candidate_offsets (list[float]): 抽出するフレームのタイムスタンプ (秒) のリスト
+
+        Returns:
+            list[NDArray[np.uint8]] | None: 全フレームの BGR 配列リスト (SCORING_SCALE) (コンテナの再オープンに失敗した場合は None)
+        """
+
+        start_time_frame_extraction = time.time()
+
+        # 結果を格納するリスト
+        scoring_width, scoring_height = self.SCORING_SCALE
+        bgr_frames: list[NDArray[np.uint8]] = []
+
+        # MPEG-TS の場合は format を明示的に指定
+        format_name = 'mpegts' if self.container_format == 'MPEG-TS' else None
+
+        # シーケンシャルにフレームを抽出（HDD への負荷を考慮）
+        container = av.open(str(self.file_path), format=format_name)
+        # PyAV で video stream が存在しない場合は、明示的にエラーとして扱う
+        if len(container.streams.video) == 0:
+            logging.error(f'{self.file_path}: No video stream found in ThumbnailGenerator.')
+            raise ValueError('No video stream found in ThumbnailGenerator.')
+        video_stream = container.streams.video[0]
+        try:
+            # コンテナは 1 回だけ開き、各フレーム抽出で seek を繰り返す
+            ## MPEG-TS でも実測で問題なければ再オープンを避けられるため、まずは 1 回オープンで検証する
+            # I フレームのみデコードする設定（FFmpeg の -skip_frame nointra 相当）
+            video_stream.codec_context.skip_frame = 'NONINTRA'
+
+            for i, offset_sec in enumerate(candidate_offsets):
+                try:
+                    # 指定位置にシーク
+                    # MPEG-TS では start_time が 0 から始まらないことがあるため、start_time を考慮する必要がある
+                    # start_time は pts 単位（90kHz クロックで表現された開始位置）なので、
+                    # offset_sec を pts 単位に変換してから start_time を加算する
+                    if video_stream.time_base is None:
+                        # time_base が None の場合はコンテナ形式に応じてフォールバックする
+                        if self.container_format == 'MPEG-TS':
+                            time_base = 1 / 90000
+                            logging.warning(f'{self.file_path}: time_base is None in ThumbnailGenerator, using fallback: {time_base}')
+                        else:
+                            logging.error(f'{self.file_path}: time_base is None in ThumbnailGenerator for non-TS container.')
+                            raise ValueError('time_base is None in ThumbnailGenerator for non-TS container.')
+                    else:
+                        time_base = float(video_stream.time_base)
+                    start_time = video_stream.start_time if video_stream.start_time else 0
+                    target_ts = int(start_time + offset_sec / time_base)
+                    container.seek(target_ts, backward=True, any_frame=False, stream=video_stream)
+
+                    # seek 後のデコーダ内部状態を初期化し、前回のデコード状態を引きずらないようにする
+                    video_stream.codec_context.flush_buffers()
+
+                    # シーク後、最初のフレームを取得
+                    frame: av.VideoFrame | None = None
+                    for packet in container.demux(video_stream):
+                        for decoded_frame in packet.decode():
+                            frame = cast(av.VideoFrame, decoded_frame)
+                            break
+                        if frame is not None:
+                            break
+
+                    if frame is None:
+                        # フレームが取得できなかった場合は黒画像を使用
+                        logging.warning(f'{self.file_path}: Failed to extract frame at {offset_sec:.2f}s. Using black image.')
+                        black_frame = np.zeros((scoring_height, scoring_width, 3), dtype=np.uint8)
+                        bgr_frames.append(black_frame)
+                        continue
+
+                    # フレームをスコアリング用の BGR 配列に変換して bgr_frames に追加する
+                    bgr_frames.append(self.convertToScoringImage(frame))
+
+                    # 進捗ログ（50フレームごと）
+                    if (i + 1) % 50 == 0:
+                        logging.debug(f'{self.file_path}: Extracted {i + 1}/{len(candidate_offsets)} frames')
+
+                except Exception as ex:
+                    # 個別のフレーム抽出エラーは警告にとどめ、黒画像で代替
+                    logging.warning(
+                        f'{self.file_path}: Error extracting frame at {offset_sec:.2f}s.',
+                        exc_info=ex,
+                    )
+                    black_frame = np.zeros((scoring_height, scoring_width, 3), dtype=np.uint8)
+                    bgr_frames.append(black_frame)
+
+                    # 一時的なデマルチプレクサの不調を想定し、念のためコンテナを再オープンして継続
+                    try:
+                        container.close()
+                    except Exception as close_ex:
+                        logging.warning(
+                            f'{self.file_path}: Failed to close container after error.',
+                            exc_info=close_ex,
+                        )
+                    try:
+                        container = av.open(str(self.file_path), format=format_name)
+                        video_stream = container.streams.video[0]
+                        video_stream.codec_context.skip_frame = 'NONINTRA'
+                    except Exception as reopen_ex:
+                        logging.error(
+                            f'{self.file_path}: Failed to reopen container after error.',
+                            exc_info=reopen_ex,
+                        )
+                        return None
+        finally:
+            container.close()
+
+        logging.info(f'{self.file_path}: All {len(bgr_frames)} frames extraction completed. ({time.time() - start_time_frame_extraction:.2f} sec)')
+
+        return bgr_frames
+
+
+    def __extractFramesByKeyFrames(
+        self,
+        candidate_offsets: list[float],
+        key_frames: NDArray[np.int64],
+    ) -> list[NDArray[np.uint8]] | None:
+        """
+        キーフレーム情報を使い、各候補オフセットの直前のキーフレームの位置 (バイトオフセット) から I フレームを1枚ずつデコードする
+        タイムスタンプでシークする方式と異なり、PyAV が候補オフセットごとに録画ファイル内を二分探索する必要がない
+        候補オフセットは昇順に並んでいるため、録画ファイルは常に先頭から末尾に向かって読み進められる
+
+        Args:
+            candidate_offsets (list[float]): 抽出するフレームのタイムスタンプ (秒) のリスト
+            key_frames (NDArray[np.int64]): 録画ファイルのキーフレーム情報 ([:, 0] が位置、[:, 1] が DTS)
+
+        Returns:
+            list[NDArray[np.uint8]] | None: 全フレームの BGR 配列リスト (SCORING_SCALE) (映像ストリームの情報を取得できなかった場合は None)
+        """
+
+        start_time_frame_extraction = time.time()
+        scoring_width, scoring_height = self.SCORING_SCALE
+
+        with open(str(self.file_path), 'rb') as file:
+
+            # 録画ファイルの先頭の PAT / PMT から、映像ストリームの PID とコーデックを取得する
+            key_frame_indexer = TSKeyFrameIndexer(str(self.file_path))
+            head_data = file.read(TSKeyFrameIndexer.READ_SIZE)
+            sync_offset = TSKeyFrameIndexer.findSyncOffset(head_data, 0)
+            if sync_offset is not None:
+                head_length = (len(head_data) - sync_offset) // ts.PACKET_SIZE * ts.PACKET_SIZE
+                key_frame_indexer.feed(head_data[sync_offset:sync_offset + head_length], sync_offset)
+            if key_frame_indexer.video_pid is None or key_frame_indexer.video_codec is None:
+                logging.warning(f'{self.file_path}: No video stream found in PMT. Falling back to timestamp-based seeking.')
+                return None
+            decoder_name = TSKeyFrameIndexer.DECODER_NAMES[key_frame_indexer.video_codec]
+
+            # キーフレーム情報の最後のエントリは、キーフレームではない「最後の映像フレーム」の場合がある
+            ## そこからは I フレームをデコードできないため、シーク先の候補から除外する
+            ## 最後のエントリが本当のキーフレームだった場合も、1つ前のキーフレームからデコードされるだけなので問題ない
+            if len(key_frames) > 1:
+                key_frames = key_frames[:-1]
+
+            # 各候補オフセットの時刻以前で最も近いキーフレームのインデックスを一括で求める
+            ## 最初のキーフレームより前の候補オフセットは、最初のキーフレームを使う
+            key_frame_dts = key_frames[:, 1]
+            target_dts = int(key_frame_dts[0]) + np.round(np.array(candidate_offsets, dtype=np.float64) * 90000).astype(np.int64)
+            key_frame_indexes = np.maximum(np.searchsorted(key_frame_dts, target_dts, side='right') - 1, 0)
+
+            bgr_frames: list[NDArray[np.uint8]] = []
+            last_key_frame_index: int | None = None
+            last_frame: NDArray[np.uint8] | None = None
+            for i, (offset_sec, key_frame_index) in enumerate(zip(candidate_offsets, key_frame_indexes)):
+                key_frame_index = int(key_frame_index)
+
+                # 直前の候補オフセットと同じキーフレームであれば、デコード済みのフレームを使い回す
+                if key_frame_index != last_key_frame_index or last_frame is None:
+                    last_key_frame_index = key_frame_index
+                    try:
+                        frame = self.__decodeKeyFrame(file, int(key_frames[key_frame_index, 0]), key_frame_indexer.video_pid, decoder_name)
+                    except Exception as ex:
+                        logging.warning(f'{self.file_path}: Error extracting frame at {offset_sec:.2f}s.', exc_info=ex)
+                        frame = None
+                    if frame is None:
+                        # フレームが取得できなかった場合は黒画像を使用
+                        logging.warning(f'{self.file_path}: Failed to extract frame at {offset_sec:.2f}s. Using black image.')
+                        bgr_frames.append(np.zeros((scoring_height, scoring_width, 3), dtype=np.uint8))
+                        last_frame = None
+                        continue
+                    last_frame = self.convertToScoringImage(frame)
+
+                bgr_frames.append(last_frame)
+
+                # 進捗ログ（50フレームごと）
+                if (i + 1) % 50 == 0:
+                    logging.debug(f'{self.file_path}: Extracted {i + 1}/{len(candidate_offsets)} frames')
+
+        logging.info(
+            f'{self.file_path}: All {len(bgr_frames)} frames extraction completed using keyframe index. '
+            f'({time.time() - start_time_frame_extraction:.2f} sec)'
+        )
+
+        return bgr_frames
+
+
+    def __decodeKeyFrame(self, file: BinaryIO, key_frame_offset: int, video_pid: int, decoder_name: str) -> av.VideoFrame | None:
+        """
+        キーフレームの映像 PES の先頭を含む TS パケットの位置から、そのキーフレームの映像データだけを読み込んでデコードする
+        次の映像 PES の先頭が現れるまでを1フレーム分の映像データとし、それ以降は読み込まない
+
+        Args:
+            file (BinaryIO): 録画ファイル
+            key_frame_offset (int): キーフレームの映像 PES の先頭を含む TS パケットのファイル内の位置
+            video_pid (int): 映像ストリームの PID
+            decoder_name (str): PyAV (FFmpeg) のデコーダー名
+
+        Returns:
+            av.VideoFrame | None: デコードしたフレーム (デコードできなかった場合は None)
+        """
+
+        file.seek(key_frame_offset)
+        chunks: list[bytes] = []
+        read_length = 0
+        is_pes_started = False
+        is_pes_finished = False
+        while is_pes_finished is False and read_length < self.MAX_KEY_FRAME_SIZE:
+            data = file.read(self.KEY_FRAME_READ_SIZE)
+            read_length += len(data)
+            packet_count = len(data) // ts.PACKET_SIZE
+            if packet_count == 0:
+                break
+
+            # 同期バイトがずれている TS パケットがあれば、その直前までを処理対象とする
+            packets = np.frombuffer(data, dtype=np.uint8, count=packet_count * ts.PACKET_SIZE).reshape(packet_count, ts.PACKET_SIZE)
+            is_synced = packets[:, 0] == ts.SYNC_BYTE[0]
+            aligned_packet_count = packet_count if bool(is_synced.all()) else int(np.argmin(is_synced))
+
+            # 映像ストリームの TS パケットのうち、キーフレームの PES に含まれるものの映像データを集める
+            pids = ((packets[:aligned_packet_count, 1].astype(np.uint16) & 0x1F) << 8) | packets[:aligned_packet_count, 2]
+            for packet_index in np.flatnonzero(pids == video_pid):
+                packet_offset = int(packet_index) * ts.PACKET_SIZE
+                if (data[packet_offset + 1] & 0x40) != 0:
+                    # 2つ目の映像 PES の先頭に達したら終了
+                    if is_pes_started is True:
+                        is_pes_finished = True
+                        break
+                    is_pes_started = True
+                elif is_pes_started is False:
+                    continue
+                es_range = TSKeyFrameIndexer.getElementaryStreamRange(data, packet_offset)
+                if es_range is not None:
+                    chunks.append(data[es_range[0]:es_range[1]])
+
+            if aligned_packet_count < packet_count:
+                break
+
+        if len(chunks) == 0:
+            return None
+
+        # I フレームのみデコードする設定（FFmpeg の -skip_frame nointra 相当）で、1フレーム分の映像データをデコードする
+        ## 後続のフレームを渡さないため、パーサーとデコーダーをフラッシュして残っているフレームを取り出す
+        decoder = av.CodecContext.create(decoder_name, 'r')
+        decoder.skip_frame = 'NONINTRA'
+        packets_to_decode = [*decoder.parse(b''.join(chunks)), *decoder.parse(None)]
+        for packet in [*packets_to_decode, None]:
+            for decoded_frame in decoder.decode(packet):
+                if isinstance(decoded_frame, av.VideoFrame):
+                    return decoded_frame
+        return None
+
+
+    @classmethod
+    def convertToScoringImage(cls, frame: av.VideoFrame) -> NDArray[np.uint8]:
+        """
+        デコードしたフレームを、スコアリング・代表サムネイル選定用の解像度 (SCORING_SCALE) の BGR 配列に変換する
+
+        Args:
+            frame (av.VideoFrame): デコードしたフレーム
+
+        Returns:
+            NDArray[np.uint8]: 変換後の画像データ (BGR)
+        """
+
+        scoring_width, scoring_height = cls.SCORING_SCALE
+
+        # フレームを numpy 配列に変換
+        img_rgb = frame.to_ndarray(format='rgb24')
+
+        # リサイズを実行
+        ## 1440x1080 から一気に 480x270 まで縮小するため INTER_AREA を使う
+        img_resized = cv2.resize(img_rgb, (scoring_width, scoring_height), interpolation=cv2.INTER_AREA)
+
+        # RGB から OpenCV 向けの BGR に変換する
+        return cast(NDArray[np.uint8], cv2.cvtColor(img_resized, cv2.COLOR_RGB2BGR))
+
+
     def __saveRepresentativeThumbnail(self, img_bgr: NDArray[np.uint8]) -> bool:
         """
         代表サムネイルを WebP ファイルに同期的に保存する
@@ -1022,7 +1242,7 @@ class ThumbnailGenerator:
         return True
 
 
-    async def __saveThumbnailInfoToDB(self) -> None:
+    async def saveThumbnailInfoToDB(self) -> None:
         """
         生成済みサムネイル情報を DB に保存する
         再生成の場合、既存のサムネイル情報は上書きされる（この時点でサムネイル自体が上書き保存されているので正常な挙動）
@@ -1140,7 +1360,7 @@ class ThumbnailGenerator:
         )
 
         # サムネイル情報を DB に保存
-        await self.__saveThumbnailInfoToDB()
+        await self.saveThumbnailInfoToDB()
 
         return True
 
@@ -1775,6 +1995,7 @@ if __name__ == "__main__":
     # デバッグ用 CLI
     # Usage:
     #   poetry run python -m app.metadata.ThumbnailGenerator generate /path/to/recorded_file.ts
+    #   poetry run python -m app.metadata.ThumbnailGenerator benchmark /path/to/recorded_file.ts
     #   poetry run python -m app.metadata.ThumbnailGenerator migrate <file_hash> <duration_sec>
     app = typer.Typer()
 
@@ -1838,6 +2059,69 @@ if __name__ == "__main__":
         # サムネイルを生成
         asyncio.run(generator.generateAndSave())
 
+    @app.command()
+    def benchmark(
+        file_path: pathlib.Path = typer.Argument(
+            ...,
+            exists=True,
+            file_okay=True,
+            dir_okay=False,
+            readable=True,
+            resolve_path=True,
+            help="MPEG-TS 形式の録画ファイルのパス",
+        ),
+    ) -> None:
+        """
+        キーフレーム情報を使う場合と使わない場合で、フレーム抽出を含むサムネイル生成にかかる時間を比較する
+        条件を揃えるため、各計測の前に録画ファイルをページキャッシュから追い出してからディスクから読み込ませる
+        生成したサムネイルは通常のサムネイル生成と同じ場所に上書き保存される
+        """
+
+        # 設定を読み込む (必須)
+        LoadConfig(bypass_validation=True)
+
+        # メタデータを解析
+        from app.metadata.MetadataAnalyzer import MetadataAnalyzer
+        analyzer = MetadataAnalyzer(file_path)
+        recorded_program = analyzer.analyze()
+        if recorded_program is None or recorded_program.recorded_video.container_format != 'MPEG-TS':
+            print(f'Error: {file_path} is not a valid MPEG-TS recorded file.')
+            return
+
+        generator = ThumbnailGenerator.fromRecordedProgram(recorded_program)
+        candidate_offsets = generator.calculateCandidateOffsets()
+
+        # キーフレーム情報を解析する
+        start_time = time.time()
+        key_frames = np.array(
+            [(key_frame['offset'], key_frame['dts']) for key_frame in TSKeyFrameIndexer(str(file_path)).iterKeyFrames()],
+            dtype=RecordedVideo.KEY_FRAME_DTYPE,
+        ).reshape(-1, 2)
+        logging.info(f'Keyframe analysis completed. ({len(key_frames)} keyframes found / {time.time() - start_time:.2f} sec)')
+
+        def DropPageCache() -> None:
+            """ 録画ファイルをページキャッシュから追い出す (posix_fadvise() に対応していない OS では何もしない) """
+            if hasattr(os, 'posix_fadvise'):
+                fd = os.open(file_path, os.O_RDONLY)
+                try:
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                finally:
+                    os.close(fd)
+
+        # キーフレーム情報を使わない場合と使う場合で、それぞれサムネイル生成にかかる時間を計測する
+        elapsed_times: dict[str, float] = {}
+        for label, benchmark_key_frames in (('without keyframe index', None), ('with keyframe index', key_frames)):
+            DropPageCache()
+            start_time = time.time()
+            success = generator.generateAndSaveThumbnails(candidate_offsets, generator.tile_rows, None, benchmark_key_frames)
+            elapsed_times[label] = time.time() - start_time
+            logging.info(f'Thumbnail generation {label}: {elapsed_times[label]:.2f} sec ({"succeeded" if success else "failed"})')
+
+        logging.info(
+            f'{len(candidate_offsets)} tiles / duration: {generator.duration_sec:.0f} sec / '
+            f'speedup with keyframe index: x{elapsed_times["without keyframe index"] / max(elapsed_times["with keyframe index"], 0.001):.2f}'
+        )
+
     @app.command()
     def migrate(
         recorded_video_id: int = typer.Argument(
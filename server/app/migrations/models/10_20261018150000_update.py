@@ -0,0 +1,16 @@
+
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        -- Index matching the (start_time, id) sort order of the recorded programs list, used for keyset pagination
+        CREATE INDEX IF NOT EXISTS "recorded_programs_start_time_id" ON "recorded_programs" ("start_time", "id");
+    """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        -- Remove keyset pagination index
+        DROP INDEX IF EXISTS "recorded_programs_start_time_id";
+    """
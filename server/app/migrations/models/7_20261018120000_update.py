@@ -0,0 +1,83 @@
+
+import json
+import struct
+
+from tortoise import BaseDBAsyncClient
+
+
+# 一度に変換するレコード数
+## key_frames は1レコードあたり数百 KB になることもあるため、全件を一度に読み込まないようにする
+CONVERT_BATCH_SIZE = 100
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+
+    # key_frames (JSON) を変換した結果を格納するカラムを先に追加する
+    await db.execute_script("""
+        -- Add key_frames_data as a BLOB column storing packed little-endian int64 (offset, dts) pairs
+        ALTER TABLE "recorded_videos" ADD COLUMN "key_frames_data" BLOB NOT NULL DEFAULT x'';
+        -- Add key_frame_count so that the presence of keyframes can be checked without reading key_frames_data
+        ALTER TABLE "recorded_videos" ADD COLUMN "key_frame_count" INT NOT NULL DEFAULT 0;
+    """)
+
+    # 既存のキーフレーム情報を JSON からバイナリに変換する
+    last_id = 0
+    while True:
+        rows = await db.execute_query_dict(
+            'SELECT "id", "key_frames" FROM "recorded_videos" WHERE "id" > ? AND "key_frames" != \'[]\' ORDER BY "id" LIMIT ?',
+            [last_id, CONVERT_BATCH_SIZE],
+        )
+        if len(rows) == 0:
+            break
+        for row in rows:
+            last_id = row['id']
+            try:
+                key_frames = json.loads(row['key_frames'])
+                key_frames_data = b''.join(struct.pack('<qq', int(kf['offset']), int(kf['dts'])) for kf in key_frames)
+            except (TypeError, ValueError, KeyError):
+                # 壊れたキーフレーム情報は変換せず、キーフレーム未解析の状態として扱う (バックグラウンド解析で再生成される)
+                continue
+            await db.execute_query(
+                'UPDATE "recorded_videos" SET "key_frames_data" = ?, "key_frame_count" = ? WHERE "id" = ?',
+                [key_frames_data, len(key_frames), row['id']],
+            )
+
+    return """
+        -- Remove the JSON key_frames column, which has been converted to key_frames_data
+        ALTER TABLE "recorded_videos" DROP COLUMN "key_frames";
+    """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+
+    # バイナリのキーフレーム情報を JSON に戻すカラムを先に追加する
+    await db.execute_script("""
+        -- Restore key_frames as a JSON column
+        ALTER TABLE "recorded_videos" ADD COLUMN "key_frames" JSON NOT NULL DEFAULT '[]';
+    """)
+
+    # 既存のキーフレーム情報をバイナリから JSON に変換する
+    last_id = 0
+    while True:
+        rows = await db.execute_query_dict(
+            'SELECT "id", "key_frames_data" FROM "recorded_videos" WHERE "id" > ? AND "key_frame_count" > 0 ORDER BY "id" LIMIT ?',
+            [last_id, CONVERT_BATCH_SIZE],
+        )
+        if len(rows) == 0:
+            break
+        for row in rows:
+            last_id = row['id']
+            key_frames = [
+                {'offset': offset, 'dts': dts}
+                for offset, dts in struct.iter_unpack('<qq', bytes(row['key_frames_data']))
+            ]
+            await db.execute_query(
+                'UPDATE "recorded_videos" SET "key_frames" = ? WHERE "id" = ?',
+                [json.dumps(key_frames, ensure_ascii=False), row['id']],
+            )
+
+    return """
+        -- Remove key_frames_data and key_frame_count columns
+        ALTER TABLE "recorded_videos" DROP COLUMN "key_frames_data";
+        ALTER TABLE "recorded_videos" DROP COLUMN "key_frame_count";
+    """
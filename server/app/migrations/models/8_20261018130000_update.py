@@ -0,0 +1,16 @@
+
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        -- Add payload_hash for diff-based program updates (existing rows are rewritten once on the next update)
+        ALTER TABLE "programs" ADD COLUMN "payload_hash" VARCHAR(32) NOT NULL DEFAULT '';
+    """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        -- Remove payload_hash column
+        ALTER TABLE "programs" DROP COLUMN "payload_hash";
+    """
@@ -0,0 +1,68 @@
+
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        -- Full-text search index for recorded programs (trigram tokenizer works with Japanese text without word segmentation)
+        CREATE VIRTUAL TABLE IF NOT EXISTS "recorded_programs_fts" USING fts5(
+            "title", "series_title", "subtitle", "channel_name",
+            tokenize = 'trigram'
+        );
+        INSERT INTO "recorded_programs_fts" ("rowid", "title", "series_title", "subtitle", "channel_name")
+            SELECT rp."id", rp."title", COALESCE(rp."series_title", ''), COALESCE(rp."subtitle", ''), COALESCE(ch."name", '')
+            FROM "recorded_programs" rp LEFT JOIN "channels" ch ON rp."channel_id" = ch."id";
+        -- Keep recorded_programs_fts in sync with recorded_programs
+        CREATE TRIGGER IF NOT EXISTS "recorded_programs_fts_insert" AFTER INSERT ON "recorded_programs" BEGIN
+            INSERT INTO "recorded_programs_fts" ("rowid", "title", "series_title", "subtitle", "channel_name")
+            VALUES (NEW."id", NEW."title", COALESCE(NEW."series_title", ''), COALESCE(NEW."subtitle", ''),
+                COALESCE((SELECT "name" FROM "channels" WHERE "id" = NEW."channel_id"), ''));
+        END;
+        CREATE TRIGGER IF NOT EXISTS "recorded_programs_fts_update" AFTER UPDATE OF "title", "series_title", "subtitle", "channel_id" ON "recorded_programs" BEGIN
+            DELETE FROM "recorded_programs_fts" WHERE "rowid" = OLD."id";
+            INSERT INTO "recorded_programs_fts" ("rowid", "title", "series_title", "subtitle", "channel_name")
+            VALUES (NEW."id", NEW."title", COALESCE(NEW."series_title", ''), COALESCE(NEW."subtitle", ''),
+                COALESCE((SELECT "name" FROM "channels" WHERE "id" = NEW."channel_id"), ''));
+        END;
+        CREATE TRIGGER IF NOT EXISTS "recorded_programs_fts_delete" AFTER DELETE ON "recorded_programs" BEGIN
+            DELETE FROM "recorded_programs_fts" WHERE "rowid" = OLD."id";
+        END;
+        -- Channel names are denormalized into recorded_programs_fts, so follow renames (channels are saved frequently, so only when the name actually changes)
+        CREATE TRIGGER IF NOT EXISTS "recorded_programs_fts_channel_rename" AFTER UPDATE OF "name" ON "channels" WHEN OLD."name" IS NOT NEW."name" BEGIN
+            UPDATE "recorded_programs_fts" SET "channel_name" = NEW."name"
+            WHERE "rowid" IN (SELECT "id" FROM "recorded_programs" WHERE "channel_id" = NEW."id");
+        END;
+        -- Full-text search index for series
+        CREATE VIRTUAL TABLE IF NOT EXISTS "series_fts" USING fts5(
+            "title", "description",
+            tokenize = 'trigram'
+        );
+        INSERT INTO "series_fts" ("rowid", "title", "description")
+            SELECT "id", "title", "description" FROM "series";
+        -- Keep series_fts in sync with series
+        CREATE TRIGGER IF NOT EXISTS "series_fts_insert" AFTER INSERT ON "series" BEGIN
+            INSERT INTO "series_fts" ("rowid", "title", "description") VALUES (NEW."id", NEW."title", NEW."description");
+        END;
+        CREATE TRIGGER IF NOT EXISTS "series_fts_update" AFTER UPDATE OF "title", "description" ON "series" BEGIN
+            DELETE FROM "series_fts" WHERE "rowid" = OLD."id";
+            INSERT INTO "series_fts" ("rowid", "title", "description") VALUES (NEW."id", NEW."title", NEW."description");
+        END;
+        CREATE TRIGGER IF NOT EXISTS "series_fts_delete" AFTER DELETE ON "series" BEGIN
+            DELETE FROM "series_fts" WHERE "rowid" = OLD."id";
+        END;
+    """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        -- Remove full-text search indexes and their sync triggers
+        DROP TRIGGER IF EXISTS "recorded_programs_fts_insert";
+        DROP TRIGGER IF EXISTS "recorded_programs_fts_update";
+        DROP TRIGGER IF EXISTS "recorded_programs_fts_delete";
+        DROP TRIGGER IF EXISTS "recorded_programs_fts_channel_rename";
+        DROP TABLE IF EXISTS "recorded_programs_fts";
+        DROP TRIGGER IF EXISTS "series_fts_insert";
+        DROP TRIGGER IF EXISTS "series_fts_update";
+        DROP TRIGGER IF EXISTS "series_fts_delete";
+        DROP TABLE IF EXISTS "series_fts";
+    """
@@ -15,12 +15,15 @@ from tortoise.models import Model as TortoiseModel
 
 from app import logging
 from app.config import Config
-from app.constants import HTTPX_CLIENT, JST
+from app.constants import JST, LOGO_DIR
 from app.utils import GetMirakurunAPIEndpointURL
+from app.utils.ChannelLogoCache import ChannelLogoCache
 from app.utils.edcb import ChSet5Item
-from app.utils.edcb.CtrlCmdUtil import CtrlCmdUtil
+from app.utils.edcb.CachedCtrlCmdUtil import CachedCtrlCmdUtil
 from app.utils.edcb.EDCBUtil import EDCBUtil
+from app.utils.HTTPClientPool import HTTPClientPool
 from app.utils.JikkyoClient import JikkyoClient
+from app.utils.ProgramPFIndex import ProgramPFIndex
 from app.utils.TSInformation import TSInformation
 
 
@@ -116,6 +119,15 @@ class Channel(TortoiseModel):
         except Exception as ex:
             logging.error('Failed to update channels:', exc_info=ex)
 
+        # 同梱のロゴがないチャンネルの局ロゴを、バックグラウンドで EDCB / Mirakurun から取得してキャッシュしておく
+        ## EDCB は EPG の取得時にロゴを保存するため、メモしている LogoData.ini とディレクトリ一覧も取得し直す
+        ## 同梱のロゴの有無はサブチャンネルなどの判定を省いた簡易的なもので、キャッシュの対象が多少多くなっても問題はない
+        ChannelLogoCache.invalidateEDCBLogoIndex()
+        ChannelLogoCache.startWarming([
+            (channel.network_id, channel.service_id) for channel in await cls.filter(is_watchable=True)
+            if not (LOGO_DIR / f'{channel.id}.png').exists()
+        ])
+
         logging.info(f'Channels update complete. ({round(time.time() - timestamp, 3)} sec)')
 
 
@@ -133,8 +145,8 @@ class Channel(TortoiseModel):
             # Mirakurun / mirakc の API からチャンネル情報を取得する
             try:
                 mirakurun_services_api_url = GetMirakurunAPIEndpointURL('/api/services')
-                async with HTTPX_CLIENT() as client:
-                    mirakurun_services_api_response = await client.get(mirakurun_services_api_url, timeout=5)
+                client = HTTPClientPool.get('Mirakurun')
+                mirakurun_services_api_response = await client.get(mirakurun_services_api_url, timeout=5)
                 if mirakurun_services_api_response.status_code != 200:  # Mirakurun / mirakc からエラーが返ってきた
                     logging.error(f'Failed to get channels from Mirakurun / mirakc. (HTTP Error {mirakurun_services_api_response.status_code})')
                     raise Exception(f'Failed to get channels from Mirakurun / mirakc. (HTTP Error {mirakurun_services_api_response.status_code})')
@@ -324,7 +336,7 @@ class Channel(TortoiseModel):
             backup_remocon_ids: dict[str, int] = {channel.id: channel.remocon_id for channel in await Channel.filter(is_watchable=True)}
 
             # CtrlCmdUtil を初期化
-            edcb = CtrlCmdUtil()
+            edcb = CachedCtrlCmdUtil()
             edcb.setConnectTimeOutSec(5)  # 5秒後にタイムアウト
 
             # EDCB の ChSet5.txt からチャンネル情報を取得する
@@ -643,3 +655,6 @@ class Channel(TortoiseModel):
             if status is not None and status['force'] != -1:
                 channel.jikkyo_force = status['force']
                 await channel.save()
+
+        # チャンネル情報一覧 API が参照するチャンネル情報のインデックスに実況勢いを反映する
+        await ProgramPFIndex.rebuildChannels()
@@ -6,10 +6,11 @@ from __future__ import annotations
 import asyncio
 import concurrent.futures
 import gc
+import hashlib
 import json
 import time
 from datetime import datetime, timedelta
-from typing import Any, cast
+from typing import Any, ClassVar, cast
 
 import ariblib.constants
 import httpx
@@ -19,12 +20,14 @@ from tortoise.models import Model as TortoiseModel
 
 from app import logging
 from app.config import Config, LoadConfig
-from app.constants import DATABASE_CONFIG, HTTPX_CLIENT, JST
+from app.constants import DATABASE_CONFIG, JST
 from app.models.Channel import Channel
 from app.schemas import Genre
 from app.utils import GetMirakurunAPIEndpointURL
 from app.utils.edcb.CtrlCmdUtil import CtrlCmdUtil
 from app.utils.edcb.EDCBUtil import EDCBUtil
+from app.utils.HTTPClientPool import HTTPClientPool
+from app.utils.ProgramPFIndex import ProgramPFIndex
 from app.utils.TSInformation import TSInformation
 
 
@@ -58,6 +61,20 @@ class Program(TortoiseModel):
     secondary_audio_type = cast(TortoiseField[str | None], fields.TextField(null=True))
     secondary_audio_language = cast(TortoiseField[str | None], fields.TextField(null=True))
     secondary_audio_sampling_rate = cast(TortoiseField[str | None], fields.TextField(null=True))
+    # 番組情報の差分更新に使う、正規化した番組情報のハッシュ
+    payload_hash = fields.CharField(32, default='')
+
+    # payload_hash の算出対象のフィールド
+    PAYLOAD_HASH_FIELDS: ClassVar[tuple[str, ...]] = (
+        'channel_id', 'network_id', 'service_id', 'event_id', 'title', 'description', 'detail',
+        'start_time', 'end_time', 'duration', 'is_free', 'genres', 'video_type', 'video_codec', 'video_resolution',
+        'primary_audio_type', 'primary_audio_language', 'primary_audio_sampling_rate',
+        'secondary_audio_type', 'secondary_audio_language', 'secondary_audio_sampling_rate',
+    )
+
+    # 番組情報を DB に一括で書き込む際の1クエリあたりの最大件数
+    ## SQLite のプレースホルダ数の上限を超えないようにする
+    BULK_WRITE_BATCH_SIZE: ClassVar[int] = 500
 
 
     @classmethod
@@ -112,6 +129,13 @@ class Program(TortoiseModel):
             except Exception as ex:
                 logging.error('Failed to update programs:', exc_info=ex)
 
+        # チャンネル情報一覧 API が参照する現在/次の番組情報のインデックスを再構築する
+        ## 番組情報の更新は別プロセスで行われる場合もあるため、必ずメインプロセスの DB から読み込み直す
+        try:
+            await ProgramPFIndex.rebuild()
+        except Exception as ex:
+            logging.error('Failed to rebuild the program p/f index:', exc_info=ex)
+
         logging.info(f'Programs update complete. ({round(time.time() - timestamp, 3)} sec)')
 
 
@@ -197,9 +221,9 @@ class Program(TortoiseModel):
                 # Mirakurun / mirakc の API から番組情報を取得する
                 try:
                     mirakurun_programs_api_url = GetMirakurunAPIEndpointURL('/api/programs')
-                    async with HTTPX_CLIENT() as client:
-                        # 10秒後にタイムアウト (SPHD や CATV も映る環境だと時間がかかるので、少し伸ばす)
-                        mirakurun_programs_api_response = await client.get(mirakurun_programs_api_url, timeout=10)
+                    client = HTTPClientPool.get('Mirakurun')
+                    # 10秒後にタイムアウト (SPHD や CATV も映る環境だと時間がかかるので、少し伸ばす)
+                    mirakurun_programs_api_response = await client.get(mirakurun_programs_api_url, timeout=10)
                     if mirakurun_programs_api_response.status_code != 200:  # Mirakurun / mirakc からエラーが返ってきた
                         logging.error(f'Failed to get programs from Mirakurun / mirakc. (HTTP Error {mirakurun_programs_api_response.status_code})')
                         raise Exception(f'Failed to get programs from Mirakurun / mirakc. (HTTP Error {mirakurun_programs_api_response.status_code})')
@@ -211,8 +235,14 @@ class Program(TortoiseModel):
                     logging.error('Failed to get programs from Mirakurun / mirakc. (Connection Timeout)')
                     raise ex
 
-                # この変数から更新or更新不要な番組情報を削除していき、残った古い番組情報を最後にまとめて削除する
-                duplicate_programs = {temp.id:temp for temp in await Program.all()}
+                # 既存の番組情報の ID → (ペイロードのハッシュ, 番組終了時刻) の辞書
+                ## この変数から更新or更新不要な番組情報を削除していき、残った古い番組情報を最後にまとめて削除する
+                existing_programs = await cls.getExistingPrograms()
+
+                # 追加・更新する番組情報 (番組 ID をキーにした辞書)
+                programs_to_save: dict[str, Program] = {}
+                added_count = 0
+                unchanged_count = 0
 
                 # チャンネル情報を取得
                 # NID32736-SID1024 形式の ID をキーにした辞書にまとめる
@@ -280,31 +310,11 @@ class Program(TortoiseModel):
                     # 番組 ID
                     program_id = f'NID{program_info["networkId"]}-SID{program_info["serviceId"]:03d}-EID{program_info["eventId"]}'
 
-                    # 重複する番組 ID の番組情報があれば取得する
-                    duplicate_program = duplicate_programs.get(program_id)
-
-                    # 重複する番組情報があり、かつタイトル・番組概要・番組詳細・番組開始時刻・番組終了時刻が全て同じ
-                    if (duplicate_program is not None and
-                        duplicate_program.title == title and
-                        duplicate_program.description == description and
-                        len(duplicate_program.detail) == len(detail) and
-                        duplicate_program.start_time == start_time and
-                        duplicate_program.end_time == end_time):
-
-                        # 更新不要なのでスキップ
-                        del duplicate_programs[program_id]
-                        continue
-
-                    # 重複する番組情報が存在しない（追加）
-                    if duplicate_program is None:
-                        program = Program()
-
-                    # 重複する番組情報が存在する（更新）
-                    else:
-                        del duplicate_programs[program_id]  # 参照を削除
-                        program = duplicate_program
+                    # 重複する番組 ID の番組情報があれば取得する (参照も削除する)
+                    duplicate_program = existing_programs.pop(program_id, None)
 
                     # 取得してきた値を設定
+                    program = Program()
                     program.id = program_id
                     program.channel_id = channel.id
                     program.network_id = int(channel.network_id)
@@ -324,10 +334,10 @@ class Program(TortoiseModel):
                     ## 基本的には EIT[p/f] 由来の「終了時間未定」が降ってくる前に EIT[schedule] 由来の番組時間を取得しているはず
                     ## 「終了時間未定」だと番組表の整合性が壊れるので、実態と一致しないとしても EIT[schedule] 由来の番組時間を優先したい
                     if program_info['duration'] == 1:
-                        if program.duration is None:  # 番組情報をまだ取得していない
+                        if duplicate_program is None:  # 番組情報をまだ取得していない
                             program.end_time = start_time + timedelta(minutes=5)
                         else:  # すでに番組情報を取得しているので以前取得した値をそのまま使う
-                            pass
+                            program.end_time = duplicate_program[1]
                     else:
                         program.end_time = end_time
                     program.duration = (program.end_time - program.start_time).total_seconds()
@@ -422,46 +432,36 @@ class Program(TortoiseModel):
                         if program.primary_audio_type == '1/0+1/0モード(デュアルモノ)':
                             program.primary_audio_language = '日本語+英語'  # 日本語+英語で固定
 
-                    # 番組情報をデータベースに保存する
+                    # 正規化した番組情報のハッシュが既存の番組情報と同じなら、更新不要なのでスキップ
+                    program.payload_hash = program.calculatePayloadHash()
+                    if duplicate_program is not None and duplicate_program[0] == program.payload_hash:
+                        unchanged_count += 1
+                        continue
+
+                    # 番組情報を保存対象に追加する (保存は最後にまとめて行う)
                     if duplicate_program is None:
                         logging.debug(f'Add Program: {program.id}')
+                        added_count += 1
                     else:
                         logging.debug(f'Update Program: {program.id}')
+                    programs_to_save[program.id] = program
 
-                    ## マルチプロセス実行時は、まれに保存する際にメインプロセスにデータベースがロックされている事がある
-                    ## 3秒待ってから再試行し、それでも失敗した場合はスキップ
-                    try:
-                        await program.save()
-                    except exceptions.OperationalError:
-                        try:
-                            await asyncio.sleep(3)
-                            await program.save()
-                        except exceptions.OperationalError:
-                            pass
-
-                # この時点で残存している番組情報は放送が終わって EPG から削除された番組なので、まとめて削除する
-                # ここで削除しないと終了した番組の情報が幽霊のように残り続ける事になり、結果 DB が肥大化して遅くなってしまう
-                for duplicate_program in duplicate_programs.values():
-                    logging.debug(f'Delete Program: {duplicate_program.id}')
-                    try:
-                        await duplicate_program.delete()
-                    except exceptions.OperationalError:
-                        try:
-                            await asyncio.sleep(3)
-                            await duplicate_program.delete()
-                        except exceptions.OperationalError:
-                            pass
+                # 追加・更新する番組情報と、放送が終わって EPG から削除された番組情報をまとめて DB に反映する
+                ## この時点で existing_programs に残存している番組情報は放送が終わって EPG から削除された番組
+                ## ここで削除しないと終了した番組の情報が幽霊のように残り続ける事になり、結果 DB が肥大化して遅くなってしまう
+                await cls.applyChanges(list(programs_to_save.values()), list(existing_programs.keys()), added_count, unchanged_count)
 
 
         # マルチプロセス実行時は、明示的に例外を拾わないとなぜかメインプロセスも含め全体がフリーズしてしまう
         except Exception as ex:
             logging.error('Failed to update programs from Mirakurun:', exc_info=ex)
 
-        # マルチプロセス実行時は、開いた Tortoise ORM のコネクションを明示的に閉じる
+        # マルチプロセス実行時は、開いた Tortoise ORM のコネクションと HTTP クライアントを明示的に閉じる
         # コネクションを閉じないと Ctrl+C を押下しても終了できない
         finally:
             if is_running_multiprocess:
                 await Tortoise.close_connections()
+                await HTTPClientPool.closeAll()
 
 
     @classmethod
@@ -500,8 +500,14 @@ class Program(TortoiseModel):
                     logging.error('Failed to get programs from EDCB.')
                     raise Exception('Failed to get programs from EDCB.')
 
-                # この変数から更新or更新不要な番組情報を削除していき、残った古い番組情報を最後にまとめて削除する
-                duplicate_programs = {temp.id:temp for temp in await Program.all()}
+                # 既存の番組情報の ID → (ペイロードのハッシュ, 番組終了時刻) の辞書
+                ## この変数から更新or更新不要な番組情報を削除していき、残った古い番組情報を最後にまとめて削除する
+                existing_programs = await cls.getExistingPrograms()
+
+                # 追加・更新する番組情報 (番組 ID をキーにした辞書)
+                programs_to_save: dict[str, Program] = {}
+                added_count = 0
+                unchanged_count = 0
 
                 # チャンネルごとに
                 for service_event_info in service_event_info_list:
@@ -584,31 +590,11 @@ class Program(TortoiseModel):
                         # 番組 ID
                         program_id = f'NID{nid}-SID{sid:03d}-EID{event_info["eid"]}'
 
-                        # 重複する番組 ID の番組情報があれば取得する
-                        duplicate_program = duplicate_programs.get(program_id)
-
-                        # 重複する番組情報があり、かつタイトル・番組概要・番組詳細・番組開始時刻・番組終了時刻が全て同じ
-                        if (duplicate_program is not None and
-                            duplicate_program.title == title and
-                            duplicate_program.description == description and
-                            len(duplicate_program.detail) == len(detail) and
-                            duplicate_program.start_time == start_time and
-                            duplicate_program.end_time == end_time):
-
-                            # 更新不要なのでスキップ
-                            del duplicate_programs[program_id]
-                            continue
-
-                        # 重複する番組情報が存在しない（追加）
-                        if duplicate_program is None:
-                            program = Program()
-
-                        # 重複する番組情報が存在する（更新）
-                        else:
-                            del duplicate_programs[program_id]  # 参照を削除
-                            program = duplicate_program
+                        # 重複する番組 ID の番組情報があれば取得する (参照も削除する)
+                        duplicate_program = existing_programs.pop(program_id, None)
 
                         # 取得してきた値を設定
+                        program = Program()
                         program.id = program_id
                         program.channel_id = channel.id
                         program.network_id = channel.network_id
@@ -708,35 +694,24 @@ class Program(TortoiseModel):
                                     else:
                                         program.secondary_audio_language += '+副音声'
 
-                        # 番組情報をデータベースに保存する
+                        # 正規化した番組情報のハッシュが既存の番組情報と同じなら、更新不要なのでスキップ
+                        program.payload_hash = program.calculatePayloadHash()
+                        if duplicate_program is not None and duplicate_program[0] == program.payload_hash:
+                            unchanged_count += 1
+                            continue
+
+                        # 番組情報を保存対象に追加する (保存は最後にまとめて行う)
                         if duplicate_program is None:
                             logging.debug(f'Add Program: {program.id}')
+                            added_count += 1
                         else:
                             logging.debug(f'Update Program: {program.id}')
+                        programs_to_save[program.id] = program
 
-                        ## マルチプロセス実行時は、まれに保存する際にメインプロセスにデータベースがロックされている事がある
-                        ## 3秒待ってから再試行し、それでも失敗した場合はスキップ
-                        try:
-                            await program.save()
-                        except exceptions.OperationalError:
-                            try:
-                                await asyncio.sleep(3)
-                                await program.save()
-                            except exceptions.OperationalError:
-                                pass
-
-                # この時点で残存している番組情報は放送が終わって EPG から削除された番組なので、まとめて削除する
-                # ここで削除しないと終了した番組の情報が幽霊のように残り続ける事になり、結果 DB が肥大化して遅くなってしまう
-                for duplicate_program in duplicate_programs.values():
-                    logging.debug(f'Delete Program: {duplicate_program.id}')
-                    try:
-                        await duplicate_program.delete()
-                    except exceptions.OperationalError:
-                        try:
-                            await asyncio.sleep(3)
-                            await duplicate_program.delete()
-                        except exceptions.OperationalError:
-                            pass
+                # 追加・更新する番組情報と、放送が終わって EPG から削除された番組情報をまとめて DB に反映する
+                ## この時点で existing_programs に残存している番組情報は放送が終わって EPG から削除された番組
+                ## ここで削除しないと終了した番組の情報が幽霊のように残り続ける事になり、結果 DB が肥大化して遅くなってしまう
+                await cls.applyChanges(list(programs_to_save.values()), list(existing_programs.keys()), added_count, unchanged_count)
 
         # マルチプロセス実行時は、明示的に例外を拾わないとなぜかメインプロセスも含め全体がフリーズしてしまう
         except Exception as ex:
@@ -752,6 +727,86 @@ class Program(TortoiseModel):
         gc.collect()
 
 
+    @classmethod
+    async def getExistingPrograms(cls) -> dict[str, tuple[str, datetime]]:
+        """
+        DB に保存されている番組情報のうち、差分更新に必要な最低限の情報のみを取得する
+        番組情報のモデルをすべて構築すると時間とメモリがかかるため、ID・ペイロードのハッシュ・番組終了時刻のみを取得する
+
+        Returns:
+            dict[str, tuple[str, datetime]]: 番組 ID → (ペイロードのハッシュ, 番組終了時刻) の辞書
+        """
+
+        rows = await Program.all().values_list('id', 'payload_hash', 'end_time')
+        return {cast(str, row[0]): (cast(str, row[1]), cast(datetime, row[2])) for row in rows}
+
+
+    def calculatePayloadHash(self) -> str:
+        """
+        正規化した番組情報のハッシュを算出する
+        番組情報の内容が前回の更新時から変わっていないかの判定に使う
+
+        Returns:
+            str: 番組情報のハッシュ (MD5 の16進数表現)
+        """
+
+        # 日時はタイムゾーンの違いで表現が変わらないよう、UNIX タイムスタンプに変換する
+        payload = json.dumps(
+            [getattr(self, field_name) for field_name in self.PAYLOAD_HASH_FIELDS],
+            ensure_ascii=False,
+            default=lambda value: value.timestamp(),
+        )
+        return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+    @classmethod
+    async def applyChanges(cls, programs_to_save: list[Program], program_ids_to_delete: list[str], added_count: int, unchanged_count: int) -> None:
+        """
+        番組情報の差分をまとめて DB に反映する
+        追加・更新は INSERT ... ON CONFLICT DO UPDATE による一括 upsert で、削除は IN 句による一括削除で行う
+
+        Args:
+            programs_to_save (list[Program]): 追加・更新する番組情報
+            program_ids_to_delete (list[str]): 削除する番組情報の ID
+            added_count (int): programs_to_save のうち新規に追加される番組情報の数 (ログ出力用)
+            unchanged_count (int): 更新不要だった番組情報の数 (ログ出力用)
+        """
+
+        timestamp = time.time()
+        update_fields = sorted(field_name for field_name in cls._meta.db_fields if field_name != 'id')
+
+        async def Apply() -> None:
+            if len(programs_to_save) > 0:
+                await Program.bulk_create(
+                    programs_to_save,
+                    batch_size = cls.BULK_WRITE_BATCH_SIZE,
+                    on_conflict = ['id'],
+                    update_fields = update_fields,
+                )
+            for index in range(0, len(program_ids_to_delete), cls.BULK_WRITE_BATCH_SIZE):
+                batch_program_ids = program_ids_to_delete[index:index + cls.BULK_WRITE_BATCH_SIZE]
+                for program_id in batch_program_ids:
+                    logging.debug(f'Delete Program: {program_id}')
+                await Program.filter(id__in=batch_program_ids).delete()
+
+        ## マルチプロセス実行時は、まれに保存する際にメインプロセスにデータベースがロックされている事がある
+        ## 3秒待ってから再試行し、それでも失敗した場合はスキップ
+        try:
+            await Apply()
+        except exceptions.OperationalError:
+            try:
+                await asyncio.sleep(3)
+                await Apply()
+            except exceptions.OperationalError as ex:
+                logging.warning('Failed to apply program changes. (Database is locked)', exc_info=ex)
+                return
+
+        logging.info(
+            f'Program changes applied. (Added: {added_count} / Updated: {len(programs_to_save) - added_count} / '
+            f'Deleted: {len(program_ids_to_delete)} / Unchanged: {unchanged_count}) ({round(time.time() - timestamp, 3)} sec)'
+        )
+
+
     @classmethod
     def updateFromMirakurunForMultiProcess(cls) -> None:
         """
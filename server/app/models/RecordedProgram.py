@@ -4,7 +4,7 @@
 from __future__ import annotations
 
 import json
-from typing import TYPE_CHECKING, cast
+from typing import TYPE_CHECKING, ClassVar, cast
 
 from tortoise import fields
 from tortoise.fields import Field as TortoiseField
@@ -60,3 +60,50 @@ class RecordedProgram(TortoiseModel):
     secondary_audio_language = cast(TortoiseField[str | None], fields.TextField(null=True))
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
+
+    # 録画番組の総数のキャッシュ (まだ数えていない場合は None)
+    ## 録画番組一覧 API でページを読み込むたびに COUNT(*) を実行しないよう、
+    ## 録画番組の追加・削除時に RecordedScanTask などから増減させて維持する
+    _total_count: ClassVar[int | None] = None
+
+
+    @classmethod
+    async def getTotalCount(cls) -> int:
+        """
+        録画番組の総数を返す
+        まだ数えていない場合のみ DB から数える
+
+        Returns:
+            int: 録画番組の総数
+        """
+
+        if cls._total_count is None:
+            cls._total_count = await cls.all().count()
+        return cls._total_count
+
+
+    @classmethod
+    def adjustTotalCount(cls, delta: int) -> None:
+        """
+        録画番組の追加・削除に合わせて、キャッシュしている録画番組の総数を増減させる
+
+        Args:
+            delta (int): 増減させる数 (追加した場合は正、削除した場合は負の数)
+        """
+
+        if cls._total_count is not None:
+            cls._total_count = max(0, cls._total_count + delta)
+
+
+    @classmethod
+    async def refreshTotalCount(cls) -> int:
+        """
+        DB から録画番組の総数を数え直し、キャッシュを更新する
+        一括スキャンの完了時など、増減の反映漏れがあってもここで実際の件数に揃える
+
+        Returns:
+            int: 録画番組の総数
+        """
+
+        cls._total_count = await cls.all().count()
+        return cls._total_count
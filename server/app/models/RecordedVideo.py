@@ -7,6 +7,8 @@ import json
 from datetime import datetime
 from typing import Literal, cast
 
+import numpy as np
+from numpy.typing import NDArray
 from tortoise import fields
 from tortoise.fields import Field as TortoiseField
 from tortoise.models import Model as TortoiseModel
@@ -48,8 +50,11 @@ class RecordedVideo(TortoiseModel):
     secondary_audio_codec = cast(TortoiseField[Literal['AAC-LC'] | None], fields.CharField(255, null=True))
     secondary_audio_channel = cast(TortoiseField[Literal['Monaural', 'Stereo', '5.1ch'] | None], fields.CharField(255, null=True))
     secondary_audio_sampling_rate = cast(TortoiseField[int | None], fields.IntField(null=True))
-    key_frames = cast(TortoiseField[list[KeyFrame]],
-        fields.JSONField(default=[], encoder=lambda x: json.dumps(x, ensure_ascii=False)))  # type: ignore
+    # キーフレーム情報は (offset, dts) の組をリトルエンディアンの int64 で詰めたバイナリとして保存する
+    ## JSON で保存すると1時間の録画でも数百 KB になり、読み込みのたびにパースのコストがかかるため
+    ## キーフレーム情報の有無は key_frame_count で判定し、実際のデータは key_frames プロパティで必要になった時にだけ参照する
+    key_frames_data = fields.BinaryField(default=b'')
+    key_frame_count = fields.IntField(default=0)
     cm_sections = cast(TortoiseField[list[CMSection] | None],
         # None は未解析状態を表す ([] は解析したが CM 区間がなかった/検出に失敗したことを表す)
         fields.JSONField(default=None, encoder=lambda x: json.dumps(x, ensure_ascii=False), null=True))  # type: ignore
@@ -59,6 +64,31 @@ class RecordedVideo(TortoiseModel):
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
 
+    # key_frames_data に格納されるキーフレーム情報の dtype (offset, dts の順に並ぶ)
+    KEY_FRAME_DTYPE = np.dtype('<i8')
+
     @property
     def has_key_frames(self) -> bool:
-        return len(self.key_frames) > 0
+        return self.key_frame_count > 0
+
+    @property
+    def key_frames(self) -> NDArray[np.int64]:
+        """
+        キーフレーム情報を (キーフレーム数, 2) の NumPy 配列として返す
+        [:, 0] がキーフレームの位置 (ファイル内のバイトオフセット)、[:, 1] がキーフレームの DTS を表す
+        key_frames_data をコピーせずに参照するビューのため、読み取り専用
+        """
+        return np.frombuffer(self.key_frames_data, dtype=self.KEY_FRAME_DTYPE).reshape(-1, 2)
+
+    def setKeyFrames(self, key_frames: list[KeyFrame]) -> None:
+        """
+        キーフレーム情報をバイナリに変換して key_frames_data と key_frame_count にセットする
+
+        Args:
+            key_frames (list[KeyFrame]): キーフレーム情報
+        """
+        self.key_frames_data = np.array(
+            [(key_frame['offset'], key_frame['dts']) for key_frame in key_frames],
+            dtype=self.KEY_FRAME_DTYPE,
+        ).reshape(-1, 2).tobytes()
+        self.key_frame_count = len(key_frames)
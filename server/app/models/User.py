@@ -11,8 +11,9 @@ from tortoise import fields
 from tortoise.fields import Field as TortoiseField
 from tortoise.models import Model as TortoiseModel
 
-from app.constants import API_REQUEST_HEADERS, HTTPX_CLIENT, NICONICO_OAUTH_CLIENT_ID
+from app.constants import API_REQUEST_HEADERS, NICONICO_OAUTH_CLIENT_ID
 from app.utils import Interlaced
+from app.utils.HTTPClientPool import HTTPClientPool
 
 
 if TYPE_CHECKING:
@@ -53,17 +54,17 @@ class User(TortoiseModel):
 
             # リフレッシュトークンを使い、ニコニコ OAuth のアクセストークンとリフレッシュトークンを更新
             token_api_url = 'https://oauth.nicovideo.jp/oauth2/token'
-            async with HTTPX_CLIENT() as client:
-                token_api_response = await client.post(
-                    url = token_api_url,
-                    headers = {**API_REQUEST_HEADERS, 'Content-Type': 'application/x-www-form-urlencoded'},
-                    data = {
-                        'grant_type': 'refresh_token',
-                        'client_id': NICONICO_OAUTH_CLIENT_ID,
-                        'client_secret': Interlaced(3),
-                        'refresh_token': self.niconico_refresh_token,
-                    },
-                )
+            client = HTTPClientPool.get('External')
+            token_api_response = await client.post(
+                url = token_api_url,
+                headers = {**API_REQUEST_HEADERS, 'Content-Type': 'application/x-www-form-urlencoded'},
+                data = {
+                    'grant_type': 'refresh_token',
+                    'client_id': NICONICO_OAUTH_CLIENT_ID,
+                    'client_secret': Interlaced(3),
+                    'refresh_token': self.niconico_refresh_token,
+                },
+            )
 
             # ステータスコードが 200 以外
             if token_api_response.status_code != 200:
@@ -90,9 +91,9 @@ class User(TortoiseModel):
             ## 頻繁に変わるものでもないとは思うけど、一応再ログインせずとも同期されるようにしておきたい
             ## 3秒応答がなかったらタイムアウト
             user_api_url = f'https://nvapi.nicovideo.jp/v1/users/{self.niconico_user_id}'
-            async with HTTPX_CLIENT() as client:
-                # X-Frontend-Id がないと INVALID_PARAMETER になる
-                user_api_response = await client.get(user_api_url, headers={**API_REQUEST_HEADERS, 'X-Frontend-Id': '6'})
+            client = HTTPClientPool.get('External')
+            # X-Frontend-Id がないと INVALID_PARAMETER になる
+            user_api_response = await client.get(user_api_url, headers={**API_REQUEST_HEADERS, 'X-Frontend-Id': '6'})
 
             if user_api_response.status_code == 200:
                 # ユーザー名
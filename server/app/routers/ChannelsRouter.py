@@ -1,27 +1,20 @@
 
-import asyncio
 import hashlib
-import json
-from datetime import datetime, timedelta
-from typing import Annotated, Any
+from typing import Annotated
 
 import anyio
-import httpx
 from fastapi import APIRouter, Depends, HTTPException, Path, Request, status
 from fastapi.responses import FileResponse, Response
 from fastapi.security.utils import get_authorization_scheme_param
-from tortoise import connections
 
 from app import logging, schemas
-from app.config import Config
-from app.constants import HTTPX_CLIENT, JST, LOGO_DIR, VERSION
+from app.constants import LOGO_DIR, VERSION
 from app.models.Channel import Channel
 from app.routers.UsersRouter import GetCurrentUser
 from app.streams.LiveStream import LiveStream
-from app.utils import GetMirakurunAPIEndpointURL, ParseDatetimeStringToJST
-from app.utils.edcb.CtrlCmdUtil import CtrlCmdUtil
-from app.utils.edcb.EDCBUtil import EDCBUtil
+from app.utils.ChannelLogoCache import ChannelLogoCache
 from app.utils.JikkyoClient import JikkyoClient
+from app.utils.ProgramPFIndex import ProgramPFIndex
 from app.utils.TSInformation import TSInformation
 
 
@@ -62,194 +55,14 @@ async def ChannelsAPI():
     地デジ (GR)・BS・CS・CATV・SKY (SPHD)・BS4K それぞれ全てのチャンネルの情報を取得する。
     """
 
-    # 現在時刻
-    now = datetime.now(JST)
-
-    # タスク
-    tasks = []
-
-    # チャンネル情報を取得
-    # remocon_id (リモコン番号) を第一ソートキー、channel_number (チャンネル番号) を第二ソートキーとしてソート
-    # Tortoise ORM では order_by() を複数回チェーンすると最後の order_by() だけが有効になるため、
-    # 必ず order_by('remocon_id', 'channel_number') のように引数で指定する必要がある
-    channels: list[Channel]
-    tasks.append(Channel.filter(is_watchable=True).order_by('remocon_id', 'channel_number'))
-
-    # データベースの生のコネクションを取得
-    # 地デジ・BS・CS を合わせると 18000 件近くになる番組情報を SQLite かつ ORM で絞り込んで素早く取得するのは無理があるらしい
-    # そこで、この部分だけは ORM の機能を使わず、直接クエリを叩いて取得する
-    connection = connections.get('default')
-
-    # 現在と次の番組情報を取得する
-    ## 一度に取得した方がパフォーマンスが向上するため敢えてそうしている
-    ## SQL 文の時間比較は、左にいくほど時刻が小さく、右にいくほど時刻が大きくなるように統一している
-    ## 番組時間は EPG の仕様上必ず24時間以下に収まるので、パフォーマンスを考慮して24時間以内に放送開始予定の番組のみに絞り込む
-    pf_programs: list[dict[str, Any]]
-    tasks.append(connection.execute_query_dict(
-        """
-        SELECT *
-        FROM (
-            SELECT
-                -- チャンネル ID (ex: NID32736-SID1024) ごとに番組開始時刻が小さい順でランクを付け、program_order フィールドにセット
-                DENSE_RANK() OVER (PARTITION BY channel_id ORDER BY start_time ASC) program_order,
-                -- 番組開始時刻が現在時刻よりも前（=放送中）なら true 、そうでないなら false を is_present フィールドにセット
-                CASE WHEN "start_time" <= (?) THEN true ELSE false END AS is_present,
-                *
-            FROM
-                "programs"
-            WHERE
-                -- 現在放送中の番組 (start_time <= now <= end_time)
-                ("start_time" <= (?) AND (?) <= "end_time")
-                OR
-                -- 24時間以内に放送開始予定の番組 (now <= start_time <= (now + 24h))
-                ((?) <= "start_time" AND "start_time" <= (?))
-        ) WHERE
-            -- program_order が 1,2 の番組情報だけを取得
-            program_order <= 2
-        """,
-        [
-            now,
-            now, now,  # 現在放送中の番組
-            now, now + timedelta(hours=24),  # 24時間以内に放送開始予定の番組
-        ],
-    ))
-
-    # 並行して実行
-    channels, pf_programs = await asyncio.gather(*tasks)
-
-    # レスポンスの雛形
-    result = {
-        'GR': [],
-        'BS': [],
-        'CS': [],
-        'CATV': [],
-        'SKY': [],
-        'BS4K': [],
-    }
-
-    # チャンネルごとに実行
-    for channel in channels:
-
-        # チャンネル情報の辞書を作成
-        ## クラスそのままだとレスポンスを返す際にシリアライズ処理が入る関係でパフォーマンスが悪い
-        channel_dict: dict[str, Any] = {
-            'id': channel.id,
-            'display_channel_id': channel.display_channel_id,
-            'network_id': channel.network_id,
-            'service_id': channel.service_id,
-            'transport_stream_id': channel.transport_stream_id,
-            'remocon_id': channel.remocon_id,
-            'channel_number': channel.channel_number,
-            'type': channel.type,
-            'name': channel.name,
-            'jikkyo_force': channel.jikkyo_force,
-            'is_subchannel': channel.is_subchannel,
-            'is_radiochannel': channel.is_radiochannel,
-            'is_watchable': True,
-            # 地デジチャンネルの地域名のリスト (デバッグ用)
-            # 広域放送局の場合は複数の地域名が含まれる
-            # 地デジ以外のチャンネルまたは地域が特定できない場合は None
-            'terrestrial_regions': (
-                TSInformation.getRegionNamesFromNetworkID(channel.network_id) if channel.type == 'GR' else None
-            ),
-            'is_display': True,
-            'viewer_count': 0,
-            'program_present': None,
-            'program_following': None,
-        }
-
-        # チャンネルに紐づく現在と次の番組情報を取得
-        pf_program: list[dict[str, Any]] = list(filter(lambda pf_program:
-            pf_program['network_id'] == channel_dict['network_id'] and
-            pf_program['service_id'] == channel_dict['service_id'],
-        pf_programs))
-
-        # 番組情報が1つ以上取得できていれば
-        if len(pf_program) >= 1:
-
-            # 番組情報が1つしか取得できておらず、現在放送中の番組情報のみの場合
-            ## 基本的にはまず起こり得ないと思うけど…（そのチャンネルが放送終了とかでもないかぎり）
-            if len(pf_program) == 1 and bool(pf_program[0]['is_present']) is True:
-
-                # program_present には取れた現在放送中の番組情報をそのままセットし、program_following には何もセットしない
-                channel_dict['program_present'] = pf_program[0]
-
-            # 番組情報が1つしか取得できておらず、次以降の番組情報のみの場合
-            ## たまにしか運用されないサブチャンネルで発生しやすい
-            elif len(pf_program) == 1 and bool(pf_program[0]['is_present']) is False:
-
-                # program_present には何もセットせず、program_following には取れた次の番組情報をそのままセットする
-                channel_dict['program_following'] = pf_program[0]
-
-            # 番組情報が2つ取得できているが、いずれも現在放送中の番組情報の場合
-            ## 万が一 DB に放送時刻が重複する番組が登録されていた場合に発生する
-            elif len(pf_program) == 2 and bool(pf_program[0]['is_present']) is True and bool(pf_program[1]['is_present']) is True:
-
-                # program_present にはとりあえず最初の番組情報をセットし、program_following には何もセットしない
-                channel_dict['program_present'] = pf_program[0]
-
-            # 番組情報が2つ取得できているが、いずれも次以降の番組情報の場合
-            ## 放送休止中やサブチャンネルなどで発生する
-            elif len(pf_program) == 2 and bool(pf_program[0]['is_present']) is False and bool(pf_program[1]['is_present']) is False:
-
-                # program_present には何もセットせず、program_following には program_order が 1 になっている方 (=より現在時刻に近い) をセットする
-                if bool(pf_program[0]['program_order']) == 1:
-                    channel_dict['program_following'] = pf_program[0]
-                elif bool(pf_program[1]['program_order']) == 1:
-                    channel_dict['program_following'] = pf_program[1]
-
-            # それ以外 (番組情報が2つ取得できていて、どちらかが現在放送中でどちらかが次の番組情報の場合)
-            else:
-
-                # 現在放送中の番組情報を program_present にセット
-                if bool(pf_program[0]['is_present']) is True:
-                    channel_dict['program_present'] = pf_program[0]
-                elif bool(pf_program[1]['is_present']) is True:
-                    channel_dict['program_present'] = pf_program[1]
-
-                # 次の番組情報を program_following にセット
-                if bool(pf_program[0]['is_present']) is False:
-                    channel_dict['program_following'] = pf_program[0]
-                elif bool(pf_program[1]['is_present']) is False:
-                    channel_dict['program_following'] = pf_program[1]
-
-            # JSON データで格納されているカラムをデコードする
-            ## ついでに SQL 文で設定した is_present / program_order フィールドを削除
-            ## 現在の番組か次の番組かを判定するために使っているフィールドだが、もう判定は終わったので必要ない
-            ## DB 由来の日時文字列は utils 側で JST aware datetime に正規化してから ISO8601 文字列にする
-            ## 真偽値も SQLite では 0/1 で管理されているため、bool 型に変換する
-            if channel_dict['program_present'] is not None:
-                channel_dict['program_present']['detail'] = json.loads(channel_dict['program_present']['detail'])
-                channel_dict['program_present']['start_time'] = ParseDatetimeStringToJST(channel_dict['program_present']['start_time']).isoformat()
-                channel_dict['program_present']['end_time'] = ParseDatetimeStringToJST(channel_dict['program_present']['end_time']).isoformat()
-                channel_dict['program_present']['is_free'] = bool(channel_dict['program_present']['is_free'])
-                channel_dict['program_present']['genres'] = json.loads(channel_dict['program_present']['genres'])
-                channel_dict['program_present'].pop('is_present')
-                channel_dict['program_present'].pop('program_order')
-            if channel_dict['program_following'] is not None:
-                channel_dict['program_following']['detail'] = json.loads(channel_dict['program_following']['detail'])
-                channel_dict['program_following']['start_time'] = ParseDatetimeStringToJST(channel_dict['program_following']['start_time']).isoformat()
-                channel_dict['program_following']['end_time'] = ParseDatetimeStringToJST(channel_dict['program_following']['end_time']).isoformat()
-                channel_dict['program_following']['is_free'] = bool(channel_dict['program_following']['is_free'])
-                channel_dict['program_following']['genres'] = json.loads(channel_dict['program_following']['genres'])
-                channel_dict['program_following'].pop('is_present')
-                channel_dict['program_following'].pop('program_order')
-
-        # サブチャンネル & 現在の番組情報が存在しないなら、表示フラグを False に設定
-        ## 現在放送中のサブチャンネルのみをチャンネルリストに表示するような挙動とする
-        ## 一般的にサブチャンネルは常に放送されているわけではないため、放送されていない時にチャンネルリストに表示する必要はない
-        if channel_dict['is_subchannel'] is True and channel_dict['program_present'] is None:
-            channel_dict['is_display'] = False
-
-        # 現在の視聴者数を取得
-        channel_dict['viewer_count'] = LiveStream.getViewerCount(channel_dict['display_channel_id'])
-
-        # せっかくチャンネルごとにループで回しているので、ここでチャンネルタイプごとの分類もやっておく
-        ## 後から filter() で絞り込むのだと効率が悪い
-        result[channel_dict['type']].append(channel_dict)
-
-    # Pydantic v2 ではバリデーションが高速化されているため、通常通り Pydantic モデルを返す
-    return schemas.LiveChannels.model_validate(result)
+    # チャンネル情報と現在/次の番組情報は、番組情報の更新時に構築されるインデックスから取得する
+    ## 地デジ・BS・CS を合わせると 18000 件近くになる番組情報をリクエストごとに DB から絞り込むのは重いため、
+    ## インデックス側でシリアライズ済みの JSON 断片を連結し、リクエストごとに変わる視聴者数などだけを埋め込む
+    ## Pydantic モデルへの変換とバリデーションも省略するため、JSON 文字列をそのままレスポンスとして返す
+    return Response(
+        content = await ProgramPFIndex.getLiveChannelsJSON(LiveStream.getViewerCount),
+        media_type = 'application/json',
+    )
 
 
 @router.get(
@@ -402,65 +215,8 @@ async def ChannelLogoAPI(
         return None
 
     async def GetFallbackLogoData(channel: Channel) -> tuple[bytes, str] | None:
-        """ フォールバックとして EDCB または Mirakurun からロゴデータと MIME タイプを取得する """
-
-        # EDCB バックエンドの場合
-        if Config().general.backend == 'EDCB':
-
-            # CtrlCmdUtil を初期化
-            edcb = CtrlCmdUtil()
-            edcb.setConnectTimeOutSec(5)  # 5秒後にタイムアウト
-
-            # EDCB の LogoData フォルダからロゴを取得
-            logo = None
-            logo_media_type = 'image/png'
-            files = await edcb.sendFileCopy2(['LogoData.ini', 'LogoData\\*.*']) or []
-            if len(files) == 2:
-                logo_data_ini = EDCBUtil.convertBytesToString(files[0]['data'])
-                logo_dir_index = EDCBUtil.convertBytesToString(files[1]['data'])
-                logo_id = EDCBUtil.getLogoIDFromLogoDataIni(logo_data_ini, channel.network_id, channel.service_id)
-                if logo_id >= 0:
-                    # なるべく画質が良いロゴタイプのものを取得
-                    for logo_type in [5, 2, 4, 1, 3, 0]:
-                        logo_name = EDCBUtil.getLogoFileNameFromDirectoryIndex(logo_dir_index, channel.network_id, logo_id, logo_type)
-                        if logo_name is not None:
-                            files = await edcb.sendFileCopy2(['LogoData\\' + logo_name]) or []
-                            if len(files) == 1:
-                                logo = files[0]['data']
-                                logo_media_type = 'image/bmp' if logo_name.upper().endswith('.BMP') else 'image/png'
-                            break
-
-            # 取得したロゴデータを返す
-            if logo is not None and len(logo) > 0:
-                return (logo, logo_media_type)
-
-        # Mirakurun バックエンドの場合
-        elif Config().general.backend == 'Mirakurun':
-
-            # Mirakurun 形式のサービス ID
-            # NID と SID を 5 桁でゼロ埋めした上で int に変換する
-            mirakurun_service_id = int(str(channel.network_id).zfill(5) + str(channel.service_id).zfill(5))
-
-            # 同梱のロゴが存在しない場合のみ、Mirakurun の API からロゴを取得する
-            ## mirakc においては、ユーザーが mirakc にロゴを手動設定している場合のみ局ロゴを取得できる
-            try:
-                mirakurun_logo_api_url = GetMirakurunAPIEndpointURL(f'/api/services/{mirakurun_service_id}/logo')
-                async with HTTPX_CLIENT() as client:
-                    mirakurun_logo_api_response = await client.get(mirakurun_logo_api_url, timeout=5)
-
-                # ステータスコードが 200 であれば
-                # ステータスコードが 503 の場合はロゴデータが存在しない
-                if mirakurun_logo_api_response.status_code == 200:
-
-                    # 取得したロゴデータを返す
-                    mirakurun_logo = mirakurun_logo_api_response.content
-                    return (mirakurun_logo, 'image/png')
-
-            # API に接続できなかった際は特にエラーは吐かず、デフォルトのロゴ画像を利用する
-            except (httpx.NetworkError, httpx.TimeoutException):
-                pass
-
-        return None
+        """ フォールバックとして EDCB または Mirakurun からロゴデータと MIME タイプを取得する (ディスクにキャッシュされたロゴがあればそれを返す) """
+        return await ChannelLogoCache.get(channel.network_id, channel.service_id)
 
     def GetETag(logo_data: bytes) -> str:
         """ ロゴデータのバイナリから ETag を生成する """
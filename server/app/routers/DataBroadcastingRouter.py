@@ -4,13 +4,12 @@ import socket
 import time
 from typing import Annotated
 
-import httpx
 from fastapi import APIRouter, Form, HTTPException, Path, Query, Request, status
 from fastapi.responses import StreamingResponse
 from ping3 import ping
 
 from app import logging, schemas
-from app.constants import API_REQUEST_HEADERS
+from app.utils.HTTPClientPool import HTTPClientPool
 
 
 # ルーター
@@ -61,17 +60,18 @@ async def BMLBrowserRequestGETProxyAPI(
     # タイムアウトはデータ放送の動作を壊さないようにあえて設定しない
     # さらにデータ放送からアクセスされるサイトは HTTPS の場合でも証明書が切れていることが日常茶飯事なので、証明書の検証を行わない
     ## 正確には放送波経由で古い規格の HTTPS 証明書が降ってきているらしいが、どのみち実装困難なので証明書の状態は無視する
-    async with httpx.AsyncClient(headers={**API_REQUEST_HEADERS, **headers}, follow_redirects=True, verify=False) as client:
-        try:
-            response = await client.get(request_url)
-        except Exception as ex:
-            # リクエスト中に例外が発生した場合は、エラーメッセージをログに出力して 500 エラーを返す
-            ## HTTP リクエスト自体が DNS 名前解決エラーや接続エラーで失敗した場合に発生する
-            logging.error('[DataBroadcastingRouter][BMLBrowserRequestGETProxyAPI] Failed to request:', exc_info=ex)
-            raise HTTPException(
-                status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail = f'Failed to request: {ex}',
-            )
+    ## いずれもデータ放送用のクライアント (HTTPClientPool の DataBroadcasting) の設定で指定されている
+    client = HTTPClientPool.get('DataBroadcasting')
+    try:
+        response = await client.get(request_url, headers=headers)
+    except Exception as ex:
+        # リクエスト中に例外が発生した場合は、エラーメッセージをログに出力して 500 エラーを返す
+        ## HTTP リクエスト自体が DNS 名前解決エラーや接続エラーで失敗した場合に発生する
+        logging.error('[DataBroadcastingRouter][BMLBrowserRequestGETProxyAPI] Failed to request:', exc_info=ex)
+        raise HTTPException(
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail = f'Failed to request: {ex}',
+        )
 
     allowed_response_headers = [
         'accept-ranges',
@@ -127,17 +127,18 @@ async def BMLBrowserRequestPOSTProxyAPI(
     # タイムアウトはデータ放送の動作を壊さないようにあえて設定しない
     # さらにデータ放送からアクセスされるサイトは HTTPS の場合でも証明書が切れていることが日常茶飯事なので、証明書の検証を行わない
     ## 正確には放送波経由で古い規格の HTTPS 証明書が降ってきているらしいが、どのみち実装困難なので証明書の状態は無視する
-    async with httpx.AsyncClient(headers={**API_REQUEST_HEADERS, **headers}, follow_redirects=True, verify=False) as client:
-        try:
-            response = await client.post(request_url, content=f'Denbun={Denbun}')
-        except Exception as ex:
-            # リクエスト中に例外が発生した場合は、エラーメッセージをログに出力して 500 エラーを返す
-            ## HTTP リクエスト自体が DNS 名前解決エラーや接続エラーで失敗した場合に発生する
-            logging.error('[DataBroadcastingRouter][BMLBrowserRequestPOSTProxyAPI] Failed to request:', exc_info=ex)
-            raise HTTPException(
-                status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail = f'Failed to request: {ex}',
-            )
+    ## いずれもデータ放送用のクライアント (HTTPClientPool の DataBroadcasting) の設定で指定されている
+    client = HTTPClientPool.get('DataBroadcasting')
+    try:
+        response = await client.post(request_url, headers=headers, content=f'Denbun={Denbun}')
+    except Exception as ex:
+        # リクエスト中に例外が発生した場合は、エラーメッセージをログに出力して 500 エラーを返す
+        ## HTTP リクエスト自体が DNS 名前解決エラーや接続エラーで失敗した場合に発生する
+        logging.error('[DataBroadcastingRouter][BMLBrowserRequestPOSTProxyAPI] Failed to request:', exc_info=ex)
+        raise HTTPException(
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail = f'Failed to request: {ex}',
+        )
 
     allowed_response_headers = [
         'accept-ranges',
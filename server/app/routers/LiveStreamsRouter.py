@@ -58,7 +58,7 @@ async def ValidateQuality(quality: Annotated[str, Path(description='映像の品
 )
 async def LiveStreamsAPI():
     """
-    すべてのライブストリームの状態を Offline・Standby・ONAir・Idling・Restart の各ステータスごとに取得する。
+    すべてのライブストリームの状態を Offline・Standby・ONAir・Idling・Restart・Warm の各ステータスごとに取得する。
     """
 
     # 返却するデータ
@@ -68,6 +68,7 @@ async def LiveStreamsAPI():
         'Idling' : {},
         'ONAir'  : {},
         'Standby': {},
+        'Warm'   : {},
         'Offline': {},
     }
 
@@ -141,6 +142,8 @@ async def LiveStreamEventAPI(
         """イベントストリームを出力するジェネレーター"""
 
         # 初期値
+        ## ステータスの変化を取りこぼさないよう、ステータスを取得する前に変化の通知を待つイベントを取得しておく
+        status_changed = live_stream.getStatusChangedEvent()
         previous_status = live_stream.getStatus()
 
         # 取得できたクライアント数はあくまで同じチャンネル+同じ画質で視聴中のクライアントをカウントしたものなので、
@@ -155,7 +158,12 @@ async def LiveStreamEventAPI(
 
         while True:
 
+            # ステータス (詳細・視聴者数を含む) が変化するまで待機する
+            ## LiveStream.setStatus() やクライアントの接続・切断の際に通知されるため、変化がない間は起床しない
+            await status_changed.wait()
+
             # 現在のライブストリームのステータスを取得
+            status_changed = live_stream.getStatusChangedEvent()
             status = live_stream.getStatus()
 
             # 取得できたクライアント数はあくまで同じチャンネル+同じ画質で視聴中のクライアントをカウントしたものなので、
@@ -187,9 +195,6 @@ async def LiveStreamEventAPI(
                 # 取得結果を保存
                 previous_status = copy.copy(status)
 
-            # 一応スリープを入れておく
-            await asyncio.sleep(0.05)
-
     # EventSourceResponse でイベントストリームを配信する
     return EventSourceResponse(generator())
 
@@ -310,7 +315,7 @@ async def LiveMPEGTSStreamAPI(
 
             if live_stream.getStatus().status != 'Offline':
 
-                # クライアントが持つ Queue から読み取ったストリームデータ
+                # ライブストリームのリングバッファから読み取ったストリームデータ
                 stream_data: bytes | None = await live_stream_client.readStreamData()
 
                 # 読み取ったストリームデータを yield で随時出力する
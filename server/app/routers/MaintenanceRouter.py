@@ -2,16 +2,16 @@
 import asyncio
 import json
 import os
+import pathlib
 import signal
 import sys
 import threading
-import time
 from collections.abc import Coroutine
 from typing import Annotated, Any, Literal
 
 import anyio
 import psutil
-from fastapi import APIRouter, Depends, Path, Request, status
+from fastapi import APIRouter, Depends, Path, Query, Request, status
 from fastapi.exceptions import HTTPException
 from fastapi.responses import Response
 from fastapi.security import OAuth2PasswordBearer
@@ -26,16 +26,19 @@ from app.constants import (
     RESTART_REQUIRED_LOCK_PATH,
     THUMBNAILS_DIR,
 )
+from app.metadata.BackgroundAnalysisPipeline import BackgroundAnalysisPipeline
 from app.metadata.CMSectionsDetector import CMSectionsDetector
 from app.metadata.KeyFrameAnalyzer import KeyFrameAnalyzer
 from app.metadata.RecordedScanTask import RecordedScanTask
-from app.metadata.ThumbnailGenerator import ThumbnailGenerator
 from app.models.Channel import Channel
 from app.models.Program import Program
 from app.models.RecordedProgram import RecordedProgram
 from app.models.RecordedVideo import RecordedVideo
 from app.models.User import User
 from app.routers.UsersRouter import GetCurrentAdminUser, GetCurrentUser
+from app.utils.FullTextSearch import FullTextSearch
+from app.utils.HTTPClientPool import HTTPClientPool
+from app.utils.LogFollower import LogFollower
 
 
 # ルーター
@@ -75,6 +78,23 @@ async def GetCurrentAdminUserOrLocal(
     return await GetCurrentAdminUser(await GetCurrentUser(token))
 
 
+def GetLogPath(log_type: Literal['server', 'access']) -> pathlib.Path:
+    """ ログの種類からログファイルのパスを取得する (ログファイルが存在しない場合は 404 エラーを送出する) """
+
+    # ログファイルのパスを決定
+    log_path = KONOMITV_SERVER_LOG_PATH if log_type == 'server' else KONOMITV_ACCESS_LOG_PATH
+
+    # ログファイルが存在しない場合はエラー
+    if not log_path.exists():
+        logging.error(f'[MaintenanceRouter][GetLogPath] Log file not found: {log_path}')
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = f'Log file not found: {log_path}',
+        )
+
+    return log_path
+
+
 @router.get(
     '/logs/{log_type}',
     summary = 'サーバーログストリーミング API',
@@ -86,79 +106,97 @@ async def GetCurrentAdminUserOrLocal(
         }
     }
 )
-def LogStreamAPI(
+async def LogStreamAPI(
     log_type: Annotated[Literal['server', 'access'], Path(description='ログの種類。server: サーバーログ、access: アクセスログ')],
     current_user: Annotated[User, Depends(GetCurrentAdminUser)],
+    lines: Annotated[int, Query(ge=1, le=LogFollower.MAX_INITIAL_LINES, description='初回に送信する末尾の行数。')] = 1000,
 ):
     """
     サーバーログまたはアクセスログを Server-Sent Events で随時配信する。
 
     イベントには、
-    - 初回にログファイルの先頭から現在の最新行までのすべての行を送信する **initial_log_update**
+    - 初回にログファイルの末尾から lines 行を送信する **initial_log_update**
+    - initial_log_update で送信した最初の行のファイル上の位置 (バイト) を送信する **initial_log_offset**
     - リアルタイムに追加されたログを送信する **log_update**
-    の2種類がある。
+    の3種類がある。
 
-    初回接続時にはログファイルの先頭から現在の最新行までのすべての行が initial_log_update イベントで一括送信され、<br>
-    その後ログに更新があれば log_update イベントで1行ずつ送信される。
+    初回接続時にはログファイルの末尾から lines 行が initial_log_update イベントで一括送信され、<br>
+    その後ログに更新があれば log_update イベントで1行ずつ送信される。<br>
+    それより前の行は、initial_log_offset の値をログ履歴取得 API の before に指定して遡って取得できる。
 
-    ファイル I/O を伴うため敢えて同期関数として実装している。<br>
+    ログファイルの監視は同じログを表示しているすべてのクライアントで共有される。<br>
     JWT エンコードされたアクセストークンがリクエストの Authorization: Bearer に設定されていて、かつ管理者アカウントでないとアクセスできない。
     """
 
     # ログファイルのパスを決定
-    log_path = KONOMITV_SERVER_LOG_PATH if log_type == 'server' else KONOMITV_ACCESS_LOG_PATH
-
-    # ログファイルが存在しない場合はエラー
-    if not log_path.exists():
-        logging.error(f'[MaintenanceRouter][LogStreamAPI] Log file not found: {log_path}')
-        raise HTTPException(
-            status_code = status.HTTP_404_NOT_FOUND,
-            detail = f'Log file not found: {log_path}',
-        )
+    log_path = GetLogPath(log_type)
 
     # ログの変更を監視し、変更があればログ行をイベントストリームとして出力する
-    def generator():
+    async def generator():
         """イベントストリームを出力するジェネレーター"""
 
-        # ファイルを開く
-        with open(log_path, encoding='utf-8') as f:
-            # 初回接続時に全ての行を送信
-            all_lines = [line.rstrip('\n') for line in f.readlines() if line.strip()]  # 空行は除外
+        # ログファイルの購読を開始し、末尾の行と以降に追記された行が届くキューを取得する
+        log_follower = LogFollower(log_path)
+        initial_lines, initial_offset, queue = await log_follower.subscribe(lines)
+        try:
+            # 初回接続時に末尾の行を送信
             yield {
                 'event': 'initial_log_update',
-                'data': json.dumps(all_lines, ensure_ascii=False),
+                'data': json.dumps(initial_lines, ensure_ascii=False),
+            }
+            yield {
+                'event': 'initial_log_offset',
+                'data': json.dumps(initial_offset),
             }
 
-            # ファイルの現在位置を記録
-            current_position = f.tell()
-
-            # 継続的に新しい行を監視
+            # 追記された行が届く度に1行ずつ送信する
             while True:
-                # ファイルが更新されたかチェック
-                f.seek(0, os.SEEK_END)
-                if f.tell() > current_position:
-                    # ファイルが更新された場合、前回の位置に戻る
-                    f.seek(current_position)
-
-                    # 新しい行を読み込む
-                    for line in f:
-                        line = line.rstrip('\n')
-                        if line:  # 空行は送信しない
-                            yield {
-                                'event': 'log_update',
-                                'data': json.dumps(line, ensure_ascii=False),
-                            }
-
-                    # 現在位置を更新
-                    current_position = f.tell()
-
-                # 少し待機
-                time.sleep(0.5)
+                for line in await queue.get():
+                    yield {
+                        'event': 'log_update',
+                        'data': json.dumps(line, ensure_ascii=False),
+                    }
+
+        finally:
+            # クライアントが切断したら購読を終了する
+            log_follower.unsubscribe(queue)
 
     # EventSourceResponse でイベントストリームを配信する
     return EventSourceResponse(generator())
 
 
+@router.get(
+    '/logs/{log_type}/history',
+    summary = 'ログ履歴取得 API',
+    response_description = '指定された位置より前のログ行。',
+    response_model = schemas.LogHistory,
+)
+async def LogHistoryAPI(
+    log_type: Annotated[Literal['server', 'access'], Path(description='ログの種類。server: サーバーログ、access: アクセスログ')],
+    current_user: Annotated[User, Depends(GetCurrentAdminUser)],
+    before: Annotated[int, Query(ge=0, description='この位置 (バイト) より前の行を取得する。initial_log_offset や前回取得した offset を指定する。')],
+    limit: Annotated[int, Query(ge=1, le=LogFollower.MAX_INITIAL_LINES, description='取得する最大行数。')] = 1000,
+):
+    """
+    サーバーログまたはアクセスログの、指定された位置より前の行を最大 limit 行取得する。<br>
+    レスポンスの offset を次のリクエストの before に指定すると、さらに前の行を遡って取得できる。
+
+    JWT エンコードされたアクセストークンがリクエストの Authorization: Bearer に設定されていて、かつ管理者アカウントでないとアクセスできない。
+    """
+
+    # ログファイルのパスを決定
+    log_path = GetLogPath(log_type)
+
+    # ファイル I/O を伴うため、別スレッドでログファイルを末尾側から遡って読み込む
+    log_lines, offset = await anyio.to_thread.run_sync(LogFollower(log_path).readLinesBefore, before, limit)
+
+    return schemas.LogHistory(
+        lines = log_lines,
+        offset = offset,
+        has_more = offset > 0,
+    )
+
+
 @router.post(
     '/update-database',
     summary = 'データベース更新 API',
@@ -176,6 +214,40 @@ async def UpdateDatabaseAPI():
     await Program.update(multiprocess=True)
 
 
+@router.post(
+    '/rebuild-search-index',
+    summary = '検索インデックス再構築 API',
+    status_code = status.HTTP_204_NO_CONTENT,
+)
+async def RebuildSearchIndexAPI():
+    """
+    録画番組・シリーズ番組の検索に使う全文検索インデックスを、DB に保存されている情報から作り直す。<br>
+    通常は録画番組・シリーズ番組の追加・更新・削除に合わせて自動で更新されるため、検索結果が DB の内容と食い違う場合にのみ利用する。<br>
+    このメンテナンス機能は管理者ユーザーでなくてもアクセスできる。
+    """
+
+    await FullTextSearch.rebuild()
+
+
+@router.get(
+    '/http-client-pools',
+    summary = 'HTTP コネクションプール利用状況取得 API',
+    response_description = '上流サーバーごとの HTTP コネクションプールの利用状況。',
+    response_model = schemas.HTTPClientPoolStatuses,
+)
+async def HTTPClientPoolStatusesAPI(
+    current_user: Annotated[User, Depends(GetCurrentAdminUser)],
+):
+    """
+    Mirakurun / mirakc や外部 API へのリクエストに使い回している、上流サーバーごとの HTTP コネクションプールの利用状況を取得する。<br>
+    JWT エンコードされたアクセストークンがリクエストの Authorization: Bearer に設定されていて、かつ管理者アカウントでないとアクセスできない。
+    """
+
+    return schemas.HTTPClientPoolStatuses(
+        [schemas.HTTPClientPoolStatus(**statistic) for statistic in HTTPClientPool.getStatistics()]
+    )
+
+
 @router.post(
     '/run-batch-scan',
     summary = '録画フォルダ一括スキャン API',
@@ -235,10 +307,10 @@ async def BackgroundAnalysisAPI():
         logging.info('Manual background analysis has started.')
 
         # キーフレーム情報が未生成、またはサムネイルが未生成の録画ファイルを取得
-        ## メモリ使用量を抑えるため、key_frames などの大きなフィールドは取得せず、必要最低限のフィールドのみを取得する
-        ## has_key_frames は key_frames を読み込まずに SQL で判定する (key_frames のデフォルト値は '[]')
+        ## メモリ使用量を抑えるため、key_frames_data などの大きなフィールドは取得せず、必要最低限のフィールドのみを取得する
+        ## has_key_frames は key_frames_data を読み込まずに key_frame_count から SQL で判定する
         video_rows = await RecordedVideo.filter(status='Recorded').annotate(
-            has_key_frames=RawSQL("CASE WHEN key_frames != '[]' THEN 1 ELSE 0 END"),
+            has_key_frames=RawSQL("CASE WHEN key_frame_count > 0 THEN 1 ELSE 0 END"),
         ).values(
             'id',
             'recorded_program_id',
@@ -263,25 +335,12 @@ async def BackgroundAnalysisAPI():
                 # キーフレーム情報解析とサムネイル生成を同時に実行
                 tasks: list[Coroutine[Any, Any, None]] = []
 
-                # キーフレーム情報が未解析の場合、タスクに追加
-                if not video_row['has_key_frames']:
-                    tasks.append(KeyFrameAnalyzer(file_path, video_row['container_format']).analyzeAndSave())
-
-                # CM 区間情報が未解析の場合、タスクに追加
-                ## cm_sections が [] の時は「解析はしたが CM 区間がなかった/検出に失敗した」ことを表している
-                ## CM 区間解析はかなり計算コストが高い処理のため、一度解析に失敗した録画ファイルは再解析しない
-                if video_row['cm_sections'] is None:
-                    tasks.append(CMSectionsDetector(
-                        file_path = anyio.Path(video_row['file_path']),
-                        duration_sec = video_row['duration'],
-                    ).detectAndSave())
-
-                # サムネイルが未生成の場合、タスクに追加
+                # サムネイルが未生成の場合、録画番組情報を取得する
                 # どちらか片方だけがないパターンも考えられるので、その場合もサムネイル生成を実行する
+                recorded_program: schemas.RecordedProgram | None = None
                 thumbnail_tile_path = anyio.Path(str(THUMBNAILS_DIR)) / f'{video_row["file_hash"]}_tile.webp'
                 thumbnail_path = anyio.Path(str(THUMBNAILS_DIR)) / f'{video_row["file_hash"]}.webp'
                 if (not await thumbnail_tile_path.is_file()) or (not await thumbnail_path.is_file()):
-                    # 録画番組情報を取得
                     db_recorded_program = await RecordedProgram.all() \
                         .select_related('recorded_video') \
                         .select_related('channel') \
@@ -289,7 +348,31 @@ async def BackgroundAnalysisAPI():
                     if db_recorded_program is not None:
                         # RecordedProgram モデルを schemas.RecordedProgram に変換
                         recorded_program = schemas.RecordedProgram.model_validate(db_recorded_program, from_attributes=True)
-                        tasks.append(ThumbnailGenerator.fromRecordedProgram(recorded_program).generateAndSave())
+
+                # CM 区間情報が未解析の場合は CM 区間検出も行う
+                ## cm_sections が [] の時は「解析はしたが CM 区間がなかった/検出に失敗した」ことを表している
+                ## CM 区間解析はかなり計算コストが高い処理のため、一度解析に失敗した録画ファイルは再解析しない
+                detect_cm_sections = video_row['cm_sections'] is None
+
+                # サムネイル生成が必要な場合は、キーフレーム情報解析・CM 区間検出とまとめて実行する
+                ## キーフレーム情報解析とサムネイル生成の両方が必要な MPEG-TS 形式の録画ファイルは、録画ファイルを1回読み込むだけで済む
+                if recorded_program is not None:
+                    tasks.append(BackgroundAnalysisPipeline(
+                        recorded_program,
+                        analyze_key_frames = not video_row['has_key_frames'],
+                        detect_cm_sections = detect_cm_sections,
+                        generate_thumbnails = True,
+                    ).runAndSave())
+                else:
+                    # キーフレーム情報が未解析の場合、タスクに追加
+                    if not video_row['has_key_frames']:
+                        tasks.append(KeyFrameAnalyzer(file_path, video_row['container_format']).analyzeAndSave())
+                    # CM 区間情報が未解析の場合、タスクに追加
+                    if detect_cm_sections is True:
+                        tasks.append(CMSectionsDetector(
+                            file_path = anyio.Path(video_row['file_path']),
+                            duration_sec = video_row['duration'],
+                        ).detectAndSave())
 
                 # タスクが存在する場合、同時実行
                 if tasks:
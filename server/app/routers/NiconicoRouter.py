@@ -9,10 +9,11 @@ from fastapi.security.utils import get_authorization_scheme_param
 from jose import jwt
 
 from app import logging, schemas
-from app.constants import API_REQUEST_HEADERS, HTTPX_CLIENT, NICONICO_OAUTH_CLIENT_ID
+from app.constants import API_REQUEST_HEADERS, NICONICO_OAUTH_CLIENT_ID
 from app.models.User import User
 from app.routers.UsersRouter import GetCurrentUser
 from app.utils import Interlaced
+from app.utils.HTTPClientPool import HTTPClientPool
 from app.utils.OAuthCallbackResponse import OAuthCallbackResponse
 
 
@@ -147,18 +148,18 @@ async def NiconicoAuthCallbackAPI(
 
         # 認証コードを使い、ニコニコ OAuth のアクセストークンとリフレッシュトークンを取得
         token_api_url = 'https://oauth.nicovideo.jp/oauth2/token'
-        async with HTTPX_CLIENT() as httpx_client:
-            token_api_response = await httpx_client.post(
-                url = token_api_url,
-                headers = {**API_REQUEST_HEADERS, 'Content-Type': 'application/x-www-form-urlencoded'},
-                data = {
-                    'grant_type': 'authorization_code',
-                    'client_id': NICONICO_OAUTH_CLIENT_ID,
-                    'client_secret': Interlaced(3),
-                    'code': code,
-                    'redirect_uri': 'https://app.konomi.tv/api/redirect/niconico',
-                },
-            )
+        httpx_client = HTTPClientPool.get('External')
+        token_api_response = await httpx_client.post(
+            url = token_api_url,
+            headers = {**API_REQUEST_HEADERS, 'Content-Type': 'application/x-www-form-urlencoded'},
+            data = {
+                'grant_type': 'authorization_code',
+                'client_id': NICONICO_OAUTH_CLIENT_ID,
+                'client_secret': Interlaced(3),
+                'code': code,
+                'redirect_uri': 'https://app.konomi.tv/api/redirect/niconico',
+            },
+        )
 
         # ステータスコードが 200 以外
         if token_api_response.status_code != 200:
@@ -195,9 +196,9 @@ async def NiconicoAuthCallbackAPI(
         # ニコニコアカウントのユーザー情報を取得
         ## 3秒応答がなかったらタイムアウト
         user_api_url = f'https://nvapi.nicovideo.jp/v1/users/{current_user.niconico_user_id}'
-        async with HTTPX_CLIENT() as httpx_client:
-            # X-Frontend-Id がないと INVALID_PARAMETER になる
-            user_api_response = await httpx_client.get(user_api_url, headers={**API_REQUEST_HEADERS, 'X-Frontend-Id': '6'})
+        httpx_client = HTTPClientPool.get('External')
+        # X-Frontend-Id がないと INVALID_PARAMETER になる
+        user_api_response = await httpx_client.get(user_api_url, headers={**API_REQUEST_HEADERS, 'X-Frontend-Id': '6'})
 
         # ステータスコードが 200 以外
         if user_api_response.status_code != 200:
@@ -15,6 +15,7 @@ from app.routers.ReservationConditionsRouter import EncodeEDCBSearchKeyInfo
 from app.routers.ReservationsRouter import GetCtrlCmdUtil
 from app.utils import NormalizeToJSTDatetime, ParseDatetimeStringToJST
 from app.utils.edcb import EventInfo, ReserveDataRequired, SearchKeyInfo
+from app.utils.edcb.CachedCtrlCmdUtil import CachedCtrlCmdUtil
 from app.utils.edcb.CtrlCmdUtil import CtrlCmdUtil
 from app.utils.edcb.EDCBUtil import EDCBUtil
 from app.utils.TSInformation import TSInformation
@@ -430,7 +431,7 @@ async def TimeTableAPI(
     reservations_by_channel_time: dict[str, list[dict[str, Any]]] = {}
     if Config().general.backend == 'EDCB':
         try:
-            edcb = CtrlCmdUtil()
+            edcb = CachedCtrlCmdUtil()
             reserve_data_list: list[ReserveDataRequired] | None = await edcb.sendEnumReserve()
             if reserve_data_list is not None:
                 # (ONID, TSID, SID) からチャンネル ID への逆引き辞書
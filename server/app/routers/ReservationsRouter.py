@@ -23,6 +23,7 @@ from app.utils.edcb import (
     ReserveDataRequired,
     ServiceEventInfo,
 )
+from app.utils.edcb.CachedCtrlCmdUtil import CachedCtrlCmdUtil
 from app.utils.edcb.CtrlCmdUtil import CtrlCmdUtil
 from app.utils.edcb.EDCBUtil import EDCBUtil
 from app.utils.TSInformation import TSInformation
@@ -657,10 +658,13 @@ def EncodeEDCBRecSettingData(record_settings: schemas.RecordSettings) -> RecSett
 
 
 def GetCtrlCmdUtil() -> CtrlCmdUtil:
-    """ バックエンドが EDCB かのチェックを行い、EDCB であれば EDCB の CtrlCmdUtil インスタンスを返す """
+    """
+    バックエンドが EDCB かのチェックを行い、EDCB であれば EDCB の CtrlCmdUtil インスタンスを返す
+    予約一覧などの応答は EDCB から更新通知を受け取るまでキャッシュされる CachedCtrlCmdUtil を返す
+    """
 
     if Config().general.backend == 'EDCB':
-        return CtrlCmdUtil()
+        return CachedCtrlCmdUtil()
     else:
         logging.warning('[ReservationsRouter][GetCtrlCmdUtil] This API is only available when the backend is EDCB.')
         raise HTTPException(
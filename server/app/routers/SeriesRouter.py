@@ -2,10 +2,12 @@
 from typing import Annotated, Literal
 
 from fastapi import APIRouter, HTTPException, Path, Query, status
+from tortoise import connections
 from tortoise.expressions import Q
 
 from app import logging, schemas
 from app.models.Series import Series
+from app.utils.FullTextSearch import FullTextSearch
 
 
 # ルーター
@@ -58,21 +60,79 @@ async def SeriesListAPI(
 )
 async def SeriesSearchAPI(
     query: Annotated[str, Query(description='検索キーワード。title または description のいずれかに部分一致するシリーズ番組を検索する。')] = '',
-    order: Annotated[Literal['desc', 'asc'], Query(description='ソート順序 (desc or asc) 。')] = 'desc',
+    order: Annotated[Literal['desc', 'asc', 'relevance'], Query(description='ソート順序 (desc or asc or relevance) 。')] = 'desc',
     page: Annotated[int, Query(description='ページ番号。')] = 1,
 ):
     """
     指定されたキーワードでシリーズ番組を一度に 100 件ずつ検索する。<br>
     キーワードは title または description のいずれかに部分一致するシリーズ番組を検索する。<br>
-    order には "desc" か "asc" を指定する。<br>
+    order には "desc" か "asc" か "relevance" (キーワードとの関連度順) を指定する。<br>
     page (ページ番号) には 1 以上の整数を指定する。
     """
 
     # クエリが空の場合は全件取得と同じ挙動にする
     if not query:
-        return await SeriesListAPI(order=order, page=page)
+        return await SeriesListAPI(order='asc' if order == 'asc' else 'desc', page=page)
+
+    # 3文字以上のキーワードは、全文検索インデックス (series_fts) を使って検索する
+    ## クエリ全体を1つのフレーズとして扱い、従来通り title または description への部分一致で検索する
+    match_expression, _ = FullTextSearch.buildMatchExpression([query])
+    if match_expression is not None:
+        connection = connections.get('default')
+
+        # 関連度順の場合は、bm25() でランク付けした上でページングしてからシリーズ番組を取得する
+        if order == 'relevance':
+            rows = await connection.execute_query_dict(
+                f"""
+                SELECT rowid AS id
+                FROM series_fts
+                WHERE series_fts MATCH ?
+                ORDER BY {FullTextSearch.getBM25Expression('series_fts')} ASC
+                LIMIT ? OFFSET ?
+                """,
+                [match_expression, PAGE_SIZE, (page - 1) * PAGE_SIZE],
+            )
+            series_ids: list[int] = [row['id'] for row in rows]
+            series_list = await Series.all() \
+                .select_related('broadcast_periods') \
+                .select_related('broadcast_periods__channel') \
+                .select_related('broadcast_periods__recorded_programs') \
+                .select_related('broadcast_periods__recorded_programs__recorded_video') \
+                .select_related('broadcast_periods__recorded_programs__channel') \
+                .filter(id__in=series_ids)
+            # bm25() によるランク順に並べ直す
+            id_to_index = {series_id: index for index, series_id in enumerate(series_ids)}
+            series_list = sorted(series_list, key=lambda series: id_to_index[series.id])
+
+        # それ以外の場合は、検索条件に一致するシリーズ番組の ID で絞り込む
+        else:
+            rows = await connection.execute_query_dict(
+                'SELECT rowid AS id FROM series_fts WHERE series_fts MATCH ?',
+                [match_expression],
+            )
+            series_list = await Series.all() \
+                .select_related('broadcast_periods') \
+                .select_related('broadcast_periods__channel') \
+                .select_related('broadcast_periods__recorded_programs') \
+                .select_related('broadcast_periods__recorded_programs__recorded_video') \
+                .select_related('broadcast_periods__recorded_programs__channel') \
+                .filter(id__in=[row['id'] for row in rows]) \
+                .order_by('-updated_at' if order == 'desc' else 'updated_at') \
+                .offset((page - 1) * PAGE_SIZE) \
+                .limit(PAGE_SIZE)
+
+        # 検索条件に一致する総件数を取得
+        total_rows = await connection.execute_query_dict(
+            'SELECT COUNT(*) AS count FROM series_fts WHERE series_fts MATCH ?',
+            [match_expression],
+        )
 
-    # 検索条件を構築
+        return {
+            'total': total_rows[0]['count'],
+            'series_list': series_list,
+        }
+
+    # 2文字以下のキーワードは trigram で分解できず全文検索インデックスを使えないため、LIKE で検索する
     # title または description のいずれかに部分一致するレコードを検索
     series_list = await Series.all() \
         .select_related('broadcast_periods') \
@@ -84,7 +144,7 @@ async def SeriesSearchAPI(
             Q(title__icontains=query) |
             Q(description__icontains=query)
         ) \
-        .order_by('-updated_at' if order == 'desc' else 'updated_at') \
+        .order_by('-updated_at' if order != 'asc' else 'updated_at') \
         .offset((page - 1) * PAGE_SIZE) \
         .limit(PAGE_SIZE)
 
@@ -5,7 +5,6 @@ from collections.abc import Coroutine
 from typing import Annotated, Any, Literal
 from urllib.parse import urlparse
 
-import httpx
 import tweepy
 from fastapi import (
     APIRouter,
@@ -28,6 +27,7 @@ from app.constants import API_REQUEST_HEADERS
 from app.models.TwitterAccount import TwitterAccount
 from app.models.User import User
 from app.routers.UsersRouter import GetCurrentUser
+from app.utils.HTTPClientPool import HTTPClientPool
 from app.utils.TwitterGraphQLAPI import TwitterGraphQLAPI
 from app.utils.TwitterScrapeBrowser import TwitterScrapeBrowser
 
@@ -529,14 +529,14 @@ async def TwitterVideoProxyAPI(
         if key.lower() in allowed_request_headers:
             proxy_headers[key] = value
 
-    # httpx クライアントを作成し、ストリーミングモードでリクエストを送信
+    # Twitter 動画配信サーバー向けの共有クライアントを使い、ストリーミングモードでリクエストを送信
     ## メモリ効率のためにレスポンスボディを一括で読み込まず、チャンク単位でストリーミング転送する
-    client = httpx.AsyncClient(follow_redirects=True, timeout=30.0)
+    ## クライアントは使い回すため閉じずに、レスポンスのみを閉じてコネクションをプールに戻す
+    client = HTTPClientPool.get('TwitterVideo')
     try:
         upstream_request = client.build_request('GET', url, headers=proxy_headers)
         upstream_response = await client.send(upstream_request, stream=True)
     except Exception as ex:
-        await client.aclose()
         logging.error('[TwitterRouter][TwitterVideoProxyAPI] Failed to request upstream:', exc_info=ex)
         raise HTTPException(
             status_code = status.HTTP_502_BAD_GATEWAY,
@@ -547,7 +547,6 @@ async def TwitterVideoProxyAPI(
     if upstream_response.status_code >= 400:
         error_body = await upstream_response.aread()
         await upstream_response.aclose()
-        await client.aclose()
         error_text = error_body[:200].decode('utf-8', errors='replace')
         logging.error(f'[TwitterRouter][TwitterVideoProxyAPI] Upstream returned HTTP {upstream_response.status_code}: {error_text}')
         raise HTTPException(
@@ -571,7 +570,6 @@ async def TwitterVideoProxyAPI(
     # ストリーミングレスポンスの完了後にクリーンアップを行う BackgroundTask
     async def cleanup() -> None:
         await upstream_response.aclose()
-        await client.aclose()
 
     return StreamingResponse(
         upstream_response.aiter_bytes(chunk_size=65536),
@@ -1,5 +1,4 @@
 
-import asyncio
 import json
 from typing import Annotated
 
@@ -168,7 +167,9 @@ async def VideoHLSBufferAPI(
     async def generator():
         """イベントストリームを出力するジェネレーター"""
 
-        # 初期値
+        # バッファ範囲の変化を通知する asyncio.Event を取得してから、現在のバッファ範囲を取得する
+        ## 取得の間にバッファ範囲が変化しても取りこぼさないよう、必ずイベントを先に取得する
+        buffer_range_changed = video_stream.getBufferRangeChangedEvent()
         previous_buffer_range = video_stream.getBufferRange()
 
         # 初回接続時に必ず現在のバッファ範囲を返す
@@ -182,6 +183,11 @@ async def VideoHLSBufferAPI(
 
         while True:
 
+            # バッファ範囲が変化するまで待機する
+            ## セグメントのエンコードが完了・リセットされる度に VideoStream から通知されるため、ポーリングは不要
+            await buffer_range_changed.wait()
+            buffer_range_changed = video_stream.getBufferRangeChangedEvent()
+
             # 現在のバッファ範囲を取得
             buffer_range = video_stream.getBufferRange()
 
@@ -199,9 +205,6 @@ async def VideoHLSBufferAPI(
                 # 取得結果を保存
                 previous_buffer_range = buffer_range
 
-            # ビジーにならないように、0.1秒ごとにチェックする
-            await asyncio.sleep(0.1)
-
     # EventSourceResponse でイベントストリームを配信する
     return EventSourceResponse(generator())
 
@@ -215,11 +218,13 @@ async def VideoHLSKeepAliveAPI(
     recorded_program: Annotated[RecordedProgram, Depends(ValidateVideoID)],
     quality: Annotated[QUALITY_TYPES, Depends(ValidateQuality)],
     session_id: Annotated[str, Query(description='セッション ID（クライアント側で適宜生成したランダム値を指定する）。')],
+    current_time: Annotated[float | None, Query(description='現在の再生位置 (秒) 。指定された場合、再生位置から先のセグメントを先読みしてエンコードする。')] = None,
 ):
     """
     録画番組のストリーミング用 HLS セグメントの生成を継続するための API 。<br>
     ストリーミングセッションを維持するために、この API は録画番組の視聴を続けている間、定期的に呼び出さなければならない。<br>
-    この API が定期的に呼び出されなくなった場合、一定時間後にストリーミング用 HLS セグメントの生成が停止され、メモリ上のデータが破棄される。
+    この API が定期的に呼び出されなくなった場合、一定時間後にストリーミング用 HLS セグメントの生成が停止され、メモリ上のデータが破棄される。<br>
+    current_time に現在の再生位置を指定すると、再生位置から数セグメント先までが常にエンコード済みになるよう先読みが行われる。
     """
 
     # 録画視聴セッションを取得
@@ -227,3 +232,7 @@ async def VideoHLSKeepAliveAPI(
 
     # セッションのアクティブ状態を維持する
     video_stream.keepAlive()
+
+    # 再生位置が指定されている場合は、再生位置を反映して先読みをスケジュールする
+    if current_time is not None:
+        await video_stream.updatePlaybackPosition(current_time)
@@ -1,4 +1,5 @@
 
+import base64
 import json
 import pathlib
 from email.utils import parsedate
@@ -27,6 +28,7 @@ from app.models.RecordedProgram import RecordedProgram
 from app.models.User import User
 from app.routers.UsersRouter import GetCurrentAdminUser
 from app.utils.DriveIOLimiter import DriveIOLimiter
+from app.utils.FullTextSearch import FullTextSearch
 from app.utils.JikkyoClient import JikkyoClient
 
 
@@ -40,7 +42,50 @@ router = APIRouter(
 PAGE_SIZE = 30
 
 
-async def ConvertRowToRecordedProgram(row: dict[str, Any]) -> schemas.RecordedProgram:
+def EncodeVideosCursor(order: Literal['desc', 'asc'], start_time: str, recorded_program_id: int) -> str:
+    """
+    録画番組一覧 API のキーセットページネーションで使うカーソルを生成する
+    カーソルは (ソート順序, 番組開始時刻, 録画番組 ID) を JSON にして URL-safe な Base64 でエンコードした不透明な文字列とする
+
+    Args:
+        order (Literal['desc', 'asc']): ソート順序
+        start_time (str): ページの最後の録画番組の番組開始時刻 (DB に保存されている文字列表現のまま)
+        recorded_program_id (int): ページの最後の録画番組の ID
+
+    Returns:
+        str: カーソル
+    """
+
+    return base64.urlsafe_b64encode(json.dumps([order, start_time, recorded_program_id]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def DecodeVideosCursor(cursor: str, order: Literal['desc', 'asc']) -> tuple[str, int]:
+    """
+    録画番組一覧 API のキーセットページネーションで使うカーソルをデコードする
+
+    Args:
+        cursor (str): EncodeVideosCursor() で生成されたカーソル
+        order (Literal['desc', 'asc']): リクエストされたソート順序
+
+    Returns:
+        tuple[str, int]: (番組開始時刻, 録画番組 ID)
+    """
+
+    try:
+        decoded_order, start_time, recorded_program_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if decoded_order != order or not isinstance(start_time, str) or not isinstance(recorded_program_id, int):
+            raise ValueError('Cursor does not match the requested order')
+    except Exception:
+        logging.error(f'[VideosRouter][DecodeVideosCursor] Specified cursor is invalid. [cursor: {cursor}]')
+        raise HTTPException(
+            status_code = status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail = 'Specified cursor is invalid',
+        )
+
+    return start_time, recorded_program_id
+
+
+def ConvertRowToRecordedProgram(row: dict[str, Any]) -> schemas.RecordedProgram:
     """ データベースの行データを RecordedProgram Pydantic モデルに変換する共通処理 """
 
     # key_frames の存在確認
@@ -321,12 +366,14 @@ async def VideosAPI(
     order: Annotated[Literal['desc', 'asc', 'ids'], Query(description='ソート順序 (desc or asc or ids) 。ids を指定すると、ids パラメータで指定された順序を維持する。')] = 'desc',
     page: Annotated[int, Query(description='ページ番号。')] = 1,
     ids: Annotated[list[int] | None, Query(description='録画番組 ID のリスト。指定時は指定された ID の録画番組のみを返す。')] = None,
+    cursor: Annotated[str | None, Query(description='前のページのレスポンスに含まれる next_cursor 。指定時は page の代わりにカーソルの続きから取得する。')] = None,
 ):
     """
     すべての録画番組を一度に 30 件ずつ取得する。<br>
     order には "desc" か "asc" か "ids" を指定する。"ids" を指定すると、ids パラメータで指定された順序を維持する。<br>
     page (ページ番号) には 1 以上の整数を指定する。<br>
-    ids には録画番組 ID のリストを指定できる。指定時は指定された ID の録画番組のみを返す。
+    ids には録画番組 ID のリストを指定できる。指定時は指定された ID の録画番組のみを返す。<br>
+    cursor には前のページのレスポンスに含まれる next_cursor を指定できる。指定時は page は無視され、深いページでも一定の速度で取得できる。
     """
 
     # 生 SQL クエリを構築
@@ -382,9 +429,9 @@ async def VideosAPI(
             rv.secondary_audio_codec,
             rv.secondary_audio_channel,
             rv.secondary_audio_sampling_rate,
-            -- key_frames は巨大なデータなので実際のデータは取得せず
-            -- 空かどうかの判定結果だけを取得する
-            CASE WHEN rv.key_frames != '[]' THEN 1 ELSE 0 END AS has_key_frames,
+            -- key_frames_data は巨大なデータなので実際のデータは取得せず
+            -- key_frame_count からキーフレーム情報の有無だけを取得する
+            CASE WHEN rv.key_frame_count > 0 THEN 1 ELSE 0 END AS has_key_frames,
             rv.cm_sections,
             rv.thumbnail_info,
             rv.created_at AS rv_created_at,
@@ -411,8 +458,22 @@ async def VideosAPI(
         LIMIT ? OFFSET ?
     """
 
+    # cursor が指定されている場合は、カーソルが指す録画番組の続きから取得する (キーセットページネーション)
+    ## OFFSET によるページングではページが深くなるほど読み飛ばす行が増えるが、
+    ## (start_time, id) のインデックスを使って続きの位置から直接読み始められるため、どのページでも速度が変わらない
+    cursor_clause = ''
+    cursor_params: list[Any] = []
+    offset = (page - 1) * PAGE_SIZE
+    if cursor is not None and order != 'ids':
+        cursor_start_time, cursor_recorded_program_id = DecodeVideosCursor(cursor, order)
+        cursor_clause = f'AND (rp.start_time, rp.id) {"<" if order == "desc" else ">"} (?, ?)'
+        cursor_params = [cursor_start_time, cursor_recorded_program_id]
+        offset = 0
+
     # ids が指定されている場合は、指定された ID の録画番組のみを返す
     target_ids: list[int] | None = None
+    total_query: str | None = None
+    total_params: list[Any] = []
     if ids is not None:
         # order が 'ids' の場合は、指定された順序を維持する
         if order == 'ids':
@@ -441,10 +502,10 @@ async def VideosAPI(
         else:
             # 通常のソート順で取得
             query = base_query.format(
-                where_clause = f'AND rp.id IN ({",".join(["?" for _ in ids])})',
+                where_clause = f'AND rp.id IN ({",".join(["?" for _ in ids])}) {cursor_clause}',
                 order = 'DESC' if order == 'desc' else 'ASC'
             )
-            params = [*ids, str(PAGE_SIZE), str((page - 1) * PAGE_SIZE)]
+            params = [*ids, *cursor_params, str(PAGE_SIZE), str(offset)]
 
             # 総数を取得
             total_query = 'SELECT COUNT(*) as count FROM recorded_programs WHERE id IN ({})'.format(
@@ -455,26 +516,33 @@ async def VideosAPI(
     else:
         # すべての録画番組を返す
         query = base_query.format(
-            where_clause = '',
+            where_clause = cursor_clause,
             order = 'DESC' if order == 'desc' else 'ASC'
         )
-        params = [str(PAGE_SIZE), str((page - 1) * PAGE_SIZE)]
+        params = [*cursor_params, str(PAGE_SIZE), str(offset)]
 
-        # 総数を取得
-        total_query = 'SELECT COUNT(*) as count FROM recorded_programs'
-        total_params = []
+        # 総数はリクエストごとに数えず、録画番組の追加・削除に合わせて維持されているキャッシュを使う
 
     try:
         # データベースから直接クエリを実行
         conn = connections.get('default')
         rows = await conn.execute_query(query, params)
-        total_result = await conn.execute_query(total_query, total_params)
-        total = total_result[1][0]['count']
+        if total_query is not None:
+            total_result = await conn.execute_query(total_query, total_params)
+            total = total_result[1][0]['count']
+        else:
+            total = await RecordedProgram.getTotalCount()
 
         # 結果を Pydantic モデルに変換
-        recorded_programs: list[schemas.RecordedProgram] = []
-        for row in rows[1]:  # rows[0] はカラム情報、rows[1] が実際のデータ
-            recorded_programs.append(await ConvertRowToRecordedProgram(row))
+        ## rows[0] はカラム情報、rows[1] が実際のデータ
+        recorded_programs = [ConvertRowToRecordedProgram(row) for row in rows[1]]
+
+        # 次のページを取得するためのカーソルを生成
+        ## ページが埋まっていない場合は、次のページは存在しない
+        next_cursor: str | None = None
+        if order != 'ids' and len(rows[1]) == PAGE_SIZE:
+            last_row = rows[1][-1]
+            next_cursor = EncodeVideosCursor(order, str(last_row['start_time']), last_row['rp_id'])
 
         # order が 'ids' の場合は、指定された順序を維持する
         if ids is not None and order == 'ids':
@@ -486,6 +554,7 @@ async def VideosAPI(
         return schemas.RecordedPrograms(
             total = total,
             recorded_programs = recorded_programs,
+            next_cursor = next_cursor,
         )
 
     except Exception as ex:
@@ -503,36 +572,40 @@ async def VideosAPI(
     response_model = schemas.RecordedPrograms,
 )
 async def VideosSearchAPI(
-    query: Annotated[str, Query(description='検索キーワード。title または series_title または subtitle のいずれかに部分一致する録画番組を検索する。')] = '',
-    order: Annotated[Literal['desc', 'asc'], Query(description='ソート順序 (desc or asc) 。')] = 'desc',
+    query: Annotated[str, Query(description='検索キーワード。title または series_title または subtitle またはチャンネル名のいずれかに部分一致する録画番組を検索する。')] = '',
+    order: Annotated[Literal['desc', 'asc', 'relevance'], Query(description='ソート順序 (desc or asc or relevance) 。')] = 'desc',
     page: Annotated[int, Query(description='ページ番号。')] = 1,
 ):
     """
     指定されたキーワードで録画番組を一度に 30 件ずつ検索する。<br>
-    キーワードは title または series_title または subtitle のいずれかに部分一致する録画番組を検索する。<br>
-    order には "desc" か "asc" を指定する。<br>
+    キーワードは title または series_title または subtitle またはチャンネル名のいずれかに部分一致する録画番組を検索する。<br>
+    order には "desc" か "asc" か "relevance" (キーワードとの関連度順) を指定する。<br>
     page (ページ番号) には 1 以上の整数を指定する。<br>
     半角または全角スペースで区切ることで、複数のキーワードによる AND 検索が可能。
     """
 
-    def BuildSearchConditions(query: str) -> tuple[str, list[str], list[str]]:
+    def BuildSearchConditions(query: str) -> tuple[str | None, str, list[str], list[str]]:
         """
-        検索キーワードから SQL の WHERE 句とパラメータを生成する
+        検索キーワードから FTS5 の検索式と、SQL の WHERE 句とパラメータを生成する
         半角または全角スペースで区切られた複数のキーワードを AND 検索する
+        3文字以上のキーワードは全文検索インデックスで検索し、それ未満のキーワードのみ LIKE で検索する
 
         Returns:
-            tuple[str, list[str], list[str]]: (WHERE 句, パラメータ, 検索キーワードのリスト)
+            tuple[str | None, str, list[str], list[str]]: (FTS5 の検索式, LIKE 検索の WHERE 句, LIKE 検索のパラメータ, 検索キーワードのリスト)
         """
 
         # 半角・全角スペースで分割
-        keywords = [keyword.strip() for keyword in query.replace('　', ' ').split(' ') if keyword.strip()]
+        keywords = FullTextSearch.splitKeywords(query)
         if not keywords:
-            return '', [], []
+            return None, '', [], []
 
-        # 各キーワードに対する検索条件を生成
+        # 全文検索インデックスで検索できるキーワードを FTS5 の検索式にまとめる
+        match_expression, like_keywords = FullTextSearch.buildMatchExpression(keywords)
+
+        # 残りのキーワードに対する検索条件を生成
         conditions: list[str] = []
         params: list[str] = []
-        for keyword in keywords:
+        for keyword in like_keywords:
             # LIKE 検索用のパラメータを生成（前後に % を付与）
             param = f'%{keyword.lower()}%'
             conditions.append('''
@@ -547,16 +620,35 @@ async def VideosSearchAPI(
 
         # AND 検索のために conditions を結合
         where_clause = ' AND '.join(conditions)
-        return where_clause, params, keywords
+        return match_expression, where_clause, params, keywords
 
     # クエリが空の場合は全件取得と同じ挙動にする
     if not query:
-        return await VideosAPI(order=order, page=page)
+        return await VideosAPI(order='asc' if order == 'asc' else 'desc', page=page)
 
     # 検索条件を構築
-    where_clause, params, keywords = BuildSearchConditions(query)
+    match_expression, where_clause, params, keywords = BuildSearchConditions(query)
     if not keywords:  # キーワードが空の場合は全件取得と同じ挙動にする
-        return await VideosAPI(order=order, page=page)
+        return await VideosAPI(order='asc' if order == 'asc' else 'desc', page=page)
+
+    # 全文検索インデックスで検索できるキーワードがある場合は、recorded_programs_fts を起点に絞り込む
+    ## 全文検索インデックスの検索条件を先頭に置き、残りの LIKE 検索は絞り込まれた録画番組に対してのみ行われるようにする
+    if match_expression is not None:
+        from_clause = 'recorded_programs_fts JOIN recorded_programs rp ON rp.id = recorded_programs_fts.rowid'
+        where_clause = ' AND '.join(['recorded_programs_fts MATCH ?', *([where_clause] if where_clause else [])])
+        params.insert(0, match_expression)
+    else:
+        from_clause = 'recorded_programs rp'
+
+    # ソート順を決定
+    ## 関連度順は bm25() によるランク付けを使うため、全文検索インデックスで検索できるキーワードがある場合のみ有効
+    ## それ以外の場合は新しい順にフォールバックする
+    if order == 'relevance' and match_expression is not None:
+        order_clause = f'{FullTextSearch.getBM25Expression("recorded_programs_fts")} ASC, rp.start_time DESC, rp.id DESC'
+    elif order == 'asc':
+        order_clause = 'rp.start_time ASC, rp.id ASC'
+    else:
+        order_clause = 'rp.start_time DESC, rp.id DESC'
 
     # 生 SQL クエリを構築
     base_query = """
@@ -611,9 +703,9 @@ async def VideosSearchAPI(
             rv.secondary_audio_codec,
             rv.secondary_audio_channel,
             rv.secondary_audio_sampling_rate,
-            -- key_frames は巨大なデータなので実際のデータは取得せず
-            -- 空かどうかの判定結果だけを取得する
-            CASE WHEN rv.key_frames != '[]' THEN 1 ELSE 0 END AS has_key_frames,
+            -- key_frames_data は巨大なデータなので実際のデータは取得せず
+            -- key_frame_count からキーフレーム情報の有無だけを取得する
+            CASE WHEN rv.key_frame_count > 0 THEN 1 ELSE 0 END AS has_key_frames,
             rv.cm_sections,
             rv.thumbnail_info,
             rv.created_at AS rv_created_at,
@@ -631,25 +723,26 @@ async def VideosSearchAPI(
             ch.is_subchannel,
             ch.is_radiochannel,
             ch.is_watchable
-        FROM recorded_programs rp
+        FROM {from_clause}
         JOIN recorded_videos rv ON rp.id = rv.recorded_program_id
         LEFT JOIN channels ch ON rp.channel_id = ch.id
         WHERE {where_clause}
-        ORDER BY rp.start_time {order}, rp.id {order}
+        ORDER BY {order_clause}
         LIMIT ? OFFSET ?
     """
 
     # クエリとパラメータを構築
     query = base_query.format(
+        from_clause = from_clause,
         where_clause = where_clause,
-        order = 'DESC' if order == 'desc' else 'ASC'
+        order_clause = order_clause,
     )
     params.extend([str(PAGE_SIZE), str((page - 1) * PAGE_SIZE)])
 
     # 総数を取得するクエリを構築
     total_query = f"""
         SELECT COUNT(*) as count
-        FROM recorded_programs rp
+        FROM {from_clause}
         LEFT JOIN channels ch ON rp.channel_id = ch.id
         WHERE {where_clause}
     """
@@ -663,9 +756,8 @@ async def VideosSearchAPI(
         total = total_result[1][0]['count']
 
         # 結果を Pydantic モデルに変換
-        recorded_programs: list[schemas.RecordedProgram] = []
-        for row in rows[1]:  # rows[0] はカラム情報、rows[1] が実際のデータ
-            recorded_programs.append(await ConvertRowToRecordedProgram(row))
+        ## rows[0] はカラム情報、rows[1] が実際のデータ
+        recorded_programs = [ConvertRowToRecordedProgram(row) for row in rows[1]]
 
         return schemas.RecordedPrograms(
             total = total,
@@ -908,6 +1000,7 @@ async def VideoDeleteAPI(
 
             # データベースから録画番組情報を削除
             await recorded_program.delete()
+            RecordedProgram.adjustTotalCount(-1)
         except Exception as ex:
             logging.error('[VideoDeleteAPI] Failed to delete recorded program from database:', exc_info=ex)
             raise HTTPException(
@@ -237,6 +237,8 @@ class RecordedProgram(PydanticModel):
 class RecordedPrograms(BaseModel):
     total: int
     recorded_programs: list[RecordedProgram]
+    # 録画番組一覧 API で次のページを取得するためのカーソル (次のページが存在しない場合は None)
+    next_cursor: str | None = None
 
 # ***** シリーズ *****
 
@@ -341,7 +343,7 @@ class TwitterCookieAuthRequest(BaseModel):
 # ***** ライブストリーム *****
 
 class LiveStreamStatus(BaseModel):
-    status: Literal['Offline', 'Standby', 'ONAir', 'Idling', 'Restart']
+    status: Literal['Offline', 'Standby', 'ONAir', 'Idling', 'Restart', 'Warm']
     detail: str
     started_at: float
     updated_at: float
@@ -623,6 +625,27 @@ class TwitterGraphQLAPIEndpointInfo(BaseModel):
     def path(self) -> str:
         return f'/i/api/graphql/{self.query_id}/{self.endpoint}'
 
+# ***** メンテナンス *****
+
+class HTTPClientPoolStatus(BaseModel):
+    upstream: Literal['Mirakurun', 'External', 'DataBroadcasting', 'TwitterVideo']
+    http2: bool
+    max_connections: int | None
+    max_keepalive_connections: int | None
+    client_count: int
+    active_connections: int
+    idle_connections: int
+    pending_requests: int
+    total_requests: int
+
+class HTTPClientPoolStatuses(RootModel[list[HTTPClientPoolStatus]]):
+    pass
+
+class LogHistory(BaseModel):
+    lines: list[str]
+    offset: int
+    has_more: bool
+
 # ***** ユーザー *****
 
 class UserAccessToken(BaseModel):
@@ -5,25 +5,17 @@ from __future__ import annotations
 
 import asyncio
 import gc
-import os
 import re
-import sys
 import time
-from collections.abc import AsyncIterator
 from typing import TYPE_CHECKING, ClassVar, Literal, cast
 
 import aiofiles
-import aiohttp
 import anyio
-import httpx
 from aiofiles.threadpool.text import AsyncTextIOWrapper
-from biim.mpeg2ts import ts
 
 from app import logging
 from app.config import Config
 from app.constants import (
-    API_REQUEST_HEADERS,
-    HTTPX_CLIENT,
     LIBRARY_PATH,
     LOGS_DIR,
     QUALITY,
@@ -31,9 +23,10 @@ from app.constants import (
 )
 from app.models.Channel import Channel
 from app.streams.LivePSIDataArchiver import LivePSIDataArchiver
-from app.utils import GetMirakurunAPIEndpointURL
-from app.utils.edcb.EDCBTuner import EDCBTuner
-from app.utils.edcb.PipeStreamReader import PipeStreamReader
+from app.streams.LiveRenditionEncoder import LiveRenditionEncoder, LiveRenditionOutput
+from app.utils.EncoderLogMatcher import EncoderLogMatcher
+from app.utils.EncoderLogReader import EncoderLogReader
+from app.utils.TSPacketReader import TSPacketReader
 
 
 if TYPE_CHECKING:
@@ -63,6 +56,29 @@ class LiveEncodingTask:
     ENCODER_TS_READ_TIMEOUT_ONAIR: ClassVar[int] = 5
     ENCODER_TS_READ_TIMEOUT_ONAIR_VCEENCC: ClassVar[int] = 10
 
+    # エンコード進捗のログから余計なゴミを取り除くための正規表現
+    ## HWEncC は内部で使われている FFmpeg 側の大量に出るデバッグログと衝突してログがごちゃまぜになりがち…
+    ## FFmpeg 側のログ（ゴミ）と完全に混ざっていると完全に除去できずに frames: の数値が桁が飛んだような出力になるけどご愛嬌…
+    ENCODER_LOG_PROGRESS_PATTERN: ClassVar[re.Pattern[str]] = re.compile(
+        r'^.*?([1-9][0-9]+ frames: [0-9\.]+ fps, [0-9]+ kb/s(?:, GPU [0-9]+%(?:, VE [0-9]+%)?, VD [0-9]+%)?)$')
+
+    # 山ほど出力されるためログから除外するメッセージ
+    ## 元は "Delay between the first packet and last packet in the muxing queue is xxxxxx > 1: forcing output" と
+    ## "removing 2 bytes from input bitstream not read by decoder." という2つのメッセージで、実害はない
+    ## FFmpeg と HWEncC のログが衝突して行の先頭が欠けることがあるので、できるだけ多く弾けるように部分一致にしている
+    ENCODER_LOG_IGNORED_PATTERN: ClassVar[re.Pattern[str]] = re.compile('|'.join(re.escape(text) for text in [
+        'removing 2 bytes from input bitstream not read by decoder.',
+        'Delay between the',
+        '[h264_metadata',
+        '[hevc_metadata',
+        'packet in the muxing queue',
+        'ing output',
+    ]))
+    ## 行の先頭が欠けて "forcing output" の末尾だけが残った行は完全一致で除外する
+    ENCODER_LOG_IGNORED_LINES: ClassVar[frozenset[str]] = frozenset([
+        'ng output', 'g output', ' output', 'output', 'utput', 'tput', 'put', 'ut', 't',
+    ])
+
 
     def __init__(self, live_stream: LiveStream) -> None:
         """
@@ -134,6 +150,81 @@ class LiveEncodingTask:
         # オプションの入る配列
         options: list[str] = []
 
+        # 入力
+        options.append(self.buildFFmpegInputOption(channel_type))
+
+        # 出力 (ストリームのマッピング・映像・音声)
+        video_filter = self.buildFFmpegVideoFilter(quality, channel_type, is_fullhd_channel)
+        options += self.buildFFmpegOutputOptions(quality, channel_type, '0:v:0', video_filter, 'pipe:1')  # 標準入力へ出力
+
+        # オプションをスペースで区切って配列にする
+        result: list[str] = []
+        for option in options:
+            result += option.split(' ')
+
+        return result
+
+
+    def buildFFmpegMultiRenditionOptions(self,
+        qualities: list[QUALITY_TYPES],
+        channel_type: Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K'],
+        is_fullhd_channel: bool,
+        output_urls: list[str],
+    ) -> list[str]:
+        """
+        複数の画質 (レンディション) を1つのプロセスでまとめてエンコードするための FFmpeg に渡すオプションを組み立てる
+        映像のデコードは1回だけ行い、split フィルターで分岐させた映像を画質ごとにインターレース解除・リサイズしてそれぞれの出力先にエンコードする
+
+        Args:
+            qualities (list[QUALITY_TYPES]): 映像の品質のリスト
+            channel_type (Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K']): チャンネルの種類
+            is_fullhd_channel (bool): フル HD 放送が実施されているチャンネルかどうか
+            output_urls (list[str]): 各画質の出力先 (pipe:3 など) のリスト (qualities と同じ順番)
+
+        Returns:
+            list[str]: FFmpeg に渡すオプションが連なる配列
+        """
+
+        # オプションの入る配列
+        options: list[str] = []
+
+        # 入力
+        options.append(self.buildFFmpegInputOption(channel_type))
+
+        # 映像のフィルターグラフ
+        ## デコードした映像を画質の数だけ split で分岐させ、それぞれ [v0] [v1] ... のラベルで出力する
+        ## オプションはスペースで区切られるため、フィルターグラフにはスペースを含めてはならない
+        split_labels = ''.join(f'[s{index}]' for index in range(len(qualities)))
+        filter_graphs = [f'[0:v:0]split={len(qualities)}{split_labels}']
+        for index, quality in enumerate(qualities):
+            video_filter = self.buildFFmpegVideoFilter(quality, channel_type, is_fullhd_channel)
+            filter_graphs.append(f'[s{index}]{video_filter}[v{index}]')
+        options.append(f'-filter_complex {";".join(filter_graphs)}')
+
+        # 出力 (ストリームのマッピング・映像・音声)
+        ## 画質ごとに出力オプションを繰り返し指定する
+        for index, (quality, output_url) in enumerate(zip(qualities, output_urls)):
+            options += self.buildFFmpegOutputOptions(quality, channel_type, f'[v{index}]', None, output_url)
+
+        # オプションをスペースで区切って配列にする
+        result: list[str] = []
+        for option in options:
+            result += option.split(' ')
+
+        return result
+
+
+    def buildFFmpegInputOption(self, channel_type: Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K']) -> str:
+        """
+        FFmpeg に渡す入力のオプションを組み立てる
+
+        Args:
+            channel_type (Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K']): チャンネルの種類
+
+        Returns:
+            str: FFmpeg に渡す入力のオプション
+        """
+
         # 入力ストリームの解析時間
         analyzeduration = round(500000 + (self._retry_count * 200000))  # リトライ回数に応じて少し増やす
         if channel_type == 'SKY':
@@ -143,11 +234,70 @@ class LiveEncodingTask:
 
         # 入力
         ## -analyzeduration をつけることで、ストリームの分析時間を短縮できる
-        options.append(f'-f mpegts -analyzeduration {analyzeduration} -i pipe:0')
+        return f'-f mpegts -analyzeduration {analyzeduration} -i pipe:0'
+
+
+    def buildFFmpegVideoFilter(self,
+        quality: QUALITY_TYPES,
+        channel_type: Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K'],
+        is_fullhd_channel: bool,
+    ) -> str:
+        """
+        FFmpeg に渡す映像のフィルター (インターレース解除・リサイズ) を組み立てる
+
+        Args:
+            quality (QUALITY_TYPES): 映像の品質
+            channel_type (Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K']): チャンネルの種類
+            is_fullhd_channel (bool): フル HD 放送が実施されているチャンネルかどうか
+
+        Returns:
+            str: FFmpeg に渡す映像のフィルター (カンマ区切り)
+        """
+
+        ## フル HD 放送が行われているチャンネルかつ、指定された品質の解像度が 1440×1080 (1080p) の場合のみ、
+        ## 特別に縦解像度を 1920 に変更してフル HD (1920×1080) でエンコードする
+        video_width = QUALITY[quality].width
+        video_height = QUALITY[quality].height
+        if video_width == 1440 and video_height == 1080 and is_fullhd_channel is True:
+            video_width = 1920
+
+        ## BS4K は 60p (プログレッシブ) で放送されているので、インターレース解除を行わない
+        if channel_type == "BS4K":
+            return f'scale={video_width}:{video_height}'
+        ## インターレース解除 (60i → 60p (フレームレート: 60fps))
+        if QUALITY[quality].is_60fps is True:
+            return f'yadif=mode=1:parity=-1:deint=1,scale={video_width}:{video_height}'
+        ## インターレース解除 (60i → 30p (フレームレート: 30fps))
+        return f'yadif=mode=0:parity=-1:deint=1,scale={video_width}:{video_height}'
+
+
+    def buildFFmpegOutputOptions(self,
+        quality: QUALITY_TYPES,
+        channel_type: Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K'],
+        video_stream: str,
+        video_filter: str | None,
+        output_url: str,
+    ) -> list[str]:
+        """
+        FFmpeg に渡す1つの出力 (ストリームのマッピング・映像・音声) のオプションを組み立てる
+
+        Args:
+            quality (QUALITY_TYPES): 映像の品質
+            channel_type (Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K']): チャンネルの種類
+            video_stream (str): 出力にマッピングする映像ストリーム (0:v:0 やフィルターグラフの出力ラベル)
+            video_filter (str | None): 映像のフィルター (フィルターグラフで既に適用済みの場合は None)
+            output_url (str): 出力先 (pipe:1 など)
+
+        Returns:
+            list[str]: FFmpeg に渡す出力のオプションが連なる配列 (スペースで区切る前のもの)
+        """
+
+        # オプションの入る配列
+        options: list[str] = []
 
         # ストリームのマッピング
         ## 音声切り替えのため、主音声・副音声両方をエンコード後の TS に含む
-        options.append('-map 0:v:0 -map 0:a:0 -map 0:a:1 -map 0:d? -ignore_unknown')
+        options.append(f'-map {video_stream} -map 0:a:0 -map 0:a:1 -map 0:d? -ignore_unknown')
 
         # フラグ
         ## 主に FFmpeg の起動を高速化するための設定
@@ -171,12 +321,9 @@ class LiveEncodingTask:
         else:
             options.append('-profile:v high')
 
-        ## フル HD 放送が行われているチャンネルかつ、指定された品質の解像度が 1440×1080 (1080p) の場合のみ、
-        ## 特別に縦解像度を 1920 に変更してフル HD (1920×1080) でエンコードする
-        video_width = QUALITY[quality].width
-        video_height = QUALITY[quality].height
-        if video_width == 1440 and video_height == 1080 and is_fullhd_channel is True:
-            video_width = 1920
+        ## インターレース解除・リサイズ
+        if video_filter is not None:
+            options.append(f'-vf {video_filter}')
 
         ## 最大 GOP 長 (秒)
         ## 30fps なら ×30 、 60fps なら ×60 された値が --gop-len で使われる
@@ -185,19 +332,11 @@ class LiveEncodingTask:
             ## H.265/HEVC では高圧縮化のため、最大 GOP 長を長くする
             gop_length_second = self.GOP_LENGTH_SECONDS_H265
 
-        ## BS4K は 60p (プログレッシブ) で放送されているので、インターレース解除を行わず 60fps でエンコードする
-        if channel_type == "BS4K":
-            options.append(f'-vf scale={video_width}:{video_height}')
+        ## BS4K は 60p (プログレッシブ) で放送されているので、60fps でエンコードする
+        if channel_type == "BS4K" or QUALITY[quality].is_60fps is True:
             options.append(f'-r 60000/1001 -g {int(gop_length_second * 60)}')
         else:
-            ## インターレース解除 (60i → 60p (フレームレート: 60fps))
-            if QUALITY[quality].is_60fps is True:
-                options.append(f'-vf yadif=mode=1:parity=-1:deint=1,scale={video_width}:{video_height}')
-                options.append(f'-r 60000/1001 -g {int(gop_length_second * 60)}')
-            ## インターレース解除 (60i → 30p (フレームレート: 30fps))
-            else:
-                options.append(f'-vf yadif=mode=0:parity=-1:deint=1,scale={video_width}:{video_height}')
-                options.append(f'-r 30000/1001 -g {int(gop_length_second * 30)}')
+            options.append(f'-r 30000/1001 -g {int(gop_length_second * 30)}')
 
         # 音声
         ## 音声が 5.1ch かどうかに関わらず、ステレオにダウンミックスする
@@ -205,14 +344,9 @@ class LiveEncodingTask:
 
         # 出力
         options.append('-y -f mpegts')  # MPEG-TS 出力ということを明示
-        options.append('pipe:1')  # 標準入力へ出力
-
-        # オプションをスペースで区切って配列にする
-        result: list[str] = []
-        for option in options:
-            result += option.split(' ')
+        options.append(output_url)
 
-        return result
+        return options
 
 
     def buildFFmpegOptionsForRadio(self) -> list[str]:
@@ -445,75 +579,6 @@ class LiveEncodingTask:
         return result
 
 
-    async def acquireMirakurunTuner(self, channel_type: Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K']) -> bool:
-        """
-        Mirakurun / mirakc で空きチューナーを確保できるまで待機する
-        mirakc は空きチューナーがない場合に 404 を返すので (バグ？) 、それを避けるために予め空きチューナーがあるかどうかを確認する
-        0.5 秒間待機しても空きチューナーがなければ False を返す (共聴できる場合もあるので、受信できないとは限らない)
-
-        Args:
-            channel_type (Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K']): チャンネルタイプ
-
-        Returns:
-            bool: チューナーを確保できたかどうか
-        """
-
-        CONFIG = Config()
-        BACKEND_TYPE: Literal['EDCB', 'Mirakurun'] = 'Mirakurun' if CONFIG.general.always_receive_tv_from_mirakurun is True else CONFIG.general.backend
-        assert BACKEND_TYPE == 'Mirakurun', 'This method is only for Mirakurun backend.'
-
-        # Mirakurun / mirakc は通常チャンネルタイプが GR, BS, CS, SKY しかないので、
-        # フォールバックとして BS4K を BS に、CATV を CS に変換する
-        fallback_channel_type = channel_type
-        if channel_type == 'BS4K':
-            fallback_channel_type = 'BS'
-        elif channel_type == 'CATV':
-            fallback_channel_type = 'CS'
-
-        mirakurun_or_mirakc = 'Mirakurun'
-        async with HTTPX_CLIENT() as client:
-
-            # 0.1 秒間隔で最大 0.5 秒間チューナーの空きを確認する
-            ## 空きチューナーがなくても利用状況によっては共聴できるので、あまり待ちすぎると無駄な時間がかかる
-            ## Mirakurun / mirakc はチャンネル切り替え時に 1 秒弱使い終わった前チャンネルのチューナープロセスが残るので、シングルチューナー環境では
-            ## それを解放し終わってからチューナーを起動できるようにする (実際はだいたい 0.25 秒程度で空きチューナーを確保できる)
-            ## 複数チューナーがある場合は他の空きチューナーを使って起動できるため、待ち時間はほとんどかからない
-            start_time = time.time()
-            for _ in range(int(0.5 / 0.1)):
-
-                # Mirakurun / mirakc からチューナーの状態を取得
-                try:
-                    response = await client.get(GetMirakurunAPIEndpointURL('/api/tuners'), timeout=5)
-                    # レスポンスヘッダーの server が mirakc であれば mirakc と判定できる
-                    if ('server' in response.headers) and ('mirakc' in response.headers['server']):
-                        mirakurun_or_mirakc = 'mirakc'
-                    tuners = response.json()
-                except httpx.NetworkError:
-                    logging.error('Failed to get tuner statuses from Mirakurun / mirakc. (Network Error)')
-                    return False
-                except httpx.TimeoutException:
-                    logging.error('Failed to get tuner statuses from Mirakurun / mirakc. (Connection Timeout)')
-                    return False
-
-                # 指定されたチャンネルタイプが受信可能なチューナーが1つでも利用可能であれば True を返す
-                for tuner in tuners:
-                    if tuner['isAvailable'] is True and tuner['isFree'] is True and channel_type in tuner['types']:
-                        logging.info(f'Acquired a tuner from {mirakurun_or_mirakc}.')
-                        logging.info(f'Tuner: {tuner["name"]} / Type: {channel_type}) / Acquired in {round(time.time() - start_time, 2)} seconds')
-                        return True
-                    if tuner['isAvailable'] is True and tuner['isFree'] is True and fallback_channel_type in tuner['types']:
-                        logging.info(f'Acquired a tuner from {mirakurun_or_mirakc}. ({channel_type} -> {fallback_channel_type})')
-                        logging.info(f'Tuner: {tuner["name"]} / Type: {fallback_channel_type}) / Acquired in {round(time.time() - start_time, 2)} seconds')
-                        return True
-
-                await asyncio.sleep(0.1)
-
-        # 空きチューナーは確保できなかったが、同じチャンネルが受信中であれば共聴することは可能なので warning に留める
-        logging.warning(f'Failed to acquire a tuner from {mirakurun_or_mirakc}.')
-        logging.warning('If the same channel is being received, it can be shared with the same tuner.')
-        return False
-
-
     async def run(self) -> None:
         """
         エンコードタスクを実行する
@@ -521,10 +586,6 @@ class LiveEncodingTask:
 
         CONFIG = Config()
 
-        # バックエンドの種類を取得
-        ## always_receive_tv_from_mirakurun が True なら、バックエンドに関わらず常に Mirakurun / mirakc から受信する
-        BACKEND_TYPE: Literal['EDCB', 'Mirakurun'] = 'Mirakurun' if CONFIG.general.always_receive_tv_from_mirakurun is True else CONFIG.general.backend
-
         # エンコーダーの種類を取得
         ENCODER_TYPE = CONFIG.general.encoder
 
@@ -547,73 +608,10 @@ class LiveEncodingTask:
         ## psisiarc は API リクエストがある度に都度起動される
         self.live_stream.psi_data_archiver = LivePSIDataArchiver(channel.service_id)
 
-        # ***** tsreadex プロセスの作成と実行 *****
-
-        # tsreadex のオプション
-        ## 放送波の前処理を行い、エンコードを安定させるツール
-        ## オプション内容は https://github.com/xtne6f/tsreadex を参照
-        tsreadex_options = [
-            # 取り除く TS パケットの10進数の PID
-            ## EIT の PID を指定
-            '-x', '18/38/39',
-            # 特定サービスのみを選択して出力するフィルタを有効にする
-            ## 有効にすると、特定のストリームのみ PID を固定して出力される
-            ## 視聴対象のチャンネルのサービス ID を指定する
-            '-n', f'{channel.service_id}' if CONFIG.tv.debug_mode_ts_path is None else '-1',
-            # 主音声ストリームが常に存在する状態にする
-            ## ストリームが存在しない場合、無音の AAC ストリームが出力される
-            ## 音声がモノラルであればステレオにする
-            ## デュアルモノを2つのモノラル音声に分離し、右チャンネルを副音声として扱う
-            '-a', '13',
-            # 副音声ストリームが常に存在する状態にする
-            ## ストリームが存在しない場合、無音の AAC ストリームが出力される
-            ## 音声がモノラルであればステレオにする
-            '-b', '5',
-            # 字幕ストリームが常に存在する状態にする
-            ## ストリームが存在しない場合、PMT の項目が補われて出力される
-            ## 実際の字幕データが現れない場合に5秒ごとに非表示の適当なデータを挿入する
-            '-c', '5',
-            # 文字スーパーストリームが常に存在する状態にする
-            ## ストリームが存在しない場合、PMT の項目が補われて出力される
-            '-u', '1',
-            # 字幕と文字スーパーを aribb24.js が解釈できる ID3 timed-metadata に変換する
-            ## +4: FFmpeg のバグを打ち消すため、変換後のストリームに規格外の5バイトのデータを追加する
-            ## +8: FFmpeg のエラーを防ぐため、変換後のストリームの PTS が単調増加となるように調整する
-            ## +4 は FFmpeg 6.1 以降不要になった (付与していると字幕が表示されなくなる) ため、
-            ## FFmpeg 4.4 系に依存している Linux 版 HWEncC 利用時のみ付与する
-            '-d', '13' if ENCODER_TYPE != 'FFmpeg' and sys.platform == 'linux' else '9',
-        ]
-
-        if CONFIG.tv.debug_mode_ts_path is None:
-            # 通常は標準入力を指定
-            tsreadex_options.append('-')
-        else:
-            # デバッグモード: 指定された TS ファイルを読み込む
-            ## 読み込み速度を 2350KB/s (18.8Mbps) に制限
-            ## 1倍速に近い値だが、TS のビットレートはチャンネルや番組、シーンによって変動するため完全な1倍速にはならない
-            tsreadex_options += [
-                '-l', '2350',
-                CONFIG.tv.debug_mode_ts_path
-            ]
-
-        # tsreadex の読み込み用パイプと書き込み用パイプを作成
-        tsreadex_read_pipe, tsreadex_write_pipe = os.pipe()
-
-        # tsreadex のプロセスを非同期で作成・実行
-        tsreadex = await asyncio.subprocess.create_subprocess_exec(
-            *[LIBRARY_PATH['tsreadex'], *tsreadex_options],
-            stdin = asyncio.subprocess.PIPE,  # 受信した放送波を書き込む
-            stdout = tsreadex_write_pipe,  # エンコーダーに繋ぐ
-            stderr = asyncio.subprocess.DEVNULL,  # 利用しない
-        )
-
-        # tsreadex の書き込み用パイプを閉じる
-        os.close(tsreadex_write_pipe)
-
         # ***** エンコーダープロセスの作成と実行 *****
 
         # エンコーダーの起動には時間がかかるので、先にエンコーダーを起動しておいた後、あとからチューナーを起動する
-        # チューナーの起動後にエンコーダー (正確には tsreadex) に受信した放送波が書き込まれる
+        # チューナーの起動後にチューナーインジェストの tsreadex で前処理された放送波がエンコーダーに書き込まれる
         # チューナーの起動にも時間がかかるが、エンコーダーの起動は非同期なのに対し、チューナーの起動は EDCB の場合は同期的
 
         # フル HD 放送が行われているチャンネルかを取得
@@ -623,8 +621,29 @@ class LiveEncodingTask:
         if channel.is_radiochannel is True:
             ENCODER_TYPE = 'FFmpeg'
 
+        # エンコーダープロセス
+        ## 複数の画質をまとめてエンコードする場合は、マルチレンディションエンコーダーのこの画質の出力が入る
+        encoder: asyncio.subprocess.Process | LiveRenditionOutput
+
+        # 複数の画質をまとめてエンコードするマルチレンディションエンコーダー (使わない場合は None)
+        rendition_encoder: LiveRenditionEncoder | None = None
+        if LiveRenditionEncoder.isEnabled(self.live_stream.quality, ENCODER_TYPE, channel.is_radiochannel) is True:
+            rendition_encoder = LiveRenditionEncoder(self.live_stream.display_channel_id)
+
+        # FFmpeg (マルチレンディション)
+        if rendition_encoder is not None:
+
+            # 同じチャンネルのマルチレンディションエンコーダーのこの画質の出力を購読する
+            ## ほかの画質の視聴で既にエンコーダーが起動していれば、エンコーダーの起動を待たずにこの画質の出力を受け取れる
+            channel_type = channel.type
+            encoder = await rendition_encoder.subscribe(
+                self.live_stream,
+                self.live_stream.ingest,
+                lambda qualities, output_urls: self.buildFFmpegMultiRenditionOptions(qualities, channel_type, is_fullhd_channel, output_urls),
+            )
+
         # FFmpeg
-        if ENCODER_TYPE == 'FFmpeg':
+        elif ENCODER_TYPE == 'FFmpeg':
 
             # オプションを取得
             # ラジオチャンネルかどうかでエンコードオプションを切り替え
@@ -637,7 +656,7 @@ class LiveEncodingTask:
             # エンコーダープロセスを非同期で作成・実行
             encoder = await asyncio.subprocess.create_subprocess_exec(
                 *[LIBRARY_PATH['FFmpeg'], *encoder_options],
-                stdin = tsreadex_read_pipe,  # tsreadex からの入力
+                stdin = asyncio.subprocess.PIPE,  # チューナーインジェストの tsreadex からの入力
                 stdout = asyncio.subprocess.PIPE,  # ストリーム出力
                 stderr = asyncio.subprocess.PIPE,  # ログ出力
             )
@@ -652,25 +671,23 @@ class LiveEncodingTask:
             # エンコーダープロセスを非同期で作成・実行
             encoder = await asyncio.subprocess.create_subprocess_exec(
                 *[LIBRARY_PATH[ENCODER_TYPE], *encoder_options],
-                stdin = tsreadex_read_pipe,  # tsreadex からの入力
+                stdin = asyncio.subprocess.PIPE,  # チューナーインジェストの tsreadex からの入力
                 stdout = asyncio.subprocess.PIPE,  # ストリーム出力
                 stderr = asyncio.subprocess.PIPE,  # ログ出力
             )
 
-        # tsreadex の読み込み用パイプを閉じる
-        os.close(tsreadex_read_pipe)
-
-        # ***** チューナーの起動と接続 *****
+        # ***** チューナーインジェストの購読とチューナーの起動 *****
 
         # エンコードタスクが稼働中かどうか
         is_running: bool = True
 
-        # 放送波の MPEG2-TS を受信する StreamReader
-        stream_reader: asyncio.StreamReader | PipeStreamReader | aiohttp.StreamReader | None = None
+        # このチャンネルのチューナーインジェスト
+        ## チューナーとの接続と tsreadex は同じチャンネルのすべての画質で共有される
+        ingest = self.live_stream.ingest
 
-        # Mirakurun の aiohttp セッション (EDCB バックエンド利用時は常に None)
-        response: aiohttp.ClientResponse | None = None
-        session: aiohttp.ClientSession | None = None
+        # チューナーインジェストを購読し、tsreadex の出力が分配されるキューを取得する
+        ## マルチレンディションエンコーダーの場合は、エンコーダー自身が tsreadex の出力を受け取るため、キューは作成しない
+        ingest_queue = ingest.subscribe(self.live_stream, receive_ts=rendition_encoder is None)
 
         # 実行中の非同期実行タスクへの参照を保持しておく
         ## run() の実行が完了するまで、ガベージコレクタにより非同期実行タスクが勝手に破棄されることを防ぐ
@@ -679,232 +696,84 @@ class LiveEncodingTask:
 
         # チューナー起動フェーズから Controller 実行までを CancelledError から保護する
         # チャンネル切り替え時に LiveStream.connect() からこのタスクがキャンセルされると、チューナー起動フェーズで
-        # await している箇所 (EDCBTuner.setChannel() / EDCBTuner.connect() など) で CancelledError が発生する可能性がある
+        # await している箇所 (LiveTunerIngest.start() など) で CancelledError が発生する可能性がある
         # CancelledError をキャッチしないとエンコーダープロセスの終了処理に到達せず、プロセスがリークしてしまう
         try:
-            # Mirakurun バックエンド
-            if BACKEND_TYPE == 'Mirakurun':
-
-                # チューナーを確保できるまで待機する
-                ## 確保できなかった場合でも共聴で受信できる可能性があるので、戻り値は無視する
-                self.live_stream.setStatus('Standby', 'チューナーを確保しています…')
-                await self.acquireMirakurunTuner(channel.type)
-
-                # Mirakurun 形式のサービス ID
-                # NID と SID を 5 桁でゼロ埋めした上で int に変換する
-                mirakurun_service_id = int(str(channel.network_id).zfill(5) + str(channel.service_id).zfill(5))
-
-                # Mirakurun の Service Stream API へ HTTP リクエストを開始
-                self.live_stream.setStatus('Standby', 'チューナーを起動しています…')
-                session = aiohttp.ClientSession()
-                try:
-                    response = await session.get(
-                        url = GetMirakurunAPIEndpointURL(f'/api/services/{mirakurun_service_id}/stream'),
-                        headers = {**API_REQUEST_HEADERS, 'X-Mirakurun-Priority': '0'},
-                        timeout = aiohttp.ClientTimeout(connect=15, sock_connect=15, sock_read=15)
-                    )
-                except (TimeoutError, aiohttp.ClientConnectorError):
-
-                    # 番組名に「放送休止」などが入っていれば停波によるものとみなし、そうでないならチューナーへの接続に失敗したものとする
-                    if program_present is None or program_present.isOffTheAirProgram():
-                        self.live_stream.setStatus('Offline', 'この時間は放送を休止しています。(E-01M)')
-                    else:
-                        self.live_stream.setStatus('Offline', 'チューナーへの接続に失敗しました。チューナー側に何らかの問題があるかもしれません。(E-01M)')
-
-                    # すべての視聴中クライアントのライブストリームへの接続を切断する
-                    self.live_stream.disconnectAll()
-
-                    # PSI/SI データアーカイバーを終了・破棄する
-                    if self.live_stream.psi_data_archiver is not None:
-                        self.live_stream.psi_data_archiver.destroy()
-                        self.live_stream.psi_data_archiver = None
-
-                    # 明示的にエンコーダープロセスを終了する
-                    ## エンコーダープロセスはチューナー接続よりも前に起動されているため、ここで終了しないとプロセスがリークする
-                    try:
-                        tsreadex.kill()
-                        encoder.kill()
-                    except Exception:
-                        pass
-
-                    # エンコードタスクを停止する
-                    await session.close()
-                    return
-
-                # 放送波の MPEG2-TS の受信元の StreamReader として設定
-                stream_reader = response.content
-
-            # EDCB バックエンド
-            elif BACKEND_TYPE == 'EDCB':
-
-                # チューナーインスタンスを取得する
-                ## Idling への切り替え、ONAir への復帰時に LiveStream 側でチューナーのアンロック/ロックが行われる
-                if self.live_stream.tuner is None:
-                    self.live_stream.tuner = EDCBTuner.getOrCreate(self.live_stream.live_stream_id)
-
-                # チューナーを起動する
-                logging.debug(f'[Live: {self.live_stream.live_stream_id}] EDCB NetworkTV ID: {self.live_stream.tuner.getEDCBNetworkTVID()}')
-                self.live_stream.setStatus('Standby', 'チューナーを起動しています…')
-                is_tuner_opened = await self.live_stream.tuner.setChannel(
-                    channel.network_id,
-                    channel.service_id,
-                    cast(int, channel.transport_stream_id),
-                    self.live_stream.live_stream_id,
-                )
-
-                # チューナーの起動に失敗した
-                # ほとんどがチューナー不足によるものなので、ステータス詳細でもそのように表示する
-                # 成功時は tuner.close() するか予約などに割り込まれるまで起動しつづけるので注意
-                if is_tuner_opened is False:
-                    self.live_stream.setStatus('Offline', 'チューナーの起動に失敗しました。空きチューナーが不足していると考えられます。(E-02E)')
-
-                    # チューナーを閉じる
-                    await self.live_stream.tuner.close(self.live_stream.live_stream_id)
-
-                    # すべての視聴中クライアントのライブストリームへの接続を切断する
-                    self.live_stream.disconnectAll()
-
-                    # PSI/SI データアーカイバーを終了・破棄する
-                    if self.live_stream.psi_data_archiver is not None:
-                        self.live_stream.psi_data_archiver.destroy()
-                        self.live_stream.psi_data_archiver = None
-
-                    # 明示的にエンコーダープロセスを終了する
-                    ## エンコーダープロセスはチューナー接続よりも前に起動されているため、ここで終了しないとプロセスがリークする
-                    try:
-                        tsreadex.kill()
-                        encoder.kill()
-                    except Exception:
-                        pass
-
-                    # エンコードタスクを停止する
-                    return
-
-                # チューナーをロックする
-                # ロックしないと途中でチューナーの制御を横取りされてしまう
-                self.live_stream.tuner.lock(self.live_stream.live_stream_id)
+            # チューナーを起動する
+            ## 同じチャンネルの別の画質が既に受信中であれば、そのチューナーをそのまま共有する
+            error_detail = await ingest.start(channel, program_present)
 
-                # チューナーに接続する
-                # 放送波が送信される TCP ソケットまたは名前付きパイプを取得する
-                self.live_stream.setStatus('Standby', 'チューナーに接続しています…')
-                reader = await self.live_stream.tuner.connect(self.live_stream.live_stream_id)
+            # チューナーの起動に失敗した
+            if error_detail is not None:
+                self.live_stream.setStatus('Offline', error_detail)
 
-                # チューナーへの接続に失敗した
-                if reader is None:
-                    self.live_stream.setStatus('Offline', 'チューナーへの接続に失敗しました。チューナー側に何らかの問題があるかもしれません。(E-03E)')
+                # チューナーインジェストの購読を解除する
+                await ingest.unsubscribe(self.live_stream)
 
-                    # チューナーを閉じる
-                    await self.live_stream.tuner.close(self.live_stream.live_stream_id)
+                # すべての視聴中クライアントのライブストリームへの接続を切断する
+                self.live_stream.disconnectAll()
 
-                    # すべての視聴中クライアントのライブストリームへの接続を切断する
-                    self.live_stream.disconnectAll()
+                # PSI/SI データアーカイバーを終了・破棄する
+                if self.live_stream.psi_data_archiver is not None:
+                    self.live_stream.psi_data_archiver.destroy()
+                    self.live_stream.psi_data_archiver = None
 
-                    # PSI/SI データアーカイバーを終了・破棄する
-                    if self.live_stream.psi_data_archiver is not None:
-                        self.live_stream.psi_data_archiver.destroy()
-                        self.live_stream.psi_data_archiver = None
-
-                    # 明示的にエンコーダープロセスを終了する
-                    ## エンコーダープロセスはチューナー接続よりも前に起動されているため、ここで終了しないとプロセスがリークする
-                    try:
-                        tsreadex.kill()
-                        encoder.kill()
-                    except Exception:
-                        pass
-
-                    # エンコードタスクを停止する
-                    return
+                # 明示的にエンコーダープロセスを終了する
+                ## エンコーダープロセスはチューナー接続よりも前に起動されているため、ここで終了しないとプロセスがリークする
+                try:
+                    encoder.kill()
+                except Exception:
+                    pass
 
-                # 放送波の MPEG2-TS の受信元の StreamReader として設定
-                stream_reader = reader
+                # エンコードタスクを停止する
+                return
 
-            # ***** チューナーからの出力の読み込み → tsreadex・エンコーダーへの書き込み *****
+            # ***** チューナーインジェストからの出力の読み込み → エンコーダーへの書き込み *****
 
-            # チューナーからの放送波 TS の最終読み取り時刻 (単調増加時間)
-            ## 単に時刻を比較する用途でしか使わないので、time.monotonic() から取得した単調増加時間が入る
-            ## Unix Time とかではないので注意
-            tuner_ts_read_at: float = time.monotonic()
-            tuner_ts_read_at_lock = asyncio.Lock()
-
-            async def Reader() -> None:
-                nonlocal tuner_ts_read_at
-
-                # 受信した放送波が入るイテレータを作成
-                # R/W バッファ: 188B (TS Packet Size) * 256 = 48128B
-                async def GetIterator(
-                        stream_reader: asyncio.StreamReader | PipeStreamReader | aiohttp.StreamReader,
-                        chunk_size: int = ts.PACKET_SIZE * 256,
-                    ) -> AsyncIterator[bytes]:
-                    while True:
-                        try:
-                            yield await stream_reader.readexactly(chunk_size)
-                        except asyncio.IncompleteReadError as ex:
-                            # もし残りのバイトがあれば、 break 前にそれらを yield する
-                            if ex.partial:
-                                yield ex.partial
-                            break
-
-                assert stream_reader is not None
-                stream_iterator = GetIterator(stream_reader)
-
-                # EDCB / Mirakurun から受信した放送波を随時 tsreadex の入力に書き込む
-                try:
-                    async for chunk in stream_iterator:
+            async def Feeder(ingest_queue: asyncio.Queue[bytes | None]) -> None:
 
-                        # チューナーからの放送波 TS の最終読み取り時刻を更新
-                        async with tuner_ts_read_at_lock:
-                            tuner_ts_read_at = time.monotonic()
+                # マルチレンディションエンコーダーの場合は Feeder を実行しないため、常にエンコーダープロセスそのものが入っている
+                assert isinstance(encoder, asyncio.subprocess.Process)
+                encoder_stdin = cast(asyncio.StreamWriter, encoder.stdin)
 
-                        # tsreadex の標準入力が閉じられていたら、タスクを終了
-                        if cast(asyncio.StreamWriter, tsreadex.stdin).is_closing():
-                            break
+                # チューナーインジェストから分配された tsreadex の出力を随時エンコーダーの入力に書き込む
+                while True:
 
-                        try:
-                            # ストリームデータを tsreadex の標準入力に書き込む
-                            cast(asyncio.StreamWriter, tsreadex.stdin).write(chunk)
-                            await cast(asyncio.StreamWriter, tsreadex.stdin).drain()
+                    # 分配の終了が通知されたら、タスクを終了
+                    chunk = await ingest_queue.get()
+                    if chunk is None:
+                        break
 
-                            # 生の放送波の TS パケットを PSI/SI データアーカイバーに送信する
-                            ## 放送波の tsreadex への書き込みを最優先で行うため、非同期タスクとして実行する
-                            ## ここで tsreadex への書き込みがブロックされると放送波の受信ループが止まり、ライブストリームの異常終了に繋がりかねない
-                            if self.live_stream.psi_data_archiver is not None:
-                                background_tasks.add(asyncio.create_task(self.live_stream.psi_data_archiver.pushTSPacketData(chunk)))
+                    # エンコーダーの標準入力が閉じられていたら、タスクを終了
+                    if encoder_stdin.is_closing():
+                        break
 
-                        # 並列タスク処理中に何らかの例外が発生した
-                        # BrokenPipeError・asyncio.TimeoutError などが想定されるが、何が発生するかわからないためすべての例外をキャッチする
-                        except Exception:
-                            break
+                    try:
+                        # ストリームデータをエンコーダーの標準入力に書き込む
+                        encoder_stdin.write(chunk)
+                        await encoder_stdin.drain()
 
-                        # エンコードタスクが終了しているか既にエンコーダープロセスが終了していたら、タスクを終了
-                        if is_running is False or tsreadex.returncode is not None or encoder.returncode is not None:
-                            break
+                    # 並列タスク処理中に何らかの例外が発生した
+                    # BrokenPipeError・asyncio.TimeoutError などが想定されるが、何が発生するかわからないためすべての例外をキャッチする
+                    except Exception:
+                        break
 
-                except OSError:
-                    pass
+                    # エンコードタスクが終了しているか既にエンコーダープロセスが終了していたら、タスクを終了
+                    if is_running is False or encoder.returncode is not None:
+                        break
 
-                # タスクを終える前に、チューナーとの接続を明示的に閉じる
+                # タスクを終える前に、エンコーダーの標準入力を閉じる
                 try:
-                    cast(asyncio.StreamWriter, tsreadex.stdin).close()
+                    encoder_stdin.close()
                 except OSError:
                     pass
 
-                ## 並行している別の非同期タスクとのタイミングの関係で 0.1 秒待ってからクリーンアップする
-                await asyncio.sleep(0.1)
-
-                # EDCB バックエンド: チューナーとのストリーミング接続を閉じる
-                ## チャンネル切り替え時に再利用するため、ここではチューナー自体は閉じない
-                if BACKEND_TYPE == 'EDCB' and self.live_stream.tuner is not None:
-                    await self.live_stream.tuner.disconnect(self.live_stream.live_stream_id)
-
-                # Mirakurun バックエンド: Service Stream API とのストリーミング接続を閉じる
-                if BACKEND_TYPE == 'Mirakurun' and response is not None and session is not None:
-                    await session.close()
-                    response.close()
-
             # タスクを非同期で実行
-            background_tasks.add(asyncio.create_task(Reader()))
+            ## マルチレンディションエンコーダーの場合は、エンコーダーへの書き込みはマルチレンディションエンコーダー側で行われる
+            if ingest_queue is not None:
+                background_tasks.add(asyncio.create_task(Feeder(ingest_queue)))
 
-            # ***** tsreadex・エンコーダーからの出力の読み込み → ライブストリームへの書き込み *****
+            # ***** エンコーダーからの出力の読み込み → ライブストリームへの書き込み *****
 
             # エンコーダーの出力のチャンクが積み増されていくバッファ
             chunk_buffer: bytearray = bytearray()
@@ -920,75 +789,87 @@ class LiveEncodingTask:
             ## そうしないと稀にパケロスするらしく、ブラウザ側で突如再生できなくなることがある
             writer_lock = asyncio.Lock()
 
-            async def Writer() -> None:
+            # チャンクを書き込む間隔 (秒)
+            ## チャンクをできるだけ等間隔でクライアントに送信するために、バッファが 64KB 分溜まるのを待たずに送信する
+            CHUNK_FLUSH_INTERVAL = 0.025
 
-                nonlocal chunk_buffer, chunk_written_at, writer_lock
+            async def FlushChunkBuffer() -> None:
+                """ チャンクバッファに溜まったエンコーダーの出力をライブストリームに書き込む (writer_lock を取得した状態で呼び出すこと) """
 
-                while True:
-                    try:
+                nonlocal chunk_buffer, chunk_written_at
 
-                        # エンコーダーからの出力を読み取る
-                        ## TS パケットのサイズが 188 bytes なので、1回の readexactly() で 188 bytes ずつ読み取る
-                        ## read() ではなく厳密な readexactly() を使わないとぴったり 188 bytes にならない場合がある
-                        chunk = await cast(asyncio.StreamReader, encoder.stdout).readexactly(ts.PACKET_SIZE)
+                # エンコーダーからの出力をライブストリームのリングバッファに書き込む
+                await self.live_stream.writeStreamData(bytes(chunk_buffer))
 
-                        # 同時に chunk_buffer / chunk_written_at にアクセスするタスクが1つだけであることを保証する (排他ロック)
-                        async with writer_lock:
+                # チャンクバッファを空にする（重要）
+                chunk_buffer = bytearray()
 
-                            # 188 bytes ごとに区切られた、エンコーダーの出力のチャンクをバッファに貯める
-                            chunk_buffer += chunk
+                # チャンクの最終書き込み時刻を更新
+                chunk_written_at = time.monotonic()
 
-                            # チャンクバッファが 65536 bytes (64KB) 以上になった時のみ
-                            if len(chunk_buffer) >= 65536:
+            async def Writer() -> None:
 
-                                # エンコーダーからの出力をライブストリームの Queue に書き込む
-                                await self.live_stream.writeStreamData(bytes(chunk_buffer))
-                                # print(f'Writer:    Chunk size: {len(chunk_buffer):05} / Time: {time.time()}')
+                nonlocal chunk_buffer, chunk_written_at, writer_lock
 
-                                # チャンクバッファを空にする（重要）
-                                chunk_buffer = bytearray()
+                # エンコーダーからの出力を TS パケット境界に揃えた大きなブロック単位で読み取る
+                ## 1パケット (188 bytes) ずつ readexactly() すると、1080p-60fps では毎秒数万回の await と排他ロックの取得が発生してしまう
+                ## 同期バイトがずれていた場合は TSPacketReader 側で次の TS パケット境界まで読み飛ばされる
+                ts_packet_reader = TSPacketReader(cast(asyncio.StreamReader, encoder.stdout))
 
-                                # チャンクの最終書き込み時刻を更新
-                                chunk_written_at = time.monotonic()
+                while True:
 
-                    # もし 188 bytes に満たないデータが返ってきたら、エンコーダーが終了したと判断してタスクを終了
-                    except asyncio.IncompleteReadError:
+                    # エンコーダーからの出力を読み取る
+                    ## 188 bytes の倍数に揃えられたデータが返る
+                    packets = await ts_packet_reader.read()
+
+                    # 空のデータが返ってきたら、エンコーダーが終了したと判断してタスクを終了
+                    if len(packets) == 0:
                         break
 
+                    # 同時に chunk_buffer / chunk_written_at にアクセスするタスクが1つだけであることを保証する (排他ロック)
+                    ## 排他ロックの取得はブロック単位でのみ行う
+                    async with writer_lock:
+
+                        # エンコーダーの出力をチャンクバッファに貯める
+                        chunk_buffer += packets
+
+                        # チャンクバッファが 65536 bytes (64KB) 以上になったか、前回のチャンク書き込みから
+                        # CHUNK_FLUSH_INTERVAL 秒以上経過している場合は、チャンクを書き込む
+                        if len(chunk_buffer) >= 65536 or (time.monotonic() - chunk_written_at) > CHUNK_FLUSH_INTERVAL:
+                            await FlushChunkBuffer()
+
                     # エンコードタスクが終了しているか既にエンコーダープロセスが終了していたら、タスクを終了
-                    if is_running is False or tsreadex.returncode is not None or encoder.returncode is not None:
+                    if is_running is False or encoder.returncode is not None:
                         break
 
-            # 前回のチャンク書き込みから 0.025 秒以上経ったもののチャンクが 64KB に達していない際に Writer に代わってチャンク書き込みを行うタスク
+                # 同期を取り直すために読み飛ばしたデータがあればログに出力する
+                if ts_packet_reader.skipped_bytes > 0:
+                    logging.warning(f'[Live: {self.live_stream.live_stream_id}] Skipped {ts_packet_reader.skipped_bytes} bytes to resync TS packets.')
+
+            # 前回のチャンク書き込みから CHUNK_FLUSH_INTERVAL 秒以上経ったもののチャンクが 64KB に達しておらず、
+            # かつエンコーダーからの次の出力がまだ届いていない際に、Writer に代わってチャンク書き込みを行うタスク
+            ## エンコーダーの出力が届いている間は Writer 側で書き込みが行われるため、SubWriter は次の書き込み予定時刻まで眠るだけになる
             ## ラジオチャンネルは通常のチャンネルと比べてデータ量が圧倒的に少ないため、64KB に達することは稀で SubWriter でのチャンク書き込みがメインになる
             async def SubWriter() -> None:
 
-                nonlocal tuner_ts_read_at, tuner_ts_read_at_lock, chunk_buffer, chunk_written_at, writer_lock
+                nonlocal chunk_buffer, chunk_written_at, writer_lock
 
                 while True:
 
-                    # チャンクバッファを 0.025 秒間隔でチェックする
-                    await asyncio.sleep(0.025)
+                    # 次のチャンク書き込み予定時刻まで待機する
+                    ## Writer 側で書き込まれた直後であれば、その分だけ長く眠る
+                    next_flush_at = chunk_written_at + CHUNK_FLUSH_INTERVAL
+                    await asyncio.sleep(max(next_flush_at - time.monotonic(), 0.005))
 
                     # 同時に chunk_buffer / chunk_written_at にアクセスするタスクが1つだけであることを保証する (排他ロック)
                     async with writer_lock:
 
-                        # 前回チャンクを書き込んでから 0.025 秒以上経過している & チャンクバッファに何かしらデータが入っている時のみ
-                        # チャンクをできるだけ等間隔でクライアントに送信するために、バッファが 64KB 分溜まるのを待たずに送信する
-                        if (time.monotonic() - chunk_written_at) > 0.025 and (len(chunk_buffer) > 0):
-
-                            # エンコーダーからの出力をライブストリームの Queue に書き込む
-                            await self.live_stream.writeStreamData(bytes(chunk_buffer))
-                            # print(f'SubWriter: Chunk size: {len(chunk_buffer):05} / Time: {time.time()}')
-
-                            # チャンクバッファを空にする（重要）
-                            chunk_buffer = bytearray()
-
-                            # チャンクの最終書き込み時刻を更新
-                            chunk_written_at = time.monotonic()
+                        # 前回チャンクを書き込んでから CHUNK_FLUSH_INTERVAL 秒以上経過している & チャンクバッファに何かしらデータが入っている時のみ
+                        if (time.monotonic() - chunk_written_at) > CHUNK_FLUSH_INTERVAL and (len(chunk_buffer) > 0):
+                            await FlushChunkBuffer()
 
                     # エンコードタスクが終了しているか既にエンコーダープロセスが終了していたら、タスクを終了
-                    if is_running is False or tsreadex.returncode is not None or encoder.returncode is not None:
+                    if is_running is False or encoder.returncode is not None:
                         break
 
             # タスクを非同期で実行
@@ -1019,113 +900,74 @@ class LiveEncodingTask:
                 if CONFIG.general.debug_encoder is True:
                     encoder_log = await aiofiles.open(encoder_log_path, mode='w', encoding='utf-8')
 
+                # エンコーダーのログを行ごとに読み取るリーダーと、既知のログを判定するための事前にコンパイルされたマッチャー
+                ## FFmpeg はコンソールの行を上書きするために frame= の進捗ログで \r しか出力しないため、readline() を使うと
+                ## 進捗ログを取得できずに永遠に Standby から ONAir に移行しない不具合が発生する
+                ## EncoderLogReader は \r と \n の両方で行を区切るため、進捗ログも1行として取得できる
+                encoder_log_reader = EncoderLogReader(cast(asyncio.StreamReader, encoder.stderr))
+                progress_matcher = EncoderLogMatcher.getProgressMatcher(ENCODER_TYPE)
+                error_matcher = EncoderLogMatcher.getErrorMatcher(ENCODER_TYPE)
+
                 # エンコーダーの出力結果を取得
                 while True:
 
-                    # 行ごとに随時読み込む
-                    ## 1バイトずつ読み込み、\r か \n が来たら行としてデコード
-                    ## FFmpeg はコンソールの行を上書きするために frame= の進捗ログで \r しか出力しないため、readline() を使うと
-                    ## 進捗ログを取得できずに永遠に Standby から ONAir に移行しない不具合が発生する
-                    buffer = bytearray()
-                    while True:
-                        byte = await cast(asyncio.StreamReader, encoder.stderr).read(1)
-                        buffer += byte
-                        if byte == b'\r' or byte == b'\n':
-                            break
-                        if byte == b'':
-                            break
+                    # 出力されたログをまとめて読み込む
+                    new_lines = await encoder_log_reader.readLines()
 
-                    # 空のデータが返ってきたら、エンコーダーが終了したと判断してタスクを終了
-                    if len(buffer) == 0:
+                    # 空のリストが返ってきたら、エンコーダーが終了したと判断してタスクを終了
+                    if len(new_lines) == 0:
                         break
 
-                    try:
-                        line = buffer.decode('utf-8').strip()
-                    except UnicodeDecodeError:
-                        continue
-
-                    # エンコード進捗のログだったら、正規表現で余計なゴミを取り除く
-                    ## HWEncC は内部で使われている FFmpeg 側の大量に出るデバッグログと衝突してログがごちゃまぜになりがち…
-                    ## FFmpeg 側のログ（ゴミ）と完全に混ざっていると完全に除去できずに frames: の数値が桁が飛んだような出力になるけどご愛嬌…
-                    match1 = re.fullmatch(r'^.*?([1-9][0-9]+ frames: [0-9\.]+ fps, [0-9]+ kb/s, GPU [0-9]+%, VE [0-9]+%, VD [0-9]+%)$', line)
-                    match2 = re.fullmatch(r'^.*?([1-9][0-9]+ frames: [0-9\.]+ fps, [0-9]+ kb/s, GPU [0-9]+%, VD [0-9]+%)$', line)
-                    match3 = re.fullmatch(r'^.*?([1-9][0-9]+ frames: [0-9\.]+ fps, [0-9]+ kb/s)$', line)
-                    if match1 is not None:
-                        line = match1.groups()[0]
-                    elif match2 is not None:
-                        line = match2.groups()[0]
-                    elif match3 is not None:
-                        line = match3.groups()[0]
-
-                    # 山ほど出力されるメッセージと空行をログから除外
-                    ## 元は "Delay between the first packet and last packet in the muxing queue is xxxxxx > 1: forcing output" と
-                    ## "removing 2 bytes from input bitstream not read by decoder." という2つのメッセージで、実害はない
-                    ## FFmpeg と HWEncC のログが衝突して行の先頭が欠けることがあるので、できるだけ多く弾けるように部分一致にしている
-                    if (('removing 2 bytes from input bitstream not read by decoder.' not in line) and
-                        ('Delay between the' not in line) and
-                        ('[h264_metadata' not in line) and
-                        ('[hevc_metadata' not in line) and
-                        ('packet in the muxing queue' not in line) and ('ing output' not in line) and
-                        ('ng output' != line) and ('g output' != line) and (' output' != line) and ('output' != line) and
-                        ('utput' != line) and ('tput' != line) and ('put' != line) and ('ut' != line) and ('t' != line) and
-                        ('' != line)):
-
-                        # ログリストに行単位で追加
-                        lines.append(line)
-
-                        # ストリーム関連のログを表示
-                        ## エンコーダーのログ出力が有効なら、ストリーム関連に限らずすべてのログを出力する
-                        if 'Stream #0:' in line or CONFIG.general.debug_encoder is True:
-                            logging.debug(f'[Live: {self.live_stream.live_stream_id}] [{ENCODER_TYPE}] ' + line)
-
-                        # エンコーダーのログ出力が有効なら、エンコーダーのログファイルに書き込む
-                        if CONFIG.general.debug_encoder is True and encoder_log is not None:
-                            await encoder_log.write(line.strip('\r\n') + '\n')
-                            await encoder_log.flush()
+                    for line in new_lines:
 
-                    # ライブストリームのステータスを取得
-                    live_stream_status = self.live_stream.getStatus()
+                        # エンコード進捗のログだったら、正規表現で余計なゴミを取り除く
+                        if ' frames: ' in line:
+                            match = self.ENCODER_LOG_PROGRESS_PATTERN.fullmatch(line)
+                            if match is not None:
+                                line = match.group(1)
 
-                    # エンコードの進捗を判定し、ステータスを更新する
-                    # 誤作動防止のため、ステータスが Standby の間のみ更新できるようにする
-                    if live_stream_status.status == 'Standby':
-                        # FFmpeg
-                        if ENCODER_TYPE == 'FFmpeg':
-                            if 'arib parser was created' in line or 'Invalid frame dimensions 0x0.' in line:
-                                self.live_stream.setStatus('Standby', 'エンコードを開始しています…')
-                            elif 'frame=    1 fps=0.0 q=0.0' in line or 'size=       0kB time=00:00' in line:
-                                self.live_stream.setStatus('Standby', 'バッファリングしています…')
-                            elif 'frame=' in line or 'bitrate=' in line:
-                                self.live_stream.setStatus('ONAir', 'ライブストリームは ONAir です。')
-                                # エラーから回復した場合は、エンコードタスクの再起動回数のカウントをリセットする
-                                if self._retry_count > 0:
-                                    self._retry_count = 0
-                        ## HWEncC
-                        else:
-                            if 'opened file "pipe:0"' in line:
+                        # 山ほど出力されるメッセージをログから除外
+                        if self.ENCODER_LOG_IGNORED_PATTERN.search(line) is None and line not in self.ENCODER_LOG_IGNORED_LINES:
+
+                            # ログリストに行単位で追加
+                            lines.append(line)
+
+                            # ストリーム関連のログを表示
+                            ## エンコーダーのログ出力が有効なら、ストリーム関連に限らずすべてのログを出力する
+                            if 'Stream #0:' in line or CONFIG.general.debug_encoder is True:
+                                logging.debug(f'[Live: {self.live_stream.live_stream_id}] [{ENCODER_TYPE}] ' + line)
+
+                            # エンコーダーのログ出力が有効なら、エンコーダーのログファイルに書き込む
+                            if CONFIG.general.debug_encoder is True and encoder_log is not None:
+                                await encoder_log.write(line + '\n')
+
+                        # エンコードの進捗を判定し、ステータスを更新する
+                        # 誤作動防止のため、ステータスが Standby の間のみ更新できるようにする
+                        if self.live_stream.getStatus().status == 'Standby':
+                            progress = progress_matcher.match(line)
+                            if progress == 'Starting':
                                 self.live_stream.setStatus('Standby', 'エンコードを開始しています…')
-                            elif 'starting output thread...' in line:
-                                self.live_stream.setStatus('Standby', 'バッファリングしています…')
-                            elif 'Encode Thread:' in line:
+                            elif progress == 'Buffering':
                                 self.live_stream.setStatus('Standby', 'バッファリングしています…')
-                            elif ' frames: ' in line:
+                            elif progress == 'ONAir':
                                 self.live_stream.setStatus('ONAir', 'ライブストリームは ONAir です。')
                                 # エラーから回復した場合は、エンコードタスクの再起動回数のカウントをリセットする
                                 if self._retry_count > 0:
                                     self._retry_count = 0
 
-                    # 特定のエラーログが出力されている場合は回復が見込めないため、エンコーダーを終了する
-                    ## エンコーダーを再起動することで回復が期待できる場合は、ステータスを Restart に設定しエンコードタスクを再起動する
-                    ## FFmpeg
-                    if ENCODER_TYPE == 'FFmpeg':
-                        if 'Stream map \'0:v:0\' matches no streams.' in line:
+                        # 特定のエラーログが出力されている場合は回復が見込めないため、エンコーダーを終了する
+                        ## エンコーダーを再起動することで回復が期待できる場合は、ステータスを Restart に設定しエンコードタスクを再起動する
+                        error_code = error_matcher.match(line)
+                        if error_code is None:
+                            continue
+                        if error_code == 'E-04F' or error_code == 'E-05H':
                             # 何らかの要因で tsreadex から放送波が受信できなかったことによるエラーのため、エンコーダーの再起動は行わない
                             ## 番組名に「放送休止」などが入っていれば停波によるものとみなし、そうでないなら放送波の受信に失敗したものとする
                             if program_present is None or program_present.isOffTheAirProgram():
-                                self.live_stream.setStatus('Offline', 'この時間は放送を休止しています。(E-04F)')
+                                self.live_stream.setStatus('Offline', f'この時間は放送を休止しています。({error_code})')
                             else:
-                                self.live_stream.setStatus('Offline', 'チューナーからの放送波の受信に失敗したため、エンコードを開始できません。(E-04F)')
-                        elif 'Conversion failed!' in line:
+                                self.live_stream.setStatus('Offline', f'チューナーからの放送波の受信に失敗したため、エンコードを開始できません。({error_code})')
+                        elif error_code == 'ER-01F':
                             # 捕捉されないエラー
                             ## エンコーダーの再起動で復帰できる可能性があるので、エンコードタスクを再起動する
                             result = self.live_stream.setStatus('Restart', 'エンコード中に予期しないエラーが発生しました。エンコードタスクを再起動しています… (ER-01F)')
@@ -1133,36 +975,26 @@ class LiveEncodingTask:
                             if result is True:
                                 for log in lines[-51:-1]:
                                     logging.warning(log)
-                    ## HWEncC
-                    else:
-                        if 'error finding stream information.' in line:
-                            # 何らかの要因で tsreadex から放送波が受信できなかったことによるエラーのため、エンコーダーの再起動は行わない
-                            ## 番組名に「放送休止」などが入っていれば停波によるものとみなし、そうでないなら放送波の受信に失敗したものとする
-                            if program_present is None or program_present.isOffTheAirProgram():
-                                self.live_stream.setStatus('Offline', 'この時間は放送を休止しています。(E-05H)')
-                            else:
-                                self.live_stream.setStatus('Offline', 'チューナーからの放送波の受信に失敗したため、エンコードを開始できません。(E-05H)')
-                        elif ENCODER_TYPE == 'NVEncC' and 'due to the NVIDIA\'s driver limitation.' in line:
+                        elif error_code == 'E-06HN':
                             # NVEncC で、同時にエンコードできるセッション数 (Geforceだと5つ) を全て使い果たしている時のエラー
                             self.live_stream.setStatus('Offline', 'NVENC のエンコードセッションが不足しているため、エンコードを開始できません。(E-06HN)')
-                        elif ENCODER_TYPE == 'QSVEncC' and ('unable to decode by qsv.' in line or 'No device found for QSV encoding!' in line):
+                        elif error_code == 'E-07HQ':
                             # QSVEncC 非対応の環境
                             self.live_stream.setStatus('Offline', 'お使いの PC 環境は QSVEncC エンコーダーに対応していません。(E-07HQ)')
-                        elif ENCODER_TYPE == 'QSVEncC' and 'iHD_drv_video.so init failed' in line:
+                        elif error_code == 'E-08HQ':
                             # QSVEncC 非対応の環境 (Linux かつ第5世代以前の Intel CPU)
                             self.live_stream.setStatus('Offline', 'お使いの PC 環境は Linux 版 QSVEncC エンコーダーに対応していません。第5世代以前の古い CPU をお使いの可能性があります。(E-08HQ)')
-                        elif ENCODER_TYPE == 'NVEncC' and 'CUDA not available.' in line:
+                        elif error_code == 'E-09HN':
                             # NVEncC 非対応の環境
                             self.live_stream.setStatus('Offline', 'お使いの PC 環境は NVEncC エンコーダーに対応していません。(E-09HN)')
-                        elif ENCODER_TYPE == 'VCEEncC' and \
-                            ('Failed to initalize VCE factory:' in line or 'Assertion failed:Init() failed to vkCreateInstance' in line):
+                        elif error_code == 'E-10HV':
                             # VCEEncC 非対応の環境
                             self.live_stream.setStatus('Offline', 'お使いの PC 環境は VCEEncC エンコーダーに対応していません。(E-10HV)')
-                        elif 'Consider increasing the value for the --input-analyze and/or --input-probesize!' in line:
+                        elif error_code == 'ER-02H':
                             # --input-probesize or --input-analyze の期間内に入力ストリームの解析が終わらなかった
                             ## エンコーダーの再起動で復帰できる可能性があるので、エンコードタスクを再起動する
                             self.live_stream.setStatus('Restart', '入力ストリームの解析に失敗しました。エンコードタスクを再起動しています… (ER-02H)')
-                        elif 'finished with error!' in line:
+                        elif error_code == 'ER-03H':
                             # 捕捉されないエラー
                             ## Controller 非同期タスク側で完全にエンコーダープロセスが落ちたタイミングで HEVC 非対応かなどを判断しているため、
                             ## ここで 0.5 秒待機してから実行する
@@ -1174,8 +1006,12 @@ class LiveEncodingTask:
                                 for log in lines[-151:-1]:
                                     logging.warning(log)
 
+                    # まとめて読み込んだ分のログをエンコーダーのログファイルに書き込む
+                    if CONFIG.general.debug_encoder is True and encoder_log is not None:
+                        await encoder_log.flush()
+
                     # エンコードタスクが終了しているか既にエンコーダープロセスが終了していたら、タスクを終了
-                    if is_running is False or tsreadex.returncode is not None or encoder.returncode is not None:
+                    if is_running is False or encoder.returncode is not None:
                         break
 
                 # タスクを終える前にエンコーダーのログファイルを閉じる
@@ -1227,32 +1063,21 @@ class LiveEncodingTask:
 
                     # 前回チューナーからの放送波 TS を読み取ってから TUNER_TS_READ_TIMEOUT 秒以上経過していたら、
                     # 停波中もしくはチューナーからの放送波 TS の送信が停止したと判断して Offline に移行
-                    async with tuner_ts_read_at_lock:
-                        if (time.monotonic() - tuner_ts_read_at) > self.TUNER_TS_READ_TIMEOUT:
+                    if (time.monotonic() - ingest.getTunerTSReadAt()) > self.TUNER_TS_READ_TIMEOUT:
 
-                            # 番組名に「放送休止」などが入っていれば停波の可能性が高い
-                            if program_present is None or program_present.isOffTheAirProgram():
-                                self.live_stream.setStatus('Offline', 'この時間は放送を休止しています。(E-11)')
+                        # 番組名に「放送休止」などが入っていれば停波の可能性が高い
+                        if program_present is None or program_present.isOffTheAirProgram():
+                            self.live_stream.setStatus('Offline', 'この時間は放送を休止しています。(E-11)')
 
-                            # それ以外は受信エラーとする
-                            else:
-                                self.live_stream.setStatus('Offline', 'チューナーからの放送波の受信がタイムアウトしました。チューナー側に何らかの問題があるかもしれません。(E-11)')
+                        # それ以外は受信エラーとする
+                        else:
+                            self.live_stream.setStatus('Offline', 'チューナーからの放送波の受信がタイムアウトしました。チューナー側に何らかの問題があるかもしれません。(E-11)')
 
                     # Mirakurun の Service Stream API からエラーが返された場合
-                    if BACKEND_TYPE == 'Mirakurun' and response is not None and response.status != 200:
-                        # レスポンスヘッダーの server が mirakc であれば mirakc と判定できる
-                        if ('server' in response.headers) and ('mirakc' in response.headers['server']):
-                            mirakurun_or_mirakc = 'mirakc'
-                        else:
-                            mirakurun_or_mirakc = 'Mirakurun'
-                        # Offline にしてエンコードタスクを停止する
-                        ## mirakc はなぜかチューナー不足時に 503 ではなく 404 を返すことがある (バグ?)
-                        if response.status == 503 or (response.status == 404 and mirakurun_or_mirakc == 'mirakc'):
-                            self.live_stream.setStatus('Offline', 'チューナーの起動に失敗しました。空きチューナーが不足している可能性があります。(E-12M)')
-                        elif response.status == 404:
-                            self.live_stream.setStatus('Offline', f'現在このチャンネルは受信できません。{mirakurun_or_mirakc} 側に問題があるかもしれません。(HTTP Error {response.status}) (E-12M)')
-                        else:
-                            self.live_stream.setStatus('Offline', f'チューナーで不明なエラーが発生しました。{mirakurun_or_mirakc} 側に問題があるかもしれません。(HTTP Error {response.status}) (E-12M)')
+                    ## Offline にしてエンコードタスクを停止する
+                    tuner_error_detail = ingest.getTunerErrorDetail()
+                    if tuner_error_detail is not None:
+                        self.live_stream.setStatus('Offline', tuner_error_detail)
                         break
 
                     # ***** 異常処理 (エンコードタスク再起動による回復が可能) *****
@@ -1294,8 +1119,8 @@ class LiveEncodingTask:
 
                     # チューナーとの接続が切断された場合
                     ## ref: https://stackoverflow.com/a/45251241/17124142
-                    if ((BACKEND_TYPE == 'Mirakurun' and response is not None and response.closed is True) or
-                        (BACKEND_TYPE == 'EDCB' and self.live_stream.tuner is not None and self.live_stream.tuner.isDisconnected() is True)):
+                    ## 同じチャンネルのほかの画質と共有しているチューナーインジェストの tsreadex が終了した場合も含む
+                    if ingest.isTunerDisconnected() is True:
 
                         # エンコードタスクを再起動
                         self.live_stream.setStatus('Restart', 'チューナーとの接続が切断されました。エンコードタスクを再起動しています… (ER-05)')
@@ -1369,14 +1194,18 @@ class LiveEncodingTask:
 
         # ***** エンコードタスクの終了処理 *****
 
-        # 稼働中フラグをオフにし、Reader・Writer・SubWriter・EncoderObServer のすべての非同期タスクを終了させる
+        # 稼働中フラグをオフにし、Feeder・Writer・SubWriter・EncoderObServer のすべての非同期タスクを終了させる
         is_running = False
 
         # 明示的にエンコーダープロセスを終了する
         ## 何らかの理由で既に終了している場合は何もしない
+        ## マルチレンディションエンコーダーの場合、kill() ではこの画質の購読を解除するだけなので、ほかの画質が購読中だとエンコーダープロセスは終了されない
+        ## エンコードタスクを再起動する場合は、フリーズしているエンコーダープロセスを使い続けないよう restart() で強制終了させる
         try:
-            tsreadex.kill()
-            encoder.kill()
+            if isinstance(encoder, LiveRenditionOutput) and self.live_stream.getStatus().status == 'Restart':
+                encoder.restart()
+            else:
+                encoder.kill()
         except Exception:
             pass
 
@@ -1391,11 +1220,12 @@ class LiveEncodingTask:
         # エンコードタスクを再起動する（エンコーダーの再起動が必要な場合）
         if self.live_stream.getStatus().status == 'Restart':
 
-            # チューナーをアンロックする (EDCB バックエンドのみ)
-            ## 新しいエンコードタスクが今回立ち上げたチューナーを再利用できるようにする
+            # チューナーインジェストの購読を解除する
+            ## 同じチャンネルのほかの画質がまだ受信中なら、チューナーと tsreadex はそのまま共有され続ける
+            ## この画質が最後の購読者だった場合でも、新しいエンコードタスクが今回立ち上げたチューナーを再利用できるよう、
+            ## チューナーは閉じずにアンロックした状態で保持する (EDCB バックエンドのみ)
             ## エンコーダーの再起動が必要なだけでチューナー自体はそのまま使えるし、わざわざ閉じてからもう一度開くのは無駄
-            if BACKEND_TYPE == 'EDCB' and self.live_stream.tuner is not None:
-                self.live_stream.tuner.unlock(self.live_stream.live_stream_id)
+            await ingest.unsubscribe(self.live_stream, keep_tuner=self._retry_count < self.MAX_RETRY_COUNT)
 
             # 再起動回数が最大再起動回数に達していなければ、再起動する
             if self._retry_count < self.MAX_RETRY_COUNT:
@@ -1404,6 +1234,7 @@ class LiveEncodingTask:
                 background_tasks.add(asyncio.create_task(self.run()))  # 新しいタスクを立ち上げる
 
             # 最大再起動回数を使い果たしたので、Offline にする
+            ## この画質が最後の購読者だった場合、チューナーは購読の解除時に終了されている
             else:
 
                 # Offline に設定
@@ -1414,29 +1245,13 @@ class LiveEncodingTask:
                     # 有料番組（契約されていないことが原因の可能性が高いため、そのように表示する）
                     self.live_stream.setStatus('Offline', 'ライブストリームの再起動に失敗しました。契約されていないため視聴できません。(E-17)')
 
-                # チューナーを終了する (EDCB バックエンドのみ)
-                ## tuner.close() した時点でそのチューナーインスタンスは意味をなさなくなるので、LiveStream インスタンスのプロパティからも削除する
-                if BACKEND_TYPE == 'EDCB' and self.live_stream.tuner is not None:
-                    if await self.live_stream.tuner.close(self.live_stream.live_stream_id) is True:
-                        self.live_stream.tuner = None
-
         # 通常終了
         else:
 
-            # EDCB バックエンドのみ
-            if BACKEND_TYPE == 'EDCB' and self.live_stream.tuner is not None:
-
-                # 再利用中ならチューナーを閉じない
-                ## LiveStream 側の handoff と競合しないようにする
-                if self.live_stream.tuner.getState() == 'Cancelling':
-                    # 強制的にガベージコレクションを実行してから早期 return する
-                    gc.collect()
-                    return
-
-                # チューナーを終了する（まだ制御をこのライブストリームが保持している場合のみ）
-                ## tuner.close() した時点でそのチューナーインスタンスは意味をなさなくなるので、LiveStream インスタンスのプロパティからも削除する
-                if await self.live_stream.tuner.close(self.live_stream.live_stream_id) is True:
-                    self.live_stream.tuner = None
+            # チューナーインジェストの購読を解除する
+            ## この画質が最後の購読者だった場合のみ、tsreadex を終了してチューナーを閉じる
+            ## チューナーが再利用中 (Cancelling) の場合は、LiveStream 側の handoff と競合しないようチューナーを閉じない
+            await ingest.unsubscribe(self.live_stream)
 
         # 強制的にガベージコレクションを実行する
         gc.collect()
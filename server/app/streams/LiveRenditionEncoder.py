@@ -0,0 +1,520 @@
+# Type Hints を指定できるように
+# ref: https://stackoverflow.com/a/33533514/17124142
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+from collections.abc import Callable, Coroutine
+from typing import TYPE_CHECKING, Any, ClassVar, cast
+
+from app import logging
+from app.config import Config
+from app.constants import LIBRARY_PATH, QUALITY_TYPES
+from app.utils.TSPacketReader import TSPacketReader
+
+
+if TYPE_CHECKING:
+    from app.streams.LiveStream import LiveStream
+    from app.streams.LiveTunerIngest import LiveTunerIngest
+
+
+class LiveRenditionOutput:
+    """
+    LiveRenditionEncoder のエンコーダープロセスのうち、1つの画質 (レンディション) の出力を扱うクラス
+    LiveEncodingTask から asyncio.subprocess.Process と同じ要領で stdout・stderr・returncode・kill() を扱えるようにする
+    LiveRenditionOutput は LiveRenditionEncoder クラス外から初期化してはいけない (必ず LiveRenditionEncoder.subscribe() で取得すること)
+    """
+
+    def __init__(self, encoder: LiveRenditionEncoder, process: asyncio.subprocess.Process, quality: QUALITY_TYPES) -> None:
+        """
+        レンディションの出力を初期化する
+
+        Args:
+            encoder (LiveRenditionEncoder): 出力元の LiveRenditionEncoder
+            process (asyncio.subprocess.Process): 出力元のエンコーダープロセス
+            quality (QUALITY_TYPES): このレンディションの映像の品質
+        """
+
+        self._encoder = encoder
+        self._process = process
+        self.quality: QUALITY_TYPES = quality
+
+        # このレンディションのエンコード後の MPEG-TS (TS パケット境界に揃えられている)
+        self.stdout = asyncio.StreamReader()
+
+        # エンコーダーのログ (標準エラー出力)
+        ## ログはすべてのレンディションで共通のため、同じ内容がすべてのレンディションの出力に書き込まれる
+        self.stderr = asyncio.StreamReader()
+
+        # 出力が閉じられたかどうか
+        self._is_closed = False
+
+
+    @property
+    def returncode(self) -> int | None:
+        """ 出力元のエンコーダープロセスの終了コード (読み取り専用) """
+        return self._process.returncode
+
+
+    def isFrom(self, process: asyncio.subprocess.Process) -> bool:
+        """
+        このレンディションの出力が、指定されたエンコーダープロセスの出力かどうかを返す
+
+        Args:
+            process (asyncio.subprocess.Process): エンコーダープロセス
+
+        Returns:
+            bool: 指定されたエンコーダープロセスの出力であれば True
+        """
+
+        return self._process is process
+
+
+    def feedStdout(self, data: bytes) -> None:
+        """
+        このレンディションのエンコード後の MPEG-TS を書き込む
+
+        Args:
+            data (bytes): エンコード後の MPEG-TS
+        """
+
+        if self._is_closed is False:
+            self.stdout.feed_data(data)
+
+
+    def feedStderr(self, data: bytes) -> None:
+        """
+        エンコーダーのログを書き込む
+
+        Args:
+            data (bytes): エンコーダーのログ
+        """
+
+        if self._is_closed is False:
+            self.stderr.feed_data(data)
+
+
+    def close(self) -> None:
+        """
+        出力を閉じ、stdout・stderr を読み取り中のタスクに EOF を通知する
+        """
+
+        if self._is_closed is True:
+            return
+        self._is_closed = True
+        self.stdout.feed_eof()
+        self.stderr.feed_eof()
+
+
+    def kill(self) -> None:
+        """
+        このレンディションの購読を解除する
+        エンコーダープロセス自体は、最後のレンディションの購読が解除された時点で終了される
+        """
+
+        self._encoder.unsubscribe(self)
+
+
+    def restart(self) -> None:
+        """
+        このレンディションの購読を解除し、出力元のエンコーダープロセスがまだ実行中であれば強制終了する
+        エンコードタスクの再起動時に呼び出され、フリーズしたエンコーダープロセスを次回の購読時に起動し直させる
+        """
+
+        self._encoder.restart(self)
+
+
+class LiveRenditionEncoder:
+    """
+    同じチャンネルの複数の画質 (レンディション) を、1つの FFmpeg プロセスでまとめてエンコードするクラス
+    映像のデコードを1回で済ませ、split フィルターで分岐させた映像を画質ごとに scale して複数の出力に同時にエンコードする
+    いずれかの画質の視聴が始まった時点ですべてのレンディションのエンコードを開始するため、画質の切り替え時にエンコーダーの起動を待たずに済む
+    """
+
+    # チャンネル ID をキーとした、マルチレンディションエンコーダーのインスタンスが入る辞書
+    __instances: ClassVar[dict[str, LiveRenditionEncoder]] = {}
+
+    # 各レンディションの出力を1回の read() で読み取る最大サイズ (バイト)
+    READ_SIZE: ClassVar[int] = 64 * 1024
+
+
+    # 必ずチャンネル ID ごとに1つのインスタンスになるように (Singleton)
+    def __new__(cls, display_channel_id: str) -> LiveRenditionEncoder:
+
+        # まだ同じチャンネル ID のインスタンスがないときだけ、インスタンスを生成する
+        if display_channel_id not in cls.__instances:
+
+            # 新しいマルチレンディションエンコーダーのインスタンスを生成する
+            instance = super().__new__(cls)
+
+            # チャンネル ID を設定
+            instance.display_channel_id = display_channel_id
+
+            # 購読しているライブストリームの画質をキーとした、レンディションの出力の辞書
+            instance._outputs = {}
+
+            # 実行中のエンコーダープロセス
+            instance._process = None
+
+            # エンコーダープロセスに入力する tsreadex の出力のキューと、キューの取得元のチューナーインジェスト
+            instance._ingest = None
+            instance._ingest_queue = None
+
+            # エンコーダープロセスの起動時の排他ロック
+            ## 複数の画質のエンコードタスクが同時に起動した場合でも、エンコーダープロセスの起動は1回だけ行う
+            instance._spawn_lock = asyncio.Lock()
+
+            # 実行中の非同期実行タスクへの参照を保持しておく
+            ## ref: https://docs.astral.sh/ruff/rules/asyncio-dangling-task/
+            instance._background_tasks = set()
+
+            # 生成したインスタンスを登録する
+            cls.__instances[display_channel_id] = instance
+
+        # 登録されているインスタンスを返す
+        return cls.__instances[display_channel_id]
+
+
+    def __init__(self, display_channel_id: str) -> None:
+        """
+        マルチレンディションエンコーダーのインスタンスを取得する
+
+        Args:
+            display_channel_id (str): チャンネル ID
+        """
+
+        # インスタンス変数の型ヒントを定義
+        # Singleton のためインスタンスの生成は __new__() で行うが、__init__() も定義しておかないと補完がうまく効かない
+        self.display_channel_id: str
+        self._outputs: dict[QUALITY_TYPES, LiveRenditionOutput]
+        self._process: asyncio.subprocess.Process | None
+        self._ingest: LiveTunerIngest | None
+        self._ingest_queue: asyncio.Queue[bytes | None] | None
+        self._spawn_lock: asyncio.Lock
+        self._background_tasks: set[asyncio.Task[None]]
+
+
+    @staticmethod
+    def getRenditionQualities() -> list[QUALITY_TYPES]:
+        """
+        1つのエンコーダープロセスでまとめてエンコードする画質 (レンディション) のリストを取得する
+
+        Returns:
+            list[QUALITY_TYPES]: レンディションの画質のリスト (重複は取り除かれる)
+        """
+
+        return list(dict.fromkeys(Config().tv.multi_rendition_qualities))
+
+
+    @classmethod
+    def isEnabled(cls, quality: QUALITY_TYPES, encoder_type: str, is_radiochannel: bool) -> bool:
+        """
+        指定された画質のライブストリームを、マルチレンディションエンコーダーでエンコードするかどうかを返す
+
+        Args:
+            quality (QUALITY_TYPES): 映像の品質
+            encoder_type (str): エンコーダーの種類
+            is_radiochannel (bool): ラジオチャンネルかどうか
+
+        Returns:
+            bool: マルチレンディションエンコーダーでエンコードするかどうか
+        """
+
+        rendition_qualities = cls.getRenditionQualities()
+
+        # 2つ以上の画質が設定されていない場合は、まとめてエンコードする意味がない
+        if len(rendition_qualities) < 2 or quality not in rendition_qualities:
+            return False
+
+        # HWEncC は1回の起動で複数の出力をエンコードできないため、FFmpeg のみ対応している
+        if encoder_type != 'FFmpeg':
+            return False
+
+        # ラジオチャンネルには映像がない
+        if is_radiochannel is True:
+            return False
+
+        # 各レンディションの出力は追加のパイプ (pass_fds) で受け取るため、Windows では利用できない
+        if sys.platform == 'win32':
+            return False
+
+        return True
+
+
+    async def subscribe(
+        self,
+        live_stream: LiveStream,
+        ingest: LiveTunerIngest,
+        build_options: Callable[[list[QUALITY_TYPES], list[str]], list[str]],
+    ) -> LiveRenditionOutput:
+        """
+        ライブストリームの画質のレンディションを購読し、その出力を返す
+        まだエンコーダープロセスが起動していない場合は、設定されているすべての画質をエンコードするエンコーダープロセスを起動する
+
+        Args:
+            live_stream (LiveStream): 購読するライブストリーム
+            ingest (LiveTunerIngest): エンコーダープロセスに入力する tsreadex の出力を取得するチューナーインジェスト
+            build_options (Callable[[list[QUALITY_TYPES], list[str]], list[str]]): レンディションの画質と出力先の URL のリストから FFmpeg に渡すオプションを組み立てる関数
+
+        Returns:
+            LiveRenditionOutput: 購読したレンディションの出力
+        """
+
+        async with self._spawn_lock:
+
+            # エンコーダープロセスが起動していないか、既に終了している場合は新たに起動する
+            if self._process is None or self._process.returncode is not None:
+                self.__stop()
+                await self.__spawn(ingest, build_options)
+            assert self._process is not None
+
+            # 再起動などで既に購読している場合は、古い出力を閉じてから差し替える
+            old_output = self._outputs.get(live_stream.quality)
+            if old_output is not None:
+                old_output.close()
+
+            output = LiveRenditionOutput(self, self._process, live_stream.quality)
+            self._outputs[live_stream.quality] = output
+            logging.debug(f'[Live: {live_stream.live_stream_id}] Subscribed to the multi-rendition encoder. ({len(self._outputs)} renditions)')
+            return output
+
+
+    def unsubscribe(self, output: LiveRenditionOutput) -> None:
+        """
+        レンディションの購読を解除する
+        最後のレンディションの購読が解除された時点で、エンコーダープロセスを終了する
+
+        Args:
+            output (LiveRenditionOutput): 購読を解除するレンディションの出力
+        """
+
+        output.close()
+
+        # 購読しているレンディションの出力でなければ何もしない (既に差し替えられている場合など)
+        if self._outputs.get(output.quality) is not output:
+            return
+        del self._outputs[output.quality]
+
+        # 最後のレンディションの購読が解除されたので、エンコーダープロセスを終了する
+        if len(self._outputs) == 0:
+            self.__stop()
+
+
+    def restart(self, output: LiveRenditionOutput) -> None:
+        """
+        レンディションの購読を解除し、そのレンディションの出力元のエンコーダープロセスがまだ実行中であれば強制終了する
+        エンコードが途中で停止した (ER-04) 場合など、ほかの画質が購読中でもエンコーダープロセス自体を起動し直す必要があるときに呼び出す
+        強制終了したエンコーダープロセスのほかのレンディションの出力には EOF が通知され、各画質のエンコードタスクも再起動される
+
+        Args:
+            output (LiveRenditionOutput): 購読を解除するレンディションの出力
+        """
+
+        self.unsubscribe(output)
+
+        # 既にほかの画質のエンコードタスクによって新しいエンコーダープロセスが起動されている場合は、そのまま使う
+        ## 各画質のエンコードタスクが互いのエンコーダープロセスを終了させ続けないようにする
+        if self._process is not None and output.isFrom(self._process):
+            logging.info(f'[Live: {self.display_channel_id}] Restarting the multi-rendition encoder.')
+            self.__stop()
+
+
+    async def __spawn(self, ingest: LiveTunerIngest, build_options: Callable[[list[QUALITY_TYPES], list[str]], list[str]]) -> None:
+        """
+        設定されているすべての画質をエンコードするエンコーダープロセスを起動する
+
+        Args:
+            ingest (LiveTunerIngest): エンコーダープロセスに入力する tsreadex の出力を取得するチューナーインジェスト
+            build_options (Callable[[list[QUALITY_TYPES], list[str]], list[str]]): FFmpeg に渡すオプションを組み立てる関数
+        """
+
+        qualities = self.getRenditionQualities()
+
+        # レンディションごとの出力用のパイプを作成する
+        ## 書き込み用パイプは pass_fds で同じ番号のままエンコーダープロセスに引き継がれるため、pipe:(番号) で出力先に指定できる
+        pipes = [os.pipe() for _ in qualities]
+        output_urls = [f'pipe:{write_pipe}' for _, write_pipe in pipes]
+
+        try:
+
+            # オプションを取得
+            encoder_options = build_options(qualities, output_urls)
+            logging.info(f'[Live: {self.display_channel_id}] FFmpeg Commands (Multi-Rendition: {", ".join(qualities)}):\nffmpeg {" ".join(encoder_options)}')
+
+            # エンコーダープロセスを非同期で作成・実行
+            process = await asyncio.subprocess.create_subprocess_exec(
+                *[LIBRARY_PATH['FFmpeg'], *encoder_options],
+                stdin = asyncio.subprocess.PIPE,  # チューナーインジェストの tsreadex からの入力
+                stdout = asyncio.subprocess.DEVNULL,  # 出力はレンディションごとのパイプで受け取る
+                stderr = asyncio.subprocess.PIPE,  # ログ出力
+                pass_fds = [write_pipe for _, write_pipe in pipes],
+            )
+
+        # エンコーダープロセスを起動できなかった場合は、誰も読み取らない読み取り用パイプも閉じる
+        except BaseException:
+            for read_pipe, _ in pipes:
+                os.close(read_pipe)
+            raise
+
+        finally:
+            # 書き込み用パイプを閉じる
+            for _, write_pipe in pipes:
+                os.close(write_pipe)
+
+        self._process = process
+        self._ingest = ingest
+        self._ingest_queue = ingest.openQueue()
+
+        # レンディションごとの出力の読み取りタスクを実行する
+        loop = asyncio.get_running_loop()
+        for quality, (read_pipe, _) in zip(qualities, pipes):
+            stream_reader = asyncio.StreamReader()
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stream_reader), os.fdopen(read_pipe, 'rb', 0))
+            self.__createTask(self.__renditionReader(process, quality, stream_reader))
+
+        # エンコーダーへの入力・ログの読み取りタスクを実行する
+        self.__createTask(self.__feeder(process, ingest, self._ingest_queue))
+        self.__createTask(self.__logReader(process))
+
+
+    async def __feeder(self, process: asyncio.subprocess.Process, ingest: LiveTunerIngest, ingest_queue: asyncio.Queue[bytes | None]) -> None:
+        """
+        チューナーインジェストから分配された tsreadex の出力を随時エンコーダーの入力に書き込む
+
+        Args:
+            process (asyncio.subprocess.Process): エンコーダープロセス
+            ingest (LiveTunerIngest): キューの取得元のチューナーインジェスト
+            ingest_queue (asyncio.Queue[bytes | None]): tsreadex の出力が分配されるキュー
+        """
+
+        encoder_stdin = cast(asyncio.StreamWriter, process.stdin)
+
+        while True:
+
+            # 分配の終了が通知されたら、タスクを終了
+            chunk = await ingest_queue.get()
+            if chunk is None:
+                break
+
+            # エンコーダーの標準入力が閉じられていたら、タスクを終了
+            if encoder_stdin.is_closing():
+                break
+
+            try:
+                # ストリームデータをエンコーダーの標準入力に書き込む
+                encoder_stdin.write(chunk)
+                await encoder_stdin.drain()
+
+            # BrokenPipeError・asyncio.TimeoutError などが想定されるが、何が発生するかわからないためすべての例外をキャッチする
+            except Exception:
+                break
+
+            # 既にエンコーダープロセスが終了していたら、タスクを終了
+            if process.returncode is not None:
+                break
+
+        # タスクを終える前に、エンコーダーの標準入力を閉じる
+        try:
+            encoder_stdin.close()
+        except OSError:
+            pass
+
+        # 以降は誰も読み取らないキューへの分配を終了する
+        ingest.closeQueue(ingest_queue)
+
+
+    async def __renditionReader(self, process: asyncio.subprocess.Process, quality: QUALITY_TYPES, stream_reader: asyncio.StreamReader) -> None:
+        """
+        1つのレンディションの出力を TS パケット境界に揃えて読み取り、その画質を購読しているレンディションの出力に書き込む
+        購読されていない画質の出力も、エンコーダーの出力が詰まらないよう読み捨てる
+
+        Args:
+            process (asyncio.subprocess.Process): エンコーダープロセス
+            quality (QUALITY_TYPES): レンディションの画質
+            stream_reader (asyncio.StreamReader): レンディションの出力用パイプの StreamReader
+        """
+
+        ts_packet_reader = TSPacketReader(stream_reader)
+
+        while True:
+
+            # 空のデータが返ってきたら、エンコーダーが終了したと判断してタスクを終了
+            packets = await ts_packet_reader.read()
+            if len(packets) == 0:
+                break
+
+            # この画質を購読しているレンディションの出力があれば書き込む
+            output = self._outputs.get(quality)
+            if output is not None and output.returncode is None and output.isFrom(process) is True:
+                output.feedStdout(packets)
+
+        # このエンコーダープロセスのレンディションの出力に EOF を通知する
+        output = self._outputs.get(quality)
+        if output is not None and output.isFrom(process) is True:
+            output.close()
+
+
+    async def __logReader(self, process: asyncio.subprocess.Process) -> None:
+        """
+        エンコーダーのログを読み取り、すべてのレンディションの出力に書き込む
+        行への分割とログの判定は、各画質のエンコードタスクの EncoderObServer で行われる
+
+        Args:
+            process (asyncio.subprocess.Process): エンコーダープロセス
+        """
+
+        stderr = cast(asyncio.StreamReader, process.stderr)
+
+        while True:
+
+            # 空のデータが返ってきたら、エンコーダーが終了したと判断してタスクを終了
+            data = await stderr.read(self.READ_SIZE)
+            if len(data) == 0:
+                break
+
+            for output in list(self._outputs.values()):
+                if output.isFrom(process) is True:
+                    output.feedStderr(data)
+
+        # エンコーダーの終了を待ってから、このエンコーダープロセスのすべてのレンディションの出力に EOF を通知する
+        ## 先に returncode を確定させておかないと、エンコードタスク側でエンコーダーの異常終了を検知できないことがある
+        await process.wait()
+        for output in list(self._outputs.values()):
+            if output.isFrom(process) is True:
+                output.close()
+
+
+    def __stop(self) -> None:
+        """
+        エンコーダープロセスを終了し、チューナーインジェストからのキューへの分配を終了する
+        """
+
+        # 明示的にエンコーダープロセスを終了する
+        ## 何らかの理由で既に終了している場合は何もしない
+        if self._process is not None:
+            try:
+                self._process.kill()
+            except Exception:
+                pass
+            self._process = None
+
+        # チューナーインジェストからのキューへの分配を終了する
+        ## 待機中の Feeder には分配の終了が通知される
+        if self._ingest is not None and self._ingest_queue is not None:
+            self._ingest.closeQueue(self._ingest_queue)
+        self._ingest = None
+        self._ingest_queue = None
+
+
+    def __createTask(self, coroutine: Coroutine[Any, Any, None]) -> None:
+        """
+        非同期タスクを作成し、完了するまで参照を保持する
+
+        Args:
+            coroutine (Coroutine[Any, Any, None]): 実行するコルーチン
+        """
+
+        task = asyncio.create_task(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
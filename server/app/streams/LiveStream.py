@@ -11,11 +11,13 @@ from hashids import Hashids
 
 from app import logging
 from app.config import Config
-from app.constants import QUALITY_TYPES
+from app.constants import QUALITY, QUALITY_TYPES
+from app.models.Channel import Channel
 from app.schemas import LiveStreamStatus
 from app.streams.LiveEncodingTask import LiveEncodingTask
 from app.streams.LivePSIDataArchiver import LivePSIDataArchiver
-from app.utils.edcb.EDCBTuner import EDCBTuner
+from app.streams.LiveStreamRingBuffer import LiveStreamRingBuffer
+from app.streams.LiveTunerIngest import LiveTunerIngest
 
 
 class LiveStreamClient:
@@ -42,8 +44,15 @@ class LiveStreamClient:
         # クライアントの種別 (mpegts)
         self.client_type: Literal['mpegts'] = client_type
 
-        # ストリームデータが入る Queue
-        self._queue: asyncio.Queue[bytes | None] = asyncio.Queue()
+        # リングバッファ上の読み取り位置 (チャンクのシーケンス番号とチャンク内の位置)
+        ## 接続時点でリングバッファ内にある最新のキーフレームから読み取りを開始する
+        self._cursor_sequence: int
+        self._cursor_offset: int
+        self._cursor_sequence, self._cursor_offset = live_stream.ring_buffer.getStartCursor()
+
+        # クライアントの接続が切断されたかどうか
+        ## True になった時点で readStreamData() は None を返す
+        self._is_closed: bool = False
 
         # ストリームデータの最終読み取り時刻のタイミング
         ## 最終読み取り時刻から 10 秒経過したクライアントは LiveStream.writeStreamData() でタイムアウトと判断され、削除される
@@ -58,11 +67,9 @@ class LiveStreamClient:
 
     async def readStreamData(self) -> bytes | None:
         """
-        自分自身の Queue からストリームデータを読み取って返す
-        Queue 内のストリームデータは writeStreamData() で書き込まれたもの
-
-        Args:
-            client (LiveStreamClient): ライブストリームクライアントのインスタンス
+        ライブストリームのリングバッファから、自分自身の読み取り位置以降のストリームデータを読み取って返す
+        読み取りが遅れて読み取り位置のデータが既に破棄されていた場合は、次のキーフレームまで読み飛ばす
+        リングバッファ内のストリームデータは LiveStream.writeStreamData() で書き込まれたもの
 
         Returns:
             bytes | None: ストリームデータ (エンコードタスクが終了した場合は None が返る)
@@ -75,28 +82,41 @@ class LiveStreamClient:
         # ストリームデータの最終読み取り時刻を更新
         self._stream_data_read_at = time.time()
 
-        # Queue から読み取ったストリームデータを返す
-        try:
-            return await self._queue.get()
-        except TypeError:
-            return None
+        ring_buffer = self._live_stream.ring_buffer
+        while True:
 
+            # 接続が切断されている場合は None を返す
+            if self._is_closed is True:
+                return None
 
-    def writeStreamData(self, stream_data: bytes | None) -> None:
-        """
-        自分自身の Queue にストリームデータを書き込む
-        Queue 内のストリームデータは readStreamData() で読み取られる
+            # 読み取り位置のチャンクが既に破棄されている場合は、次のキーフレームまで読み飛ばす
+            if ring_buffer.isEvicted(self._cursor_sequence):
+                skipped_from = self._cursor_sequence
+                self._cursor_sequence, self._cursor_offset = ring_buffer.getSkipCursor(self._cursor_sequence)
+                logging.debug(
+                    f'[Live: {self._live_stream.live_stream_id}] Client is too slow, skipped '
+                    f'{self._cursor_sequence - skipped_from} chunks. Client ID: {self.client_id}'
+                )
 
-        Args:
-            stream_data (bytes): 書き込むストリームデータ (エンコードタスクが終了した場合は None を渡す)
-        """
+            # 読み取り位置のチャンクがあればそれを返す
+            chunk = ring_buffer.getChunk(self._cursor_sequence)
+            if chunk is not None:
+                data = chunk.data if self._cursor_offset == 0 else chunk.data[self._cursor_offset:]
+                self._cursor_sequence += 1
+                self._cursor_offset = 0
+                return data
 
-        # mpegts クライアント以外では実行しない
-        if self.client_type != 'mpegts':
-            return None
+            # まだチャンクが書き込まれていないので、書き込まれるまで待機する
+            await ring_buffer.wait()
 
-        # Queue にストリームデータを書き込む
-        self._queue.put_nowait(stream_data)
+
+    def close(self) -> None:
+        """
+        クライアントの接続を切断し、readStreamData() で待機中のクライアントに終了を通知する
+        """
+
+        self._is_closed = True
+        self._live_stream.ring_buffer.notify()
 
 
 class LiveStream:
@@ -106,6 +126,13 @@ class LiveStream:
     # この辞書にライブストリームに関する全てのデータが格納されている
     __instances: ClassVar[dict[str, LiveStream]] = {}
 
+    # チャンネル ID をキーとした、同じチャンネルのすべての画質のライブストリームに接続中のクライアント数
+    ## クライアントの接続・切断の度に増減させ、getViewerCount() で全ライブストリームを走査しなくて済むようにする
+    __viewer_counts: ClassVar[dict[str, int]] = {}
+
+    # Warm 状態の間、チューナーとの接続が切断されていないかを確認する間隔 (秒)
+    WARM_TUNER_CHECK_INTERVAL: ClassVar[float] = 1.0
+
 
     # 必ずライブストリーム ID ごとに1つのインスタンスになるように (Singleton)
     def __new__(cls, display_channel_id: str, quality: QUALITY_TYPES) -> LiveStream:
@@ -130,8 +157,17 @@ class LiveStream:
             ## したがって、クライアントの数はこのリストの長さで求められる
             instance._clients = []
 
+            # ステータス (接続中のクライアント数を含む) が次に変化した際にセットされるイベント
+            ## セットと同時に新しいイベントに差し替えることで、待機中のすべての購読者に変化を一斉に通知する
+            instance._status_changed = asyncio.Event()
+
+            # エンコーダーの出力を全クライアントで共有するリングバッファ
+            ## クライアントは読み取り位置だけを保持するため、視聴者数に関わらずメモリ使用量は一定になる
+            instance.ring_buffer = LiveStreamRingBuffer()
+
             # ストリームのステータス
-            ## Offline, Standby, ONAir, Idling, Restart のいずれか
+            ## Offline, Standby, ONAir, Idling, Restart, Warm のいずれか
+            ## Warm は視聴者がいない状態で、エンコーダーを起動せずにチューナーと tsreadex だけを事前に起動している状態を表す
             instance._status = 'Offline'
 
             # ストリームのステータス詳細
@@ -152,13 +188,16 @@ class LiveStream:
             # ref: https://docs.astral.sh/ruff/rules/asyncio-dangling-task/
             instance._live_encoding_task_ref = None
 
+            # 実行中の Warm 状態を維持するタスクへの参照
+            instance._warm_task_ref = None
+
             # PSI/SI データアーカイバーのインスタンス
             ## LiveStreamsRouter からアクセスする必要があるためここに設置している
             instance.psi_data_archiver = None
 
-            # EDCB バックエンドのチューナーインスタンス
-            ## Mirakurun バックエンドを使っている場合は None のまま
-            instance.tuner = None
+            # このチャンネルのチューナーインジェスト
+            ## チューナーとの接続と tsreadex は、同じチャンネルのすべての画質のライブストリームで共有される
+            instance.ingest = LiveTunerIngest(display_channel_id)
 
             # チューナー再利用時の排他ロック
             ## チューナー再利用の競合を避けるため、LiveStream ごとにロックを持つ
@@ -186,14 +225,17 @@ class LiveStream:
         self.display_channel_id: str
         self.quality: QUALITY_TYPES
         self._clients: list[LiveStreamClient]
-        self._status: Literal['Offline', 'Standby', 'ONAir', 'Idling', 'Restart']
+        self._status_changed: asyncio.Event
+        self.ring_buffer: LiveStreamRingBuffer
+        self._status: Literal['Offline', 'Standby', 'ONAir', 'Idling', 'Restart', 'Warm']
         self._detail: str
         self._started_at: float
         self._updated_at: float
         self._stream_data_written_at: float
         self._live_encoding_task_ref: asyncio.Task[None] | None
+        self._warm_task_ref: asyncio.Task[None] | None
         self.psi_data_archiver: LivePSIDataArchiver | None
-        self.tuner: EDCBTuner | None
+        self.ingest: LiveTunerIngest
         self._tuner_lock: asyncio.Lock
 
 
@@ -260,13 +302,8 @@ class LiveStream:
             int: 視聴者数
         """
 
-        # 指定されたチャンネル ID に紐づくライブストリームを探して視聴者数を集計
-        viewer_count = 0
-        for live_stream in LiveStream.getAllLiveStreams():
-            if live_stream.display_channel_id == display_channel_id:
-                viewer_count += live_stream.getStatus().client_count
-
-        return viewer_count
+        # クライアントの接続・切断の度に更新しているチャンネルごとの視聴者数を返す
+        return cls.__viewer_counts.get(display_channel_id, 0)
 
 
     async def connect(self, client_type: Literal['mpegts']) -> LiveStreamClient:
@@ -286,16 +323,23 @@ class LiveStream:
         current_status = self._status
         should_start_task: bool = False
 
-        # ライブストリームが Offline な場合、新たにエンコードタスクを起動する
-        if current_status == 'Offline':
+        # ライブストリームが Offline (または Warm) な場合、新たにエンコードタスクを起動する
+        ## Warm 状態の場合は既にチューナーと tsreadex が起動しているため、エンコーダーの起動だけで済む
+        if current_status == 'Offline' or current_status == 'Warm':
 
             # ステータスを Standby に設定
             # 現在 Idling 状態のライブストリームを探す前に設定しないと多重に LiveEncodingTask が起動しかねず、重篤な不具合につながる
             async with self._tuner_lock:
-                if self._status == 'Offline':
+                if self._status == 'Offline' or self._status == 'Warm':
                     self.setStatus('Standby', 'エンコードタスクを起動しています…')
                     should_start_task = True
 
+                    # Warm 状態を維持するタスクを終了する
+                    ## チューナーインジェストの購読は、これから起動するエンコードタスクにそのまま引き継がれる
+                    if self._warm_task_ref is not None:
+                        self._warm_task_ref.cancel()
+                        self._warm_task_ref = None
+
             # 一般にチューナーリソースは無尽蔵にあるわけではないので、現在 Idling（=つまり誰も見ていない）ライブストリームがあるのなら
             # それを Offline にしてチューナーリソースを解放し、新しいライブストリームがチューナーを使えるようにする
             ## EDCB バックエンドの場合はチューナーインスタンスを直接移譲して再利用できるため、より高度なチューナー再利用ロジックを実行する
@@ -306,88 +350,109 @@ class LiveStream:
                 Config().general.always_receive_tv_from_mirakurun is False
             )
 
+            # 同じチャンネルの別の画質が既にチューナーインジェストで受信中 (起動中を含む) の場合は、そのチューナーを共有して受信する
+            ## 新たにチューナーを確保する必要はないため、チューナーリソースの再利用・解放は行わない
+            is_sharing_tuner = self.ingest.isRunning() is True
+
             # EDCB バックエンドの場合は、再利用できるチューナーがあれば取得しておく
-            if should_start_task is True and is_edcb_backend is True:
+            ## エンコードタスクの再起動などでこのチャンネルのチューナーインジェストが既にチューナーを保持している場合は対象外
+            if should_start_task is True and is_sharing_tuner is False and is_edcb_backend is True and self.ingest.tuner is None:
 
-                # チューナー再利用の対象になりうる Standby / ONAir / Idling のストリームを探す
+                # チューナー再利用の対象になりうる Standby / ONAir / Idling / Warm のストリームだけが購読しているチューナーインジェストを探す
                 # (クライアントが 0 のもののみを対象にする)
+                ## チューナーは同じチャンネルのすべての画質で共有されているため、購読しているすべての画質が対象になりうる場合のみ再利用する
                 ## Idling への移行は非同期で遅れて発生するため、短時間リトライする
                 for _ in range(15):
                     found_reusable_tuner = False
                     should_wait_next_retry = False
 
-                    for live_stream in LiveStream.getAllLiveStreams():
-                        # 自分自身は対象外
-                        if live_stream is self:
+                    for ingest in LiveTunerIngest.getAllIngests():
+                        # 自分自身のチャンネルのチューナーインジェストは対象外
+                        if ingest is self.ingest:
                             continue
 
-                        # ステータスを取得
-                        async with live_stream._tuner_lock:
-                            live_stream_status = live_stream.getStatus()
-
-                        # クライアントが接続されている場合は対象外
-                        # ただし Standby 状態のストリームはまだクライアントに有意なデータを配信していないため、
-                        # client_count に関係なくチューナー再利用の対象にする (disconnectAll() で安全に切断できる)
-                        if live_stream_status.client_count != 0 and live_stream_status.status != 'Standby':
-                            # 近いタイミングで Idling に遷移する可能性があるため、リトライ対象とする
-                            if (live_stream_status.status == 'ONAir' or
-                                live_stream_status.status == 'Idling'):
-                                should_wait_next_retry = True
+                        # チューナーが割り当てられていない場合は対象外
+                        if ingest.tuner is None:
                             continue
 
-                        # Standby / ONAir / Idling 状態でない場合は対象外
-                        if live_stream_status.status not in ('Standby', 'ONAir', 'Idling'):
+                        # チューナーが既にキャンセル中の場合は対象外
+                        if ingest.tuner.getState() == 'Cancelling':
                             continue
 
-                        # チューナーが割り当てられていない場合は対象外
-                        if live_stream.tuner is None:
+                        # 購読しているライブストリームがない場合は対象外 (エンコードタスクの再起動中など)
+                        subscribers = ingest.getSubscribers()
+                        if len(subscribers) == 0:
                             continue
 
-                        # チューナーが既にキャンセル中の場合は対象外
-                        if live_stream.tuner.getState() == 'Cancelling':
+                        is_reusable = True
+                        for live_stream in subscribers:
+
+                            # ステータスを取得
+                            async with live_stream._tuner_lock:
+                                live_stream_status = live_stream.getStatus()
+
+                            # クライアントが接続されている場合は対象外
+                            # ただし Standby 状態のストリームはまだクライアントに有意なデータを配信していないため、
+                            # client_count に関係なくチューナー再利用の対象にする (disconnectAll() で安全に切断できる)
+                            if live_stream_status.client_count != 0 and live_stream_status.status != 'Standby':
+                                # 近いタイミングで Idling に遷移する可能性があるため、リトライ対象とする
+                                if (live_stream_status.status == 'ONAir' or
+                                    live_stream_status.status == 'Idling'):
+                                    should_wait_next_retry = True
+                                is_reusable = False
+                                break
+
+                            # Standby / ONAir / Idling / Warm 状態でない場合は対象外
+                            ## Warm 状態のストリームは誰も視聴していないため、常に直ちにチューナーを明け渡す
+                            if live_stream_status.status not in ('Standby', 'ONAir', 'Idling', 'Warm'):
+                                is_reusable = False
+                                break
+
+                        if is_reusable is False:
                             continue
 
                         # チューナー再利用のため、チューナー状態をキャンセル中に切り替える
-                        live_stream.tuner.setState('Cancelling')
+                        ingest.tuner.setState('Cancelling')
 
-                        # ステータスを Offline に設定
-                        live_stream.setStatus('Offline', '新しいライブストリームが開始されたため、チューナーリソースを再利用します。')
+                        # チューナーを共有しているすべての画質のライブストリームを終了する
+                        for live_stream in subscribers:
 
-                        # すべての視聴中クライアントのライブストリームへの接続を切断する
-                        live_stream.disconnectAll()
+                            # ステータスを Offline に設定
+                            live_stream.setStatus('Offline', '新しいライブストリームが開始されたため、チューナーリソースを再利用します。')
 
-                        # PSI/SI データアーカイバーを終了・破棄する
-                        if live_stream.psi_data_archiver is not None:
-                            live_stream.psi_data_archiver.destroy()
-                            live_stream.psi_data_archiver = None
+                            # すべての視聴中クライアントのライブストリームへの接続を切断する
+                            live_stream.disconnectAll()
+
+                            # PSI/SI データアーカイバーを終了・破棄する
+                            if live_stream.psi_data_archiver is not None:
+                                live_stream.psi_data_archiver.destroy()
+                                live_stream.psi_data_archiver = None
 
                         # チューナーとのストリーミング接続を明示的に閉じる
-                        await live_stream.tuner.disconnect(live_stream.live_stream_id)
+                        await ingest.tuner.disconnect(ingest.ingest_id)
 
-                        # チューナーの制御権限を移譲する
-                        if live_stream.tuner.handoff(live_stream.live_stream_id, self.live_stream_id) is False:
+                        # チューナーの制御権限とインスタンスを、このチャンネルのチューナーインジェストに移譲する
+                        if ingest.handoff(self.ingest) is False:
                             continue
 
                         # 実行中のタスクがあればキャンセルする
-                        if live_stream._live_encoding_task_ref is not None:
-                            live_stream._live_encoding_task_ref.cancel()
-
-                            # タスクの完了を最大 10 秒待つ
-                            ## エンコーダープロセスの kill とバックグラウンドタスクの完了を含め、通常は 0.5 秒程度で完了する
-                            ## EDCB との通信ハングなどで無期限にブロックされることを防ぐためにタイムアウトを設ける
-                            ## asyncio.wait() はタスクの状態を変更しないため、タイムアウトしても旧タスクは自然終了を続ける
-                            done, _ = await asyncio.wait(
-                                {live_stream._live_encoding_task_ref},
-                                timeout=10.0,
-                            )
-                            if not done:
-                                logging.warning(f'[Live: {live_stream.live_stream_id}] Encoding task cleanup did not complete within 10 seconds.')
-
-                            live_stream._live_encoding_task_ref = None
-
-                        # チューナーインスタンスを移譲する
-                        self.tuner = live_stream.tuner
-                        live_stream.tuner = None
+                        for live_stream in subscribers:
+                            if live_stream._live_encoding_task_ref is not None:
+                                live_stream._live_encoding_task_ref.cancel()
+
+                                # タスクの完了を最大 10 秒待つ
+                                ## エンコーダープロセスの kill とバックグラウンドタスクの完了を含め、通常は 0.5 秒程度で完了する
+                                ## EDCB との通信ハングなどで無期限にブロックされることを防ぐためにタイムアウトを設ける
+                                ## asyncio.wait() はタスクの状態を変更しないため、タイムアウトしても旧タスクは自然終了を続ける
+                                done, _ = await asyncio.wait(
+                                    {live_stream._live_encoding_task_ref},
+                                    timeout=10.0,
+                                )
+                                if not done:
+                                    logging.warning(f'[Live: {live_stream.live_stream_id}] Encoding task cleanup did not complete within 10 seconds.')
+
+                                live_stream._live_encoding_task_ref = None
+
                         found_reusable_tuner = True
                         break
 
@@ -398,21 +463,29 @@ class LiveStream:
 
                     await asyncio.sleep(0.1)
 
-            # Mirakurun バックエンドの場合は、現在 Idling 状態のライブストリームを Offline にしてチューナーリソースを解放する
+            # Mirakurun バックエンドの場合は、購読しているすべての画質が Idling (または Warm) 状態のチューナーインジェストのライブストリームを Offline にしてチューナーリソースを解放する
             ## Mirakurun バックエンドではチューナーインスタンスの直接移譲はできないため、
-            ## Idling ストリームを Offline にして Controller の自然終了 → Reader 内での HTTP セッション切断を通じて
+            ## Idling ストリームを Offline にして Controller の自然終了 → 最後の画質の購読解除時の HTTP セッション切断を通じて
             ## Mirakurun/mirakc 側でチューナーが解放されるのを待つ形になる
-            elif should_start_task is True and is_edcb_backend is False:
+            elif should_start_task is True and is_sharing_tuner is False and is_edcb_backend is False:
 
                 # 画質切り替えなどタイミングの問題で Idling なストリームがない事もあるので、リトライする
                 ## ONAir (client_count == 0) のストリームが存在する場合、近いタイミングで Idling に遷移する可能性があるため
                 for _ in range(15):
 
-                    # 現在 Idling 状態のライブストリームがあれば
-                    idling_live_streams = self.getIdlingLiveStreams()
-                    if len(idling_live_streams) > 0:
-                        # チューナーリソースを解放する
-                        idling_live_streams[0].setStatus('Offline', '新しいライブストリームが開始されたため、チューナーリソースを解放しました。')
+                    # 購読しているすべての画質が Idling (または Warm) 状態のチューナーインジェストがあれば
+                    released_tuner = False
+                    for ingest in LiveTunerIngest.getAllIngests():
+                        subscribers = ingest.getSubscribers()
+                        if ingest is self.ingest or len(subscribers) == 0:
+                            continue
+                        if all(live_stream.getStatus().status in ('Idling', 'Warm') for live_stream in subscribers):
+                            # チューナーリソースを解放する
+                            for live_stream in subscribers:
+                                live_stream.setStatus('Offline', '新しいライブストリームが開始されたため、チューナーリソースを解放しました。')
+                            released_tuner = True
+                            break
+                    if released_tuner is True:
                         break
 
                     # 現在 ONAir 状態のライブストリームがなく、リトライしたところで Idling なライブストリームが取得できる見込みがない
@@ -431,7 +504,7 @@ class LiveStream:
         # ライブストリームクライアントのインスタンスを生成・登録する
         async with self._tuner_lock:
             client = LiveStreamClient(self, client_type)
-            self._clients.append(client)
+            self.__addClient(client)
             logging.info(f'[Live: {self.live_stream_id}] Client Connected. Client ID: {client.client_id}')
 
         # ***** アイドリングからの復帰 *****
@@ -444,6 +517,91 @@ class LiveStream:
         return client
 
 
+    async def warm(self) -> bool:
+        """
+        ライブストリームを Warm 状態にして、エンコーダーを起動せずにチューナーと tsreadex だけを事前に起動しておく
+        Warm 状態のライブストリームに視聴者が接続した場合は、エンコーダーの起動だけでライブストリームを開始できる
+        Warm 状態のチューナーは、ほかのチャンネルの視聴開始時のチューナー再利用ロジックで直ちに明け渡される
+
+        Returns:
+            bool: Warm 状態に移行したかどうか (既に Offline 以外の状態だった場合は False を返す)
+        """
+
+        async with self._tuner_lock:
+
+            # Offline 以外の状態からは Warm 状態に移行しない
+            if self._status != 'Offline':
+                return False
+
+            # Offline への移行直後で、まだエンコードタスクの終了処理が完了していない場合は移行しない
+            if self._live_encoding_task_ref is not None and self._live_encoding_task_ref.done() is False:
+                return False
+
+            self.setStatus('Warm', 'チューナーを事前に起動しています…')
+
+        # Warm 状態を維持するタスクを非同期で実行
+        self._warm_task_ref = asyncio.create_task(self.__runWarmTask())
+        return True
+
+
+    async def __runWarmTask(self) -> None:
+        """
+        チューナーインジェストを購読してチューナーと tsreadex を起動し、ライブストリームが Warm 状態の間維持する
+        Warm 状態から Offline に移行した場合は購読を解除し、ほかに購読している画質がなければチューナーを解放する
+        視聴者の接続により Standby に移行した場合は、購読をそのままエンコードタスクに引き継ぐ
+        """
+
+        # チャンネル情報と現在の番組情報を取得する
+        channel = await Channel.filter(display_channel_id=self.display_channel_id).first()
+        if channel is None:
+            self.setStatus('Offline', 'チャンネル情報が見つからないため、チューナーを事前に起動できませんでした。')
+            return
+        program_present = (await channel.getCurrentAndNextProgram())[0]
+
+        # 情報の取得中に Warm 状態でなくなっていたら何もしない
+        ## 視聴者の接続により Standby に移行していた場合に購読すると、エンコードタスクの購読を上書きしてしまう
+        if self._status != 'Warm':
+            return
+
+        # チューナーインジェストを購読する
+        ## エンコーダーは起動しないため、tsreadex の出力を受け取るキューは作成しない
+        self.ingest.subscribe(self, receive_ts=False)
+
+        try:
+            # チューナーを起動する
+            ## 同じチャンネルの別の画質が既に受信中であれば、そのチューナーをそのまま共有する
+            error_detail = await self.ingest.start(channel, program_present)
+            if error_detail is not None:
+                self.setStatus('Offline', error_detail)
+                return
+
+            if self._status == 'Warm':
+                self.setStatus('Warm', 'チューナーを事前に起動しました。')
+
+                # 誰も視聴していないため、チューナーをアンロックして EDCB やほかのチャンネルが再利用できるようにする
+                self.ingest.unlockTuner()
+
+            # Warm 状態の間、チューナーとの接続を監視する
+            while self._status == 'Warm':
+
+                # ステータスの変化を待つ (一定間隔でチューナーとの接続も確認する)
+                status_changed = self.getStatusChangedEvent()
+                try:
+                    await asyncio.wait_for(status_changed.wait(), timeout=self.WARM_TUNER_CHECK_INTERVAL)
+                except TimeoutError:
+                    pass
+
+                # チューナーとの接続が切断された (EDCB がチューナーを録画に使うため奪った場合など)
+                if self._status == 'Warm' and self.ingest.isTunerDisconnected() is True:
+                    self.setStatus('Offline', 'チューナーとの接続が切断されたため、チューナーの事前起動を終了しました。')
+
+        finally:
+            # Offline に移行した (またはサーバーの終了などでタスクがキャンセルされた) 場合は、チューナーインジェストの購読を解除する
+            ## 視聴者の接続により Standby に移行した場合は、購読はエンコードタスクに引き継がれるため解除しない
+            if self._status == 'Offline' or self._status == 'Warm':
+                await self.ingest.unsubscribe(self)
+
+
     def disconnect(self, client: LiveStreamClient) -> None:
         """
         指定されたクライアントのライブストリームへの接続を切断する
@@ -456,11 +614,8 @@ class LiveStream:
 
         # 指定されたライブストリームクライアントを削除する
         ## すでにタイムアウトなどで削除されていたら何もしない
-        try:
-            self._clients.remove(client)
+        if self.__removeClient(client) is True:
             logging.info(f'[Live: {self.live_stream_id}] Client Disconnected. Client ID: {client.client_id}')
-        except ValueError:
-            pass
         del client
 
 
@@ -471,16 +626,87 @@ class LiveStream:
         """
 
         # すべてのクライアントの接続を切断する
-        for client in self._clients:
-            # mpegts クライアントのみ、Queue に None を追加して接続切断を通知する
-            if client.client_type == 'mpegts':
-                client.writeStreamData(None)
+        ## disconnect() でリストから削除されるため、コピーしたリストに対してループする
+        for client in list(self._clients):
+            # readStreamData() で待機中のクライアントに接続切断を通知する
+            client.close()
             self.disconnect(client)
             del client
 
         # 念のためクライアントが入るリストを空にする
         self._clients = []
 
+        # リングバッファに残っている古いストリームデータを破棄する
+        ## エンコードタスクの再起動後に接続したクライアントに、前回のエンコーダーの出力が配信されないようにする
+        self.ring_buffer.clear()
+
+
+    def __addClient(self, client: LiveStreamClient) -> None:
+        """
+        クライアントをライブストリームに登録し、チャンネルの視聴者数を増やしてステータスの購読者に通知する
+
+        Args:
+            client (LiveStreamClient): ライブストリームクライアントのインスタンス
+        """
+
+        self._clients.append(client)
+        LiveStream.__viewer_counts[self.display_channel_id] = LiveStream.__viewer_counts.get(self.display_channel_id, 0) + 1
+        self.__publishViewerCountChange()
+
+
+    def __removeClient(self, client: LiveStreamClient) -> bool:
+        """
+        クライアントをライブストリームから削除し、チャンネルの視聴者数を減らしてステータスの購読者に通知する
+
+        Args:
+            client (LiveStreamClient): ライブストリームクライアントのインスタンス
+
+        Returns:
+            bool: クライアントを削除したかどうか (すでにタイムアウトなどで削除されていた場合は False を返す)
+        """
+
+        try:
+            self._clients.remove(client)
+        except ValueError:
+            return False
+        LiveStream.__viewer_counts[self.display_channel_id] = max(LiveStream.__viewer_counts.get(self.display_channel_id, 0) - 1, 0)
+        self.__publishViewerCountChange()
+        return True
+
+
+    def __publishStatusChange(self) -> None:
+        """
+        ステータスの変化を待機中のすべての購読者に通知する
+        """
+
+        status_changed = self._status_changed
+        self._status_changed = asyncio.Event()
+        status_changed.set()
+
+
+    def __publishViewerCountChange(self) -> None:
+        """
+        視聴者数の変化を、同じチャンネルのすべての画質のライブストリームの購読者に通知する
+        視聴者数はチャンネル単位で集計しているため、他の画質のライブストリームの購読者にも通知する必要がある
+        """
+
+        for quality in QUALITY:
+            live_stream = LiveStream.__instances.get(f'{self.display_channel_id}-{quality}')
+            if live_stream is not None:
+                live_stream.__publishStatusChange()
+
+
+    def getStatusChangedEvent(self) -> asyncio.Event:
+        """
+        ステータス (詳細・チャンネルの視聴者数を含む) が次に変化した際にセットされるイベントを取得する
+        変化の取りこぼしを防ぐため、必ずステータスを取得する前にイベントを取得してから待機すること
+
+        Returns:
+            asyncio.Event: ステータスが次に変化した際にセットされるイベント
+        """
+
+        return self._status_changed
+
 
     def getStatus(self) -> LiveStreamStatus:
         """
@@ -499,12 +725,12 @@ class LiveStream:
         )
 
 
-    def setStatus(self, status: Literal['Offline', 'Standby', 'ONAir', 'Idling', 'Restart'], detail: str, quiet: bool = False) -> bool:
+    def setStatus(self, status: Literal['Offline', 'Standby', 'ONAir', 'Idling', 'Restart', 'Warm'], detail: str, quiet: bool = False) -> bool:
         """
         ライブストリームのステータスを設定する
 
         Args:
-            status (Literal['Offline', 'Standby', 'ONAir', 'Idling', 'Restart']): ライブストリームのステータス
+            status (Literal['Offline', 'Standby', 'ONAir', 'Idling', 'Restart', 'Warm']): ライブストリームのステータス
             detail (str): ステータスの詳細
             quiet (bool): ステータス設定のログを出力するかどうか
 
@@ -527,9 +753,9 @@ class LiveStream:
         if self._status == 'Offline' and status == 'Restart':
             return False
 
-        # ストリーム開始 (Offline or Restart → Standby) 時、started_at と stream_data_written_at を更新する
+        # ストリーム開始 (Offline or Restart or Warm → Standby) 時、started_at と stream_data_written_at を更新する
         # ここで更新しておかないと、いつまで経っても初期化時の古いタイムスタンプが使われてしまう
-        if ((self._status == 'Offline' or self._status == 'Restart') and status == 'Standby'):
+        if ((self._status == 'Offline' or self._status == 'Restart' or self._status == 'Warm') and status == 'Standby'):
             self._started_at = time.time()
             self._stream_data_written_at = time.time()
 
@@ -548,16 +774,20 @@ class LiveStream:
         # 最終更新のタイムスタンプを更新
         self._updated_at = time.time()
 
-        # チューナーインスタンスが存在する場合 (= EDCB バックエンド利用時) のみ
-        if self.tuner is not None:
+        # ステータスの変化を購読者に通知する
+        self.__publishStatusChange()
+
+        # チューナーのロック状態を更新する
+        ## チューナーは同じチャンネルのすべての画質で共有しているため、ロック状態はチューナーインジェスト側で管理する
+        ## チューナーインスタンスを保持していない場合 (Mirakurun バックエンド利用時など) は、チューナーインジェスト側で何もしない
 
-            # Idling への切り替え時、チューナーをアンロックして再利用できるように
-            if self._status == 'Idling':
-                self.tuner.unlock(self.live_stream_id)
+        # Idling への切り替え時、同じチャンネルのすべての画質が Idling であればチューナーをアンロックして再利用できるように
+        if self._status == 'Idling':
+            self.ingest.unlockTuner()
 
-            # ONAir への切り替え（復帰）時、再びチューナーをロックして制御を横取りされないように
-            if self._status == 'ONAir':
-                self.tuner.lock(self.live_stream_id)
+        # ONAir への切り替え（復帰）時、再びチューナーをロックして制御を横取りされないように
+        if self._status == 'ONAir':
+            self.ingest.lockTuner()
 
         return True
 
@@ -575,18 +805,19 @@ class LiveStream:
 
     async def writeStreamData(self, stream_data: bytes) -> None:
         """
-        接続している全ての mpegts クライアントの Queue にストリームデータを書き込む
+        ストリームデータをリングバッファに書き込み、接続している全ての mpegts クライアントに通知する
         同時にストリームデータの最終書き込み時刻を更新し、クライアントがタイムアウトしていたら削除する
 
         Args:
-            stream_data (bytes): 書き込むストリームデータ
+            stream_data (bytes): 書き込むストリームデータ (TS パケット境界に揃えられている必要がある)
         """
 
         # ストリームデータの書き込み時刻
         now = time.time()
 
-        # 接続している全てのクライアントの Queue にストリームデータを書き込む
-        for client in self._clients:
+        # 接続している全てのクライアントのタイムアウトを確認する
+        ## タイムアウトしたクライアントはリストから削除されるため、コピーしたリストに対してループする
+        for client in list(self._clients):
 
             # タイムアウト秒数は 10 秒
             timeout = 10
@@ -594,14 +825,14 @@ class LiveStream:
             # 最終読み取り時刻を指定秒数過ぎたクライアントはタイムアウトと判断し、クライアントを削除する
             ## 主にネットワークが切断されたなどの理由で発生する
             if now - client.stream_data_read_at > timeout:
-                self._clients.remove(client)
+                client.close()
+                self.__removeClient(client)
                 logging.info(f'[Live: {self.live_stream_id}] Client Disconnected (Timeout). Client ID: {client.client_id}')
                 del client
-                continue
 
-            # ストリームデータを書き込む (クライアント種別が mpegts の場合のみ)
-            if client.client_type == 'mpegts':
-                client.writeStreamData(stream_data)
+        # ストリームデータをリングバッファに書き込む
+        ## 書き込みと同時に、readStreamData() で待機中のクライアントが起こされる
+        self.ring_buffer.write(stream_data)
 
         # ストリームデータが空でなければ、最終書き込み時刻を更新
         if stream_data != b'':
@@ -0,0 +1,267 @@
+# Type Hints を指定できるように
+# ref: https://stackoverflow.com/a/33533514/17124142
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import ClassVar
+
+from biim.mpeg2ts import ts
+
+
+@dataclass
+class LiveStreamRingBufferChunk:
+    """
+    リングバッファに格納される、エンコーダーの出力のチャンクを表すデータクラス
+    """
+
+    # チャンクのシーケンス番号 (ライブストリームの開始から単調増加する)
+    sequence: int
+    # チャンクのデータ (TS パケット境界に揃えられている)
+    data: bytes
+    # チャンク内でクライアントが再生を開始できる位置 (バイト)
+    ## キーフレームの直前の PAT を優先し、見つからなければキーフレームの TS パケットの位置を指す
+    ## チャンク内にキーフレームがない場合は None
+    keyframe_offset: int | None
+    # チャンク内の最初の PAT の位置 (バイト)
+    ## チャンク内に PAT がない場合は None
+    pat_offset: int | None
+
+
+class LiveStreamRingBuffer:
+    """
+    ライブストリームのエンコーダーの出力を、全クライアントで共有するリングバッファ
+    書き込みはエンコードタスク (単一のプロデューサー) からのみ行われ、各クライアントは読み取り位置 (カーソル) だけを保持する
+    クライアントごとにデータを複製しないため、視聴者数に関わらずライブストリームあたりのメモリ使用量は一定に保たれる
+    """
+
+    # リングバッファに保持するデータの最大サイズ (バイト)
+    ## 1080p-60fps の最大ビットレート (13Mbps) でおよそ 5 秒分に相当する
+    MAX_BUFFER_SIZE: ClassVar[int] = 8 * 1024 * 1024  # 8MB
+
+
+    def __init__(self) -> None:
+        """
+        リングバッファを初期化する
+        """
+
+        # チャンクが格納される両端キュー
+        self._chunks: deque[LiveStreamRingBufferChunk] = deque()
+
+        # 現在保持しているチャンクの合計サイズ (バイト)
+        self._buffer_size: int = 0
+
+        # 次に書き込まれるチャンクのシーケンス番号
+        self._next_sequence: int = 0
+
+        # 新しいチャンクが書き込まれたことを待機中のクライアントに通知するイベント
+        ## 書き込みごとに set() した上で新しいインスタンスに差し替える
+        self._written_event: asyncio.Event = asyncio.Event()
+
+
+    @property
+    def next_sequence(self) -> int:
+        """ 次に書き込まれるチャンクのシーケンス番号 (読み取り専用) """
+        return self._next_sequence
+
+
+    @staticmethod
+    def findSyncPoints(data: bytes) -> tuple[int | None, int | None]:
+        """
+        TS パケット境界に揃えられたデータから、キーフレームと PAT の位置を探す
+        キーフレームは random_access_indicator が立っていて、かつ映像 PES の先頭を含む TS パケットで判定する
+        (FFmpeg は音声 PES の先頭にも random_access_indicator を立てるため、PES の stream_id も確認している)
+
+        Args:
+            data (bytes): TS パケット境界に揃えられたデータ
+
+        Returns:
+            tuple[int | None, int | None]: (キーフレームの直前の PAT またはキーフレームの位置, 最初の PAT の位置)
+        """
+
+        keyframe_offset: int | None = None
+        first_pat_offset: int | None = None
+        last_pat_offset: int | None = None
+
+        for offset in range(0, len(data) - ts.PACKET_SIZE + 1, ts.PACKET_SIZE):
+
+            # TS パケット境界でない場合はそれ以上探さない
+            if data[offset] != ts.SYNC_BYTE[0]:
+                break
+
+            # PAT (PID 0x00)
+            pid = ((data[offset + 1] & 0x1F) << 8) | data[offset + 2]
+            if pid == 0x00:
+                if first_pat_offset is None:
+                    first_pat_offset = offset
+                last_pat_offset = offset
+                continue
+
+            # payload_unit_start_indicator が立っていない場合は対象外
+            if (data[offset + 1] & 0x40) == 0:
+                continue
+
+            # アダプテーションフィールドがない場合は対象外
+            adaptation_field_control = (data[offset + 3] & 0x30) >> 4
+            if (adaptation_field_control & 0x02) == 0:
+                continue
+            adaptation_field_length = data[offset + 4]
+            if adaptation_field_length == 0:
+                continue
+
+            # random_access_indicator が立っていない場合は対象外
+            if (data[offset + 5] & 0x40) == 0:
+                continue
+
+            # ペイロードが映像 PES (stream_id: 0xE0 ~ 0xEF) の先頭かどうかを確認する
+            payload_offset = offset + 5 + adaptation_field_length
+            if (adaptation_field_control & 0x01) == 0 or payload_offset + 4 > offset + ts.PACKET_SIZE:
+                continue
+            if (data[payload_offset:payload_offset + 3] != b'\x00\x00\x01' or
+                (data[payload_offset + 3] & 0xF0) != 0xE0):
+                continue
+
+            # キーフレームの直前に PAT があれば、PAT の位置から再生を開始できるようにする
+            keyframe_offset = last_pat_offset if last_pat_offset is not None else offset
+            break
+
+        return (keyframe_offset, first_pat_offset)
+
+
+    def write(self, data: bytes) -> None:
+        """
+        リングバッファにチャンクを書き込む
+        保持しているデータの合計サイズが MAX_BUFFER_SIZE を超えた場合は、古いチャンクから順に破棄する
+
+        Args:
+            data (bytes): 書き込むチャンク (TS パケット境界に揃えられている必要がある)
+        """
+
+        if len(data) == 0:
+            return
+
+        keyframe_offset, pat_offset = self.findSyncPoints(data)
+        self._chunks.append(LiveStreamRingBufferChunk(
+            sequence = self._next_sequence,
+            data = data,
+            keyframe_offset = keyframe_offset,
+            pat_offset = pat_offset,
+        ))
+        self._next_sequence += 1
+        self._buffer_size += len(data)
+
+        # 古いチャンクから順に破棄する (最新のチャンクは必ず残す)
+        while self._buffer_size > self.MAX_BUFFER_SIZE and len(self._chunks) > 1:
+            evicted_chunk = self._chunks.popleft()
+            self._buffer_size -= len(evicted_chunk.data)
+
+        # 待機中のクライアントに通知する
+        self.notify()
+
+
+    def notify(self) -> None:
+        """
+        リングバッファを待機中のすべてのクライアントを起こす
+        新しいチャンクの書き込み時のほか、クライアントの切断時にも呼び出される
+        """
+
+        self._written_event.set()
+        self._written_event = asyncio.Event()
+
+
+    def clear(self) -> None:
+        """
+        リングバッファに保持しているすべてのチャンクを破棄する
+        シーケンス番号はリセットしないため、既存のクライアントのカーソルは次に書き込まれるチャンクを指すことになる
+        """
+
+        self._chunks.clear()
+        self._buffer_size = 0
+        self.notify()
+
+
+    def getStartCursor(self) -> tuple[int, int]:
+        """
+        新しく接続したクライアントの読み取り開始位置を取得する
+        リングバッファ内の最新のキーフレームから読み取りを開始することで、クライアントはすぐに映像をデコードできる
+        キーフレームがなければ最新の PAT から、それもなければ次に書き込まれるチャンクから読み取りを開始する
+
+        Returns:
+            tuple[int, int]: (読み取りを開始するチャンクのシーケンス番号, チャンク内の読み取り開始位置)
+        """
+
+        for chunk in reversed(self._chunks):
+            if chunk.keyframe_offset is not None:
+                return (chunk.sequence, chunk.keyframe_offset)
+        for chunk in reversed(self._chunks):
+            if chunk.pat_offset is not None:
+                return (chunk.sequence, chunk.pat_offset)
+        return (self._next_sequence, 0)
+
+
+    def getSkipCursor(self, sequence: int) -> tuple[int, int]:
+        """
+        読み取りが遅れて、読み取り位置のチャンクが既に破棄されたクライアントの新しい読み取り位置を取得する
+        途中から読み取るとデコードが破綻するため、保持しているチャンクのうち最も古いキーフレームまで読み飛ばす
+        キーフレームがなければ最も古い PAT まで、それもなければ保持している最も古いチャンクまで読み飛ばす
+
+        Args:
+            sequence (int): 現在の読み取り位置のチャンクのシーケンス番号
+
+        Returns:
+            tuple[int, int]: (読み取りを開始するチャンクのシーケンス番号, チャンク内の読み取り開始位置)
+        """
+
+        for chunk in self._chunks:
+            if chunk.sequence >= sequence and chunk.keyframe_offset is not None:
+                return (chunk.sequence, chunk.keyframe_offset)
+        for chunk in self._chunks:
+            if chunk.sequence >= sequence and chunk.pat_offset is not None:
+                return (chunk.sequence, chunk.pat_offset)
+        if len(self._chunks) > 0:
+            return (max(sequence, self._chunks[0].sequence), 0)
+        return (self._next_sequence, 0)
+
+
+    def getChunk(self, sequence: int) -> LiveStreamRingBufferChunk | None:
+        """
+        指定されたシーケンス番号のチャンクを取得する
+
+        Args:
+            sequence (int): チャンクのシーケンス番号
+
+        Returns:
+            LiveStreamRingBufferChunk | None: チャンク (既に破棄されているか、まだ書き込まれていない場合は None)
+        """
+
+        if len(self._chunks) == 0:
+            return None
+        index = sequence - self._chunks[0].sequence
+        if index < 0 or index >= len(self._chunks):
+            return None
+        return self._chunks[index]
+
+
+    def isEvicted(self, sequence: int) -> bool:
+        """
+        指定されたシーケンス番号のチャンクが既に破棄されているかを返す
+
+        Args:
+            sequence (int): チャンクのシーケンス番号
+
+        Returns:
+            bool: 既に破棄されていれば True
+        """
+
+        if len(self._chunks) == 0:
+            return sequence < self._next_sequence
+        return sequence < self._chunks[0].sequence
+
+
+    async def wait(self) -> None:
+        """
+        新しいチャンクが書き込まれるか、notify() が呼び出されるまで待機する
+        """
+
+        await self._written_event.wait()
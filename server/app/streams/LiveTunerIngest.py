@@ -0,0 +1,986 @@
+# Type Hints を指定できるように
+# ref: https://stackoverflow.com/a/33533514/17124142
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from collections.abc import AsyncIterator
+from typing import TYPE_CHECKING, ClassVar, Literal, cast
+
+import aiohttp
+import httpx
+from biim.mpeg2ts import ts
+
+from app import logging
+from app.config import Config
+from app.constants import API_REQUEST_HEADERS, LIBRARY_PATH
+from app.models.Channel import Channel
+from app.models.Program import Program
+from app.utils import GetMirakurunAPIEndpointURL
+from app.utils.edcb.EDCBTuner import EDCBTuner
+from app.utils.edcb.PipeStreamReader import PipeStreamReader
+from app.utils.HTTPClientPool import HTTPClientPool
+from app.utils.TSPacketReader import TSPacketReader
+
+
+if TYPE_CHECKING:
+    from app.streams.LiveStream import LiveStream
+
+
+class LiveTunerIngest:
+    """
+    同じチャンネルのすべての画質のライブストリームで、チューナーとの接続と tsreadex のプロセスを共有するクラス
+    tsreadex で前処理した放送波を、購読している画質ごとのエンコードタスクに分配する
+    購読しているライブストリームがすべていなくなった時点で、tsreadex を終了してチューナーを解放する
+    """
+
+    # チャンネル ID をキーとした、チューナーインジェストのインスタンスが入る辞書
+    __instances: ClassVar[dict[str, LiveTunerIngest]] = {}
+
+    # 画質ごとのエンコードタスクに分配する、tsreadex の出力のキューの最大チャンク数
+    ## エンコーダーへの書き込みが詰まっている画質があっても、ほかの画質への分配が止まらないようにする
+    ## キューが溢れた場合はそのチャンクを破棄する (エンコーダーは後段の ER-04 の検出で再起動される)
+    SUBSCRIBER_QUEUE_SIZE: ClassVar[int] = 256
+
+
+    # 必ずチャンネル ID ごとに1つのインスタンスになるように (Singleton)
+    def __new__(cls, display_channel_id: str) -> LiveTunerIngest:
+
+        # まだ同じチャンネル ID のインスタンスがないときだけ、インスタンスを生成する
+        if display_channel_id not in cls.__instances:
+
+            # 新しいチューナーインジェストのインスタンスを生成する
+            instance = super().__new__(cls)
+
+            # チャンネル ID を設定
+            instance.display_channel_id = display_channel_id
+
+            # EDCB バックエンドのチューナーの制御権限を持つ ID
+            ## 画質ごとのライブストリーム ID (チャンネル ID-画質) とは重複しない
+            instance.ingest_id = f'{display_channel_id}-Ingest'
+
+            # 購読しているライブストリームをキーとした、tsreadex の出力を分配するキューの辞書
+            ## キューに None が入れられた場合は分配の終了を表す
+            ## 複数画質の同時エンコード時など、ライブストリーム自身が tsreadex の出力を受け取らない場合は None になる
+            instance._subscribers = {}
+
+            # tsreadex の出力を分配するすべてのキューのリスト
+            instance._queues = []
+
+            # キューが溢れて破棄したチャンクの数が入る、キューをキーとした辞書
+            ## チャンクを破棄しているキューのみ含まれ、キューの溢れが解消するかキューが閉じられた時点で破棄したチャンクの数をログに出力して削除される
+            instance._dropped_chunk_counts = {}
+
+            # EDCB バックエンドのチューナーインスタンス
+            ## Mirakurun バックエンドを使っている場合は None のまま
+            instance.tuner = None
+
+            # 実行中の start() のタスク
+            ## 複数の画質のエンコードタスクが同時に起動した場合でも、チューナーの起動は1回だけ行う
+            instance._start_task = None
+
+            # チューナーインジェストが稼働中かどうか
+            instance._is_running = False
+
+            # チューナーインジェストを停止するか、チューナーを移譲するたびに加算される世代番号
+            ## 起動中に停止された場合に、起動処理を中断するために使う
+            instance._generation = 0
+
+            # tsreadex のプロセス
+            instance._tsreadex = None
+
+            # Mirakurun の aiohttp セッション (EDCB バックエンド利用時は常に None)
+            instance._response = None
+            instance._session = None
+
+            # チューナーからの放送波 TS の最終読み取り時刻 (単調増加時間)
+            ## 単に時刻を比較する用途でしか使わないので、time.monotonic() から取得した単調増加時間が入る
+            ## Unix Time とかではないので注意
+            instance._tuner_ts_read_at = 0.0
+
+            # Reader・Distributor の非同期タスク
+            instance._reader_task = None
+            instance._distributor_task = None
+
+            # 実行中の非同期実行タスクへの参照を保持しておく
+            ## ref: https://docs.astral.sh/ruff/rules/asyncio-dangling-task/
+            instance._background_tasks = set()
+
+            # 生成したインスタンスを登録する
+            cls.__instances[display_channel_id] = instance
+
+        # 登録されているインスタンスを返す
+        return cls.__instances[display_channel_id]
+
+
+    def __init__(self, display_channel_id: str) -> None:
+        """
+        チューナーインジェストのインスタンスを取得する
+
+        Args:
+            display_channel_id (str): チャンネル ID
+        """
+
+        # インスタンス変数の型ヒントを定義
+        # Singleton のためインスタンスの生成は __new__() で行うが、__init__() も定義しておかないと補完がうまく効かない
+        self.display_channel_id: str
+        self.ingest_id: str
+        self._subscribers: dict[LiveStream, asyncio.Queue[bytes | None] | None]
+        self._queues: list[asyncio.Queue[bytes | None]]
+        self._dropped_chunk_counts: dict[asyncio.Queue[bytes | None], int]
+        self.tuner: EDCBTuner | None
+        self._start_task: asyncio.Task[str | None] | None
+        self._is_running: bool
+        self._generation: int
+        self._tsreadex: asyncio.subprocess.Process | None
+        self._response: aiohttp.ClientResponse | None
+        self._session: aiohttp.ClientSession | None
+        self._tuner_ts_read_at: float
+        self._reader_task: asyncio.Task[None] | None
+        self._distributor_task: asyncio.Task[None] | None
+        self._background_tasks: set[asyncio.Task[None]]
+
+
+    @classmethod
+    def getAllIngests(cls) -> list[LiveTunerIngest]:
+        """
+        全てのチューナーインジェストのインスタンスを取得する
+
+        Returns:
+            list[LiveTunerIngest]: チューナーインジェストのインスタンスの入ったリスト
+        """
+
+        return list(cls.__instances.values())
+
+
+    def getSubscribers(self) -> list[LiveStream]:
+        """
+        このチューナーインジェストを購読しているライブストリームを取得する
+
+        Returns:
+            list[LiveStream]: 購読しているライブストリームのリスト
+        """
+
+        return list(self._subscribers.keys())
+
+
+    def isRunning(self) -> bool:
+        """
+        チューナーインジェストが稼働中 (起動中を含む) かどうかを返す
+
+        Returns:
+            bool: 稼働中かどうか
+        """
+
+        return self._is_running is True or self._start_task is not None
+
+
+    def subscribe(self, live_stream: LiveStream, receive_ts: bool = True) -> asyncio.Queue[bytes | None] | None:
+        """
+        ライブストリームをこのチューナーインジェストに購読させ、tsreadex の出力が分配されるキューを返す
+        実際にチューナーを起動するには、購読した後に start() を呼び出す必要がある
+
+        Args:
+            live_stream (LiveStream): 購読するライブストリーム
+            receive_ts (bool): tsreadex の出力を受け取るかどうか (False の場合はチューナーの共有だけを行い、キューは作成しない)
+
+        Returns:
+            asyncio.Queue[bytes | None] | None: tsreadex の出力 (TS パケット境界に揃えられている) が分配されるキュー
+        """
+
+        # 再起動などで既に購読している場合は、古いキューの待機者に終了を通知してから差し替える
+        old_queue = self._subscribers.get(live_stream)
+        if old_queue is not None:
+            self.closeQueue(old_queue)
+
+        queue = self.openQueue() if receive_ts is True else None
+        self._subscribers[live_stream] = queue
+        logging.debug(f'[Live: {self.display_channel_id}] Subscribed: {live_stream.live_stream_id} ({len(self._subscribers)} qualities)')
+        return queue
+
+
+    async def unsubscribe(self, live_stream: LiveStream, keep_tuner: bool = False) -> None:
+        """
+        ライブストリームのこのチューナーインジェストの購読を解除する
+        最後のライブストリームが購読を解除した時点で、tsreadex を終了してチューナーを解放する
+
+        Args:
+            live_stream (LiveStream): 購読を解除するライブストリーム
+            keep_tuner (bool): 最後のライブストリームだった場合に、チューナーを閉じずにアンロックした状態で保持しておくかどうか (エンコードタスクの再起動時)
+        """
+
+        # 購読していなければ何もしない
+        if live_stream not in self._subscribers:
+            return
+        queue = self._subscribers.pop(live_stream)
+
+        # キューで待機中のエンコードタスクに分配の終了を通知する
+        if queue is not None:
+            self.closeQueue(queue)
+        logging.debug(f'[Live: {self.display_channel_id}] Unsubscribed: {live_stream.live_stream_id} ({len(self._subscribers)} qualities)')
+
+        # まだ購読している画質が残っている場合は、チューナーインジェストを継続する
+        if len(self._subscribers) > 0:
+            return
+
+        # 最後の画質の購読が解除されたので、チューナーインジェストを停止する
+        await self.stop(keep_tuner=keep_tuner)
+
+
+    def openQueue(self) -> asyncio.Queue[bytes | None]:
+        """
+        tsreadex の出力が分配されるキューを新たに作成する
+        ライブストリームの購読とは独立しているため、チューナーの起動・停止は購読しているライブストリームに従う
+
+        Returns:
+            asyncio.Queue[bytes | None]: tsreadex の出力 (TS パケット境界に揃えられている) が分配されるキュー
+        """
+
+        queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=self.SUBSCRIBER_QUEUE_SIZE)
+        self._queues.append(queue)
+        return queue
+
+
+    def closeQueue(self, queue: asyncio.Queue[bytes | None]) -> None:
+        """
+        openQueue() で作成したキューへの分配を終了し、キューで待機中のタスクに終了を通知する
+
+        Args:
+            queue (asyncio.Queue[bytes | None]): 分配を終了するキュー
+        """
+
+        if queue in self._queues:
+            self._queues.remove(queue)
+        self.__logDroppedChunks(queue)
+        self.__notifyQueueEnd(queue)
+
+
+    async def start(self, channel: Channel, program_present: Program | None) -> str | None:
+        """
+        チューナーを起動して tsreadex に接続し、購読しているライブストリームへの分配を開始する
+        既に稼働中の場合は何もしない (起動中の場合は起動の完了を待つ)
+
+        Args:
+            channel (Channel): 受信するチャンネルの情報
+            program_present (Program | None): 現在放送中の番組情報
+
+        Returns:
+            str | None: 起動に失敗した場合はライブストリームのステータス詳細に表示するエラーメッセージ、成功した場合は None
+        """
+
+        # 稼働中だが、チューナーとの接続が既に切断されている場合は一旦停止してから起動し直す
+        ## 同じチャンネルの別の画質のエンコードタスクが ER-05 で再起動中の場合などに発生する
+        if self._is_running is True and self.isTunerDisconnected() is True:
+            await self.stop(keep_tuner=True)
+
+        # 既に稼働中
+        if self._is_running is True:
+            return None
+
+        # まだ起動していなければ、チューナーの起動を開始する
+        ## 同時に起動した他の画質のエンコードタスクは、同じ起動タスクの完了を待つ
+        if self._start_task is None:
+            self._start_task = asyncio.create_task(self.__runStartTask(channel, program_present))
+
+        # チャンネル切り替えで呼び出し元のエンコードタスクがキャンセルされても、起動処理自体は中断しない
+        return await asyncio.shield(self._start_task)
+
+
+    async def __runStartTask(self, channel: Channel, program_present: Program | None) -> str | None:
+        """
+        start() から起動タスクとして実行され、チューナーの起動が完了したら起動タスクへの参照を破棄する
+
+        Args:
+            channel (Channel): 受信するチャンネルの情報
+            program_present (Program | None): 現在放送中の番組情報
+
+        Returns:
+            str | None: 起動に失敗した場合はライブストリームのステータス詳細に表示するエラーメッセージ、成功した場合は None
+        """
+
+        try:
+            error_detail = await self.__start(channel, program_present)
+        finally:
+            self._start_task = None
+
+        # 起動中にすべての画質の購読が解除された場合は、誰も使わないチューナーを起動したままにしないよう停止する
+        if error_detail is None and len(self._subscribers) == 0:
+            await self.stop()
+
+        return error_detail
+
+
+    async def __start(self, channel: Channel, program_present: Program | None) -> str | None:
+        """
+        チューナーを起動して tsreadex に接続し、購読しているライブストリームへの分配を開始する (start() から1回だけ呼び出される)
+
+        Args:
+            channel (Channel): 受信するチャンネルの情報
+            program_present (Program | None): 現在放送中の番組情報
+
+        Returns:
+            str | None: 起動に失敗した場合はライブストリームのステータス詳細に表示するエラーメッセージ、成功した場合は None
+        """
+
+        CONFIG = Config()
+
+        # 起動開始時点の世代番号
+        ## 起動処理の途中で stop() や handoff() が実行された場合は世代番号が変わるため、await のたびに確認して起動を中断する
+        generation = self._generation
+
+        # バックエンドの種類を取得
+        ## always_receive_tv_from_mirakurun が True なら、バックエンドに関わらず常に Mirakurun / mirakc から受信する
+        BACKEND_TYPE: Literal['EDCB', 'Mirakurun'] = 'Mirakurun' if CONFIG.general.always_receive_tv_from_mirakurun is True else CONFIG.general.backend
+
+        # エンコーダーの種類を取得
+        ENCODER_TYPE = CONFIG.general.encoder
+
+        # ***** tsreadex プロセスの作成と実行 *****
+
+        # tsreadex のオプション
+        ## 放送波の前処理を行い、エンコードを安定させるツール
+        ## オプション内容は https://github.com/xtne6f/tsreadex を参照
+        tsreadex_options = [
+            # 取り除く TS パケットの10進数の PID
+            ## EIT の PID を指定
+            '-x', '18/38/39',
+            # 特定サービスのみを選択して出力するフィルタを有効にする
+            ## 有効にすると、特定のストリームのみ PID を固定して出力される
+            ## 視聴対象のチャンネルのサービス ID を指定する
+            '-n', f'{channel.service_id}' if CONFIG.tv.debug_mode_ts_path is None else '-1',
+            # 主音声ストリームが常に存在する状態にする
+            ## ストリームが存在しない場合、無音の AAC ストリームが出力される
+            ## 音声がモノラルであればステレオにする
+            ## デュアルモノを2つのモノラル音声に分離し、右チャンネルを副音声として扱う
+            '-a', '13',
+            # 副音声ストリームが常に存在する状態にする
+            ## ストリームが存在しない場合、無音の AAC ストリームが出力される
+            ## 音声がモノラルであればステレオにする
+            '-b', '5',
+            # 字幕ストリームが常に存在する状態にする
+            ## ストリームが存在しない場合、PMT の項目が補われて出力される
+            ## 実際の字幕データが現れない場合に5秒ごとに非表示の適当なデータを挿入する
+            '-c', '5',
+            # 文字スーパーストリームが常に存在する状態にする
+            ## ストリームが存在しない場合、PMT の項目が補われて出力される
+            '-u', '1',
+            # 字幕と文字スーパーを aribb24.js が解釈できる ID3 timed-metadata に変換する
+            ## +4: FFmpeg のバグを打ち消すため、変換後のストリームに規格外の5バイトのデータを追加する
+            ## +8: FFmpeg のエラーを防ぐため、変換後のストリームの PTS が単調増加となるように調整する
+            ## +4 は FFmpeg 6.1 以降不要になった (付与していると字幕が表示されなくなる) ため、
+            ## FFmpeg 4.4 系に依存している Linux 版 HWEncC 利用時のみ付与する
+            ## tsreadex はすべての画質で共有されるため、ラジオチャンネルでも設定上のエンコーダーの種類で判定する
+            '-d', '13' if ENCODER_TYPE != 'FFmpeg' and sys.platform == 'linux' else '9',
+        ]
+
+        if CONFIG.tv.debug_mode_ts_path is None:
+            # 通常は標準入力を指定
+            tsreadex_options.append('-')
+        else:
+            # デバッグモード: 指定された TS ファイルを読み込む
+            ## 読み込み速度を 2350KB/s (18.8Mbps) に制限
+            ## 1倍速に近い値だが、TS のビットレートはチャンネルや番組、シーンによって変動するため完全な1倍速にはならない
+            tsreadex_options += [
+                '-l', '2350',
+                CONFIG.tv.debug_mode_ts_path
+            ]
+
+        # tsreadex のプロセスを非同期で作成・実行
+        ## 出力は Distributor で読み取り、購読しているすべての画質のエンコーダーに分配する
+        tsreadex = await asyncio.subprocess.create_subprocess_exec(
+            *[LIBRARY_PATH['tsreadex'], *tsreadex_options],
+            stdin = asyncio.subprocess.PIPE,  # 受信した放送波を書き込む
+            stdout = asyncio.subprocess.PIPE,  # 各画質のエンコーダーに分配する
+            stderr = asyncio.subprocess.DEVNULL,  # 利用しない
+        )
+        self._tsreadex = tsreadex
+
+        async def AbortStart(
+            tuner: EDCBTuner | None = None,
+            session: aiohttp.ClientSession | None = None,
+            response: aiohttp.ClientResponse | None = None,
+        ) -> str:
+            """ 起動中にチューナーインジェストが停止・チューナーが移譲された場合に、起動途中のリソースを後始末する """
+
+            # tsreadex を終了する
+            ## stop() の時点でまだ tsreadex が起動していなかった場合に備え、ここでも終了しておく
+            try:
+                tsreadex.kill()
+            except Exception:
+                pass
+            if self._tsreadex is tsreadex:
+                self._tsreadex = None
+
+            # Mirakurun バックエンド: stop() の後に開始した Service Stream API とのストリーミング接続を閉じる
+            if response is not None:
+                response.close()
+            if session is not None and session.closed is False:
+                await session.close()
+                if self._session is session:
+                    self._session = None
+
+            # EDCB バックエンド: stop() の後に接続・起動したチューナーを後始末する
+            ## 制御権限を確認してから操作されるため、既に別のチューナーインジェストに移譲されている場合は何もしない
+            if tuner is not None:
+                await tuner.disconnect(self.ingest_id)
+                if self.tuner is tuner:
+                    # チューナーインスタンスを保持したまま停止された場合は、stop(keep_tuner=True) と同様にアンロックしておく
+                    tuner.unlock(self.ingest_id)
+                else:
+                    await tuner.close(self.ingest_id)
+
+            logging.debug(f'[Live: {self.display_channel_id}] Tuner ingest was stopped while starting.')
+            return 'チューナーの起動中にライブストリームが停止されました。'
+
+        # tsreadex の起動中に停止された
+        if self._generation != generation:
+            return await AbortStart()
+
+        # ***** チューナーの起動と接続 *****
+
+        # 放送波の MPEG2-TS を受信する StreamReader
+        stream_reader: asyncio.StreamReader | PipeStreamReader | aiohttp.StreamReader | None = None
+
+        # Mirakurun バックエンド
+        if BACKEND_TYPE == 'Mirakurun':
+
+            # チューナーを確保できるまで待機する
+            ## 確保できなかった場合でも共聴で受信できる可能性があるので、戻り値は無視する
+            self.__setSubscribersStatus('Standby', 'チューナーを確保しています…')
+            await self.acquireMirakurunTuner(channel.type)
+            if self._generation != generation:
+                return await AbortStart()
+
+            # Mirakurun 形式のサービス ID
+            # NID と SID を 5 桁でゼロ埋めした上で int に変換する
+            mirakurun_service_id = int(str(channel.network_id).zfill(5) + str(channel.service_id).zfill(5))
+
+            # Mirakurun の Service Stream API へ HTTP リクエストを開始
+            self.__setSubscribersStatus('Standby', 'チューナーを起動しています…')
+            session = aiohttp.ClientSession()
+            self._session = session
+            try:
+                response = await session.get(
+                    url = GetMirakurunAPIEndpointURL(f'/api/services/{mirakurun_service_id}/stream'),
+                    headers = {**API_REQUEST_HEADERS, 'X-Mirakurun-Priority': '0'},
+                    timeout = aiohttp.ClientTimeout(connect=15, sock_connect=15, sock_read=15)
+                )
+            except (TimeoutError, aiohttp.ClientConnectorError):
+
+                # 接続中に停止された
+                if self._generation != generation:
+                    return await AbortStart(session=session)
+
+                # tsreadex を終了し、HTTP セッションを閉じる
+                await self.__cleanup()
+
+                # 番組名に「放送休止」などが入っていれば停波によるものとみなし、そうでないならチューナーへの接続に失敗したものとする
+                if program_present is None or program_present.isOffTheAirProgram():
+                    return 'この時間は放送を休止しています。(E-01M)'
+                else:
+                    return 'チューナーへの接続に失敗しました。チューナー側に何らかの問題があるかもしれません。(E-01M)'
+
+            # 接続中に停止された
+            if self._generation != generation:
+                return await AbortStart(session=session, response=response)
+
+            # 放送波の MPEG2-TS の受信元の StreamReader として設定
+            self._response = response
+            stream_reader = response.content
+
+        # EDCB バックエンド
+        elif BACKEND_TYPE == 'EDCB':
+
+            # チューナーインスタンスを取得する
+            ## エンコードタスクの再起動時やチューナーの移譲を受けた場合は、保持しているチューナーインスタンスをそのまま使う
+            ## Idling への切り替え、ONAir への復帰時に LiveStream 側でチューナーのアンロック/ロックが行われる
+            ## 起動中に stop() や handoff() で self.tuner が差し替えられても操作対象がずれないよう、ローカル変数で保持する
+            if self.tuner is None:
+                self.tuner = EDCBTuner.getOrCreate(self.ingest_id)
+            tuner = self.tuner
+
+            # チューナーを起動する
+            logging.debug(f'[Live: {self.display_channel_id}] EDCB NetworkTV ID: {tuner.getEDCBNetworkTVID()}')
+            self.__setSubscribersStatus('Standby', 'チューナーを起動しています…')
+            is_tuner_opened = await tuner.setChannel(
+                channel.network_id,
+                channel.service_id,
+                cast(int, channel.transport_stream_id),
+                self.ingest_id,
+            )
+
+            # チューナーの起動中に停止された、またはチューナーが移譲された
+            if self._generation != generation or self.tuner is not tuner:
+                return await AbortStart(tuner=tuner)
+
+            # チューナーの起動に失敗した
+            # ほとんどがチューナー不足によるものなので、ステータス詳細でもそのように表示する
+            # 成功時は tuner.close() するか予約などに割り込まれるまで起動しつづけるので注意
+            if is_tuner_opened is False:
+
+                # tsreadex を終了し、チューナーを閉じる
+                await self.__cleanup()
+                if await tuner.close(self.ingest_id) is True and self.tuner is tuner:
+                    self.tuner = None
+                return 'チューナーの起動に失敗しました。空きチューナーが不足していると考えられます。(E-02E)'
+
+            # チューナーをロックする
+            # ロックしないと途中でチューナーの制御を横取りされてしまう
+            tuner.lock(self.ingest_id)
+
+            # チューナーに接続する
+            # 放送波が送信される TCP ソケットまたは名前付きパイプを取得する
+            self.__setSubscribersStatus('Standby', 'チューナーに接続しています…')
+            reader = await tuner.connect(self.ingest_id)
+
+            # チューナーへの接続中に停止された、またはチューナーが移譲された
+            if self._generation != generation or self.tuner is not tuner:
+                return await AbortStart(tuner=tuner)
+
+            # チューナーへの接続に失敗した
+            if reader is None:
+
+                # tsreadex を終了し、チューナーを閉じる
+                await self.__cleanup()
+                if await tuner.close(self.ingest_id) is True and self.tuner is tuner:
+                    self.tuner = None
+                return 'チューナーへの接続に失敗しました。チューナー側に何らかの問題があるかもしれません。(E-03E)'
+
+            # 放送波の MPEG2-TS の受信元の StreamReader として設定
+            stream_reader = reader
+
+        # ***** チューナーからの出力の読み込み → tsreadex への書き込み / tsreadex からの出力の読み込み → 各画質への分配 *****
+
+        assert stream_reader is not None
+        self._tuner_ts_read_at = time.monotonic()
+        self._is_running = True
+        self._reader_task = asyncio.create_task(self.__reader(tsreadex, stream_reader))
+        self._distributor_task = asyncio.create_task(self.__distributor(tsreadex))
+        return None
+
+
+    async def __reader(self, tsreadex: asyncio.subprocess.Process, stream_reader: asyncio.StreamReader | PipeStreamReader | aiohttp.StreamReader) -> None:
+        """
+        チューナーから受信した放送波を tsreadex の入力と、購読しているライブストリームの PSI/SI データアーカイバーに書き込む
+
+        Args:
+            tsreadex (asyncio.subprocess.Process): tsreadex のプロセス
+            stream_reader (asyncio.StreamReader | PipeStreamReader | aiohttp.StreamReader): 放送波の MPEG2-TS を受信する StreamReader
+        """
+
+        # 受信した放送波が入るイテレータを作成
+        # R/W バッファ: 188B (TS Packet Size) * 256 = 48128B
+        async def GetIterator(
+                stream_reader: asyncio.StreamReader | PipeStreamReader | aiohttp.StreamReader,
+                chunk_size: int = ts.PACKET_SIZE * 256,
+            ) -> AsyncIterator[bytes]:
+            while True:
+                try:
+                    yield await stream_reader.readexactly(chunk_size)
+                except asyncio.IncompleteReadError as ex:
+                    # もし残りのバイトがあれば、 break 前にそれらを yield する
+                    if ex.partial:
+                        yield ex.partial
+                    break
+
+        stream_iterator = GetIterator(stream_reader)
+        tsreadex_stdin = cast(asyncio.StreamWriter, tsreadex.stdin)
+
+        # EDCB / Mirakurun から受信した放送波を随時 tsreadex の入力に書き込む
+        try:
+            async for chunk in stream_iterator:
+
+                # チューナーからの放送波 TS の最終読み取り時刻を更新
+                self._tuner_ts_read_at = time.monotonic()
+
+                # tsreadex の標準入力が閉じられていたら、タスクを終了
+                if tsreadex_stdin.is_closing():
+                    break
+
+                try:
+                    # ストリームデータを tsreadex の標準入力に書き込む
+                    tsreadex_stdin.write(chunk)
+                    await tsreadex_stdin.drain()
+
+                    # 生の放送波の TS パケットを、購読しているすべての画質の PSI/SI データアーカイバーに送信する
+                    ## 放送波の tsreadex への書き込みを最優先で行うため、非同期タスクとして実行する
+                    ## ここで tsreadex への書き込みがブロックされると放送波の受信ループが止まり、ライブストリームの異常終了に繋がりかねない
+                    for live_stream in self._subscribers:
+                        if live_stream.psi_data_archiver is not None:
+                            task = asyncio.create_task(live_stream.psi_data_archiver.pushTSPacketData(chunk))
+                            self._background_tasks.add(task)
+                            task.add_done_callback(self._background_tasks.discard)
+
+                # 並列タスク処理中に何らかの例外が発生した
+                # BrokenPipeError・asyncio.TimeoutError などが想定されるが、何が発生するかわからないためすべての例外をキャッチする
+                except Exception:
+                    break
+
+                # チューナーインジェストが停止しているか既に tsreadex が終了していたら、タスクを終了
+                if self._is_running is False or tsreadex.returncode is not None:
+                    break
+
+        except OSError:
+            pass
+
+        # タスクを終える前に、tsreadex の標準入力を閉じる
+        try:
+            tsreadex_stdin.close()
+        except OSError:
+            pass
+
+
+    async def __distributor(self, tsreadex: asyncio.subprocess.Process) -> None:
+        """
+        tsreadex の出力を TS パケット境界に揃えて読み取り、購読しているすべての画質のキューに分配する
+
+        Args:
+            tsreadex (asyncio.subprocess.Process): tsreadex のプロセス
+        """
+
+        # tsreadex からの出力を TS パケット境界に揃えた大きなブロック単位で読み取る
+        ts_packet_reader = TSPacketReader(cast(asyncio.StreamReader, tsreadex.stdout))
+
+        while True:
+
+            # tsreadex からの出力を読み取る
+            packets = await ts_packet_reader.read()
+
+            # 空のデータが返ってきたら、tsreadex が終了したと判断してタスクを終了
+            if len(packets) == 0:
+                break
+
+            # すべてのキューに、同じチャンクを分配する
+            ## bytes はイミュータブルなので、コピーせずに同じオブジェクトを共有できる
+            for queue in list(self._queues):
+                try:
+                    queue.put_nowait(packets)
+                except asyncio.QueueFull:
+                    # キューが溢れ始めた時点で警告し、溢れが解消するまで破棄したチャンクの数を数える
+                    dropped_chunk_count = self._dropped_chunk_counts.get(queue, 0)
+                    if dropped_chunk_count == 0:
+                        logging.warning(f'[Live: {self.display_channel_id}] Encoder input queue is full. Dropping tuner TS chunks.')
+                    self._dropped_chunk_counts[queue] = dropped_chunk_count + 1
+                    continue
+
+                # キューの溢れが解消したので、破棄したチャンクの数をログに出力する
+                if queue in self._dropped_chunk_counts:
+                    self.__logDroppedChunks(queue)
+
+            # チューナーインジェストが停止していたら、タスクを終了
+            if self._is_running is False:
+                break
+
+        # すべてのキューに、分配の終了を通知する
+        for queue in list(self._queues):
+            self.__logDroppedChunks(queue)
+            self.__notifyQueueEnd(queue)
+
+
+    async def stop(self, keep_tuner: bool = False) -> None:
+        """
+        tsreadex を終了してチューナーとのストリーミング接続を閉じ、チューナーインジェストを停止する
+
+        Args:
+            keep_tuner (bool): チューナーを閉じずにアンロックした状態で保持しておくかどうか (エンコードタスクの再起動時)
+        """
+
+        # 稼働中フラグをオフにし、Reader・Distributor の非同期タスクを終了させる
+        ## 世代番号を進め、起動中の場合は起動処理を中断させる
+        self._is_running = False
+        self._generation += 1
+
+        # tsreadex を終了し、チューナーとのストリーミング接続を閉じる
+        await self.__cleanup()
+
+        # EDCB バックエンドのみ
+        if self.tuner is not None:
+
+            # エンコードタスクの再起動時はチューナーをアンロックして保持する
+            ## エンコーダーの再起動が必要なだけでチューナー自体はそのまま使えるし、わざわざ閉じてからもう一度開くのは無駄
+            if keep_tuner is True:
+                self.tuner.unlock(self.ingest_id)
+                return
+
+            # 再利用中ならチューナーを閉じない
+            ## LiveStream 側の handoff と競合しないようにする
+            if self.tuner.getState() == 'Cancelling':
+                return
+
+            # チューナーを終了する（まだ制御をこのチューナーインジェストが保持している場合のみ）
+            ## tuner.close() した時点でそのチューナーインスタンスは意味をなさなくなるので、プロパティからも削除する
+            if await self.tuner.close(self.ingest_id) is True:
+                self.tuner = None
+
+
+    async def __cleanup(self) -> None:
+        """
+        tsreadex を終了し、チューナーとのストリーミング接続を閉じる (チューナー自体は閉じない)
+        """
+
+        # 明示的に tsreadex を終了する
+        ## 何らかの理由で既に終了している場合は何もしない
+        if self._tsreadex is not None:
+            try:
+                self._tsreadex.kill()
+            except Exception:
+                pass
+            self._tsreadex = None
+
+        # EDCB バックエンド: チューナーとのストリーミング接続を閉じる
+        ## チャンネル切り替え時に再利用するため、ここではチューナー自体は閉じない
+        if self.tuner is not None:
+            await self.tuner.disconnect(self.ingest_id)
+
+        # Mirakurun バックエンド: Service Stream API とのストリーミング接続を閉じる
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+
+        # Reader・Distributor の終了を待つ
+        ## ストリーミング接続を閉じたことで、通常はすぐに終了する
+        for task in (self._reader_task, self._distributor_task):
+            if task is not None and task.done() is False:
+                task.cancel()
+        self._reader_task = None
+        self._distributor_task = None
+
+
+    def handoff(self, next_ingest: LiveTunerIngest) -> bool:
+        """
+        チューナーの制御権限とインスタンスを、別のチャンネルのチューナーインジェストに移譲する (EDCB バックエンドのみ)
+        ストリーミング接続のクリーンアップは呼び出し元で行う
+
+        Args:
+            next_ingest (LiveTunerIngest): 移譲先のチューナーインジェスト
+
+        Returns:
+            bool: 移譲に成功したかどうか
+        """
+
+        if self.tuner is None:
+            return False
+
+        # チューナーの制御権限を移譲する
+        if self.tuner.handoff(self.ingest_id, next_ingest.ingest_id) is False:
+            return False
+
+        # チューナーインスタンスを移譲する
+        ## 世代番号を進め、起動中の場合は起動処理を中断させる
+        next_ingest.tuner = self.tuner
+        self.tuner = None
+        self._generation += 1
+        return True
+
+
+    def lockTuner(self) -> None:
+        """
+        チューナーをロックして、制御を横取りされないようにする (EDCB バックエンドのみ)
+        購読しているいずれかの画質が ONAir に復帰した際に呼び出される
+        """
+
+        if self.tuner is not None:
+            self.tuner.lock(self.ingest_id)
+
+
+    def unlockTuner(self) -> None:
+        """
+        購読しているすべての画質が Idling であれば、チューナーをアンロックして再利用できるようにする (EDCB バックエンドのみ)
+        いずれかの画質が Idling に移行した際に呼び出される
+        """
+
+        if self.tuner is None:
+            return
+
+        # まだ視聴中の画質が残っている場合はアンロックしない
+        for live_stream in self._subscribers:
+            if live_stream.getStatus().status in ('Standby', 'ONAir'):
+                return
+
+        self.tuner.unlock(self.ingest_id)
+
+
+    def getTunerTSReadAt(self) -> float:
+        """
+        チューナーからの放送波 TS の最終読み取り時刻 (単調増加時間) を取得する
+
+        Returns:
+            float: チューナーからの放送波 TS の最終読み取り時刻 (time.monotonic() の値)
+        """
+
+        return self._tuner_ts_read_at
+
+
+    def getTunerErrorDetail(self) -> str | None:
+        """
+        Mirakurun の Service Stream API からエラーが返されている場合、ライブストリームのステータス詳細に表示するエラーメッセージを取得する
+
+        Returns:
+            str | None: エラーメッセージ (エラーが返されていない場合や EDCB バックエンド利用時は None)
+        """
+
+        response = self._response
+        if response is None or response.status == 200:
+            return None
+
+        # レスポンスヘッダーの server が mirakc であれば mirakc と判定できる
+        if ('server' in response.headers) and ('mirakc' in response.headers['server']):
+            mirakurun_or_mirakc = 'mirakc'
+        else:
+            mirakurun_or_mirakc = 'Mirakurun'
+
+        ## mirakc はなぜかチューナー不足時に 503 ではなく 404 を返すことがある (バグ?)
+        if response.status == 503 or (response.status == 404 and mirakurun_or_mirakc == 'mirakc'):
+            return 'チューナーの起動に失敗しました。空きチューナーが不足している可能性があります。(E-12M)'
+        elif response.status == 404:
+            return f'現在このチャンネルは受信できません。{mirakurun_or_mirakc} 側に問題があるかもしれません。(HTTP Error {response.status}) (E-12M)'
+        else:
+            return f'チューナーで不明なエラーが発生しました。{mirakurun_or_mirakc} 側に問題があるかもしれません。(HTTP Error {response.status}) (E-12M)'
+
+
+    def isTunerDisconnected(self) -> bool:
+        """
+        チューナーとのストリーミング接続が切断されたかどうかを返す
+        tsreadex が終了して Reader が停止した場合も切断されたものとみなす
+
+        Returns:
+            bool: チューナーとのストリーミング接続が切断されたかどうか
+        """
+
+        # まだ稼働していない
+        if self._is_running is False:
+            return False
+
+        # Reader が終了している
+        if self._reader_task is None or self._reader_task.done() is True:
+            return True
+
+        # Mirakurun バックエンド
+        ## ref: https://stackoverflow.com/a/45251241/17124142
+        if self._response is not None:
+            return self._response.closed is True
+
+        # EDCB バックエンド
+        if self.tuner is not None:
+            return self.tuner.isDisconnected() is True
+
+        return False
+
+
+    async def acquireMirakurunTuner(self, channel_type: Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K']) -> bool:
+        """
+        Mirakurun / mirakc で空きチューナーを確保できるまで待機する
+        mirakc は空きチューナーがない場合に 404 を返すので (バグ？) 、それを避けるために予め空きチューナーがあるかどうかを確認する
+        0.5 秒間待機しても空きチューナーがなければ False を返す (共聴できる場合もあるので、受信できないとは限らない)
+
+        Args:
+            channel_type (Literal['GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K']): チャンネルタイプ
+
+        Returns:
+            bool: チューナーを確保できたかどうか
+        """
+
+        CONFIG = Config()
+        BACKEND_TYPE: Literal['EDCB', 'Mirakurun'] = 'Mirakurun' if CONFIG.general.always_receive_tv_from_mirakurun is True else CONFIG.general.backend
+        assert BACKEND_TYPE == 'Mirakurun', 'This method is only for Mirakurun backend.'
+
+        # Mirakurun / mirakc は通常チャンネルタイプが GR, BS, CS, SKY しかないので、
+        # フォールバックとして BS4K を BS に、CATV を CS に変換する
+        fallback_channel_type = channel_type
+        if channel_type == 'BS4K':
+            fallback_channel_type = 'BS'
+        elif channel_type == 'CATV':
+            fallback_channel_type = 'CS'
+
+        mirakurun_or_mirakc = 'Mirakurun'
+        client = HTTPClientPool.get('Mirakurun')
+
+        # 0.1 秒間隔で最大 0.5 秒間チューナーの空きを確認する
+        ## 空きチューナーがなくても利用状況によっては共聴できるので、あまり待ちすぎると無駄な時間がかかる
+        ## Mirakurun / mirakc はチャンネル切り替え時に 1 秒弱使い終わった前チャンネルのチューナープロセスが残るので、シングルチューナー環境では
+        ## それを解放し終わってからチューナーを起動できるようにする (実際はだいたい 0.25 秒程度で空きチューナーを確保できる)
+        ## 複数チューナーがある場合は他の空きチューナーを使って起動できるため、待ち時間はほとんどかからない
+        start_time = time.time()
+        for _ in range(int(0.5 / 0.1)):
+
+            # Mirakurun / mirakc からチューナーの状態を取得
+            try:
+                response = await client.get(GetMirakurunAPIEndpointURL('/api/tuners'), timeout=5)
+                # レスポンスヘッダーの server が mirakc であれば mirakc と判定できる
+                if ('server' in response.headers) and ('mirakc' in response.headers['server']):
+                    mirakurun_or_mirakc = 'mirakc'
+                tuners = response.json()
+            except httpx.NetworkError:
+                logging.error('Failed to get tuner statuses from Mirakurun / mirakc. (Network Error)')
+                return False
+            except httpx.TimeoutException:
+                logging.error('Failed to get tuner statuses from Mirakurun / mirakc. (Connection Timeout)')
+                return False
+
+            # 指定されたチャンネルタイプが受信可能なチューナーが1つでも利用可能であれば True を返す
+            for tuner in tuners:
+                if tuner['isAvailable'] is True and tuner['isFree'] is True and channel_type in tuner['types']:
+                    logging.info(f'Acquired a tuner from {mirakurun_or_mirakc}.')
+                    logging.info(f'Tuner: {tuner["name"]} / Type: {channel_type}) / Acquired in {round(time.time() - start_time, 2)} seconds')
+                    return True
+                if tuner['isAvailable'] is True and tuner['isFree'] is True and fallback_channel_type in tuner['types']:
+                    logging.info(f'Acquired a tuner from {mirakurun_or_mirakc}. ({channel_type} -> {fallback_channel_type})')
+                    logging.info(f'Tuner: {tuner["name"]} / Type: {fallback_channel_type}) / Acquired in {round(time.time() - start_time, 2)} seconds')
+                    return True
+
+            await asyncio.sleep(0.1)
+
+        # 空きチューナーは確保できなかったが、同じチャンネルが受信中であれば共聴することは可能なので warning に留める
+        logging.warning(f'Failed to acquire a tuner from {mirakurun_or_mirakc}.')
+        logging.warning('If the same channel is being received, it can be shared with the same tuner.')
+        return False
+
+
+    def __setSubscribersStatus(self, status: Literal['Standby'], detail: str) -> None:
+        """
+        購読しているすべての画質のライブストリームのステータスを設定する (チューナーの起動中の進捗表示用)
+
+        Args:
+            status (Literal['Standby']): ライブストリームのステータス
+            detail (str): ステータスの詳細
+        """
+
+        for live_stream in list(self._subscribers):
+            if live_stream.getStatus().status == 'Standby':
+                live_stream.setStatus(status, detail)
+
+
+    def __logDroppedChunks(self, queue: asyncio.Queue[bytes | None]) -> None:
+        """
+        キューが溢れて破棄したチャンクの数をログに出力し、数え直せるようにリセットする
+        放送波の TS が欠落するとエンコーダーの異常と見分けがつきにくいため、どれだけ破棄したかを必ず記録しておく
+
+        Args:
+            queue (asyncio.Queue[bytes | None]): 破棄したチャンクの数をログに出力するキュー
+        """
+
+        dropped_chunk_count = self._dropped_chunk_counts.pop(queue, 0)
+        if dropped_chunk_count > 0:
+            logging.warning(f'[Live: {self.display_channel_id}] Dropped {dropped_chunk_count} tuner TS chunks while the encoder input queue was full.')
+
+
+    @staticmethod
+    def __notifyQueueEnd(queue: asyncio.Queue[bytes | None]) -> None:
+        """
+        キューで待機中のエンコードタスクに分配の終了を通知する
+        キューが溢れている場合は、古いチャンクを破棄してでも終了の通知を優先する
+
+        Args:
+            queue (asyncio.Queue[bytes | None]): 分配の終了を通知するキュー
+        """
+
+        while True:
+            try:
+                queue.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                queue.get_nowait()
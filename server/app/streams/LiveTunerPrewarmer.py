@@ -0,0 +1,97 @@
+# Type Hints を指定できるように
+# ref: https://stackoverflow.com/a/33533514/17124142
+from __future__ import annotations
+
+import time
+from datetime import datetime
+from typing import ClassVar
+
+from app import logging
+from app.config import Config
+from app.constants import JST, QUALITY_TYPES
+from app.streams.LiveStream import LiveStream
+
+
+class LiveTunerPrewarmer:
+    """
+    事前起動ポリシーに従い、よく視聴されるチャンネルなどのチューナーを Warm 状態で事前に起動しておくクラス
+    Warm 状態のチャンネルは視聴開始時にエンコーダーの起動だけで済むため、ライブストリームの起動にかかる時間を短縮できる
+    """
+
+    # Warm 状態にするライブストリームの画質
+    ## チューナーと tsreadex は同じチャンネルのすべての画質で共有されるため、どの画質で視聴を開始しても事前起動の恩恵を受けられる
+    WARM_QUALITY: ClassVar[QUALITY_TYPES] = '1080p'
+
+    # チャンネル ID をキーとした、サーバーの起動以降の累計視聴時間 (視聴者数 × 秒)
+    __watched_seconds: ClassVar[dict[str, float]] = {}
+
+    # 累計視聴時間の最終集計時刻 (単調増加時間)
+    __counted_at: ClassVar[float] = 0
+
+
+    @classmethod
+    async def update(cls) -> None:
+        """
+        チャンネルごとの累計視聴時間を集計し、事前起動ポリシーに従って各チャンネルのライブストリームを Warm 状態に切り替える
+        事前起動の対象から外れたチャンネルの Warm 状態のライブストリームは Offline にしてチューナーを解放する
+        """
+
+        # Warm 状態にする画質のライブストリームを、チャンネル ID ごとに取得する
+        live_streams = {
+            live_stream.display_channel_id: live_stream
+            for live_stream in LiveStream.getAllLiveStreams() if live_stream.quality == cls.WARM_QUALITY
+        }
+
+        # 前回の集計からの経過時間分、各チャンネルの累計視聴時間を加算する
+        now = time.monotonic()
+        if cls.__counted_at != 0:
+            elapsed = now - cls.__counted_at
+            for display_channel_id in live_streams:
+                viewer_count = LiveStream.getViewerCount(display_channel_id)
+                if viewer_count > 0:
+                    cls.__watched_seconds[display_channel_id] = cls.__watched_seconds.get(display_channel_id, 0) + viewer_count * elapsed
+        cls.__counted_at = now
+
+        # 事前起動の対象のチャンネルを取得する
+        warm_channel_ids = cls.getWarmChannelIDs()
+
+        # 事前起動の対象から外れたチャンネルの Warm 状態のライブストリームを Offline にし、チューナーを解放する
+        for live_stream in LiveStream.getAllLiveStreams():
+            if live_stream.getStatus().status == 'Warm' and live_stream.display_channel_id not in warm_channel_ids:
+                live_stream.setStatus('Offline', 'チューナーの事前起動の対象から外れたため、チューナーを解放しました。')
+
+        # 事前起動の対象のチャンネルのライブストリームを Warm 状態にする
+        ## 既に視聴中・Warm 状態のライブストリームや、存在しないチャンネルは何もしない
+        for display_channel_id in warm_channel_ids:
+            live_stream = live_streams.get(display_channel_id)
+            if live_stream is None:
+                continue
+            if await live_stream.warm() is True:
+                logging.info(f'[LiveTunerPrewarmer] Prewarming tuner for {display_channel_id}.')
+
+
+    @classmethod
+    def getWarmChannelIDs(cls) -> list[str]:
+        """
+        現在の事前起動ポリシーで、チューナーを事前に起動しておくチャンネルの ID のリストを取得する
+
+        Returns:
+            list[str]: チューナーを事前に起動しておくチャンネルの ID のリスト (優先度が高い順)
+        """
+
+        config = Config().tv
+
+        # 事前起動する時間帯が設定されていて、現在がその時間帯でなければ事前起動しない
+        if len(config.prewarm_hours) > 0 and datetime.now(JST).hour not in config.prewarm_hours:
+            return []
+
+        # 固定で事前起動するチャンネル
+        result = list(dict.fromkeys(config.prewarm_channels))
+
+        # サーバーの起動以降の累計視聴時間が長い上位 N チャンネル
+        ranking = sorted(cls.__watched_seconds.items(), key=lambda item: item[1], reverse=True)
+        for display_channel_id, _ in ranking[:config.prewarm_channel_count]:
+            if display_channel_id not in result:
+                result.append(display_channel_id)
+
+        return result
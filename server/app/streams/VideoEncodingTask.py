@@ -7,8 +7,10 @@ import asyncio
 import math
 import os
 import sys
+from collections import deque
 from typing import TYPE_CHECKING, ClassVar, Literal, cast
 
+import numpy as np
 from biim.mpeg2ts import ts
 from biim.mpeg2ts.h264 import H264PES
 from biim.mpeg2ts.h265 import H265PES
@@ -21,6 +23,10 @@ from biim.mpeg2ts.pmt import PMTSection
 from app import logging
 from app.config import Config
 from app.constants import LIBRARY_PATH, QUALITY, QUALITY_TYPES
+from app.streams.VideoSegmentCache import VideoSegmentCache
+from app.utils.EncoderLogMatcher import EncoderLogMatcher
+from app.utils.EncoderLogReader import EncoderLogReader
+from app.utils.TSPacketReader import TSPacketReader
 
 
 if TYPE_CHECKING:
@@ -38,6 +44,10 @@ class VideoEncodingTask:
     ## この数を超えた場合はエンコードタスクを再起動しない（無限ループを避ける）
     MAX_RETRY_COUNT: ClassVar[int] = 10  # 10回まで
 
+    # 保持しておくエンコーダーのログの最大行数
+    ## リトライに失敗した際に、直近のエンコーダーのログを出力するために利用する
+    MAX_ENCODER_LOG_LINES: ClassVar[int] = 150
+
 
     def __init__(self, video_stream: VideoStream) -> None:
         """
@@ -57,6 +67,11 @@ class VideoEncodingTask:
         self._encoder_process: asyncio.subprocess.Process | None = None
         self._tsreadex_feed_task: asyncio.Future[None] | None = None
 
+        # エンコーダーのログ (標準エラー出力) を読み取り続けるタスクと、直近のエンコーダーのログ
+        ## 標準エラー出力を読み取らずにいるとパイプのバッファが一杯になり、エンコーダーが書き込みでブロックしてしまう
+        self._encoder_log_task: asyncio.Task[None] | None = None
+        self._encoder_log_lines: deque[str] = deque(maxlen=self.MAX_ENCODER_LOG_LINES)
+
         # エンコードタスクを完了済みかどうか
         self._is_finished: bool = False
 
@@ -66,6 +81,23 @@ class VideoEncodingTask:
         # エンコードタスクのリトライ回数のカウント
         self._retry_count: int = 0
 
+        # 現在エンコード中のセグメントのシーケンス番号
+        ## エンコーダーを起動するまでは None になる
+        ## 録画視聴セッション側で、リクエストされたセグメントが先読み範囲内かどうかを判定するために使われる
+        self._current_sequence: int | None = None
+
+
+    @property
+    def current_sequence(self) -> int | None:
+        """ 現在エンコード中のセグメントのシーケンス番号 (エンコーダーを起動していない場合は None) """
+        return self._current_sequence
+
+
+    @property
+    def is_running(self) -> bool:
+        """ エンコードタスクが実行中 (完了もキャンセルもされていない) かどうか """
+        return self._is_finished is False and self._is_cancelled is False
+
 
     def buildFFmpegOptions(self,
         quality: QUALITY_TYPES,
@@ -353,6 +385,24 @@ class VideoEncodingTask:
         return result
 
 
+    def buildEncoderSettings(self) -> str:
+        """
+        HLS セグメントキャッシュのキーに含める、エンコーダーの種類とエンコードオプションを連結した文字列を組み立てる
+        タイムスタンプオフセットやリトライ回数に依存しない値にするため、output_ts_offset を 0 としてオプションを組み立てる
+        (リトライ回数はエンコードタスクを新たに初期化した直後の 0 であることを前提としている)
+
+        Returns:
+            str: エンコーダーの種類とエンコードオプションを連結した文字列
+        """
+
+        ENCODER_TYPE = Config().general.encoder
+        if ENCODER_TYPE == 'FFmpeg':
+            encoder_options = self.buildFFmpegOptions(self.video_stream.quality, 0.0)
+        else:
+            encoder_options = self.buildHWEncCOptions(self.video_stream.quality, ENCODER_TYPE, 0.0)
+        return f'{ENCODER_TYPE} {" ".join(encoder_options)}'
+
+
     async def run(self, start_sequence: int) -> None:
         """
         エンコードタスクを実行する
@@ -368,24 +418,62 @@ class VideoEncodingTask:
         CONFIG = Config()
         ENCODER_TYPE = CONFIG.general.encoder
 
-        # 新しいエンコードタスクを起動させた時点で既にエンコード済みのセグメントは使えなくなるので、すべてリセットする
+        # 以前のエンコードタスクがキャンセルされた時点でエンコード中だったセグメントは、データが途中までしかないためリセットする
+        ## エンコード済みのセグメントはタイムスタンプが録画ファイル上の DTS に揃えられており、エンコードタスクを跨いでもそのまま使える
+        ## (HLS セグメントキャッシュと同様の前提) ため、先読み済みのセグメントを無駄にしないよう残しておく
+        ## ただし、クライアントに読み取られないまま残っているエンコード済みのセグメントは MAX_READED_SEGMENTS による破棄の対象にならないため、
+        ## シークの度にメモリ使用量が増え続けないよう、エンコードを開始するセグメントから MAX_READED_SEGMENTS 個の範囲外にあるものは破棄する
+        ## 破棄したセグメントも HLS セグメントキャッシュに残っていれば、再度要求された時点でキャッシュから読み込まれる
+        keep_end_sequence = start_sequence + self.video_stream.MAX_READED_SEGMENTS
         for segment in self.video_stream.segments:
-            if segment.encode_status != 'Pending':
+            if segment.encode_status == 'Encoding':
+                await segment.resetState()
+            elif (segment.encode_status == 'Completed' and segment.is_encoded_segment_ts_future_readed is False and
+                  not (start_sequence <= segment.sequence_index < keep_end_sequence)):
                 await segment.resetState()
 
-        # 処理対象の VideoStreamSegment を取得し、エンコード中状態に設定
+        # エンコードを開始するセグメントから連続してキャッシュ済みのセグメントは、エンコーダーを起動せずにキャッシュから返す
+        ## 先頭から MAX_READED_SEGMENTS 個まではキャッシュから読み込んで完了状態にし、それ以降はメモリを節約するため
+        ## Pending のまま読み飛ばす (クライアントから要求された時点で VideoStream.getSegment() がキャッシュから読み込む)
         current_sequence = start_sequence
+        cached_segment_count = 0
+        while current_sequence < len(self.video_stream.segments):
+            cached_segment = self.video_stream.segments[current_sequence]
+            cache_key = self.video_stream.getSegmentCacheKey(cached_segment)
+            if cached_segment_count < self.video_stream.MAX_READED_SEGMENTS:
+                cached_segment_ts = await VideoSegmentCache.get(cache_key)
+                if cached_segment_ts is None:
+                    break
+                if self._is_cancelled is True:
+                    return
+                cached_segment.setCompleted(cached_segment_ts)
+            elif await VideoSegmentCache.contains(cache_key) is False:
+                break
+            cached_segment_count += 1
+            current_sequence += 1
+        if cached_segment_count > 0:
+            logging.info(f'{self.video_stream.log_prefix}[Segment {start_sequence}] Served {cached_segment_count} HLS Segments from Cache.')
+
+        # 最終セグメントまですべてキャッシュ済みの場合は、エンコーダーを起動せずに終了する
+        if current_sequence >= len(self.video_stream.segments):
+            self._is_finished = True
+            logging.info(f'{self.video_stream.log_prefix} Finished the Encoding Task. (All segments were cached)')
+            return
+
+        # 処理対象の VideoStreamSegment を取得し、エンコード中状態に設定
         current_segment: VideoStreamSegment = self.video_stream.segments[current_sequence]
-        current_segment.encode_status = 'Encoding'
+        self._current_sequence = current_sequence
+        current_segment.setEncoding()
         logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Starting the Encoder...')
 
         # エンコーダーに渡す出力 TS のタイムスタンプオフセットを算出
+        ## セグメント開始位置よりも後のキーフレームは採用せず、直前のキーフレームの DTS を採用する
+        ## キーフレームの位置は昇順に並んでいるため、二分探索で求められる
         output_ts_offset: float = 0.0
-        for kf in self.video_stream.recorded_program.recorded_video.key_frames:
-            # セグメント開始位置よりも後のキーフレームは採用せず、直前の DTS を記録
-            if kf['offset'] > current_segment.start_file_position:
-                break
-            output_ts_offset = kf['dts'] / ts.HZ  # 秒単位
+        key_frames = self.video_stream.recorded_program.recorded_video.key_frames
+        key_frame_index = int(np.searchsorted(key_frames[:, 0], current_segment.start_file_position, side='right')) - 1
+        if key_frame_index >= 0:
+            output_ts_offset = int(key_frames[key_frame_index, 1]) / ts.HZ  # 秒単位
 
         # MPEG-TS 形式の場合のみ、録画ファイルを開く
         # それ以外の場合は一旦 None とする
@@ -396,6 +484,16 @@ class VideoEncodingTask:
         # 切り出した HLS セグメント用 MPEG-TS パケットを一時的に保持するバッファ
         encoded_segment = bytearray()
 
+        # エンコーダーの出力を最後まで読み取ったかどうか
+        ## 最終セグメントを HLS セグメントキャッシュに保存してよいかの判定に使う (タイムアウト時などは途中までしかエンコードされていない)
+        is_encoder_output_eof = False
+
+        # 組み立て途中の音声 PES を構成する TS パケット
+        ## 音声は PES を再構築せず、エンコーダーが出力した TS パケットをそのままセグメントにコピーする
+        ## ただしセグメントの境界で PES が分断されないよう、PES の終端 (次の PES の先頭パケット) を受け取るまではここに貯めておく
+        ## 最初の PES の先頭パケットを受け取るまでは None とし、それ以前の断片は破棄する
+        pending_audio_pes: bytearray | None = None
+
         try:
             # 最大 MAX_RETRY_COUNT 回までリトライする
             while self._retry_count < self.MAX_RETRY_COUNT:
@@ -404,7 +502,6 @@ class VideoEncodingTask:
                 pat_parser: SectionParser[PATSection] = SectionParser(PATSection)
                 pmt_parser: SectionParser[PMTSection] = SectionParser(PMTSection)
                 video_parser: PESParser[PES] = PESParser(PES)
-                audio_parser: PESParser[PES] = PESParser(PES)
                 # PID と CC (Continuity Counter) をリセット
                 pmt_pid: int | None = None
                 pat_cc: int = 0
@@ -412,7 +509,6 @@ class VideoEncodingTask:
                 video_pid: int | None = None
                 video_cc: int = 0
                 audio_pid: int | None = None
-                audio_cc: int = 0
 
                 # 録画ファイルが MPEG-4 形式の場合、psisimux で MPEG-TS に変換し、
                 # TS ファイル入力の代わりに psisimux からの出力を tsreadex への入力として渡す
@@ -722,6 +818,9 @@ class VideoEncodingTask:
                 # エンコーダーの出力を読み取り、MPEG-TS パーサーでパースする
                 assert self._encoder_process is not None and self._encoder_process.stdout is not None
 
+                # エンコーダーのログの読み取りを開始する
+                self._encoder_log_task = asyncio.create_task(self.__collectEncoderLog(self._encoder_process, ENCODER_TYPE))
+
                 # 最新の PAT と PMT を保持
                 latest_pat: PATSection | None = None
                 latest_pmt: PMTSection | None = None
@@ -745,7 +844,18 @@ class VideoEncodingTask:
                 # エンコードタスク開始時点のセグメント開始 DTS を保存しておく
                 first_segment_start_dts: int = current_segment.start_dts
 
-                while True:
+                # エンコーダーからの出力を TS パケット境界に揃えた大きなブロック単位で読み取る
+                ## 1パケット (188 bytes) ずつ readexactly() すると、シーク直後などエンコーダーの出力が集中する場面で await の回数が膨大になる
+                ## 同期バイトがずれていた場合は TSPacketReader 側で次の TS パケット境界まで読み飛ばされる
+                ts_packet_reader = TSPacketReader(self._encoder_process.stdout)
+
+                # 組み立て途中の音声 PES をリセット
+                pending_audio_pes = None
+
+                # 最終セグメントまでエンコードし終えたかどうか
+                is_final_segment_reached = False
+
+                while is_final_segment_reached is False:
                     # エンコードタスクがキャンセルされた場合、処理を中断する
                     if self._is_cancelled is True:
                         break
@@ -756,207 +866,247 @@ class VideoEncodingTask:
                         logging.warning(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Encoder output read timeout.')
                         break
 
-                    # 同期バイトを探す
-                    isEOF = False
-                    while True:
-                        try:
-                            # この時点で既にエンコーダープロセスが終了していたら処理中断
-                            if self._encoder_process is None:
-                                break
-                            sync_byte = await self._encoder_process.stdout.readexactly(1)
-                            if sync_byte == ts.SYNC_BYTE:
-                                break
-                            elif sync_byte == b'':
-                                isEOF = True
-                                break
-                        except asyncio.IncompleteReadError:
-                            isEOF = True
-                        break
-                    if isEOF:
+                    # この時点で既にエンコーダープロセスが終了していたら処理中断
+                    if self._encoder_process is None:
                         break
 
-                    # TS パケットを読み込む
-                    try:
-                        # この時点で既にエンコーダープロセスが終了していたら処理中断
-                        if self._encoder_process is None:
-                            break
-                        packet = ts.SYNC_BYTE + await self._encoder_process.stdout.readexactly(ts.PACKET_SIZE - 1)
-                        last_read_time = current_time  # 正常に読み取れた場合はタイムアウトをリセット
-                    except asyncio.IncompleteReadError:
-                        break
+                    # エンコーダーからの出力を読み取る
+                    ## 188 bytes の倍数に揃えられたデータが返る
+                    block = await ts_packet_reader.read()
 
-                    # PID を取得
-                    pid = ts.pid(packet)
-
-                    # PAT (Program Association Table)
-                    if pid == 0x00:
-                        pat_parser.push(packet)
-                        for pat in pat_parser:
-                            if pat.CRC32() != 0:
-                                continue
-                            latest_pat = pat
-
-                            # PMT の PID を取得
-                            for program_number, program_map_pid in pat:
-                                if program_number == 0:
-                                    continue
-                                pmt_pid = program_map_pid
-
-                            # PAT を再構築して candidate に追加
-                            for packet in packetize_section(pat, False, False, 0, 0, pat_cc):
-                                encoded_segment += packet
-                                pat_cc = (pat_cc + 1) & 0x0F
-
-                    # PMT (Program Map Table)
-                    elif pid == pmt_pid:
-                        pmt_parser.push(packet)
-                        for pmt in pmt_parser:
-                            if pmt.CRC32() != 0:
-                                continue
-                            latest_pmt = pmt
-
-                            # ストリームの PID を取得
-                            for stream_type, elementary_pid, _ in pmt:
-                                if stream_type == 0x1b:  # H.264
-                                    if video_pid is None:
-                                        video_pid = elementary_pid
-                                        # H.264 映像 PES を解析できるようパーサーを差し替える
-                                        video_parser = PESParser(H264PES)
-                                        logging.debug(f'{self.video_stream.log_prefix} H.264 PID: 0x{elementary_pid:04x}')
-                                elif stream_type == 0x24:  # H.265
-                                    if video_pid is None:
-                                        video_pid = elementary_pid
-                                        # H.265 映像 PES を解析できるようパーサーを差し替える
-                                        video_parser = PESParser(H265PES)
-                                        logging.debug(f'{self.video_stream.log_prefix} H.265 PID: 0x{elementary_pid:04x}')
-                                elif stream_type == 0x0F:  # AAC
-                                    if audio_pid is None:
-                                        audio_pid = elementary_pid
-                                        logging.debug(f'{self.video_stream.log_prefix} AAC PID: 0x{elementary_pid:04x}')
-                            # PMT を再構築して candidate に追加
-                            for packet in packetize_section(pmt, False, False, cast(int, pmt_pid), 0, pmt_cc):
-                                encoded_segment += packet
-                                pmt_cc = (pmt_cc + 1) & 0x0F
-
-                    # 映像ストリーム
-                    elif pid == video_pid:
-                        video_parser.push(packet)
-                        for video in video_parser:
-                            # 現在の PES の 33bit タイムスタンプ (DTS 優先, 90kHz)
-                            current_timestamp_33bit = cast(int, video.dts() or video.pts())
-
-                            # 最初のフレームでアンカーを確定
-                            if first_video_timestamp_33bit is None:
-                                first_video_timestamp_33bit = current_timestamp_33bit
-                                last_video_timestamp_33bit = current_timestamp_33bit
-
-                            # wrap-around 検出 (大きく逆行した場合のみ wrap とみなす)
-                            assert last_video_timestamp_33bit is not None
-                            if current_timestamp_33bit < last_video_timestamp_33bit and (last_video_timestamp_33bit - current_timestamp_33bit) > (ts.PCR_CYCLE // 2):
-                                wrap_offset_ticks += ts.PCR_CYCLE
-                            last_video_timestamp_33bit = current_timestamp_33bit
-
-                            # 単調増加となるよう展開した現在の DTS (DB 上の単調増加 DTS に揃える)
-                            assert first_video_timestamp_33bit is not None
-                            current_timestamp_unwrapped = first_segment_start_dts + (current_timestamp_33bit - first_video_timestamp_33bit + wrap_offset_ticks)
-
-                            # Future がまだ未完了の場合にのみ実行
-                            if current_segment is not None:
-                                # 判定に用いる次セグメント開始時刻
-                                next_segment_start_timestamp = current_segment.start_dts + round(current_segment.duration_seconds * ts.HZ)
-                                # logging.debug(
-                                #     f'{self.video_stream.log_prefix} Current Timestamp: {current_timestamp_unwrapped} / '
-                                #     f'Next Segment Start Timestamp: {next_segment_start_timestamp}'
-                                # )
-
-                                # 現在の映像 PES が (H.264: IDR, H.265: IDR/CRA) フレームかを判定
-                                def _has_idr_frame(pes: PES) -> bool:
-                                    try:
-                                        if isinstance(pes, H264PES):
-                                            for ebsp in pes.ebsps:
-                                                nal_unit_type = ebsp[0] & 0x1f
-                                                if nal_unit_type == 0x05:
-                                                    return True
-                                        elif isinstance(pes, H265PES):
-                                            for ebsp in pes.ebsps:
-                                                nal_unit_type = (ebsp[0] >> 1) & 0x3f
-                                                # biim に合わせて IDR/CRA のみを採用 (BLA は除外)
-                                                if nal_unit_type in (19, 20, 21):
-                                                    return True
-                                    except Exception:
-                                        pass
-                                    return False
-                                has_idr_frame = _has_idr_frame(video)
-
-                                # 次のセグメントの開始時刻以上になったら、現在のセグメントを確定して次のセグメントへ移行
-                                is_reached_planned_boundary = (current_timestamp_unwrapped >= next_segment_start_timestamp)
-                                is_should_finalize_now = False
-                                if is_split_pending is True:
-                                    # 次に来た (H.264: IDR, H.265: IDR/CRA) フレームで確定する
-                                    if has_idr_frame:
-                                        is_should_finalize_now = True
+                    # 空のデータが返ってきたら、エンコーダーの出力を最後まで読み取ったと判断する
+                    if len(block) == 0:
+                        is_encoder_output_eof = True
+                        break
+                    last_read_time = current_time  # 正常に読み取れた場合はタイムアウトをリセット
+
+                    # ブロック内のすべての TS パケットの PID と payload_unit_start_indicator を NumPy で一括して取り出す
+                    block_view = memoryview(block)
+                    packets = np.frombuffer(block, dtype=np.uint8).reshape(-1, ts.PACKET_SIZE)
+                    packet_count = len(packets)
+                    pids = ((packets[:, 1] & 0x1F).astype(np.int32) << 8) | packets[:, 2]
+                    is_payload_unit_start = (packets[:, 1] & 0x40) != 0
+                    pid_list: list[int] = pids.tolist()
+
+                    position = 0
+                    while position < packet_count and is_final_segment_reached is False:
+
+                        # 現在の PID の割り当てをもとに、Python 側で1パケットずつ処理する必要がある TS パケットを洗い出す
+                        ## PAT/PMT と映像の TS パケットはパーサーに渡し、音声の TS パケットは PES の先頭パケットのみを PES の区切りとして扱う
+                        ## それ以外の TS パケットは、エンコーダーの出力をそのままセグメントにコピーする
+                        ## PAT/PMT の内容によって PID の割り当てが変わった場合は、その時点から洗い出し直す
+                        pid_assignment = (pmt_pid, video_pid, audio_pid)
+                        is_audio = pids[position:] == (audio_pid if audio_pid is not None else -1)
+                        is_event = (is_audio & is_payload_unit_start[position:]) | (pids[position:] == 0x00)
+                        if pmt_pid is not None:
+                            is_event |= pids[position:] == pmt_pid
+                        if video_pid is not None:
+                            is_event |= pids[position:] == video_pid
+                        event_indexes: list[int] = (np.flatnonzero(is_event) + position).tolist()
+                        # 末尾に番兵を置き、最後に処理した TS パケット以降のデータもコピーされるようにする
+                        event_indexes.append(packet_count)
+
+                        copy_start = position
+                        for event_index in event_indexes:
+
+                            # 直前に処理した TS パケットからこの TS パケットまでの間のデータを、memoryview のスライスでコピーする
+                            if copy_start < event_index:
+                                is_audio_range = is_audio[copy_start - position:event_index - position]
+                                if not is_audio_range.any():
+                                    encoded_segment += block_view[copy_start * ts.PACKET_SIZE:event_index * ts.PACKET_SIZE]
                                 else:
-                                    if is_reached_planned_boundary is True:
-                                        if has_idr_frame:
-                                            is_should_finalize_now = True
+                                    # 音声 PES の途中の TS パケットは組み立て途中の音声 PES に、それ以外はセグメントに振り分ける
+                                    range_packets = packets[copy_start:event_index]
+                                    if pending_audio_pes is not None:
+                                        pending_audio_pes += range_packets[is_audio_range].tobytes()
+                                    encoded_segment += range_packets[~is_audio_range].tobytes()
+
+                            # ブロックの末尾に到達した
+                            if event_index == packet_count:
+                                position = packet_count
+                                break
+                            copy_start = position = event_index + 1
+
+                            pid = pid_list[event_index]
+                            packet = block[event_index * ts.PACKET_SIZE:(event_index + 1) * ts.PACKET_SIZE]
+
+                            # PAT (Program Association Table)
+                            if pid == 0x00:
+                                pat_parser.push(packet)
+                                for pat in pat_parser:
+                                    if pat.CRC32() != 0:
+                                        continue
+                                    latest_pat = pat
+
+                                    # PMT の PID を取得
+                                    for program_number, program_map_pid in pat:
+                                        if program_number == 0:
+                                            continue
+                                        pmt_pid = program_map_pid
+
+                                    # PAT を再構築して candidate に追加
+                                    for packet in packetize_section(pat, False, False, 0, 0, pat_cc):
+                                        encoded_segment += packet
+                                        pat_cc = (pat_cc + 1) & 0x0F
+
+                            # PMT (Program Map Table)
+                            elif pid == pmt_pid:
+                                pmt_parser.push(packet)
+                                for pmt in pmt_parser:
+                                    if pmt.CRC32() != 0:
+                                        continue
+                                    latest_pmt = pmt
+
+                                    # ストリームの PID を取得
+                                    for stream_type, elementary_pid, _ in pmt:
+                                        if stream_type == 0x1b:  # H.264
+                                            if video_pid is None:
+                                                video_pid = elementary_pid
+                                                # H.264 映像 PES を解析できるようパーサーを差し替える
+                                                video_parser = PESParser(H264PES)
+                                                logging.debug(f'{self.video_stream.log_prefix} H.264 PID: 0x{elementary_pid:04x}')
+                                        elif stream_type == 0x24:  # H.265
+                                            if video_pid is None:
+                                                video_pid = elementary_pid
+                                                # H.265 映像 PES を解析できるようパーサーを差し替える
+                                                video_parser = PESParser(H265PES)
+                                                logging.debug(f'{self.video_stream.log_prefix} H.265 PID: 0x{elementary_pid:04x}')
+                                        elif stream_type == 0x0F:  # AAC
+                                            if audio_pid is None:
+                                                audio_pid = elementary_pid
+                                                logging.debug(f'{self.video_stream.log_prefix} AAC PID: 0x{elementary_pid:04x}')
+                                    # PMT を再構築して candidate に追加
+                                    for packet in packetize_section(pmt, False, False, cast(int, pmt_pid), 0, pmt_cc):
+                                        encoded_segment += packet
+                                        pmt_cc = (pmt_cc + 1) & 0x0F
+
+                            # 映像ストリーム
+                            elif pid == video_pid:
+                                video_parser.push(packet)
+                                for video in video_parser:
+                                    # 現在の PES の 33bit タイムスタンプ (DTS 優先, 90kHz)
+                                    current_timestamp_33bit = cast(int, video.dts() or video.pts())
+
+                                    # 最初のフレームでアンカーを確定
+                                    if first_video_timestamp_33bit is None:
+                                        first_video_timestamp_33bit = current_timestamp_33bit
+                                        last_video_timestamp_33bit = current_timestamp_33bit
+
+                                    # wrap-around 検出 (大きく逆行した場合のみ wrap とみなす)
+                                    assert last_video_timestamp_33bit is not None
+                                    if current_timestamp_33bit < last_video_timestamp_33bit and (last_video_timestamp_33bit - current_timestamp_33bit) > (ts.PCR_CYCLE // 2):
+                                        wrap_offset_ticks += ts.PCR_CYCLE
+                                    last_video_timestamp_33bit = current_timestamp_33bit
+
+                                    # 単調増加となるよう展開した現在の DTS (DB 上の単調増加 DTS に揃える)
+                                    assert first_video_timestamp_33bit is not None
+                                    current_timestamp_unwrapped = first_segment_start_dts + (current_timestamp_33bit - first_video_timestamp_33bit + wrap_offset_ticks)
+
+                                    # Future がまだ未完了の場合にのみ実行
+                                    if current_segment is not None:
+                                        # 判定に用いる次セグメント開始時刻
+                                        next_segment_start_timestamp = current_segment.start_dts + round(current_segment.duration_seconds * ts.HZ)
+                                        # logging.debug(
+                                        #     f'{self.video_stream.log_prefix} Current Timestamp: {current_timestamp_unwrapped} / '
+                                        #     f'Next Segment Start Timestamp: {next_segment_start_timestamp}'
+                                        # )
+
+                                        # 現在の映像 PES が (H.264: IDR, H.265: IDR/CRA) フレームかを判定
+                                        def _has_idr_frame(pes: PES) -> bool:
+                                            try:
+                                                if isinstance(pes, H264PES):
+                                                    for ebsp in pes.ebsps:
+                                                        nal_unit_type = ebsp[0] & 0x1f
+                                                        if nal_unit_type == 0x05:
+                                                            return True
+                                                elif isinstance(pes, H265PES):
+                                                    for ebsp in pes.ebsps:
+                                                        nal_unit_type = (ebsp[0] >> 1) & 0x3f
+                                                        # biim に合わせて IDR/CRA のみを採用 (BLA は除外)
+                                                        if nal_unit_type in (19, 20, 21):
+                                                            return True
+                                            except Exception:
+                                                pass
+                                            return False
+                                        has_idr_frame = _has_idr_frame(video)
+
+                                        # 次のセグメントの開始時刻以上になったら、現在のセグメントを確定して次のセグメントへ移行
+                                        is_reached_planned_boundary = (current_timestamp_unwrapped >= next_segment_start_timestamp)
+                                        is_should_finalize_now = False
+                                        if is_split_pending is True:
+                                            # 次に来た (H.264: IDR, H.265: IDR/CRA) フレームで確定する
+                                            if has_idr_frame:
+                                                is_should_finalize_now = True
                                         else:
-                                            # (H.264: IDR, H.265: IDR/CRA) フレームまで現在のセグメントを延長
-                                            is_split_pending = True
-
-                                # 無事セグメントを安全に分割できる地点に到達したので、現在のセグメントを確定
-                                if is_should_finalize_now is True:
-                                    if not current_segment.encoded_segment_ts_future.done():
-                                        current_segment.encoded_segment_ts_future.set_result(bytes(encoded_segment))
-                                    current_segment.encode_status = 'Completed'
-                                    logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Successfully Encoded HLS Segment.')
-
-                                    # 次のセグメントへ移行
-                                    current_sequence += 1
-
-                                    # 最終セグメントの場合はループを抜ける
-                                    if current_sequence >= len(self.video_stream.segments):
-                                        logging.info(f'{self.video_stream.log_prefix} Reached the final segment.')
-                                        break
-
-                                    # 新しいセグメント用のデータと状態を初期化
-                                    ## ここで encoded_segment は空の bytearray にリセットされる
-                                    logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Encoding...')
-                                    current_segment = self.video_stream.segments[current_sequence]
-                                    current_segment.encode_status = 'Encoding'
-                                    encoded_segment = bytearray()
-                                    is_split_pending = False
-
-                                    # 新しいセグメントの先頭に PAT と PMT を追加
-                                    if latest_pat is not None:
-                                        for packet in packetize_section(latest_pat, False, False, 0, 0, pat_cc):
-                                            encoded_segment += packet
-                                            pat_cc = (pat_cc + 1) & 0x0F
-                                    if latest_pmt is not None:
-                                        for packet in packetize_section(latest_pmt, False, False, cast(int, pmt_pid), 0, pmt_cc):
-                                            encoded_segment += packet
-                                            pmt_cc = (pmt_cc + 1) & 0x0F
-
-                            # 現在の映像 PES をパケット化して、現在処理対象のセグメントに追加
-                            for packet in packetize_pes(video, False, False, cast(int, video_pid), 0, video_cc):
-                                encoded_segment += packet
-                                video_cc = (video_cc + 1) & 0x0F
-
-                    # 音声ストリーム
-                    elif pid == audio_pid:
-                        audio_parser.push(packet)
-                        for audio in audio_parser:
-                            # PES パケットを再構築して candidate に追加
-                            for packet in packetize_pes(audio, False, False, cast(int, audio_pid), 0, audio_cc):
-                                encoded_segment += packet
-                                audio_cc = (audio_cc + 1) & 0x0F
-
-                    # その他のパケット
-                    else:
-                        encoded_segment += packet
+                                            if is_reached_planned_boundary is True:
+                                                if has_idr_frame:
+                                                    is_should_finalize_now = True
+                                                else:
+                                                    # (H.264: IDR, H.265: IDR/CRA) フレームまで現在のセグメントを延長
+                                                    is_split_pending = True
+
+                                        # 無事セグメントを安全に分割できる地点に到達したので、現在のセグメントを確定
+                                        if is_should_finalize_now is True:
+                                            encoded_segment_ts = bytes(encoded_segment)
+                                            current_segment.setCompleted(encoded_segment_ts)
+                                            logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Successfully Encoded HLS Segment.')
+
+                                            # エンコード済みのセグメントを HLS セグメントキャッシュに保存
+                                            await VideoSegmentCache.put(self.video_stream.getSegmentCacheKey(current_segment), encoded_segment_ts)
+
+                                            # 次のセグメントへ移行
+                                            current_sequence += 1
+
+                                            # 最終セグメントの場合はループを抜ける
+                                            if current_sequence >= len(self.video_stream.segments):
+                                                logging.info(f'{self.video_stream.log_prefix} Reached the final segment.')
+                                                is_final_segment_reached = True
+                                                break
 
-                    # 最終セグメントの場合はループを抜ける
-                    if current_sequence >= len(self.video_stream.segments):
-                        break
+                                            # 新しいセグメント用のデータと状態を初期化
+                                            ## ここで encoded_segment は空の bytearray にリセットされる
+                                            logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Encoding...')
+                                            current_segment = self.video_stream.segments[current_sequence]
+                                            ## 以前のエンコードタスクでエンコード済みのセグメントは、Completed のまま上書きする
+                                            current_segment.setEncoding()
+                                            self._current_sequence = current_sequence
+                                            encoded_segment = bytearray()
+                                            is_split_pending = False
+
+                                            # 新しいセグメントの先頭に PAT と PMT を追加
+                                            if latest_pat is not None:
+                                                for packet in packetize_section(latest_pat, False, False, 0, 0, pat_cc):
+                                                    encoded_segment += packet
+                                                    pat_cc = (pat_cc + 1) & 0x0F
+                                            if latest_pmt is not None:
+                                                for packet in packetize_section(latest_pmt, False, False, cast(int, pmt_pid), 0, pmt_cc):
+                                                    encoded_segment += packet
+                                                    pmt_cc = (pmt_cc + 1) & 0x0F
+
+                                    # 現在の映像 PES をパケット化して、現在処理対象のセグメントに追加
+                                    for packet in packetize_pes(video, False, False, cast(int, video_pid), 0, video_cc):
+                                        encoded_segment += packet
+                                        video_cc = (video_cc + 1) & 0x0F
+
+                            # 音声ストリーム (PES の先頭パケット)
+                            else:
+                                # 直前の音声 PES が完結したので、現在処理対象のセグメントに追加
+                                if pending_audio_pes is not None:
+                                    encoded_segment += pending_audio_pes
+                                pending_audio_pes = bytearray(packet)
+
+                            # 最終セグメントの場合はループを抜ける
+                            if current_sequence >= len(self.video_stream.segments):
+                                is_final_segment_reached = True
+                                break
+
+                            # PID の割り当てが変わった場合は、残りの TS パケットを洗い出し直す
+                            if (pmt_pid, video_pid, audio_pid) != pid_assignment:
+                                break
+
+                # 同期を取り直すために読み飛ばしたデータがあればログに出力する
+                if ts_packet_reader.skipped_bytes > 0:
+                    logging.warning(f'{self.video_stream.log_prefix} Skipped {ts_packet_reader.skipped_bytes} bytes to resync TS packets.')
 
                 # エンコーダープロセスを終了
                 if self._encoder_process is not None:
@@ -1017,18 +1167,9 @@ class VideoEncodingTask:
                     self._retry_count += 1
                     if self._retry_count < self.MAX_RETRY_COUNT:
                         logging.warning(f'{self.video_stream.log_prefix} Failed to get video/audio PID. Retrying... ({self._retry_count}/{self.MAX_RETRY_COUNT})')
-                        # エンコーダーのデバッグログが有効な場合のみ、全てのログを出力
-                        if CONFIG.general.debug_encoder is True:
-                            logging.debug(f'{self.video_stream.log_prefix} Encoder stderr:')
-                            assert self._encoder_process.stderr is not None
-                            while True:
-                                try:
-                                    line = await self._encoder_process.stderr.readline()
-                                    if not line:  # EOF
-                                        break
-                                    logging.debug(f'{self.video_stream.log_prefix} [{ENCODER_TYPE}] {line.decode("utf-8").strip()}')
-                                except Exception:
-                                    pass
+                        # エンコーダーのログの読み取りを終了する
+                        ## エンコーダーのデバッグログが有効な場合は、読み取った時点ですべてのログが出力されている
+                        await self.__stopEncoderLogCollection()
                         # リトライ前にフィードタスクの完了を待つ
                         if self._tsreadex_feed_task is not None:
                             try:
@@ -1073,18 +1214,15 @@ class VideoEncodingTask:
                 # ファイルを閉じる
                 file.close()
 
-            # エンコーダーのデバッグログが有効 or リトライ失敗時のみ、全てのログを出力
-            if (CONFIG.general.debug_encoder is True or self._retry_count >= self.MAX_RETRY_COUNT) and self._encoder_process is not None:
+            # エンコーダーのログの読み取りを終了する
+            await self.__stopEncoderLogCollection()
+
+            # リトライ失敗時のみ、直近のエンコーダーのログを出力
+            ## エンコーダーのデバッグログが有効な場合は、読み取った時点ですべてのログが出力されている
+            if CONFIG.general.debug_encoder is False and self._retry_count >= self.MAX_RETRY_COUNT and len(self._encoder_log_lines) > 0:
                 logging.debug(f'{self.video_stream.log_prefix} Encoder stderr:')
-                assert self._encoder_process.stderr is not None
-                while True:
-                    try:
-                        line = await self._encoder_process.stderr.readline()
-                        if not line:  # EOF
-                            break
-                        logging.debug(f'{self.video_stream.log_prefix} [{ENCODER_TYPE}] {line.decode("utf-8").strip()}')
-                    except Exception:
-                        pass
+                for line in self._encoder_log_lines:
+                    logging.debug(f'{self.video_stream.log_prefix} [{ENCODER_TYPE}] {line}')
             # finally 句の最後でクリーンアップする前に、フィードタスクの完了を待つ
             # 通常はリトライループ内で既に完了しているが、念のため再チェック
             if self._tsreadex_feed_task is not None:
@@ -1104,15 +1242,80 @@ class VideoEncodingTask:
 
             # 最後のセグメントが完了していない場合は、現在のバッファを future にセット
             if current_segment is not None and not current_segment.encoded_segment_ts_future.done():
-                current_segment.encoded_segment_ts_future.set_result(bytes(encoded_segment))
-                current_segment.encode_status = 'Completed'
+                # エンコーダーの出力を最後まで読み取れた場合は、最後の音声 PES も完結しているため現在のセグメントに追加する
+                ## 次の PES の先頭パケットが来ないため、ここで追加しないと最後の音声 PES が失われる
+                if is_encoder_output_eof is True and pending_audio_pes is not None:
+                    encoded_segment += pending_audio_pes
+                    pending_audio_pes = None
+                encoded_segment_ts = bytes(encoded_segment)
+                current_segment.setCompleted(encoded_segment_ts)
                 logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Successfully Encoded Final HLS Segment.')
 
+                # 録画ファイルの最終セグメントをエンコーダーの出力の最後まで読み取れた場合のみ、HLS セグメントキャッシュに保存
+                if is_encoder_output_eof is True and current_sequence == len(self.video_stream.segments) - 1:
+                    await VideoSegmentCache.put(self.video_stream.getSegmentCacheKey(current_segment), encoded_segment_ts)
+
             # エンコードタスクでのすべての処理を完了した
             self._is_finished = True
             logging.info(f'{self.video_stream.log_prefix} Finished the Encoding Task.')
 
 
+    async def __collectEncoderLog(self, encoder_process: asyncio.subprocess.Process, encoder_type: Literal['FFmpeg', 'QSVEncC', 'NVEncC', 'VCEEncC', 'rkmppenc']) -> None:
+        """
+        エンコーダーのログ (標準エラー出力) を終了まで読み取り続け、直近のログを保持する
+        エンコーダーのデバッグログが有効な場合はすべてのログを随時出力し、既知のエラーのログはデバッグログの設定に関わらず出力する
+
+        Args:
+            encoder_process (asyncio.subprocess.Process): エンコーダーのプロセス
+            encoder_type (Literal['FFmpeg', 'QSVEncC', 'NVEncC', 'VCEEncC', 'rkmppenc']): エンコーダーの種類
+        """
+
+        # ライブストリーミングのエンコードタスクと同じリーダーとマッチャーを使う
+        encoder_log_reader = EncoderLogReader(cast(asyncio.StreamReader, encoder_process.stderr))
+        error_matcher = EncoderLogMatcher.getErrorMatcher(encoder_type)
+        is_debug_encoder = Config().general.debug_encoder
+
+        # 前回のエンコーダーのログは破棄する
+        self._encoder_log_lines.clear()
+
+        try:
+            while True:
+                lines = await encoder_log_reader.readLines()
+                if len(lines) == 0:
+                    break
+                for line in lines:
+                    self._encoder_log_lines.append(line)
+                    if is_debug_encoder is True:
+                        logging.debug(f'{self.video_stream.log_prefix} [{encoder_type}] {line}')
+                    error_code = error_matcher.match(line)
+                    if error_code is not None:
+                        logging.warning(f'{self.video_stream.log_prefix} [{encoder_type}] Encoder reported an error. ({error_code}): {line}')
+        except Exception as ex:
+            logging.debug(f'{self.video_stream.log_prefix} Failed to read the encoder log:', exc_info=ex)
+
+
+    async def __stopEncoderLogCollection(self) -> None:
+        """
+        エンコーダーのログの読み取りを終了する
+        エンコーダーが終了していれば残りのログを読み切るまで少し待ち、それでも終わらなければ読み取りをキャンセルする
+        """
+
+        if self._encoder_log_task is None:
+            return
+        encoder_log_task = self._encoder_log_task
+        self._encoder_log_task = None
+        try:
+            await asyncio.wait_for(encoder_log_task, timeout=1.0)
+        except TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # ログの読み取りタスク自体がキャンセルされていた場合のみ無視する
+            ## この処理を実行しているタスク (エンコードタスクなど) がキャンセルされた場合は、キャンセルを握りつぶさず伝播させる
+            current_task = asyncio.current_task()
+            if current_task is not None and current_task.cancelling() > 0:
+                raise
+
+
     async def cancel(self) -> None:
         """
         起動中のエンコードタスクをキャンセルし、起動中の外部プロセスを終了する
@@ -0,0 +1,294 @@
+# Type Hints を指定できるように
+# ref: https://stackoverflow.com/a/33533514/17124142
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import ClassVar
+
+from app import logging
+from app.config import Config
+from app.constants import VIDEO_SEGMENT_CACHE_DIR
+
+
+class VideoSegmentCache:
+    """
+    エンコード済みの HLS セグメントをデータディレクトリに永続化する、コンテンツアドレス方式のキャッシュ
+    同じ録画番組を複数のセッションで再生した場合や、シークで過去のセグメントに戻った場合に、同じセグメントを再エンコードせずに済むようにする
+    キャッシュの合計サイズが上限を超えた場合は、最後にアクセスされた日時が古いセグメントから順に削除する (LRU)
+    """
+
+    # キャッシュキーの算出に含めるキャッシュ形式のバージョン
+    ## セグメントの切り出し処理を変更してキャッシュ済みのセグメントと互換性がなくなった場合は、この値を上げてキャッシュを無効化する
+    CACHE_FORMAT_VERSION: ClassVar[int] = 1
+
+    # キャッシュファイルの拡張子
+    CACHE_FILE_EXTENSION: ClassVar[str] = '.ts'
+
+    # キャッシュのインデックス (キャッシュキー → ファイルサイズ)
+    ## 先頭ほど最後にアクセスされた日時が古い (LRU 順)
+    ## 起動後に初めてアクセスされた時点でキャッシュディレクトリを走査して構築する
+    _index: ClassVar[OrderedDict[str, int] | None] = None
+
+    # キャッシュの合計サイズ (バイト)
+    _total_size: ClassVar[int] = 0
+
+    # インデックスの操作を排他制御するためのロック
+    ## キャッシュの読み書きはスレッドプール上で行われるため、asyncio.Lock ではなく threading.Lock を使う
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+
+    @classmethod
+    def isEnabled(cls) -> bool:
+        """
+        HLS セグメントキャッシュが有効かどうかを返す
+
+        Returns:
+            bool: キャッシュの最大サイズが 0 より大きければ True
+        """
+
+        return Config().video.segment_cache_max_size > 0
+
+
+    @classmethod
+    def getMaxSize(cls) -> int:
+        """
+        キャッシュの最大サイズ (バイト) を返す
+
+        Returns:
+            int: キャッシュの最大サイズ (バイト)
+        """
+
+        return int(Config().video.segment_cache_max_size * 1024 * 1024 * 1024)
+
+
+    @classmethod
+    def getCacheKey(cls, file_hash: str, quality: str, start_dts: int, duration_seconds: float, encoder_settings: str) -> str:
+        """
+        HLS セグメントのキャッシュキーを算出する
+        セグメントの長さも含めているのは、キーフレーム情報の再解析などでセグメント境界が変わった場合に別のセグメントとして扱うため
+
+        Args:
+            file_hash (str): 録画ファイルのハッシュ
+            quality (str): 映像の品質
+            start_dts (int): HLS セグメントの開始タイムスタンプ (90kHz)
+            duration_seconds (float): HLS セグメント長 (秒単位)
+            encoder_settings (str): エンコーダーの種類とエンコードオプションを連結した文字列
+
+        Returns:
+            str: キャッシュキー (SHA-256 の16進数表現)
+        """
+
+        source = '\n'.join([
+            str(cls.CACHE_FORMAT_VERSION),
+            file_hash,
+            quality,
+            str(start_dts),
+            f'{duration_seconds:.6f}',
+            encoder_settings,
+        ])
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+    @classmethod
+    def _getCachePath(cls, cache_key: str) -> Path:
+        """
+        キャッシュキーに対応するキャッシュファイルのパスを返す
+        1つのディレクトリにファイルが大量に並ばないよう、キャッシュキーの先頭2文字でサブディレクトリを分ける
+
+        Args:
+            cache_key (str): キャッシュキー
+
+        Returns:
+            Path: キャッシュファイルのパス
+        """
+
+        return VIDEO_SEGMENT_CACHE_DIR / cache_key[:2] / f'{cache_key}{cls.CACHE_FILE_EXTENSION}'
+
+
+    @classmethod
+    def _loadIndex(cls) -> OrderedDict[str, int]:
+        """
+        キャッシュディレクトリを走査してインデックスを構築する (_lock を取得した状態で呼び出すこと)
+        最終アクセス日時は、キャッシュヒット時に更新している最終更新日時で代用する
+
+        Returns:
+            OrderedDict[str, int]: キャッシュのインデックス
+        """
+
+        if cls._index is not None:
+            return cls._index
+
+        entries: list[tuple[float, str, int]] = []
+        if VIDEO_SEGMENT_CACHE_DIR.is_dir():
+            for cache_path in VIDEO_SEGMENT_CACHE_DIR.glob(f'*/*{cls.CACHE_FILE_EXTENSION}'):
+                try:
+                    stat = cache_path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, cache_path.stem, stat.st_size))
+
+        # 最終アクセス日時が古い順に並べる
+        entries.sort()
+        cls._index = OrderedDict((cache_key, size) for _, cache_key, size in entries)
+        cls._total_size = sum(size for _, _, size in entries)
+        logging.debug(f'[VideoSegmentCache] Loaded {len(cls._index)} cached segments ({cls._total_size / 1024 / 1024:.1f} MB).')
+        return cls._index
+
+
+    @classmethod
+    def _getSync(cls, cache_key: str) -> bytes | None:
+        """
+        キャッシュ済みの HLS セグメントを取得する (同期関数)
+
+        Args:
+            cache_key (str): キャッシュキー
+
+        Returns:
+            bytes | None: キャッシュ済みの HLS セグメント (キャッシュが存在しない場合は None)
+        """
+
+        with cls._lock:
+            index = cls._loadIndex()
+            if cache_key not in index:
+                return None
+
+            cache_path = cls._getCachePath(cache_key)
+            try:
+                with open(cache_path, 'rb') as file:
+                    data = file.read()
+                # 最終アクセス日時を更新する (再起動後も LRU の順序を維持するため)
+                os.utime(cache_path)
+            except OSError:
+                # キャッシュファイルが外部から削除された場合などはインデックスからも削除する
+                cls._total_size -= index.pop(cache_key)
+                return None
+
+            # LRU の順序を更新する
+            index.move_to_end(cache_key)
+            return data
+
+
+    @classmethod
+    def _putSync(cls, cache_key: str, data: bytes) -> None:
+        """
+        エンコード済みの HLS セグメントをキャッシュに保存する (同期関数)
+        保存後にキャッシュの合計サイズが上限を超えた場合は、最終アクセス日時が古いセグメントから順に削除する
+
+        Args:
+            cache_key (str): キャッシュキー
+            data (bytes): エンコード済みの HLS セグメント
+        """
+
+        max_size = cls.getMaxSize()
+
+        # 1セグメントだけで上限を超える場合は保存しない
+        if len(data) == 0 or len(data) > max_size:
+            return
+
+        with cls._lock:
+            index = cls._loadIndex()
+            if cache_key in index:
+                index.move_to_end(cache_key)
+                return
+
+            # 書き込み途中のファイルを読み取らないよう、一時ファイルに書き込んでからリネームする
+            cache_path = cls._getCachePath(cache_key)
+            temp_path = cache_path.with_suffix('.tmp')
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(temp_path, 'wb') as file:
+                    file.write(data)
+                os.replace(temp_path, cache_path)
+            except OSError as ex:
+                logging.warning(f'[VideoSegmentCache] Failed to write cache file: {cache_path}', exc_info=ex)
+                temp_path.unlink(missing_ok=True)
+                return
+
+            index[cache_key] = len(data)
+            cls._total_size += len(data)
+
+            # 上限を超えた分だけ古いセグメントから削除する
+            evicted_count = 0
+            while cls._total_size > max_size and len(index) > 1:
+                evicted_cache_key, evicted_size = index.popitem(last=False)
+                cls._total_size -= evicted_size
+                evicted_count += 1
+                try:
+                    cls._getCachePath(evicted_cache_key).unlink(missing_ok=True)
+                except OSError as ex:
+                    logging.warning(f'[VideoSegmentCache] Failed to delete cache file: {evicted_cache_key}', exc_info=ex)
+            if evicted_count > 0:
+                logging.debug(f'[VideoSegmentCache] Evicted {evicted_count} cached segments.')
+
+
+    @classmethod
+    def _containsSync(cls, cache_key: str) -> bool:
+        """
+        HLS セグメントがキャッシュ済みかどうかを返す (同期関数)
+
+        Args:
+            cache_key (str): キャッシュキー
+
+        Returns:
+            bool: キャッシュ済みであれば True
+        """
+
+        with cls._lock:
+            return cache_key in cls._loadIndex()
+
+
+    @classmethod
+    async def contains(cls, cache_key: str) -> bool:
+        """
+        HLS セグメントがキャッシュ済みかどうかを返す
+        キャッシュファイルの読み込みは行わないため、get() よりも高速に判定できる
+
+        Args:
+            cache_key (str): キャッシュキー
+
+        Returns:
+            bool: キャッシュ済みであれば True (キャッシュが無効化されている場合は常に False)
+        """
+
+        if cls.isEnabled() is False:
+            return False
+        return await asyncio.to_thread(cls._containsSync, cache_key)
+
+
+    @classmethod
+    async def get(cls, cache_key: str) -> bytes | None:
+        """
+        キャッシュ済みの HLS セグメントを取得する
+        キャッシュが無効化されている場合は常に None を返す
+
+        Args:
+            cache_key (str): キャッシュキー
+
+        Returns:
+            bytes | None: キャッシュ済みの HLS セグメント (キャッシュが存在しない場合は None)
+        """
+
+        if cls.isEnabled() is False:
+            return None
+        return await asyncio.to_thread(cls._getSync, cache_key)
+
+
+    @classmethod
+    async def put(cls, cache_key: str, data: bytes) -> None:
+        """
+        エンコード済みの HLS セグメントをキャッシュに保存する
+        キャッシュが無効化されている場合は何もしない
+
+        Args:
+            cache_key (str): キャッシュキー
+            data (bytes): エンコード済みの HLS セグメント
+        """
+
+        if cls.isEnabled() is False:
+            return
+        await asyncio.to_thread(cls._putSync, cache_key, data)
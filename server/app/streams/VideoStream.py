@@ -5,10 +5,11 @@
 from __future__ import annotations
 
 import asyncio
+import bisect
 import math
 import uuid
 from collections.abc import Callable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import ClassVar, Literal
 
 from biim.mpeg2ts import ts
@@ -18,6 +19,7 @@ from app import logging
 from app.constants import QUALITY_TYPES
 from app.models.RecordedProgram import RecordedProgram
 from app.streams.VideoEncodingTask import VideoEncodingTask
+from app.streams.VideoSegmentCache import VideoSegmentCache
 from app.utils import SetTimeout
 
 
@@ -45,6 +47,33 @@ class VideoStreamSegment:
     # HLS セグメントのエンコード済み MPEG-TS データが既にクライアントによって読み取られているかを表すフラグ
     ## このフラグが True の VideoStreamSegment は、メモリ節約のため順に破棄される (readed と意図的に過去形にしている)
     is_encoded_segment_ts_future_readed: bool = False
+    # HLS セグメントがエンコード完了状態になった・エンコード完了状態から戻った際に呼び出されるコールバック関数
+    ## VideoStream がエンコード完了済みのバッファ範囲を差分更新するために利用する
+    on_completion_changed: Callable[[VideoStreamSegment], None] | None = field(default=None, repr=False)
+
+    def setEncoding(self) -> None:
+        """
+        このセグメントをエンコード中状態にする
+        以前のエンコードタスクでエンコード済みのセグメントは、データをそのまま使い回すため Completed のままにする
+        (Completed から戻すとエンコード完了済みのバッファ範囲が実際と食い違うため、戻す場合は必ず resetState() を使う)
+        """
+        if self.encode_status == 'Pending':
+            self.encode_status = 'Encoding'
+
+    def setCompleted(self, encoded_segment_ts: bytes) -> None:
+        """
+        このセグメントをエンコード完了状態にする
+        既に asyncio.Future が完了している (以前のエンコードタスクでエンコード済み) 場合は、データは上書きせずそのまま使う
+
+        Args:
+            encoded_segment_ts (bytes): エンコード済みの MPEG-TS データ
+        """
+        if not self.encoded_segment_ts_future.done():
+            self.encoded_segment_ts_future.set_result(encoded_segment_ts)
+        is_changed = self.encode_status != 'Completed'
+        self.encode_status = 'Completed'
+        if is_changed is True and self.on_completion_changed is not None:
+            self.on_completion_changed(self)
 
     async def resetState(self) -> None:
         """
@@ -54,9 +83,12 @@ class VideoStreamSegment:
         """
         if not self.encoded_segment_ts_future.done():
             self.encoded_segment_ts_future.set_result(b'')  # 前の Future がまだ完了していない場合は空のデータで完了させる
+        is_changed = self.encode_status == 'Completed'
         self.encode_status = 'Pending'
         self.encoded_segment_ts_future = asyncio.Future()  # asyncio.Future を再初期化
         self.is_encoded_segment_ts_future_readed = False
+        if is_changed is True and self.on_completion_changed is not None:
+            self.on_completion_changed(self)
 
 
 class VideoStream:
@@ -72,6 +104,10 @@ class VideoStream:
     # エンコードする HLS セグメントの最低長さ (秒)
     SEGMENT_DURATION_SECONDS: ClassVar[float] = float(6)  # 6秒
 
+    # 再生位置から何セグメント先までを先読みしてエンコードしておくか
+    ## リクエストされたセグメントが実行中のエンコードタスクのこの範囲内にある場合は、エンコードタスクを再起動せずにエンコードを待つ
+    PREFETCH_SEGMENTS: ClassVar[int] = 5
+
     # 録画視聴セッションのインスタンスが入る、セッション ID をキーとした辞書
     # この辞書に録画視聴セッションに関する全てのデータが格納されている
     __instances: ClassVar[dict[str, VideoStream]] = {}
@@ -99,9 +135,33 @@ class VideoStream:
             # HLS セグメントを格納するリスト
             instance._segments = []
 
+            # エンコード完了済みのセグメントのシーケンス番号を昇順に格納するリスト
+            ## セグメントの状態が変わる度に差分更新し、バッファ範囲の算出で全セグメントを走査せずに済むようにする
+            instance._completed_sequences = []
+
+            # エンコード完了済みのバッファ範囲 (秒)
+            instance._buffer_range = (0, 0)
+
+            # バッファ範囲が変化したことを通知するための asyncio.Event
+            ## バッファ範囲が変化する度に set() された上で新しい asyncio.Event に差し替えられる
+            instance._buffer_range_changed = asyncio.Event()
+
             # 現在実行中のエンコードタスク
             instance._encoding_task = VideoEncodingTask(instance)
 
+            # HLS セグメントキャッシュのキーに含める、エンコーダーの種類とエンコードオプションを連結した文字列
+            ## 録画番組と画質が同じであればセッション中に変化しないため、初回のキャッシュキー算出時に一度だけ組み立てる
+            instance._encoder_settings = None
+
+            # 現在の再生位置にあたるセグメントのシーケンス番号
+            ## セグメントのリクエストと Keep-Alive API で通知される再生位置から更新される
+            instance._playback_sequence = 0
+
+            # 先読みのヒット数とミス数
+            ## ミスは、リクエストされたセグメントのためにエンコードタスクを再起動する必要があった回数を表す
+            instance._prefetch_hit_count = 0
+            instance._prefetch_miss_count = 0
+
             # キャンセルされない限り SESSION_TIMEOUT 秒後にインスタンスを破棄するタイマー
             # cancel_destroy_timer() を呼び出すことでタイマーをキャンセルできる
             instance._cancel_destroy_timer = SetTimeout(lambda: asyncio.create_task(instance.destroy()), cls.SESSION_TIMEOUT)
@@ -144,7 +204,14 @@ class VideoStream:
         self.quality: QUALITY_TYPES
         self._base_dts: int
         self._segments: list[VideoStreamSegment]
+        self._completed_sequences: list[int]
+        self._buffer_range: tuple[float, float]
+        self._buffer_range_changed: asyncio.Event
         self._encoding_task: VideoEncodingTask
+        self._encoder_settings: str | None
+        self._playback_sequence: int
+        self._prefetch_hit_count: int
+        self._prefetch_miss_count: int
         self._cancel_destroy_timer: Callable[[], None]
 
 
@@ -166,10 +233,35 @@ class VideoStream:
         return tuple(self._segments)
 
 
+    def getSegmentCacheKey(self, segment: VideoStreamSegment) -> str:
+        """
+        HLS セグメントキャッシュのキャッシュキーを取得する
+
+        Args:
+            segment (VideoStreamSegment): HLS セグメント
+
+        Returns:
+            str: キャッシュキー
+        """
+
+        if self._encoder_settings is None:
+            # リトライ回数の影響を受けないよう、新しく初期化したエンコードタスクでエンコードオプションを組み立てる
+            self._encoder_settings = VideoEncodingTask(self).buildEncoderSettings()
+
+        return VideoSegmentCache.getCacheKey(
+            file_hash = self.recorded_program.recorded_video.file_hash,
+            quality = self.quality,
+            start_dts = segment.start_dts,
+            duration_seconds = segment.duration_seconds,
+            encoder_settings = self._encoder_settings,
+        )
+
+
     def keepAlive(self) -> None:
         """
         録画視聴セッションのアクティブ状態を維持する
         番組の視聴中は定期的にこのメソッドを呼び出す必要があり、呼び出されなくなった場合は自動的に終了処理が行われる
+        再生位置の更新と先読みのスケジューリングは updatePlaybackPosition() で行う
         """
 
         # 前回のタイマーをキャンセルする
@@ -179,27 +271,160 @@ class VideoStream:
         self._cancel_destroy_timer = SetTimeout(lambda: asyncio.create_task(self.destroy()), self.SESSION_TIMEOUT)
 
 
+    async def updatePlaybackPosition(self, playback_position: float) -> None:
+        """
+        クライアントから通知された再生位置を反映し、再生位置から PREFETCH_SEGMENTS 個先までのセグメントの先読みをスケジュールする
+
+        Args:
+            playback_position (float): 再生位置 (秒)
+        """
+
+        if len(self._segments) == 0:
+            return
+
+        # 再生位置を含むセグメントを二分探索で探す
+        playback_dts = self._base_dts + round(playback_position * ts.HZ)
+        sequence = bisect.bisect_right(self._segments, playback_dts, key=lambda segment: segment.start_dts) - 1
+        self._playback_sequence = min(max(sequence, 0), len(self._segments) - 1)
+
+        await self.schedulePrefetch()
+
+
+    def isWithinPrefetchWindow(self, segment_sequence: int) -> bool:
+        """
+        指定されたセグメントが、実行中のエンコードタスクの先読み範囲内にあるかを返す
+        先読み範囲内であれば、エンコードタスクを再起動しなくてもまもなくエンコードが完了する
+
+        Args:
+            segment_sequence (int): HLS セグメントのシーケンス番号
+
+        Returns:
+            bool: 先読み範囲内であれば True
+        """
+
+        current_sequence = self._encoding_task.current_sequence
+        if self._encoding_task.is_running is False or current_sequence is None:
+            return False
+        return current_sequence <= segment_sequence <= current_sequence + self.PREFETCH_SEGMENTS
+
+
+    async def schedulePrefetch(self) -> None:
+        """
+        再生位置から PREFETCH_SEGMENTS 個先までのセグメントがエンコード済みかエンコード予定になっているかを確認し、
+        そうでなければ先読み範囲の最初の未エンコードのセグメントからエンコードタスクを開始する
+        """
+
+        if len(self._segments) == 0:
+            return
+
+        # 先読み範囲のうち、エンコード済みでもキャッシュ済みでもない最初のセグメントを探す
+        prefetch_end = min(self._playback_sequence + self.PREFETCH_SEGMENTS + 1, len(self._segments))
+        for segment in self._segments[self._playback_sequence:prefetch_end]:
+            if segment.encode_status != 'Pending':
+                continue
+            if await VideoSegmentCache.contains(self.getSegmentCacheKey(segment)) is True:
+                continue
+
+            # 実行中のエンコードタスクがまもなくエンコードする場合は何もしない
+            if self.isWithinPrefetchWindow(segment.sequence_index) is True:
+                return
+
+            # 先読みのためにエンコードタスクを (再) 起動する
+            logging.info(f'{self.log_prefix}[Segment {segment.sequence_index}] Prefetching from playback position (Segment {self._playback_sequence}).')
+            await self.restartEncodingTask(segment.sequence_index)
+            return
+
+
+    async def restartEncodingTask(self, segment_sequence: int) -> None:
+        """
+        実行中のエンコードタスクをキャンセルし、指定されたセグメントから新たにエンコードタスクを開始する
+
+        Args:
+            segment_sequence (int): エンコードを開始するセグメントのシーケンス番号
+        """
+
+        # 既存のエンコードタスクをキャンセル
+        await self._encoding_task.cancel()
+        logging.info(f'{self.log_prefix}[Segment {segment_sequence}] Previous Encoding Task Canceled.')
+
+        # 新しいエンコードタスクのインスタンスを初期化
+        ## エンコードタスクは基本使い回せないので、再度新しく初期化する
+        self._encoding_task = VideoEncodingTask(self)
+
+        # 新しいエンコードタスクを開始
+        asyncio.create_task(self._encoding_task.run(segment_sequence))
+        logging.info(f'{self.log_prefix}[Segment {segment_sequence}] New Encoding Task Started.')
+
+
     def getBufferRange(self) -> tuple[float, float]:
         """
         エンコード完了済みの HLS セグメントのバッファ範囲 (秒) を返す
+        バッファ範囲はセグメントの状態が変わる度に差分更新されているため、全セグメントを走査することはない
 
         Returns:
             tuple[float, float]: バッファ範囲 (開始時刻, 終了時刻)
         """
 
-        # エンコード済みの全セグメントの範囲を計算する
-        # エンコード済み (Completed) のセグメントのみを対象とする
-        encoded_segments = [s for s in self._segments if s.encode_status == 'Completed']
-        if encoded_segments:
+        return self._buffer_range
+
+
+    def getBufferRangeChangedEvent(self) -> asyncio.Event:
+        """
+        次にバッファ範囲が変化した際に set() される asyncio.Event を返す
+        イベントが set() された後は、再度このメソッドを呼び出して新しい asyncio.Event を取得する必要がある
+
+        Returns:
+            asyncio.Event: バッファ範囲の変化を通知する asyncio.Event
+        """
+
+        return self._buffer_range_changed
+
+
+    def __onSegmentCompletionChanged(self, segment: VideoStreamSegment) -> None:
+        """
+        セグメントがエンコード完了状態になった・エンコード完了状態から戻った際に呼び出され、バッファ範囲を差分更新する
+
+        Args:
+            segment (VideoStreamSegment): 状態が変化した HLS セグメント
+        """
+
+        # エンコード完了済みのシーケンス番号のリストを更新する
+        index = bisect.bisect_left(self._completed_sequences, segment.sequence_index)
+        is_contained = index < len(self._completed_sequences) and self._completed_sequences[index] == segment.sequence_index
+        if segment.encode_status == 'Completed' and is_contained is False:
+            self._completed_sequences.insert(index, segment.sequence_index)
+        elif segment.encode_status != 'Completed' and is_contained is True:
+            del self._completed_sequences[index]
+        else:
+            return
+
+        # バッファ範囲を再計算する (範囲の両端が変わっていなければ通知されない)
+        self.__updateBufferRange()
+
+
+    def __updateBufferRange(self) -> None:
+        """
+        エンコード完了済みの最初と最後のセグメントからバッファ範囲を算出し、変化していれば購読者に通知する
+        """
+
+        if len(self._completed_sequences) > 0 and len(self._segments) > 0:
             # エンコード済みの最初のセグメントの開始時刻から最後のセグメントの終了時刻までを計算
-            first_segment = encoded_segments[0]
-            last_segment = encoded_segments[-1]
+            first_segment = self._segments[self._completed_sequences[0]]
+            last_segment = self._segments[self._completed_sequences[-1]]
             buffer_start = (first_segment.start_dts - self._base_dts) / ts.HZ
             buffer_end = (last_segment.start_dts - self._base_dts) / ts.HZ + last_segment.duration_seconds
-            return (buffer_start, buffer_end)
+            buffer_range = (buffer_start, buffer_end)
         else:
-            # エンコード済みのセグメントがない場合は (0, 0) を返す
-            return (0, 0)
+            # エンコード済みのセグメントがない場合は (0, 0) とする
+            buffer_range = (0, 0)
+
+        if buffer_range == self._buffer_range:
+            return
+        self._buffer_range = buffer_range
+
+        # 待機中の購読者を起こし、次の変化を待つための新しい asyncio.Event に差し替える
+        self._buffer_range_changed.set()
+        self._buffer_range_changed = asyncio.Event()
 
 
     async def getVirtualPlaylist(self, cache_key: str | None = None) -> str:
@@ -228,6 +453,7 @@ class VideoStream:
                 )
 
             # キーフレーム情報を取得
+            ## key_frames は DB から読み込んだバイナリをコピーせずに参照する NumPy 配列のビューで、ここで初めてデコードされる
             key_frames = self.recorded_program.recorded_video.key_frames
             if len(key_frames) < 2:  # 最低2つのキーフレームが必要
                 logging.error(f'{self.log_prefix} Not enough keyframes.')
@@ -236,54 +462,50 @@ class VideoStream:
                     detail = 'Not enough keyframes',
                 )
 
-            # 最初のキーフレームの DTS を基準として保存する
-            self._base_dts = key_frames[0]['dts']
+            # 以降のループで NumPy のスカラー型を扱わないよう、offset と DTS をそれぞれ Python の int のリストに変換する
+            key_frame_offsets: list[int] = key_frames[:, 0].tolist()
+            key_frame_dts: list[int] = key_frames[:, 1].tolist()
 
-            # キーフレーム間隔の最大値を計算する
-            max_key_frame_interval = 0.0
-            for i in range(1, len(key_frames)):
-                current_frame = key_frames[i - 1]
-                next_frame = key_frames[i]
-                interval = (next_frame['dts'] - current_frame['dts']) / ts.HZ
-                max_key_frame_interval = max(max_key_frame_interval, interval)
+            # 最初のキーフレームの DTS を基準として保存する
+            self._base_dts = key_frame_dts[0]
 
             segment_sequence = 0
             accumulated_duration: float = 0.0
-            # セグメントの開始フレーム（フレーム情報全体を保持）
-            segment_start_frame = key_frames[0]
+            # セグメントの開始フレームのインデックス
+            segment_start_index = 0
 
             # キーフレーム情報を先頭から順に処理し、各間隔を累積していく
-            for i in range(1, len(key_frames)):
-                current_frame = key_frames[i - 1]
-                next_frame = key_frames[i]
+            for i in range(1, len(key_frame_dts)):
                 # 各キーフレーム間の時間差を算出
-                duration = (next_frame['dts'] - current_frame['dts']) / ts.HZ
+                duration = (key_frame_dts[i] - key_frame_dts[i - 1]) / ts.HZ
                 accumulated_duration += duration
 
                 # キーフレーム間隔が SEGMENT_DURATION_SECONDS 以上になったら、新しいセグメントに切り替える
                 if accumulated_duration >= self.SEGMENT_DURATION_SECONDS:
                     self._segments.append(VideoStreamSegment(
                         sequence_index = segment_sequence,
-                        start_file_position = segment_start_frame['offset'],
-                        start_dts = segment_start_frame['dts'],
+                        start_file_position = key_frame_offsets[segment_start_index],
+                        start_dts = key_frame_dts[segment_start_index],
                         duration_seconds = accumulated_duration,
                         encode_status = 'Pending',
                         encoded_segment_ts_future = asyncio.Future(),
+                        on_completion_changed = self.__onSegmentCompletionChanged,
                     ))
                     segment_sequence += 1
-                    # 次のセグメントの開始フレームとして、現在の next_frame を設定
-                    segment_start_frame = next_frame
+                    # 次のセグメントの開始フレームとして、現在のキーフレームを設定
+                    segment_start_index = i
                     accumulated_duration = 0.0
 
             # ループ後に、残りの時間がある場合は最後のセグメントとして追加
             if accumulated_duration > 0:
                 self._segments.append(VideoStreamSegment(
                     sequence_index = segment_sequence,
-                    start_file_position = segment_start_frame['offset'],
-                    start_dts = segment_start_frame['dts'],
+                    start_file_position = key_frame_offsets[segment_start_index],
+                    start_dts = key_frame_dts[segment_start_index],
                     duration_seconds = accumulated_duration,
                     encode_status = 'Pending',
                     encoded_segment_ts_future = asyncio.Future(),
+                    on_completion_changed = self.__onSegmentCompletionChanged,
                 ))
 
             # HLS セグメント長の最小値・最大値・平均値をロギング
@@ -344,19 +566,25 @@ class VideoStream:
         # シーケンス番号に対応する HLS セグメントを取得する
         segment = self._segments[segment_sequence]
 
-        # 当該セグメントのエンコードがまだ完了していない場合は、エンコードタスクを非同期で開始する
-        if segment.encode_status == 'Pending':
-            # 既存のエンコードタスクをキャンセル
-            await self._encoding_task.cancel()
-            logging.info(f'{self.log_prefix}[Segment {segment_sequence}] Previous Encoding Task Canceled.')
+        # リクエストされたセグメントを現在の再生位置とみなす
+        self._playback_sequence = segment_sequence
 
-            # 新しいエンコードタスクのインスタンスを初期化
-            ## エンコードタスクは基本使い回せないので、再度新しく初期化する
-            self._encoding_task = VideoEncodingTask(self)
+        # 当該セグメントが HLS セグメントキャッシュに存在する場合は、エンコードタスクを再起動せずにキャッシュから返す
+        ## 実行中のエンコードタスクはそのまま先のセグメントのエンコードを続けられる
+        if segment.encode_status == 'Pending':
+            cached_segment_ts = await VideoSegmentCache.get(self.getSegmentCacheKey(segment))
+            if cached_segment_ts is not None and segment.encode_status == 'Pending':
+                segment.setCompleted(cached_segment_ts)
+                logging.info(f'{self.log_prefix}[Segment {segment_sequence}] Served HLS Segment from Cache.')
 
-            # 新しいエンコードタスクを開始
-            asyncio.create_task(self._encoding_task.run(segment_sequence))
-            logging.info(f'{self.log_prefix}[Segment {segment_sequence}] New Encoding Task Started.')
+        # 当該セグメントのエンコードがまだ完了していない場合は、エンコードタスクを非同期で開始する
+        ## ただし、実行中のエンコードタスクの先読み範囲内であれば、エンコードタスクを再起動せずにそのままエンコードの完了を待つ
+        if segment.encode_status == 'Pending' and self.isWithinPrefetchWindow(segment_sequence) is False:
+            self._prefetch_miss_count += 1
+            logging.debug(f'{self.log_prefix}[Segment {segment_sequence}] Prefetch missed.')
+            await self.restartEncodingTask(segment_sequence)
+        else:
+            self._prefetch_hit_count += 1
 
         # セグメントデータの Future が完了したらそのデータを返す
         encoded_segment_ts = await asyncio.shield(segment.encoded_segment_ts_future)
@@ -370,6 +598,9 @@ class VideoStream:
             await oldest_segment.resetState()
             logging.info(f'{self.log_prefix}[Segment {oldest_segment.sequence_index}] Reset segment data to free memory.')
 
+        # 次に再生されるセグメントが先読みされているかを確認する
+        await self.schedulePrefetch()
+
         return encoded_segment_ts
 
 
@@ -385,6 +616,16 @@ class VideoStream:
 
         # すべての HLS セグメントを削除する
         self._segments = []
+        self._completed_sequences = []
+        self.__updateBufferRange()
+
+        # 先読みのヒット率をロギング
+        prefetch_request_count = self._prefetch_hit_count + self._prefetch_miss_count
+        if prefetch_request_count > 0:
+            logging.info(
+                f'{self.log_prefix} Prefetch stats: {self._prefetch_hit_count} hits / {self._prefetch_miss_count} misses '
+                f'(hit rate: {self._prefetch_hit_count / prefetch_request_count * 100:.1f}%)'
+            )
 
         # アクティブな間保持されていたインスタンスを削除する
         ## これにより、このインスタンスには誰も参照できなくなるため、ガベージコレクションによりメモリから解放される (はず)
@@ -0,0 +1,361 @@
+
+import asyncio
+import time
+from typing import ClassVar, Literal
+
+import anyio
+import httpx
+
+from app import logging
+from app.config import Config
+from app.constants import LOGO_CACHE_DIR
+from app.utils import GetMirakurunAPIEndpointURL
+from app.utils.edcb.CtrlCmdUtil import CtrlCmdUtil
+from app.utils.edcb.EDCBUtil import EDCBUtil
+from app.utils.HTTPClientPool import HTTPClientPool
+
+
+# 局ロゴの MIME タイプ (EDCB の LogoData フォルダには BMP 形式のロゴが含まれることがある)
+LogoMediaType = Literal['image/png', 'image/bmp']
+
+
+class ChannelLogoCache:
+    """
+    KonomiTV に同梱されていない局ロゴを EDCB / Mirakurun から取得し、(ネットワーク ID, サービス ID) をキーにディスクにキャッシュするクラス
+    以前はロゴ API へのリクエストの度に EDCB から LogoData.ini とディレクトリ一覧を取得して解析し直していたため、
+    番組表のように多数のチャンネルのロゴを一度に表示すると、チャンネル数の2倍以上の CtrlCmd のやり取りが発生していた
+    キャッシュしたロゴは REVALIDATE_INTERVAL を過ぎたらバックグラウンドで取得し直し、次回以降のリクエストで新しいロゴを返す
+    """
+
+    # キャッシュしたロゴを取得し直すまでの秒数 (1日)
+    ## 局ロゴは EPG の取得時にまれに更新される程度なので、長めに取る
+    REVALIDATE_INTERVAL: ClassVar[float] = 60 * 60 * 24
+
+    # ロゴが存在しなかったチャンネルを記憶しておく秒数 (1時間)
+    ## この間はデフォルトのロゴを返し、EDCB / Mirakurun にロゴを問い合わせない
+    NEGATIVE_CACHE_TTL: ClassVar[float] = 60 * 60
+
+    # EDCB の LogoData フォルダから取得するロゴの種類の優先順位 (なるべく画質が良いロゴタイプのものを取得する)
+    EDCB_LOGO_TYPE_PRIORITY: ClassVar[tuple[int, ...]] = (5, 2, 4, 1, 3, 0)
+
+    # Mirakurun からロゴを取得する際の最大同時リクエスト数
+    MIRAKURUN_MAX_CONCURRENT_REQUESTS: ClassVar[int] = 4
+
+    # EDCB から取得した (LogoData.ini の内容, LogoData フォルダのディレクトリ一覧) のメモ
+    ## EDCB が EPG の取得時にロゴを保存するため、EPG データの更新通知を受け取るかチャンネル情報を更新した際に破棄する
+    __edcb_logo_index: ClassVar[tuple[str, str] | None] = None
+    __edcb_logo_index_lock: ClassVar[asyncio.Lock] = asyncio.Lock()
+
+    # ロゴが存在しなかったチャンネルの (ネットワーク ID, サービス ID) と、それを確認した時刻
+    __missing_logos: ClassVar[dict[tuple[int, int], float]] = {}
+
+    # バックグラウンドで取得し直している最中のチャンネルの (ネットワーク ID, サービス ID) と、そのタスク
+    ## タスクの参照を保持しておかないと、実行中にガベージコレクションされることがある
+    __revalidate_tasks: ClassVar[dict[tuple[int, int], asyncio.Task[None]]] = {}
+
+    # ロゴのキャッシュを事前に作成するバックグラウンドタスク
+    __warm_task: ClassVar[asyncio.Task[None] | None] = None
+
+
+    @staticmethod
+    def getCachePath(network_id: int, service_id: int, media_type: LogoMediaType) -> anyio.Path:
+        """
+        ロゴのキャッシュファイルのパスを取得する
+
+        Args:
+            network_id (int): ネットワーク ID
+            service_id (int): サービス ID
+            media_type (LogoMediaType): ロゴの MIME タイプ
+
+        Returns:
+            anyio.Path: ロゴのキャッシュファイルのパス
+        """
+
+        extension = 'bmp' if media_type == 'image/bmp' else 'png'
+        return anyio.Path(LOGO_CACHE_DIR / f'NID{network_id}-SID{service_id}.{extension}')
+
+
+    @classmethod
+    async def get(cls, network_id: int, service_id: int) -> tuple[bytes, LogoMediaType] | None:
+        """
+        EDCB / Mirakurun から取得した局ロゴを、キャッシュがあればキャッシュから取得する
+        キャッシュがない場合は EDCB / Mirakurun から取得してキャッシュに保存する
+
+        Args:
+            network_id (int): ネットワーク ID
+            service_id (int): サービス ID
+
+        Returns:
+            tuple[bytes, LogoMediaType] | None: ロゴデータと MIME タイプ (ロゴが存在しない場合は None)
+        """
+
+        key = (network_id, service_id)
+
+        # キャッシュが存在すればそれを返す
+        for media_type in ('image/png', 'image/bmp'):
+            cache_path = cls.getCachePath(network_id, service_id, media_type)
+            try:
+                cache_stat = await cache_path.stat()
+                logo_data = await cache_path.read_bytes()
+            except FileNotFoundError:
+                continue
+
+            # 一定期間が経過したキャッシュは、今回はそのまま返しつつバックグラウンドで取得し直す
+            if time.time() - cache_stat.st_mtime > cls.REVALIDATE_INTERVAL and key not in cls.__revalidate_tasks:
+                cls.__revalidate_tasks[key] = asyncio.create_task(cls.__revalidate(network_id, service_id))
+            return (logo_data, media_type)
+
+        # 直近でロゴが存在しないことを確認したチャンネル
+        missing_at = cls.__missing_logos.get(key)
+        if missing_at is not None and time.time() - missing_at < cls.NEGATIVE_CACHE_TTL:
+            return None
+
+        logos = await cls.__fetchLogos([key])
+        if key not in logos:
+            cls.__missing_logos[key] = time.time()
+            return None
+        await cls.__saveLogo(network_id, service_id, *logos[key])
+        return logos[key]
+
+
+    @classmethod
+    def startWarming(cls, service_keys: list[tuple[int, int]]) -> None:
+        """
+        指定されたチャンネルのロゴのキャッシュをバックグラウンドで作成する
+        チャンネル情報の更新後に呼び出され、番組表などを初めて表示した際にロゴの取得待ちが発生しないようにする
+        既に作成中の場合は何もしない
+
+        Args:
+            service_keys (list[tuple[int, int]]): キャッシュを作成するチャンネルの (ネットワーク ID, サービス ID) のリスト
+        """
+
+        if cls.__warm_task is not None and not cls.__warm_task.done():
+            return
+        cls.__warm_task = asyncio.create_task(cls.__warm(service_keys))
+
+
+    @classmethod
+    def invalidateEDCBLogoIndex(cls) -> None:
+        """
+        メモしている EDCB の LogoData.ini とディレクトリ一覧を破棄し、次回のロゴ取得時に取得し直すようにする
+        ロゴが存在しないことを記憶しているチャンネルも、新たにロゴが保存されている可能性があるため忘れる
+        """
+
+        cls.__edcb_logo_index = None
+        cls.__missing_logos.clear()
+
+
+    @classmethod
+    async def __warm(cls, service_keys: list[tuple[int, int]]) -> None:
+        """
+        指定されたチャンネルのうち、まだロゴのキャッシュがないチャンネルのロゴをまとめて取得してキャッシュする
+
+        Args:
+            service_keys (list[tuple[int, int]]): キャッシュを作成するチャンネルの (ネットワーク ID, サービス ID) のリスト
+        """
+
+        try:
+            target_keys: list[tuple[int, int]] = []
+            for network_id, service_id in service_keys:
+                if not await cls.getCachePath(network_id, service_id, 'image/png').exists() and \
+                   not await cls.getCachePath(network_id, service_id, 'image/bmp').exists():
+                    target_keys.append((network_id, service_id))
+            if len(target_keys) == 0:
+                return
+
+            start_time = time.time()
+            logos = await cls.__fetchLogos(target_keys)
+            for (network_id, service_id), (logo_data, media_type) in logos.items():
+                await cls.__saveLogo(network_id, service_id, logo_data, media_type)
+            now = time.time()
+            for key in target_keys:
+                if key not in logos:
+                    cls.__missing_logos[key] = now
+            logging.debug(f'[ChannelLogoCache] Warmed logo cache. ({len(logos)}/{len(target_keys)} logos / {now - start_time:.2f} sec)')
+        except Exception as ex:
+            logging.warning('[ChannelLogoCache] Failed to warm logo cache:', exc_info=ex)
+
+
+    @classmethod
+    async def __revalidate(cls, network_id: int, service_id: int) -> None:
+        """
+        キャッシュしたロゴを EDCB / Mirakurun から取得し直す
+        取得できなかった場合は一時的な接続エラーの可能性があるため、キャッシュを消さずに次の再取得までの期間を延ばす
+
+        Args:
+            network_id (int): ネットワーク ID
+            service_id (int): サービス ID
+        """
+
+        key = (network_id, service_id)
+        try:
+            logos = await cls.__fetchLogos([key])
+            if key in logos:
+                await cls.__saveLogo(network_id, service_id, *logos[key])
+            else:
+                for media_type in ('image/png', 'image/bmp'):
+                    cache_path = cls.getCachePath(network_id, service_id, media_type)
+                    if await cache_path.exists():
+                        await cache_path.touch()
+        except Exception as ex:
+            logging.warning(f'[ChannelLogoCache] Failed to revalidate logo cache (NID{network_id}-SID{service_id}):', exc_info=ex)
+        finally:
+            cls.__revalidate_tasks.pop(key, None)
+
+
+    @classmethod
+    async def __saveLogo(cls, network_id: int, service_id: int, logo_data: bytes, media_type: LogoMediaType) -> None:
+        """
+        ロゴをキャッシュに保存する
+        読み込み中のリクエストに書きかけのファイルを返さないよう、一時ファイルに書き込んでから置き換える
+
+        Args:
+            network_id (int): ネットワーク ID
+            service_id (int): サービス ID
+            logo_data (bytes): ロゴデータ
+            media_type (LogoMediaType): ロゴの MIME タイプ
+        """
+
+        cache_path = cls.getCachePath(network_id, service_id, media_type)
+        await cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_path.with_name(cache_path.name + '.tmp')
+        await temp_path.write_bytes(logo_data)
+        await temp_path.replace(cache_path)
+
+        # PNG と BMP でロゴの形式が変わった場合は、古い形式のキャッシュを削除する
+        other_path = cls.getCachePath(network_id, service_id, 'image/bmp' if media_type == 'image/png' else 'image/png')
+        await other_path.unlink(missing_ok=True)
+        cls.__missing_logos.pop((network_id, service_id), None)
+
+
+    @classmethod
+    async def __fetchLogos(cls, service_keys: list[tuple[int, int]]) -> dict[tuple[int, int], tuple[bytes, LogoMediaType]]:
+        """
+        EDCB または Mirakurun から、指定されたチャンネルのロゴをまとめて取得する
+
+        Args:
+            service_keys (list[tuple[int, int]]): ロゴを取得するチャンネルの (ネットワーク ID, サービス ID) のリスト
+
+        Returns:
+            dict[tuple[int, int], tuple[bytes, LogoMediaType]]: (ネットワーク ID, サービス ID) をキーとしたロゴデータと MIME タイプ (ロゴが存在しないチャンネルは含まれない)
+        """
+
+        if Config().general.backend == 'EDCB':
+            return await cls.__fetchLogosFromEDCB(service_keys)
+        elif Config().general.backend == 'Mirakurun':
+            return await cls.__fetchLogosFromMirakurun(service_keys)
+        return {}
+
+
+    @classmethod
+    async def __getEDCBLogoIndex(cls, edcb: CtrlCmdUtil) -> tuple[str, str] | None:
+        """
+        EDCB の LogoData.ini と LogoData フォルダのディレクトリ一覧を取得する
+        一度取得した内容は invalidateEDCBLogoIndex() が呼ばれるまで使い回す
+
+        Args:
+            edcb (CtrlCmdUtil): CtrlCmdUtil のインスタンス
+
+        Returns:
+            tuple[str, str] | None: (LogoData.ini の内容, LogoData フォルダのディレクトリ一覧) (取得できなかった場合は None)
+        """
+
+        async with cls.__edcb_logo_index_lock:
+            if cls.__edcb_logo_index is None:
+                files = await edcb.sendFileCopy2(['LogoData.ini', 'LogoData\\*.*']) or []
+                if len(files) == 2:
+                    cls.__edcb_logo_index = (
+                        EDCBUtil.convertBytesToString(files[0]['data']),
+                        EDCBUtil.convertBytesToString(files[1]['data']),
+                    )
+            return cls.__edcb_logo_index
+
+
+    @classmethod
+    async def __fetchLogosFromEDCB(cls, service_keys: list[tuple[int, int]]) -> dict[tuple[int, int], tuple[bytes, LogoMediaType]]:
+        """
+        EDCB の LogoData フォルダから、指定されたチャンネルのロゴをまとめて取得する
+        ロゴファイルは1回の CMD_EPG_SRV_FILE_COPY2 でまとめて取得する
+
+        Args:
+            service_keys (list[tuple[int, int]]): ロゴを取得するチャンネルの (ネットワーク ID, サービス ID) のリスト
+
+        Returns:
+            dict[tuple[int, int], tuple[bytes, LogoMediaType]]: (ネットワーク ID, サービス ID) をキーとしたロゴデータと MIME タイプ
+        """
+
+        # CtrlCmdUtil を初期化
+        edcb = CtrlCmdUtil()
+        edcb.setConnectTimeOutSec(5)  # 5秒後にタイムアウト
+
+        logo_index = await cls.__getEDCBLogoIndex(edcb)
+        if logo_index is None:
+            return {}
+        logo_data_ini, logo_dir_index = logo_index
+
+        # 各チャンネルのロゴのファイル名を LogoData.ini とディレクトリ一覧から特定する
+        logo_names: dict[tuple[int, int], str] = {}
+        for network_id, service_id in service_keys:
+            logo_id = EDCBUtil.getLogoIDFromLogoDataIni(logo_data_ini, network_id, service_id)
+            if logo_id < 0:
+                continue
+            for logo_type in cls.EDCB_LOGO_TYPE_PRIORITY:
+                logo_name = EDCBUtil.getLogoFileNameFromDirectoryIndex(logo_dir_index, network_id, logo_id, logo_type)
+                if logo_name is not None:
+                    logo_names[(network_id, service_id)] = logo_name
+                    break
+        if len(logo_names) == 0:
+            return {}
+
+        # 同じロゴを共有するチャンネルもあるので、重複を除いてからまとめて取得する
+        unique_logo_names = list(dict.fromkeys(logo_names.values()))
+        files = await edcb.sendFileCopy2(['LogoData\\' + logo_name for logo_name in unique_logo_names]) or []
+        if len(files) != len(unique_logo_names):
+            return {}
+        logo_files = {logo_name: file['data'] for logo_name, file in zip(unique_logo_names, files)}
+
+        logos: dict[tuple[int, int], tuple[bytes, LogoMediaType]] = {}
+        for key, logo_name in logo_names.items():
+            logo_data = logo_files[logo_name]
+            if len(logo_data) > 0:
+                logos[key] = (bytes(logo_data), 'image/bmp' if logo_name.upper().endswith('.BMP') else 'image/png')
+        return logos
+
+
+    @classmethod
+    async def __fetchLogosFromMirakurun(cls, service_keys: list[tuple[int, int]]) -> dict[tuple[int, int], tuple[bytes, LogoMediaType]]:
+        """
+        Mirakurun / mirakc の API から、指定されたチャンネルのロゴを取得する
+        mirakc においては、ユーザーが mirakc にロゴを手動設定している場合のみ局ロゴを取得できる
+
+        Args:
+            service_keys (list[tuple[int, int]]): ロゴを取得するチャンネルの (ネットワーク ID, サービス ID) のリスト
+
+        Returns:
+            dict[tuple[int, int], tuple[bytes, LogoMediaType]]: (ネットワーク ID, サービス ID) をキーとしたロゴデータと MIME タイプ
+        """
+
+        client = HTTPClientPool.get('Mirakurun')
+        semaphore = asyncio.Semaphore(cls.MIRAKURUN_MAX_CONCURRENT_REQUESTS)
+        logos: dict[tuple[int, int], tuple[bytes, LogoMediaType]] = {}
+
+        async def FetchLogo(network_id: int, service_id: int) -> None:
+
+            # Mirakurun 形式のサービス ID
+            # NID と SID を 5 桁でゼロ埋めした上で int に変換する
+            mirakurun_service_id = int(str(network_id).zfill(5) + str(service_id).zfill(5))
+            async with semaphore:
+                try:
+                    mirakurun_logo_api_url = GetMirakurunAPIEndpointURL(f'/api/services/{mirakurun_service_id}/logo')
+                    mirakurun_logo_api_response = await client.get(mirakurun_logo_api_url, timeout=5)
+                # API に接続できなかった際は特にエラーは吐かず、デフォルトのロゴ画像を利用する
+                except (httpx.NetworkError, httpx.TimeoutException):
+                    return
+
+            # ステータスコードが 200 であれば取得したロゴデータを返す
+            # ステータスコードが 503 の場合はロゴデータが存在しない
+            if mirakurun_logo_api_response.status_code == 200 and len(mirakurun_logo_api_response.content) > 0:
+                logos[(network_id, service_id)] = (mirakurun_logo_api_response.content, 'image/png')
+
+        await asyncio.gather(*[FetchLogo(network_id, service_id) for network_id, service_id in service_keys])
+        return logos
@@ -16,7 +16,7 @@ class DriveIOLimiter:
     """
 
     # クラス変数として Semaphore の辞書を保持
-    # key: ドライブ識別子 (Windows) またはマウントポイント (Linux)
+    # key: 処理を識別するキーとドライブ識別子 (Windows) またはマウントポイント (Linux) の組
     # value: その HDD 用の Semaphore
     _drive_semaphores: ClassVar[dict[str, asyncio.Semaphore]] = {}
 
@@ -71,13 +71,16 @@ class DriveIOLimiter:
 
 
     @classmethod
-    def getSemaphore(cls, path: anyio.Path) -> asyncio.Semaphore:
+    def getSemaphore(cls, path: anyio.Path, process_key: str = 'BackgroundAnalysis') -> asyncio.Semaphore:
         """
         指定されたパスの HDD 用の Semaphore を取得する
         同一 HDD に対して同時に1つまでしかバックグラウンドタスクを実行できないようにする
+        process_key が異なる処理同士は別々の Semaphore で制限される
+        (一括スキャン時のメタデータ解析が、時間のかかるバックグラウンド解析の完了待ちで止まらないようにするため)
 
         Args:
             path (anyio.Path): 対象ファイルパス
+            process_key (str, optional): 同時実行数を制限する処理を識別するキー
 
         Returns:
             asyncio.Semaphore: 対応する HDD 用の Semaphore
@@ -85,13 +88,14 @@ class DriveIOLimiter:
 
         # ドライブの識別子を取得
         drive_id = cls.getDriveID(path)
+        semaphore_key = f'{process_key}:{drive_id}'
 
         # HDD ごとのセマフォがなければ作成
-        if drive_id not in cls._drive_semaphores:
+        if semaphore_key not in cls._drive_semaphores:
             # 同時に1つのタスクしか実行できないようにする
-            cls._drive_semaphores[drive_id] = asyncio.Semaphore(1)
+            cls._drive_semaphores[semaphore_key] = asyncio.Semaphore(1)
 
-        return cls._drive_semaphores[drive_id]
+        return cls._drive_semaphores[semaphore_key]
 
 
 if __name__ == '__main__':
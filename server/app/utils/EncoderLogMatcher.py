@@ -0,0 +1,168 @@
+
+# Type Hints を指定できるように
+# ref: https://stackoverflow.com/a/33533514/17124142
+from __future__ import annotations
+
+import re
+from collections.abc import Sequence
+from typing import ClassVar, Generic, Literal, TypeVar
+
+
+# ジェネリック型
+T = TypeVar('T')
+
+# エンコーダーの種類
+EncoderType = Literal['FFmpeg', 'QSVEncC', 'NVEncC', 'VCEEncC', 'rkmppenc']
+
+# エンコーダーの進捗を表すログの種類
+## Starting: エンコードを開始している / Buffering: バッファリングしている / ONAir: エンコードが進んでいる
+EncoderProgress = Literal['Starting', 'Buffering', 'ONAir']
+
+
+class EncoderLogMatcher(Generic[T]):
+    """
+    エンコーダーのログの行に含まれる既知の文字列を探し、対応する値 (エラーコードなど) を返すクラス
+    すべての文字列を1つの正規表現にまとめてコンパイルしておくため、行ごとに部分一致を何十回も繰り返さずに済む
+    1つの行に複数の文字列が含まれている場合は、ルールのリストで先に指定されたものが優先される
+    """
+
+    # エンコーダーの種類ごとの、エンコーダーの進捗を表すログの EncoderLogMatcher
+    __progress_matchers: ClassVar[dict[str, EncoderLogMatcher[EncoderProgress]]] = {}
+
+    # エンコーダーの種類ごとの、回復が見込めない・エンコーダーの再起動が必要なエラーのログの EncoderLogMatcher
+    __error_matchers: ClassVar[dict[str, EncoderLogMatcher[str]]] = {}
+
+
+    def __init__(self, rules: Sequence[tuple[str, T]]) -> None:
+        """
+        EncoderLogMatcher を初期化する
+
+        Args:
+            rules (Sequence[tuple[str, T]]): (ログの行に含まれる文字列, 対応する値) のリスト (先に指定したものほど優先される)
+        """
+
+        self._values = [value for _, value in rules]
+
+        # 各文字列をルールのインデックスを名前にしたグループにして、1つの正規表現にまとめる
+        ## 同じ位置から複数の文字列にマッチする場合、正規表現の選択は先に書かれたもの (優先度が高いもの) を選ぶ
+        self._pattern = re.compile('|'.join(f'(?P<r{index}>{re.escape(text)})' for index, (text, _) in enumerate(rules)))
+
+
+    def match(self, line: str) -> T | None:
+        """
+        ログの行に含まれる既知の文字列を探し、対応する値を返す
+
+        Args:
+            line (str): ログの行
+
+        Returns:
+            T | None: 最も優先度の高いルールに対応する値 (どの文字列も含まれていない場合は None)
+        """
+
+        best_index: int | None = None
+        for match in self._pattern.finditer(line):
+            index = int(match.lastgroup[1:]) if match.lastgroup is not None else None
+            if index is not None and (best_index is None or index < best_index):
+                best_index = index
+        return self._values[best_index] if best_index is not None else None
+
+
+    @classmethod
+    def getProgressMatcher(cls, encoder_type: EncoderType) -> EncoderLogMatcher[EncoderProgress]:
+        """
+        エンコーダーの進捗を表すログの EncoderLogMatcher を取得する
+
+        Args:
+            encoder_type (EncoderType): エンコーダーの種類
+
+        Returns:
+            EncoderLogMatcher[EncoderProgress]: エンコーダーの進捗を表すログの EncoderLogMatcher
+        """
+
+        if encoder_type not in cls.__progress_matchers:
+            rules: list[tuple[str, EncoderProgress]]
+            # FFmpeg
+            if encoder_type == 'FFmpeg':
+                rules = [
+                    ('arib parser was created', 'Starting'),
+                    ('Invalid frame dimensions 0x0.', 'Starting'),
+                    ('frame=    1 fps=0.0 q=0.0', 'Buffering'),
+                    ('size=       0kB time=00:00', 'Buffering'),
+                    ('frame=', 'ONAir'),
+                    ('bitrate=', 'ONAir'),
+                ]
+            # HWEncC
+            else:
+                rules = [
+                    ('opened file "pipe:0"', 'Starting'),
+                    ('starting output thread...', 'Buffering'),
+                    ('Encode Thread:', 'Buffering'),
+                    (' frames: ', 'ONAir'),
+                ]
+            cls.__progress_matchers[encoder_type] = EncoderLogMatcher(rules)
+
+        return cls.__progress_matchers[encoder_type]
+
+
+    @classmethod
+    def getErrorMatcher(cls, encoder_type: EncoderType) -> EncoderLogMatcher[str]:
+        """
+        回復が見込めない・エンコーダーの再起動が必要なエラーのログの EncoderLogMatcher を取得する
+        マッチした場合は、ライブストリームのステータス詳細に表示されるものと同じエラーコード (E-04F など) を返す
+
+        Args:
+            encoder_type (EncoderType): エンコーダーの種類
+
+        Returns:
+            EncoderLogMatcher[str]: エラーのログの EncoderLogMatcher
+        """
+
+        if encoder_type not in cls.__error_matchers:
+            rules: list[tuple[str, str]]
+            # FFmpeg
+            if encoder_type == 'FFmpeg':
+                rules = [
+                    # tsreadex から放送波が受信できなかった
+                    ('Stream map \'0:v:0\' matches no streams.', 'E-04F'),
+                    # 捕捉されないエラー
+                    ('Conversion failed!', 'ER-01F'),
+                ]
+            # HWEncC
+            else:
+                rules = [
+                    # tsreadex から放送波が受信できなかった
+                    ('error finding stream information.', 'E-05H'),
+                ]
+                if encoder_type == 'NVEncC':
+                    rules += [
+                        # 同時にエンコードできるセッション数 (Geforceだと5つ) を全て使い果たしている
+                        ('due to the NVIDIA\'s driver limitation.', 'E-06HN'),
+                    ]
+                if encoder_type == 'QSVEncC':
+                    rules += [
+                        # QSVEncC 非対応の環境
+                        ('unable to decode by qsv.', 'E-07HQ'),
+                        ('No device found for QSV encoding!', 'E-07HQ'),
+                        # QSVEncC 非対応の環境 (Linux かつ第5世代以前の Intel CPU)
+                        ('iHD_drv_video.so init failed', 'E-08HQ'),
+                    ]
+                if encoder_type == 'NVEncC':
+                    rules += [
+                        # NVEncC 非対応の環境
+                        ('CUDA not available.', 'E-09HN'),
+                    ]
+                if encoder_type == 'VCEEncC':
+                    rules += [
+                        # VCEEncC 非対応の環境
+                        ('Failed to initalize VCE factory:', 'E-10HV'),
+                        ('Assertion failed:Init() failed to vkCreateInstance', 'E-10HV'),
+                    ]
+                rules += [
+                    # --input-probesize or --input-analyze の期間内に入力ストリームの解析が終わらなかった
+                    ('Consider increasing the value for the --input-analyze and/or --input-probesize!', 'ER-02H'),
+                    # 捕捉されないエラー
+                    ('finished with error!', 'ER-03H'),
+                ]
+            cls.__error_matchers[encoder_type] = EncoderLogMatcher(rules)
+
+        return cls.__error_matchers[encoder_type]
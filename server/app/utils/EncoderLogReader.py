@@ -0,0 +1,98 @@
+
+import asyncio
+import re
+from typing import ClassVar
+
+
+class EncoderLogReader:
+    """
+    asyncio.StreamReader からエンコーダーのログ (標準エラー出力) をまとめて読み取り、\\r または \\n で行に分割して返すクラス
+    FFmpeg はコンソールの行を上書きするために frame= の進捗ログで \\r しか出力しないため、readline() では進捗ログを取得できない
+    1バイトずつ read(1) するのと比べ、await の回数をログの行数程度まで減らせる
+    """
+
+    # 1回の read() で読み取る最大サイズ (バイト)
+    READ_SIZE: ClassVar[int] = 64 * 1024
+
+    # 改行 (\r または \n) が来ないまま溜められる最大サイズ (バイト)
+    ## これを超えた場合は、改行が来ていなくてもそこまでを1行として扱う
+    MAX_LINE_LENGTH: ClassVar[int] = 64 * 1024
+
+    # 行の区切り文字 (\r または \n) にマッチする正規表現
+    LINE_SEPARATOR_PATTERN: ClassVar[re.Pattern[bytes]] = re.compile(rb'[\r\n]')
+
+
+    def __init__(self, stream_reader: asyncio.StreamReader, read_size: int = READ_SIZE) -> None:
+        """
+        EncoderLogReader を初期化する
+
+        Args:
+            stream_reader (asyncio.StreamReader): 読み取り元の StreamReader (エンコーダーの標準エラー出力)
+            read_size (int, optional): 1回の read() で読み取る最大サイズ (バイト)
+        """
+
+        self._stream_reader = stream_reader
+        self._read_size = read_size
+
+        # まだ改行が来ていない、読み取り途中の行
+        self._buffer = bytearray()
+
+
+    async def readLines(self) -> list[str]:
+        """
+        新たに出力されたログを行ごとに読み取る
+        前後の空白は取り除かれ、空行と UTF-8 としてデコードできない行は除外される
+
+        Returns:
+            list[str]: 読み取ったログの行 (EOF に達した場合は空のリスト)
+        """
+
+        while True:
+            data = await self._stream_reader.read(self._read_size)
+
+            # EOF に達した場合、改行で終わっていない残りのデータを最後の行として返す
+            if len(data) == 0:
+                if len(self._buffer) == 0:
+                    return []
+                raw_lines = [bytes(self._buffer)]
+                self._buffer.clear()
+                lines = self._decodeLines(raw_lines)
+                if len(lines) > 0:
+                    return lines
+                continue
+
+            self._buffer += data
+
+            # 最後の区切り文字までを行に分割し、書き込み途中の行は次回の読み取りまでバッファに残す
+            raw_lines = self.LINE_SEPARATOR_PATTERN.split(self._buffer)
+            self._buffer = bytearray(raw_lines.pop())
+            if len(self._buffer) > self.MAX_LINE_LENGTH:
+                raw_lines.append(bytes(self._buffer))
+                self._buffer.clear()
+
+            lines = self._decodeLines(raw_lines)
+            if len(lines) > 0:
+                return lines
+
+
+    @staticmethod
+    def _decodeLines(raw_lines: list[bytes] | list[bytearray]) -> list[str]:
+        """
+        バイト列の行を文字列に変換する (空行と UTF-8 としてデコードできない行は除外する)
+
+        Args:
+            raw_lines (list[bytes] | list[bytearray]): バイト列の行
+
+        Returns:
+            list[str]: 文字列の行
+        """
+
+        lines: list[str] = []
+        for raw_line in raw_lines:
+            try:
+                line = raw_line.decode('utf-8').strip()
+            except UnicodeDecodeError:
+                continue
+            if line != '':
+                lines.append(line)
+        return lines
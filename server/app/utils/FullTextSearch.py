@@ -0,0 +1,116 @@
+
+import time
+from typing import ClassVar
+
+from tortoise import connections
+
+from app import logging
+
+
+class FullTextSearch:
+    """
+    録画番組・シリーズ番組の検索に使う、SQLite FTS5 の全文検索インデックスを扱うクラス
+    インデックスは trigram トークナイザーを使った仮想テーブル (recorded_programs_fts / series_fts) で、
+    分かち書きをせずに日本語の部分一致検索ができる
+    元のテーブルとの同期は DB のトリガーで行われるため、録画番組やシリーズ番組の追加・更新・削除時に別途処理する必要はない
+    """
+
+    # trigram トークナイザーのインデックスで検索できるキーワードの最小文字数
+    ## 2文字以下のキーワードは trigram (3文字単位) に分解できないため、インデックスを使わずに LIKE で検索する
+    MIN_MATCH_KEYWORD_LENGTH: ClassVar[int] = 3
+
+    # bm25() で録画番組の検索結果をランク付けする際の、各カラムの重み
+    ## recorded_programs_fts のカラム順 (title, series_title, subtitle, channel_name) に対応する
+    RECORDED_PROGRAMS_BM25_WEIGHTS: ClassVar[tuple[float, ...]] = (10.0, 5.0, 2.0, 1.0)
+
+    # bm25() でシリーズ番組の検索結果をランク付けする際の、各カラムの重み
+    ## series_fts のカラム順 (title, description) に対応する
+    SERIES_BM25_WEIGHTS: ClassVar[tuple[float, ...]] = (10.0, 1.0)
+
+
+    @staticmethod
+    def splitKeywords(query: str) -> list[str]:
+        """
+        検索クエリを半角・全角スペースで区切り、キーワードのリストに変換する
+
+        Args:
+            query (str): 検索クエリ
+
+        Returns:
+            list[str]: キーワードのリスト
+        """
+
+        return [keyword.strip() for keyword in query.replace('　', ' ').split(' ') if keyword.strip()]
+
+
+    @classmethod
+    def buildMatchExpression(cls, keywords: list[str]) -> tuple[str | None, list[str]]:
+        """
+        キーワードのリストから、FTS5 の MATCH 演算子に渡す AND 検索の検索式を組み立てる
+        MIN_MATCH_KEYWORD_LENGTH に満たないキーワードは検索式に含めず、LIKE で検索するキーワードとして別に返す
+
+        Args:
+            keywords (list[str]): キーワードのリスト
+
+        Returns:
+            tuple[str | None, list[str]]: (MATCH 演算子に渡す検索式 (該当するキーワードがない場合は None), LIKE で検索するキーワードのリスト)
+        """
+
+        match_keywords: list[str] = []
+        like_keywords: list[str] = []
+        for keyword in keywords:
+            if len(keyword) >= cls.MIN_MATCH_KEYWORD_LENGTH:
+                # キーワードをダブルクォートで囲み、FTS5 の演算子や記号として解釈されないようにする
+                ## キーワード内のダブルクォートは2つ重ねてエスケープする
+                match_keywords.append('"' + keyword.replace('"', '""') + '"')
+            else:
+                like_keywords.append(keyword)
+
+        if len(match_keywords) == 0:
+            return None, like_keywords
+        return ' AND '.join(match_keywords), like_keywords
+
+
+    @classmethod
+    def getBM25Expression(cls, table_name: str) -> str:
+        """
+        検索結果のランク付けに使う bm25() の SQL 式を返す
+        bm25() は関連性が高いほど小さな値を返すため、昇順でソートする
+
+        Args:
+            table_name (str): FTS5 の仮想テーブル名 (recorded_programs_fts または series_fts)
+
+        Returns:
+            str: bm25() の SQL 式
+        """
+
+        weights = cls.RECORDED_PROGRAMS_BM25_WEIGHTS if table_name == 'recorded_programs_fts' else cls.SERIES_BM25_WEIGHTS
+        return f'bm25({table_name}, {", ".join(str(weight) for weight in weights)})'
+
+
+    @staticmethod
+    async def rebuild() -> None:
+        """
+        全文検索インデックスを元のテーブルから作り直す
+        通常はトリガーで同期されているため不要だが、DB を外部のツールで編集した場合などにインデックスを整合させるために使う
+        """
+
+        start_time = time.time()
+        logging.info('Rebuilding full-text search index...')
+
+        connection = connections.get('default')
+        await connection.execute_script("""
+            BEGIN;
+            DELETE FROM "recorded_programs_fts";
+            INSERT INTO "recorded_programs_fts" ("rowid", "title", "series_title", "subtitle", "channel_name")
+                SELECT rp."id", rp."title", COALESCE(rp."series_title", ''), COALESCE(rp."subtitle", ''), COALESCE(ch."name", '')
+                FROM "recorded_programs" rp LEFT JOIN "channels" ch ON rp."channel_id" = ch."id";
+            DELETE FROM "series_fts";
+            INSERT INTO "series_fts" ("rowid", "title", "description")
+                SELECT "id", "title", "description" FROM "series";
+            COMMIT;
+            INSERT INTO "recorded_programs_fts" ("recorded_programs_fts") VALUES ('optimize');
+            INSERT INTO "series_fts" ("series_fts") VALUES ('optimize');
+        """)
+
+        logging.info(f'Full-text search index rebuilt. ({time.time() - start_time:.2f} sec)')
@@ -0,0 +1,196 @@
+
+import asyncio
+import importlib.util
+import os
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any, ClassVar, Literal
+
+import httpx
+
+from app import logging
+from app.constants import API_REQUEST_HEADERS
+
+
+# 接続先の上流サーバーの種類
+## Mirakurun: Mirakurun / mirakc の API (ローカルネットワーク内)
+## External: GitHub API・ニコニコ・NX-Jikkyo などのインターネット上の API
+## DataBroadcasting: データ放送 (BML) から要求されるインターネット上のサイト (証明書を検証しない・タイムアウトしない)
+## TwitterVideo: Twitter の動画配信サーバー (長時間のストリーミング転送を伴う)
+UpstreamType = Literal['Mirakurun', 'External', 'DataBroadcasting', 'TwitterVideo']
+
+
+class HTTPClientPool:
+    """
+    上流サーバーごとに httpx.AsyncClient をアプリケーションの起動中使い回すためのクラス
+    以前はリクエストの度に httpx.AsyncClient を作成していたため、毎回 TCP 接続・TLS ハンドシェイクからやり直しになっていた
+    上流サーバーごとにコネクションプールを分けているので、データ放送や Twitter 動画のプロキシで接続が埋まっても
+    Mirakurun / mirakc へのリクエストが待たされることはない
+
+    httpx.AsyncClient は作成されたイベントループに紐づくため、クライアントはプロセス・イベントループごとに作成する
+    (番組情報の更新はマルチプロセスで別のイベントループ上で実行されるため)
+    共有のクライアントを閉じてしまわないよう、利用側では async with を使わないこと
+    """
+
+    # HTTP/2 を利用するには h2 パッケージが必要なので、インストールされている場合のみ有効にする
+    IS_HTTP2_AVAILABLE: ClassVar[bool] = importlib.util.find_spec('h2') is not None
+
+    # 上流サーバーごとの httpx.AsyncClient の設定
+    UPSTREAM_CONFIGS: ClassVar[dict[UpstreamType, dict[str, Any]]] = {
+        'Mirakurun': {
+            # Mirakurun / mirakc は HTTP/1.1 のみ対応
+            'http2': False,
+            # 3 秒応答がない場合はタイムアウトする
+            'timeout': 3.0,
+            'limits': httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0),
+        },
+        'External': {
+            'http2': True,
+            # 3 秒応答がない場合はタイムアウトする
+            'timeout': 3.0,
+            'limits': httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60.0),
+        },
+        'DataBroadcasting': {
+            # データ放送からアクセスされるサイトは古いサーバーが多いので HTTP/1.1 で接続する
+            'http2': False,
+            # タイムアウトはデータ放送の動作を壊さないようにあえて設定しない
+            'timeout': None,
+            # データ放送からアクセスされるサイトは HTTPS の場合でも証明書が切れていることが日常茶飯事なので、証明書の検証を行わない
+            'verify': False,
+            'limits': httpx.Limits(max_connections=50, max_keepalive_connections=10, keepalive_expiry=30.0),
+        },
+        'TwitterVideo': {
+            'http2': True,
+            'timeout': 30.0,
+            'limits': httpx.Limits(max_connections=50, max_keepalive_connections=10, keepalive_expiry=60.0),
+        },
+    }
+
+    # (プロセス ID, イベントループの ID, 上流サーバーの種類) をキーとした httpx.AsyncClient のインスタンス
+    __clients: ClassVar[dict[tuple[int, int, UpstreamType], httpx.AsyncClient]] = {}
+
+    # httpx.AsyncClient と同じキーをもつ、各クライアントのトランスポート
+    ## コネクションプールの利用状況を取得するため、クライアント作成時にトランスポートを自前で作成して保持しておく
+    __transports: ClassVar[dict[tuple[int, int, UpstreamType], httpx.AsyncHTTPTransport]] = {}
+
+    # 上流サーバーごとの累計リクエスト数
+    __request_counts: ClassVar[dict[UpstreamType, int]] = {}
+
+
+    @classmethod
+    def get(cls, upstream: UpstreamType) -> httpx.AsyncClient:
+        """
+        指定された上流サーバー向けの httpx.AsyncClient を取得する
+        現在のイベントループ向けのクライアントがまだ作成されていない場合は作成する
+
+        Args:
+            upstream (UpstreamType): 上流サーバーの種類
+
+        Returns:
+            httpx.AsyncClient: 上流サーバー向けの httpx.AsyncClient
+        """
+
+        key = (os.getpid(), id(asyncio.get_running_loop()), upstream)
+        client = cls.__clients.get(key)
+        if client is not None and client.is_closed is False:
+            return client
+
+        config = cls.UPSTREAM_CONFIGS[upstream]
+        # コネクションプールの設定はトランスポートに指定する
+        transport = httpx.AsyncHTTPTransport(
+            limits = config['limits'],
+            http2 = config['http2'] is True and cls.IS_HTTP2_AVAILABLE is True,
+            verify = config.get('verify', True),
+        )
+        client = httpx.AsyncClient(
+            # KonomiTV の User-Agent を指定
+            headers = API_REQUEST_HEADERS,
+            # リダイレクトを追跡する
+            follow_redirects = True,
+            timeout = config['timeout'],
+            transport = transport,
+            # 複数のユーザー・リクエストでクライアントを共有するため、レスポンスの Cookie を保存しない
+            cookies = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+            event_hooks = {'request': [cls.__createRequestHook(upstream)]},
+        )
+        cls.__clients[key] = client
+        cls.__transports[key] = transport
+        logging.debug(f'[HTTPClientPool] Created a HTTP client for {upstream}.')
+        return client
+
+
+    @classmethod
+    def __createRequestHook(cls, upstream: UpstreamType):
+        """
+        リクエスト数を数えるためのイベントフックを作成する
+
+        Args:
+            upstream (UpstreamType): 上流サーバーの種類
+        """
+
+        async def RequestHook(request: httpx.Request) -> None:
+            cls.__request_counts[upstream] = cls.__request_counts.get(upstream, 0) + 1
+        return RequestHook
+
+
+    @classmethod
+    def getStatistics(cls) -> list[dict[str, Any]]:
+        """
+        上流サーバーごとのコネクションプールの利用状況を取得する
+        同じ上流サーバー向けのクライアントが複数のイベントループにまたがっている場合は合算する
+
+        Returns:
+            list[dict[str, Any]]: 上流サーバーごとのコネクションプールの利用状況
+        """
+
+        statistics: dict[UpstreamType, dict[str, Any]] = {}
+        for upstream, config in cls.UPSTREAM_CONFIGS.items():
+            limits: httpx.Limits = config['limits']
+            statistics[upstream] = {
+                'upstream': upstream,
+                'http2': config['http2'] is True and cls.IS_HTTP2_AVAILABLE is True,
+                'max_connections': limits.max_connections,
+                'max_keepalive_connections': limits.max_keepalive_connections,
+                'client_count': 0,
+                'active_connections': 0,
+                'idle_connections': 0,
+                'pending_requests': 0,
+                'total_requests': cls.__request_counts.get(upstream, 0),
+            }
+
+        for key, client in cls.__clients.items():
+            pid, _, upstream = key
+            if pid != os.getpid() or client.is_closed is True:
+                continue
+            statistic = statistics[upstream]
+            statistic['client_count'] += 1
+            # httpx は公開 API としてプールの状態を提供していないため、クライアント作成時に保持したトランスポートが持つ httpcore のコネクションプールから取得する
+            pool = getattr(cls.__transports.get(key), '_pool', None)
+            if pool is None:
+                continue
+            for connection in pool.connections:
+                if connection.is_idle():
+                    statistic['idle_connections'] += 1
+                else:
+                    statistic['active_connections'] += 1
+            statistic['pending_requests'] += len(getattr(pool, '_requests', []))
+
+        return list(statistics.values())
+
+
+    @classmethod
+    async def closeAll(cls) -> None:
+        """
+        現在のイベントループ向けに作成したすべての httpx.AsyncClient を閉じる
+        アプリケーションの終了時や、マルチプロセスでの処理の終了時に呼び出す
+        """
+
+        current_key = (os.getpid(), id(asyncio.get_running_loop()))
+        for key, client in list(cls.__clients.items()):
+            if key[:2] != current_key:
+                continue
+            del cls.__clients[key]
+            cls.__transports.pop(key, None)
+            try:
+                await client.aclose()
+            except Exception as ex:
+                logging.warning(f'[HTTPClientPool] Failed to close the HTTP client for {key[2]}:', exc_info=ex)
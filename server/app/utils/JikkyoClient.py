@@ -13,9 +13,10 @@ from bs4 import BeautifulSoup
 from typing_extensions import TypedDict
 
 from app import logging, schemas
-from app.constants import API_REQUEST_HEADERS, HTTPX_CLIENT, JIKKYO_CHANNELS_PATH, JST
+from app.constants import API_REQUEST_HEADERS, JIKKYO_CHANNELS_PATH, JST
 from app.models.User import User
 from app.utils import ParseDatetimeStringToJST
+from app.utils.HTTPClientPool import HTTPClientPool
 
 
 class JikkyoChannelStatus(TypedDict):
@@ -222,10 +223,10 @@ class JikkyoClient:
         # NX-Jikkyo のチャンネル情報 API から実況チャンネルのステータスを取得する
         ## サーバー混雑時は若干時間がかかることがあるのでタイムアウトを 5 秒に伸ばしている
         try:
-            async with HTTPX_CLIENT() as client:
-                response = await client.get('https://nx-jikkyo.tsukumijima.net/api/v1/channels', timeout=5.0)
-                response.raise_for_status()
-                channels_data = response.json()
+            client = HTTPClientPool.get('External')
+            response = await client.get('https://nx-jikkyo.tsukumijima.net/api/v1/channels', timeout=5.0)
+            response.raise_for_status()
+            channels_data = response.json()
         except (httpx.NetworkError, httpx.TimeoutException, httpx.HTTPStatusError):
             # エラー発生時はステータス更新を中断
             return
@@ -312,15 +313,15 @@ class JikkyoClient:
         try:
             # 実況チャンネル ID に対応するニコニコチャンネルで現在放送中のニコニコ生放送番組の ID を取得する
             nicolive_program_id = None
-            async with HTTPX_CLIENT() as client:
-                response = await client.get(f'https://ch.nicovideo.jp/{self.nicochannel_id}/live')
-                response.raise_for_status()
-                soup = BeautifulSoup(response.content, 'html.parser')
-                live_now = soup.find('div', id='live_now')
-                if live_now:
-                    live_link = live_now.find('a', href=lambda href: bool(href and href.startswith('https://live.nicovideo.jp/watch/lv')))  # type: ignore
-                    if live_link:
-                        nicolive_program_id = cast(str, live_link.get('href')).split('/')[-1]
+            client = HTTPClientPool.get('External')
+            response = await client.get(f'https://ch.nicovideo.jp/{self.nicochannel_id}/live')
+            response.raise_for_status()
+            soup = BeautifulSoup(response.content, 'html.parser')
+            live_now = soup.find('div', id='live_now')
+            if live_now:
+                live_link = live_now.find('a', href=lambda href: bool(href and href.startswith('https://live.nicovideo.jp/watch/lv')))  # type: ignore
+                if live_link:
+                    nicolive_program_id = cast(str, live_link.get('href')).split('/')[-1]
 
             # 何らかの理由で放送中のニコニコ生放送番組が取得できなかった
             ## メンテナンス中などで実況番組が放送されていないか、ニコニコチャンネルの HTML 構造が変更された可能性が高い
@@ -342,11 +343,11 @@ class JikkyoClient:
             )
 
             async def get_session():  # 使い回せるように関数化
-                async with HTTPX_CLIENT() as client:
-                    return await client.get(
-                        url = wsendpoint_api_url,
-                        headers = {**API_REQUEST_HEADERS, 'Authorization': f'Bearer {current_user.niconico_access_token}'},
-                    )
+                client = HTTPClientPool.get('External')
+                return await client.get(
+                    url = wsendpoint_api_url,
+                    headers = {**API_REQUEST_HEADERS, 'Authorization': f'Bearer {current_user.niconico_access_token}'},
+                )
             wsendpoint_api_response = await get_session()
 
             # ステータスコードが 401 (Unauthorized)
@@ -426,8 +427,8 @@ class JikkyoClient:
             start_time = int(recording_start_time.timestamp())
             end_time = int(recording_end_time.timestamp())
             kakolog_api_url = f'https://jikkyo.tsukumijima.net/api/kakolog/{self.jikkyo_id}?starttime={start_time}&endtime={end_time}&format=json'
-            async with HTTPX_CLIENT() as client:
-                kakolog_api_response = await client.get(kakolog_api_url, timeout=30)
+            client = HTTPClientPool.get('External')
+            kakolog_api_response = await client.get(kakolog_api_url, timeout=30)
         except (httpx.NetworkError, httpx.TimeoutException):  # 接続エラー（サーバー再起動やタイムアウトなど）
             return schemas.JikkyoComments(
                 is_success = False,
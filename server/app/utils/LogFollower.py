@@ -0,0 +1,262 @@
+
+# Type Hints を指定できるように
+# ref: https://stackoverflow.com/a/33533514/17124142
+from __future__ import annotations
+
+import asyncio
+import os
+from pathlib import Path
+from typing import ClassVar
+
+import anyio
+from watchfiles import awatch
+
+from app import logging
+
+
+class LogFollower:
+    """
+    ログファイルへの追記を監視し、追記された行を購読者に配信するクラス
+    同じログファイルを購読するすべてのクライアントで1つの監視タスクを共有し、追記された部分だけを一度読み込んで配信する
+    監視には watchfiles (inotify などの OS のファイル変更通知) を使うため、ログが書き込まれていない間はファイルを読み込まない
+    """
+
+    # 購読開始時に送信する行数の上限
+    MAX_INITIAL_LINES: ClassVar[int] = 10000
+
+    # ログファイルを末尾から遡って読み込む際のチャンクサイズ (バイト)
+    READ_CHUNK_SIZE: ClassVar[int] = 64 * 1024
+
+    # 購読者ごとのキューに溜められる、配信待ちのまとまりの最大数
+    ## 受信が追いつかないクライアントのために際限なくメモリを使わないよう、上限を超えた場合は古いものから破棄する
+    MAX_QUEUED_BATCHES: ClassVar[int] = 1000
+
+    # ログファイルのパスをキーとした LogFollower のインスタンス
+    __instances: ClassVar[dict[Path, LogFollower]] = {}
+
+
+    # 必ずログファイルごとに1つのインスタンスになるように (Singleton)
+    def __new__(cls, log_path: Path) -> LogFollower:
+
+        # まだ同じログファイルのインスタンスがないときだけ、インスタンスを生成する
+        if log_path not in cls.__instances:
+
+            # 新しい LogFollower のインスタンスを生成する
+            instance = super().__new__(cls)
+
+            # 監視するログファイルのパス
+            instance.log_path = log_path
+
+            # 購読者ごとの、追記された行のまとまりが入るキュー
+            instance._subscribers = set()
+
+            # ログファイルの追記を監視するタスク (購読者がいない間は None)
+            instance._follow_task = None
+
+            # 配信済みの最後の完全な行の直後にあたるファイル上の位置 (バイト)
+            ## 改行で終わっていない書き込み途中の行は、改行が書き込まれるまで配信しない
+            instance._position = 0
+
+            # ローテーションを検知するための、前回読み込んだ時点のログファイルの inode 番号
+            instance._inode = None
+
+            # 生成したインスタンスを登録する
+            cls.__instances[log_path] = instance
+
+        # 登録されているインスタンスを返す
+        return cls.__instances[log_path]
+
+
+    def __init__(self, log_path: Path) -> None:
+        """
+        ログファイルの LogFollower のインスタンスを取得する
+
+        Args:
+            log_path (Path): 監視するログファイルのパス
+        """
+
+        # インスタンス変数の型ヒントを定義
+        # Singleton のためインスタンスの生成は __new__() で行うが、__init__() も定義しておかないと補完がうまく効かない
+        self.log_path: Path
+        self._subscribers: set[asyncio.Queue[list[str]]]
+        self._follow_task: asyncio.Task[None] | None
+        self._position: int
+        self._inode: int | None
+
+
+    async def subscribe(self, initial_lines: int) -> tuple[list[str], int, asyncio.Queue[list[str]]]:
+        """
+        ログファイルの購読を開始する
+        購読時点のログファイルの末尾 initial_lines 行と、以降に追記された行が届くキューを返す
+        購読を終了する際は、必ず unsubscribe() を呼び出すこと
+
+        Args:
+            initial_lines (int): 購読開始時に取得する末尾の行数
+
+        Returns:
+            tuple[list[str], int, asyncio.Queue[list[str]]]: 末尾の行・その最初の行のファイル上の位置 (バイト)・追記された行が届くキュー
+        """
+
+        # 監視タスクが動いていない場合は、現在のログファイルの末尾から監視を開始する
+        if self._follow_task is None or self._follow_task.done():
+            stat = await anyio.Path(self.log_path).stat()
+            self._position = stat.st_size
+            self._inode = stat.st_ino
+            self._follow_task = asyncio.create_task(self.__follow())
+
+        # 先にキューを登録してから、現在の配信位置より前の行を読み込む
+        ## 読み込みの間に追記された行は監視タスクからキューに届くため、取りこぼしも重複も起きない
+        queue: asyncio.Queue[list[str]] = asyncio.Queue(maxsize=self.MAX_QUEUED_BATCHES)
+        self._subscribers.add(queue)
+        try:
+            lines, start_position = await anyio.to_thread.run_sync(
+                self.readLinesBefore, self._position, min(initial_lines, self.MAX_INITIAL_LINES))
+        except BaseException:
+            self.unsubscribe(queue)
+            raise
+
+        return lines, start_position, queue
+
+
+    def unsubscribe(self, queue: asyncio.Queue[list[str]]) -> None:
+        """
+        ログファイルの購読を終了する
+        購読者がいなくなった場合は、ログファイルの監視も終了する
+
+        Args:
+            queue (asyncio.Queue[list[str]]): subscribe() で取得したキュー
+        """
+
+        self._subscribers.discard(queue)
+        if len(self._subscribers) == 0 and self._follow_task is not None:
+            self._follow_task.cancel()
+            self._follow_task = None
+
+
+    def readLinesBefore(self, end_position: int, max_lines: int) -> tuple[list[str], int]:
+        """
+        ログファイルの指定された位置より前にある行を、末尾から最大 max_lines 行読み込む
+        ファイルを末尾から一定サイズずつ遡って読み込むため、ログファイルが巨大でも必要な分しか読み込まない
+        ファイル I/O を伴うため、非同期関数からは anyio.to_thread.run_sync() で呼び出すこと
+
+        Args:
+            end_position (int): 読み込みを終了するファイル上の位置 (バイト、行の先頭を指定する)
+            max_lines (int): 読み込む最大行数
+
+        Returns:
+            tuple[list[str], int]: 読み込んだ行 (空行は除外) と、その最初の行のファイル上の位置 (バイト)
+        """
+
+        with open(self.log_path, 'rb') as f:
+
+            # ローテーション直後などで指定位置がファイルサイズを超えている場合は、ファイルの末尾までとする
+            end_position = min(end_position, f.seek(0, os.SEEK_END))
+
+            # 末尾から READ_CHUNK_SIZE ずつ遡り、max_lines 行を超える改行が見つかるかファイルの先頭に到達するまで読み込む
+            start_position = end_position
+            buffer = b''
+            while start_position > 0 and buffer.count(b'\n') <= max_lines:
+                read_size = min(self.READ_CHUNK_SIZE, start_position)
+                start_position -= read_size
+                f.seek(start_position)
+                buffer = f.read(read_size) + buffer
+
+        # 途中から読み込んだ最初の行は不完全なので捨て、末尾から max_lines 行だけを残す
+        raw_lines = buffer.split(b'\n')
+        if raw_lines[-1] == b'':
+            raw_lines.pop()
+        if start_position > 0:
+            start_position += len(raw_lines.pop(0)) + 1
+        if len(raw_lines) > max_lines:
+            start_position += sum(len(raw_line) + 1 for raw_line in raw_lines[:-max_lines])
+            raw_lines = raw_lines[-max_lines:]
+
+        return self.__decodeLines(raw_lines), start_position
+
+
+    async def __follow(self) -> None:
+        """
+        ログファイルの追記を監視し、追記された行を購読者に配信し続ける
+        """
+
+        try:
+            # ローテーションで新しいログファイルが作成された場合も検知できるよう、ログファイルのあるフォルダごと監視する
+            async for _ in awatch(self.log_path.parent, watch_filter=lambda change, path: Path(path).name == self.log_path.name):
+                # 配信位置の更新はイベントループ上で行い、subscribe() で配信位置を参照した際に読み込み途中の状態が見えないようにする
+                lines, self._position, self._inode = await anyio.to_thread.run_sync(
+                    self.__readAppendedLines, self._position, self._inode)
+                if len(lines) > 0:
+                    self.__publish(lines)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logging.error(f'[LogFollower] Failed to follow the log file: {self.log_path}', exc_info=ex)
+
+
+    def __readAppendedLines(self, position: int, inode: int | None) -> tuple[list[str], int, int | None]:
+        """
+        前回の配信位置以降にログファイルに追記された完全な行を読み込む
+
+        Args:
+            position (int): 前回の配信位置 (バイト)
+            inode (int | None): 前回読み込んだ時点のログファイルの inode 番号
+
+        Returns:
+            tuple[list[str], int, int | None]: 追記された行 (空行は除外)・新しい配信位置・ログファイルの inode 番号
+        """
+
+        try:
+            with open(self.log_path, 'rb') as f:
+                # ログファイルがローテーションされた (別のファイルに置き換わった・切り詰められた) 場合は、先頭から読み直す
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != inode or stat.st_size < position:
+                    inode = stat.st_ino
+                    position = 0
+                if stat.st_size == position:
+                    return [], position, inode
+                f.seek(position)
+                data = f.read(stat.st_size - position)
+        except FileNotFoundError:
+            # ローテーション中で一時的にログファイルが存在しない
+            return [], position, inode
+
+        # 最後の改行までを配信し、書き込み途中の行は次回に回す
+        last_newline_index = data.rfind(b'\n')
+        if last_newline_index == -1:
+            return [], position, inode
+        return self.__decodeLines(data[:last_newline_index].split(b'\n')), position + last_newline_index + 1, inode
+
+
+    def __publish(self, lines: list[str]) -> None:
+        """
+        追記された行をすべての購読者のキューに配信する
+
+        Args:
+            lines (list[str]): 追記された行
+        """
+
+        for queue in self._subscribers:
+            # キューが一杯の場合は、一番古いまとまりを破棄してから追加する
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(lines)
+
+
+    @staticmethod
+    def __decodeLines(raw_lines: list[bytes]) -> list[str]:
+        """
+        ログファイルから読み込んだバイト列の行を文字列に変換する (空行は除外)
+
+        Args:
+            raw_lines (list[bytes]): バイト列の行
+
+        Returns:
+            list[str]: 文字列の行
+        """
+
+        lines: list[str] = []
+        for raw_line in raw_lines:
+            line = raw_line.decode('utf-8', errors='replace').rstrip('\r')
+            if line.strip():
+                lines.append(line)
+        return lines
@@ -30,10 +30,23 @@ class ProcessLimiter:
         """
 
         if process_key not in cls._semaphores:
-            # CPU 論理コア数を取得
-            cpu_count = psutil.cpu_count(logical=True)
-            if cpu_count is None:
-                cpu_count = 4  # 取得できない場合は4コアと仮定
-            # 同時実行数を CPU コア数の 50% に制限
-            cls._semaphores[process_key] = asyncio.Semaphore(cpu_count // 2)
+            cls._semaphores[process_key] = asyncio.Semaphore(cls.getMaxConcurrency())
         return cls._semaphores[process_key]
+
+
+    @staticmethod
+    def getMaxConcurrency() -> int:
+        """
+        外部プロセスの最大同時実行数 (CPU 論理コア数の 50%) を返す
+        プロセスプールのワーカー数など、Semaphore 以外で同時実行数を揃えたい場合にも使う
+
+        Returns:
+            int: 外部プロセスの最大同時実行数 (最低でも1)
+        """
+
+        # CPU 論理コア数を取得
+        cpu_count = psutil.cpu_count(logical=True)
+        if cpu_count is None:
+            cpu_count = 4  # 取得できない場合は4コアと仮定
+        # 同時実行数を CPU コア数の 50% に制限
+        return max(1, cpu_count // 2)
@@ -0,0 +1,334 @@
+# Type Hints を指定できるように
+# ref: https://stackoverflow.com/a/33533514/17124142
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, ClassVar
+
+from tortoise import connections
+
+from app import logging
+from app.constants import JST
+from app.utils import ParseDatetimeStringToJST, SetTimeout
+from app.utils.TSInformation import TSInformation
+
+
+@dataclass(slots=True)
+class IndexedProgram:
+    """
+    ProgramPFIndex が保持する番組情報
+    JSON へのシリアライズは現在/次の番組として初めて参照された時に行い、以降は結果を使い回す
+    """
+    start_time: datetime
+    end_time: datetime
+    row: dict[str, Any]
+    json_fragment: str | None = None
+
+
+class ProgramPFIndex:
+    """
+    チャンネルごとの現在と次の番組情報 (EIT[p/f] 相当) をメモリ上に保持するインデックス
+    チャンネル情報一覧 API は頻繁にポーリングされるため、リクエストごとに DB に問い合わせずに済むよう、
+    番組情報の更新完了時にインデックスを再構築し、番組の切り替わり時刻にタイマーで現在/次の番組を進める
+    レスポンスに埋め込むチャンネル情報と番組情報は、あらかじめ JSON 文字列にシリアライズしておく
+    """
+
+    # 番組情報を読み込む期間
+    ## 次の番組は現在時刻から24時間以内に放送開始予定の番組に限られるが、次回の再構築までの間もタイマーで番組を進められるよう、少し長めに読み込む
+    LOAD_WINDOW: ClassVar[timedelta] = timedelta(hours=25)
+
+    # 次の番組として扱う、現在時刻から放送開始までの最大の時間
+    FOLLOWING_WINDOW: ClassVar[timedelta] = timedelta(hours=24)
+
+    # チャンネルタイプの一覧 (レスポンスに含まれる順序)
+    CHANNEL_TYPES: ClassVar[tuple[str, ...]] = ('GR', 'BS', 'CS', 'CATV', 'SKY', 'BS4K')
+
+    # (network_id, service_id) → 開始時刻順に並んだ番組情報のリスト
+    _programs: ClassVar[dict[tuple[int, int], list[IndexedProgram]]] = {}
+
+    # (network_id, service_id) → (現在の番組, 次の番組)
+    _pf_programs: ClassVar[dict[tuple[int, int], tuple[IndexedProgram | None, IndexedProgram | None]]] = {}
+
+    # ライブ視聴可能なチャンネル情報の (チャンネルタイプ, display_channel_id, (network_id, service_id), サブチャンネルかどうか, シリアライズ済みの JSON 断片) のリスト
+    ## JSON 断片は末尾の閉じ括弧を含まず、リクエストごとに変わる is_display 以降のフィールドを後から連結する
+    _channels: ClassVar[list[tuple[str, str, tuple[int, int], bool, str]]] = []
+
+    # インデックスを構築済みかどうか
+    _is_built: ClassVar[bool] = False
+
+    # 次に現在/次の番組が切り替わる時刻
+    _next_boundary: ClassVar[datetime | None] = None
+
+    # 番組の切り替わり時刻に現在/次の番組を進めるタイマーをキャンセルする関数
+    _cancel_advance_timer: ClassVar[Callable[[], None] | None] = None
+
+    # インデックスの再構築を排他制御するためのロック
+    _rebuild_lock: ClassVar[asyncio.Lock | None] = None
+
+
+    @classmethod
+    async def rebuild(cls) -> None:
+        """
+        DB からチャンネル情報と番組情報を読み込み、インデックスを再構築する
+        Program.update() の完了時に呼び出される
+        """
+
+        if cls._rebuild_lock is None:
+            cls._rebuild_lock = asyncio.Lock()
+        async with cls._rebuild_lock:
+            now = datetime.now(JST)
+            connection = connections.get('default')
+
+            # 現在放送中か、LOAD_WINDOW 以内に放送開始予定の番組情報を取得する
+            ## SQL 文の時間比較は、左にいくほど時刻が小さく、右にいくほど時刻が大きくなるように統一している
+            program_rows = await connection.execute_query_dict(
+                """
+                SELECT *
+                FROM "programs"
+                WHERE (?) <= "end_time" AND "start_time" <= (?)
+                ORDER BY "start_time" ASC
+                """,
+                [now, now + cls.LOAD_WINDOW],
+            )
+
+            programs: dict[tuple[int, int], list[IndexedProgram]] = {}
+            for row in program_rows:
+                start_time = ParseDatetimeStringToJST(row['start_time'])
+                end_time = ParseDatetimeStringToJST(row['end_time'])
+                programs.setdefault((row['network_id'], row['service_id']), []).append(IndexedProgram(
+                    start_time = start_time,
+                    end_time = end_time,
+                    row = row,
+                ))
+            cls._programs = programs
+
+            await cls.__loadChannels()
+            cls._is_built = True
+            cls.__advance()
+            logging.debug(f'[ProgramPFIndex] Rebuilt the index. ({len(program_rows)} programs / {len(cls._channels)} channels)')
+
+
+    @classmethod
+    async def rebuildChannels(cls) -> None:
+        """
+        DB からチャンネル情報のみを読み込み直す
+        ニコニコ実況の勢いなど、番組情報の更新とは別に更新されるチャンネル情報を反映するために呼び出される
+        """
+
+        if cls._is_built is False:
+            return
+        await cls.__loadChannels()
+
+
+    @classmethod
+    async def getLiveChannelsJSON(cls, get_viewer_count: Callable[[str], int]) -> str:
+        """
+        チャンネル情報一覧 API のレスポンスとなる JSON 文字列を組み立てる
+        インデックスの構築後は DB に一切問い合わせず、シリアライズ済みの JSON 断片を連結するだけで済む
+
+        Args:
+            get_viewer_count (Callable[[str], int]): display_channel_id から現在の視聴者数を取得する関数
+
+        Returns:
+            str: schemas.LiveChannels 形式の JSON 文字列
+        """
+
+        # まだインデックスが構築されていなければ構築する
+        if cls._is_built is False:
+            await cls.rebuild()
+
+        # タイマーの遅延などで切り替わり時刻を過ぎている場合は、ここで現在/次の番組を進める
+        if cls._next_boundary is not None and datetime.now(JST) >= cls._next_boundary:
+            cls.__advance()
+
+        result: dict[str, list[str]] = {channel_type: [] for channel_type in cls.CHANNEL_TYPES}
+        for channel_type, display_channel_id, service_key, is_subchannel, channel_fragment in cls._channels:
+            program_present, program_following = cls._pf_programs.get(service_key, (None, None))
+
+            # サブチャンネル & 現在の番組情報が存在しないなら、表示フラグを False に設定
+            ## 現在放送中のサブチャンネルのみをチャンネルリストに表示するような挙動とする
+            ## 一般的にサブチャンネルは常に放送されているわけではないため、放送されていない時にチャンネルリストに表示する必要はない
+            is_display = not (is_subchannel is True and program_present is None)
+
+            result[channel_type].append(
+                f'{channel_fragment},'
+                f'"is_display":{"true" if is_display else "false"},'
+                f'"viewer_count":{get_viewer_count(display_channel_id)},'
+                f'"program_present":{cls.__serializeProgram(program_present)},'
+                f'"program_following":{cls.__serializeProgram(program_following)}}}'
+            )
+
+        return '{' + ','.join(f'"{channel_type}":[{",".join(fragments)}]' for channel_type, fragments in result.items()) + '}'
+
+
+    @classmethod
+    async def __loadChannels(cls) -> None:
+        """
+        ライブ視聴可能なチャンネル情報を DB から読み込み、JSON 断片にシリアライズする
+        """
+
+        # remocon_id (リモコン番号) を第一ソートキー、channel_number (チャンネル番号) を第二ソートキーとしてソート
+        connection = connections.get('default')
+        channel_rows = await connection.execute_query_dict(
+            """
+            SELECT *
+            FROM "channels"
+            WHERE "is_watchable" = 1
+            ORDER BY "remocon_id" ASC, "channel_number" ASC
+            """,
+        )
+
+        channels: list[tuple[str, str, tuple[int, int], bool, str]] = []
+        for row in channel_rows:
+            channel_dict: dict[str, Any] = {
+                'id': row['id'],
+                'display_channel_id': row['display_channel_id'],
+                'network_id': row['network_id'],
+                'service_id': row['service_id'],
+                'transport_stream_id': row['transport_stream_id'],
+                'remocon_id': row['remocon_id'],
+                'channel_number': row['channel_number'],
+                'type': row['type'],
+                'name': row['name'],
+                # 地デジチャンネルの地域名のリスト (デバッグ用)
+                # 広域放送局の場合は複数の地域名が含まれる
+                # 地デジ以外のチャンネルまたは地域が特定できない場合は None
+                'terrestrial_regions': (
+                    TSInformation.getRegionNamesFromNetworkID(row['network_id']) if row['type'] == 'GR' else None
+                ),
+                'jikkyo_force': row['jikkyo_force'],
+                # 真偽値は SQLite では 0/1 で管理されているため、bool 型に変換する
+                'is_subchannel': bool(row['is_subchannel']),
+                'is_radiochannel': bool(row['is_radiochannel']),
+                'is_watchable': True,
+            }
+            # 末尾の閉じ括弧を取り除き、後からリクエストごとに変わるフィールドを連結できるようにする
+            channel_fragment = json.dumps(channel_dict, ensure_ascii=False)[:-1]
+            channels.append((
+                row['type'],
+                row['display_channel_id'],
+                (row['network_id'], row['service_id']),
+                channel_dict['is_subchannel'],
+                channel_fragment,
+            ))
+        cls._channels = channels
+
+
+    @classmethod
+    def __advance(cls) -> None:
+        """
+        現在時刻に合わせてチャンネルごとの現在と次の番組を選び直し、次の切り替わり時刻にタイマーを設定する
+        """
+
+        now = datetime.now(JST)
+        pf_programs: dict[tuple[int, int], tuple[IndexedProgram | None, IndexedProgram | None]] = {}
+        next_boundary: datetime | None = None
+
+        for service_key, programs in cls._programs.items():
+
+            # 放送が終了した番組はもう参照されないため、インデックスから取り除く
+            if len(programs) > 0 and programs[0].end_time < now:
+                programs[:] = [program for program in programs if now <= program.end_time]
+
+            # 現在放送中の番組 (start_time <= now <= end_time) と、24時間以内に放送開始予定の番組 (now <= start_time <= now + 24h) を候補とする
+            ## 番組開始時刻が小さい順に2つ目までの開始時刻を持つ番組のみを対象とする (従来の DENSE_RANK() による絞り込みと同等)
+            candidates: list[IndexedProgram] = []
+            start_times: list[datetime] = []
+            following_limit = now + cls.FOLLOWING_WINDOW
+            upcoming_index = bisect.bisect_left(programs, now, key=lambda program: program.start_time)
+            for program in programs[:upcoming_index]:
+                if now <= program.end_time:
+                    candidates.append(program)
+            for program in programs[upcoming_index:]:
+                if program.start_time > following_limit:
+                    break
+                candidates.append(program)
+            for program in candidates:
+                if program.start_time not in start_times:
+                    start_times.append(program.start_time)
+            start_times = sorted(start_times)[:2]
+            candidates = sorted(
+                (program for program in candidates if program.start_time in start_times),
+                key=lambda program: program.start_time,
+            )
+
+            # 番組開始時刻が現在時刻よりも前 (=放送中) の最初の番組を現在の番組に、そうでない最初の番組を次の番組にする
+            program_present = next((program for program in candidates if program.start_time <= now), None)
+            program_following = next((program for program in candidates if program.start_time > now), None)
+            pf_programs[service_key] = (program_present, program_following)
+
+            # この番組の組み合わせが変わる最も早い時刻を求める
+            ## 現在の番組の終了時刻の直後か、次の番組の開始時刻
+            for boundary in (
+                program_present.end_time + timedelta(seconds=1) if program_present is not None else None,
+                program_following.start_time if program_following is not None else None,
+            ):
+                if boundary is not None and boundary > now and (next_boundary is None or boundary < next_boundary):
+                    next_boundary = boundary
+
+        cls._pf_programs = pf_programs
+        cls._next_boundary = next_boundary
+
+        # 次の切り替わり時刻にタイマーを設定する
+        if cls._cancel_advance_timer is not None:
+            cls._cancel_advance_timer()
+            cls._cancel_advance_timer = None
+        if next_boundary is not None:
+            cls._cancel_advance_timer = SetTimeout(cls.__advance, (next_boundary - now).total_seconds())
+
+
+    @staticmethod
+    def __serializeProgram(program: IndexedProgram | None) -> str:
+        """
+        番組情報を schemas.Program 形式の JSON 文字列にシリアライズする
+        一度シリアライズした結果は IndexedProgram に保持して使い回す
+
+        Args:
+            program (IndexedProgram | None): 番組情報
+
+        Returns:
+            str: JSON 文字列 (番組情報が None の場合は null)
+        """
+
+        if program is None:
+            return 'null'
+        if program.json_fragment is not None:
+            return program.json_fragment
+
+        # JSON データで格納されているカラムをデコードする
+        ## DB 由来の日時文字列は JST aware datetime に正規化してから ISO8601 文字列にする
+        ## 真偽値も SQLite では 0/1 で管理されているため、bool 型に変換する
+        row = program.row
+        program_dict: dict[str, Any] = {
+            'id': row['id'],
+            'channel_id': row['channel_id'],
+            'network_id': row['network_id'],
+            'service_id': row['service_id'],
+            'event_id': row['event_id'],
+            'title': row['title'],
+            'description': row['description'],
+            'detail': json.loads(row['detail']),
+            'start_time': program.start_time.isoformat(),
+            'end_time': program.end_time.isoformat(),
+            'duration': float(row['duration']),
+            'is_free': bool(row['is_free']),
+            'genres': json.loads(row['genres']),
+            'video_type': row['video_type'],
+            'video_codec': row['video_codec'],
+            'video_resolution': row['video_resolution'],
+            'primary_audio_type': row['primary_audio_type'],
+            'primary_audio_language': row['primary_audio_language'],
+            'primary_audio_sampling_rate': row['primary_audio_sampling_rate'],
+            'secondary_audio_type': row['secondary_audio_type'],
+            'secondary_audio_language': row['secondary_audio_language'],
+            'secondary_audio_sampling_rate': row['secondary_audio_sampling_rate'],
+        }
+        program.json_fragment = json.dumps(program_dict, ensure_ascii=False)
+        # シリアライズ後は元の行データは不要なので解放する
+        program.row = {}
+        return program.json_fragment
@@ -0,0 +1,491 @@
+from collections.abc import Generator, Iterator
+from typing import ClassVar, Literal
+
+import numpy as np
+from biim.mpeg2ts import ts
+from biim.mpeg2ts.parser import SectionParser
+from biim.mpeg2ts.pat import PATSection
+from biim.mpeg2ts.pmt import PMTSection
+
+from app import schemas
+
+
+class TSKeyFrameIndexer:
+    """
+    MPEG-TS 形式の録画ファイルを先頭から大きなブロック単位で読み取り、映像ストリームのキーフレームの位置と DTS を逐次出力するクラス
+    ffprobe -show_packets の出力をすべてメモリに読み込む方式と異なり、ファイルサイズに関わらずメモリ使用量は一定に保たれる
+    TS パケットの PID の判定は NumPy で一括で行い、Python で処理するのは映像 PES の先頭を含む TS パケットのみに限定している
+    """
+
+    # 1回に読み取るサイズ (バイト)
+    ## TS パケット 10000 個分 (1.88MB)
+    READ_SIZE: ClassVar[int] = ts.PACKET_SIZE * 10000
+
+    # キーフレームかどうかを判定するために蓄積する映像 PES のペイロードの最大サイズ (バイト)
+    ## この範囲内でスライスの NAL ユニット (MPEG-2 ではピクチャヘッダ) が見つからない場合は、random_access_indicator の有無で判定する
+    MAX_PROBE_SIZE: ClassVar[int] = 4096
+
+    # 映像ストリームの stream_type とコーデックの対応
+    VIDEO_STREAM_TYPES: ClassVar[dict[int, Literal['MPEG-2', 'H.264', 'H.265']]] = {
+        0x02: 'MPEG-2',
+        0x1B: 'H.264',
+        0x24: 'H.265',
+    }
+
+    # 映像コーデックと、PyAV (FFmpeg) で映像データを直接デコードする際のデコーダー名の対応
+    DECODER_NAMES: ClassVar[dict[Literal['MPEG-2', 'H.264', 'H.265'], str]] = {
+        'MPEG-2': 'mpeg2video',
+        'H.264': 'h264',
+        'H.265': 'hevc',
+    }
+
+
+    def __init__(self, file_path: str) -> None:
+        """
+        キーフレームのインデクサーを初期化する
+
+        Args:
+            file_path (str): 解析対象の MPEG-TS 形式の録画ファイルのパス
+        """
+
+        self.file_path = file_path
+
+        # 解析対象の映像ストリームの PID とコーデック (PMT から取得する)
+        self.video_pid: int | None = None
+        self.video_codec: Literal['MPEG-2', 'H.264', 'H.265'] | None = None
+
+        # PAT / PMT のパーサー
+        self._pat_parser: SectionParser[PATSection] = SectionParser(PATSection)
+        self._pmt_parser: SectionParser[PMTSection] = SectionParser(PMTSection)
+        self._pmt_pid: int | None = None
+
+        # キーフレームかどうかの判定待ちの映像 PES
+        ## (PES の先頭を含む TS パケットのファイル内の位置, DTS, random_access_indicator の有無, 蓄積中のペイロード)
+        self._probing_pes: tuple[int, int, bool, bytearray] | None = None
+
+        # 最後に出力したキーフレームと、最後に見つかった映像 PES の (位置, DTS)
+        self._last_key_frame: schemas.KeyFrame | None = None
+        self._last_pes: schemas.KeyFrame | None = None
+
+        # DTS の 33bit ラップアラウンドを展開するための状態
+        ## ffprobe と同様に、ラップアラウンドしても単調増加となるよう展開した DTS を出力する
+        self._last_timestamp_33bit: int | None = None
+        self._wrap_offset_ticks: int = 0
+
+
+    def iterKeyFrames(self) -> Iterator[schemas.KeyFrame]:
+        """
+        録画ファイルを先頭から読み取り、見つかったキーフレームの位置と DTS を順に返す
+        ffprobe を使っていた頃の挙動に合わせ、最後の映像フレームがキーフレームでない場合もシーク可能性のために最後に出力する
+        ファイルの読み込みを伴う同期関数のため、非同期処理中に呼び出す場合はスレッドプール上で実行すること
+
+        Yields:
+            schemas.KeyFrame: キーフレームの位置 (PES の先頭を含む TS パケットのファイル内のバイトオフセット) と DTS (90kHz)
+        """
+
+        with open(self.file_path, 'rb') as file:
+
+            # 先頭の TS パケット境界を探す
+            data = file.read(self.READ_SIZE)
+            start_offset = self.findSyncOffset(data, 0)
+            if start_offset is None:
+                return
+            buffer = data[start_offset:]
+            buffer_offset = start_offset
+
+            while True:
+
+                # TS パケット境界に揃った部分を処理し、処理しきれなかった残りのデータを次回に回す
+                processed_length = yield from self._processBlock(buffer, buffer_offset)
+                buffer = buffer[processed_length:]
+                buffer_offset += processed_length
+
+                data = file.read(self.READ_SIZE)
+                if len(data) == 0:
+                    break
+                buffer = buffer + data
+
+        yield from self._finishRemaining()
+
+
+    def feed(self, data: bytes, data_offset: int) -> list[schemas.KeyFrame]:
+        """
+        録画ファイルを外部で読み込む場合に、読み込んだデータを先頭から順に渡してキーフレームを取り出す
+        data はすべて TS パケット境界に揃っている必要がある (同期がずれている部分は呼び出し側で取り除くこと)
+        録画ファイルをすべて渡し終えたら、最後に finish() を呼び出すこと
+
+        Args:
+            data (bytes): TS パケット境界に揃ったデータ
+            data_offset (int): data の先頭のファイル内の位置
+
+        Returns:
+            list[schemas.KeyFrame]: data の中で新たに判定が確定したキーフレーム
+        """
+
+        return list(self._processBlock(data, data_offset))
+
+
+    def finish(self) -> list[schemas.KeyFrame]:
+        """
+        feed() で録画ファイルをすべて渡し終えた後に呼び出し、残りのキーフレームを取り出す
+
+        Returns:
+            list[schemas.KeyFrame]: 判定待ちだったキーフレームと、最後の映像フレーム
+        """
+
+        return list(self._finishRemaining())
+
+
+    def _finishRemaining(self) -> Iterator[schemas.KeyFrame]:
+        """
+        録画ファイルの末尾に達した後、判定待ちの映像 PES と最後の映像フレームを出力する
+
+        Yields:
+            schemas.KeyFrame: 残りのキーフレーム
+        """
+
+        # 判定待ちの映像 PES があれば判定を確定させる
+        yield from self._finishProbingPES()
+
+        # 最後の映像フレームがキーフレームでない場合も、シーク可能性のために追加する
+        if self._last_pes is not None and self._last_pes != self._last_key_frame:
+            yield self._last_pes
+
+
+    @staticmethod
+    def findSyncOffset(data: bytes, start: int) -> int | None:
+        """
+        TS パケット境界 (同期バイトの 188 バイト先と 376 バイト先にも同期バイトがある位置) を探す
+
+        Args:
+            data (bytes): 探索対象のデータ
+            start (int): 探索を開始する位置
+
+        Returns:
+            int | None: TS パケット境界の位置 (見つからない場合は None)
+        """
+
+        position = data.find(ts.SYNC_BYTE, start)
+        while position != -1:
+            if all(
+                position + step >= len(data) or data[position + step] == ts.SYNC_BYTE[0]
+                for step in (ts.PACKET_SIZE, ts.PACKET_SIZE * 2)
+            ):
+                return position
+            position = data.find(ts.SYNC_BYTE, position + 1)
+        return None
+
+
+    def _processBlock(self, data: bytes, data_offset: int) -> Generator[schemas.KeyFrame, None, int]:
+        """
+        TS パケット境界から始まるデータのうち、TS パケット境界に揃った部分を処理する
+        途中で同期がずれている場合は、ずれる直前までを処理した上で次の TS パケット境界までを処理済みとして扱う
+
+        Args:
+            data (bytes): TS パケット境界から始まるデータ
+            data_offset (int): data の先頭のファイル内の位置
+
+        Yields:
+            schemas.KeyFrame: 見つかったキーフレーム
+
+        Returns:
+            int: 処理済みとして扱ったデータの長さ (バイト)
+        """
+
+        packet_count = len(data) // ts.PACKET_SIZE
+        if packet_count == 0:
+            return 0
+        packets = np.frombuffer(data, dtype=np.uint8, count=packet_count * ts.PACKET_SIZE).reshape(packet_count, ts.PACKET_SIZE)
+
+        # 同期バイトがずれている TS パケットがあれば、その直前までを処理対象とする
+        is_synced = packets[:, 0] == ts.SYNC_BYTE[0]
+        aligned_packet_count = packet_count if bool(is_synced.all()) else int(np.argmin(is_synced))
+        packets = packets[:aligned_packet_count]
+
+        # 各 TS パケットの PID を一括で算出する
+        pids = ((packets[:, 1].astype(np.uint16) & 0x1F) << 8) | packets[:, 2]
+
+        # まだ映像ストリームの PID が判明していなければ、PAT / PMT を1パケットずつ解析する
+        first_packet_index = 0
+        while self.video_pid is None and first_packet_index < aligned_packet_count:
+            self._processPSIPacket(data, first_packet_index * ts.PACKET_SIZE, int(pids[first_packet_index]))
+            first_packet_index += 1
+
+        # 映像ストリームの TS パケットのみを処理する
+        if self.video_pid is not None:
+            video_packet_indexes = np.flatnonzero(pids[first_packet_index:] == self.video_pid) + first_packet_index
+            if len(video_packet_indexes) > 0:
+                is_payload_unit_start = (packets[video_packet_indexes, 1] & 0x40) != 0
+                pes_start_positions = np.flatnonzero(is_payload_unit_start)
+
+                # 前のブロックから判定待ちの PES があれば、このブロックの最初の PES の先頭までのパケットで判定を続ける
+                continuation_end = int(pes_start_positions[0]) if len(pes_start_positions) > 0 else len(video_packet_indexes)
+                if self._probing_pes is not None:
+                    yield from self._probePacketRange(data, video_packet_indexes, 0, continuation_end)
+
+                for position_index, start_position in enumerate(pes_start_positions):
+                    start_position = int(start_position)
+                    next_start_position = int(pes_start_positions[position_index + 1]) \
+                        if position_index + 1 < len(pes_start_positions) else len(video_packet_indexes)
+
+                    # 直前の PES の判定を確定させてから、新しい PES の判定を開始する
+                    yield from self._finishProbingPES()
+                    packet_offset = int(video_packet_indexes[start_position]) * ts.PACKET_SIZE
+                    self._startProbingPES(data, packet_offset, data_offset + packet_offset)
+
+                    # 同じ PES の後続のパケットで判定を続ける
+                    yield from self._probePacketRange(data, video_packet_indexes, start_position + 1, next_start_position)
+
+        # 同期がずれている場合は、次の TS パケット境界までを処理済みとして扱う
+        processed_length = aligned_packet_count * ts.PACKET_SIZE
+        if aligned_packet_count < packet_count:
+            next_sync_offset = self.findSyncOffset(data, processed_length + 1)
+            processed_length = next_sync_offset if next_sync_offset is not None else len(data)
+        return processed_length
+
+
+    def _processPSIPacket(self, data: bytes, packet_offset: int, pid: int) -> None:
+        """
+        PAT / PMT の TS パケットを解析し、最初の番組の映像ストリームの PID とコーデックを取得する
+
+        Args:
+            data (bytes): TS パケットを含むデータ
+            packet_offset (int): data 内の TS パケットの位置
+            pid (int): TS パケットの PID
+        """
+
+        # PAT (PID 0x00)
+        if pid == 0x00:
+            self._pat_parser.push(data[packet_offset:packet_offset + ts.PACKET_SIZE])
+            for pat in self._pat_parser:
+                if pat.CRC32() != 0:
+                    continue
+                for program_number, program_map_pid in pat:
+                    if program_number != 0:
+                        self._pmt_pid = program_map_pid
+                        break
+
+        # PMT
+        elif pid == self._pmt_pid:
+            self._pmt_parser.push(data[packet_offset:packet_offset + ts.PACKET_SIZE])
+            for pmt in self._pmt_parser:
+                if pmt.CRC32() != 0:
+                    continue
+                for stream_type, elementary_pid, _ in pmt:
+                    if stream_type in self.VIDEO_STREAM_TYPES:
+                        self.video_pid = elementary_pid
+                        self.video_codec = self.VIDEO_STREAM_TYPES[stream_type]
+                        break
+
+
+    @staticmethod
+    def getPayloadRange(data: bytes, packet_offset: int) -> tuple[int, int, bool]:
+        """
+        TS パケットのペイロードの範囲と random_access_indicator の有無を取得する
+
+        Args:
+            data (bytes): TS パケットを含むデータ
+            packet_offset (int): data 内の TS パケットの位置
+
+        Returns:
+            tuple[int, int, bool]: (ペイロードの開始位置, ペイロードの終了位置, random_access_indicator の有無)
+        """
+
+        packet_end = packet_offset + ts.PACKET_SIZE
+        adaptation_field_control = (data[packet_offset + 3] & 0x30) >> 4
+        payload_start = packet_offset + 4
+        is_random_access = False
+        if (adaptation_field_control & 0x02) != 0:
+            adaptation_field_length = data[packet_offset + 4]
+            if adaptation_field_length > 0:
+                is_random_access = (data[packet_offset + 5] & 0x40) != 0
+            payload_start += 1 + adaptation_field_length
+        if (adaptation_field_control & 0x01) == 0:
+            payload_start = packet_end
+        return (min(payload_start, packet_end), packet_end, is_random_access)
+
+
+    @classmethod
+    def getElementaryStreamRange(cls, data: bytes, packet_offset: int) -> tuple[int, int] | None:
+        """
+        映像ストリームの TS パケットから、PES ヘッダーを除いた映像データ (エレメンタリーストリーム) の範囲を取得する
+
+        Args:
+            data (bytes): TS パケットを含むデータ
+            packet_offset (int): data 内の TS パケットの位置
+
+        Returns:
+            tuple[int, int] | None: (映像データの開始位置, 映像データの終了位置) (PES ヘッダーが1つの TS パケットに収まっていない場合は None)
+        """
+
+        payload_start, payload_end, _ = cls.getPayloadRange(data, packet_offset)
+
+        # PES の先頭を含む TS パケットの場合は、PES ヘッダーを読み飛ばす
+        if (data[packet_offset + 1] & 0x40) != 0:
+            if payload_end - payload_start < 9 or data[payload_start:payload_start + 3] != b'\x00\x00\x01':
+                return None
+            payload_start = min(payload_start + 9 + data[payload_start + 8], payload_end)
+        return (payload_start, payload_end)
+
+
+    def _startProbingPES(self, data: bytes, packet_offset: int, file_offset: int) -> None:
+        """
+        映像 PES の先頭を含む TS パケットから PES ヘッダーを解析し、キーフレームかどうかの判定を開始する
+
+        Args:
+            data (bytes): TS パケットを含むデータ
+            packet_offset (int): data 内の TS パケットの位置
+            file_offset (int): TS パケットのファイル内の位置
+        """
+
+        payload_start, payload_end, is_random_access = self.getPayloadRange(data, packet_offset)
+
+        # PES ヘッダーが1つの TS パケットに収まっていない場合は対象外
+        if payload_end - payload_start < 9 or data[payload_start:payload_start + 3] != b'\x00\x00\x01':
+            return
+        pes_header_data_length = data[payload_start + 8]
+        es_start = payload_start + 9 + pes_header_data_length
+        if es_start > payload_end:
+            return
+
+        # DTS (なければ PTS) を取得する
+        pts_dts_flags = (data[payload_start + 7] & 0xC0) >> 6
+        if pts_dts_flags == 0b11:
+            timestamp_33bit = self.parseTimestamp(data, payload_start + 14)
+        elif pts_dts_flags == 0b10:
+            timestamp_33bit = self.parseTimestamp(data, payload_start + 9)
+        else:
+            return
+
+        # 33bit ラップアラウンドを展開する (大きく逆行した場合のみラップアラウンドとみなす)
+        if self._last_timestamp_33bit is not None and \
+           timestamp_33bit < self._last_timestamp_33bit and (self._last_timestamp_33bit - timestamp_33bit) > (ts.PCR_CYCLE // 2):
+            self._wrap_offset_ticks += ts.PCR_CYCLE
+        self._last_timestamp_33bit = timestamp_33bit
+        dts = timestamp_33bit + self._wrap_offset_ticks
+
+        self._last_pes = {'offset': file_offset, 'dts': dts}
+        self._probing_pes = (file_offset, dts, is_random_access, bytearray(data[es_start:payload_end]))
+
+
+    @staticmethod
+    def parseTimestamp(data: bytes, offset: int) -> int:
+        """
+        PES ヘッダー内の 33bit の PTS / DTS を取得する
+
+        Args:
+            data (bytes): PES ヘッダーを含むデータ
+            offset (int): PTS / DTS の位置
+
+        Returns:
+            int: PTS / DTS (90kHz)
+        """
+
+        return (((data[offset] & 0x0E) << 29) |
+                (data[offset + 1] << 22) |
+                ((data[offset + 2] & 0xFE) << 14) |
+                (data[offset + 3] << 7) |
+                (data[offset + 4] >> 1))
+
+
+    def _probePacketRange(self, data: bytes, video_packet_indexes: np.ndarray, begin: int, end: int) -> Iterator[schemas.KeyFrame]:
+        """
+        判定待ちの映像 PES の後続の TS パケットのペイロードを蓄積し、キーフレームかどうかを判定できた時点で判定を確定させる
+
+        Args:
+            data (bytes): TS パケットを含むデータ
+            video_packet_indexes (np.ndarray): data 内の映像ストリームの TS パケットのインデックス
+            begin (int): 蓄積を開始する video_packet_indexes 上の位置
+            end (int): 蓄積を終了する video_packet_indexes 上の位置 (この位置は含まない)
+
+        Yields:
+            schemas.KeyFrame: 判定の結果キーフレームだった場合のキーフレーム
+        """
+
+        position = begin
+        while self._probing_pes is not None:
+
+            # 蓄積済みのペイロードで判定できれば確定させる
+            is_key_frame = self._isKeyFrame(self._probing_pes[3])
+            if is_key_frame is not None or len(self._probing_pes[3]) >= self.MAX_PROBE_SIZE:
+                yield from self._finishProbingPES(is_key_frame)
+                return
+
+            if position >= end:
+                return
+            packet_offset = int(video_packet_indexes[position]) * ts.PACKET_SIZE
+            payload_start, payload_end, _ = self.getPayloadRange(data, packet_offset)
+            self._probing_pes[3].extend(data[payload_start:payload_end])
+            position += 1
+
+
+    def _finishProbingPES(self, is_key_frame: bool | None = None) -> Iterator[schemas.KeyFrame]:
+        """
+        判定待ちの映像 PES の判定を確定させ、キーフレームであれば出力する
+        ペイロードから判定できなかった場合は、random_access_indicator の有無で判定する
+
+        Args:
+            is_key_frame (bool | None): 判定済みの結果 (None の場合は蓄積済みのペイロードから改めて判定する)
+
+        Yields:
+            schemas.KeyFrame: キーフレームだった場合のキーフレーム
+        """
+
+        if self._probing_pes is None:
+            return
+        file_offset, dts, is_random_access, payload = self._probing_pes
+        self._probing_pes = None
+
+        if is_key_frame is None:
+            is_key_frame = self._isKeyFrame(payload)
+        if is_key_frame is None:
+            is_key_frame = is_random_access
+
+        if is_key_frame is True:
+            self._last_key_frame = {'offset': file_offset, 'dts': dts}
+            yield self._last_key_frame
+
+
+    def _isKeyFrame(self, payload: bytes | bytearray) -> bool | None:
+        """
+        映像 PES のペイロードの先頭部分から、キーフレームかどうかを判定する
+        - MPEG-2: ピクチャヘッダの picture_coding_type が I ピクチャ
+        - H.264: IDR スライス、または Recovery Point SEI を伴うスライス
+        - H.265: IRAP (BLA / IDR / CRA) スライス
+
+        Args:
+            payload (bytes | bytearray): 映像 PES のペイロードの先頭部分
+
+        Returns:
+            bool | None: キーフレームであれば True 、そうでなければ False (判定に必要なデータが足りない場合は None)
+        """
+
+        has_recovery_point = False
+        position = payload.find(b'\x00\x00\x01')
+        while position != -1 and position + 5 < len(payload):
+            header = payload[position + 3]
+
+            if self.video_codec == 'MPEG-2':
+                # ピクチャヘッダ (start_code: 0x00)
+                if header == 0x00:
+                    picture_coding_type = (payload[position + 5] >> 3) & 0x07
+                    return picture_coding_type == 1
+
+            elif self.video_codec == 'H.264':
+                nal_unit_type = header & 0x1F
+                if nal_unit_type == 5:
+                    return True
+                # SEI の最初のメッセージが Recovery Point (payloadType: 6) かどうか
+                if nal_unit_type == 6 and payload[position + 4] == 6:
+                    has_recovery_point = True
+                if 1 <= nal_unit_type <= 4:
+                    return has_recovery_point
+
+            elif self.video_codec == 'H.265':
+                nal_unit_type = (header >> 1) & 0x3F
+                if nal_unit_type < 32:
+                    return 16 <= nal_unit_type <= 23
+
+            position = payload.find(b'\x00\x00\x01', position + 3)
+
+        return None
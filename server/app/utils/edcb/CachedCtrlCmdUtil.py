@@ -0,0 +1,126 @@
+
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TypeVar
+
+from pydantic_core import Url
+
+from app.utils.edcb import (
+    AutoAddData,
+    AutoAddDataRequired,
+    ManualAutoAddData,
+    NotifyUpdate,
+    ReserveData,
+    ReserveDataRequired,
+    ServiceEventInfo,
+    ServiceInfo,
+)
+from app.utils.edcb.CtrlCmdUtil import CtrlCmdUtil
+from app.utils.edcb.EDCBNotifyWatcher import EDCBNotifyWatcher
+
+
+# ジェネリック型
+T = TypeVar('T')
+
+
+class CachedCtrlCmdUtil(CtrlCmdUtil):
+    """
+    一覧取得系のコマンドの応答を EDCBNotifyWatcher のキャッシュから返す CtrlCmdUtil
+    対応する NotifyUpdate の通知を受け取るまでは同じ応答を返すため、何も変更されていない間は EDCB とやり取りせずに済む
+    予約などを変更するコマンドを送った場合は、通知の到着を待たずに対応するキャッシュを破棄する
+
+    キャッシュを利用するのは、EDCBNotifyWatcher が通知を監視しているサーバー設定の EDCB に接続する場合のみ
+    接続先を指定した場合や、EDCBNotifyWatcher が通知を監視できていない場合は CtrlCmdUtil と同じく毎回 EDCB から取得する
+    """
+
+    __is_cacheable: bool
+
+    def __init__(self, edcb_url: Url | None = None) -> None:
+        super().__init__(edcb_url)
+        self.__is_cacheable = edcb_url is None
+
+    def setNWSetting(self, host: str, port: int) -> None:
+        """ TCP/IP モードにする (接続先が変わるためキャッシュを利用しない) """
+        self.__is_cacheable = False
+        super().setNWSetting(host, port)
+
+    def setPipeSetting(self, name: str, dir: str | None = None) -> None:
+        """ 名前付きパイプ / UNIX ドメインソケットモードにする (接続先が変わるためキャッシュを利用しない) """
+        self.__is_cacheable = False
+        super().setPipeSetting(name, dir)
+
+    async def sendEnumService(self) -> list[ServiceInfo] | None:
+        """ サービス一覧を取得する (EPG データが更新されるまでキャッシュする) """
+        return await self.__getOrFetch(NotifyUpdate.EPGDATA, ('EnumService',), super().sendEnumService)
+
+    async def sendEnumPgInfoEx(self, service_time_list: list[int]) -> list[ServiceEventInfo] | None:
+        """ サービス指定と時間指定で番組情報一覧を取得する (EPG データが更新されるまでキャッシュする) """
+        return await self.__getOrFetch(NotifyUpdate.EPGDATA, ('EnumPgInfoEx', tuple(service_time_list)),
+                                       lambda: super(CachedCtrlCmdUtil, self).sendEnumPgInfoEx(service_time_list))
+
+    async def sendEnumReserve(self) -> list[ReserveDataRequired] | None:
+        """ 予約一覧を取得する (予約情報が更新されるまでキャッシュする) """
+        return await self.__getOrFetch(NotifyUpdate.RESERVE_INFO, ('EnumReserve',), super().sendEnumReserve)
+
+    async def sendAddReserve(self, reserve_list: list[ReserveData]) -> bool:
+        """ 予約を追加する """
+        return self.__invalidateIfSucceeded(await super().sendAddReserve(reserve_list), NotifyUpdate.RESERVE_INFO)
+
+    async def sendChgReserve(self, reserve_list: list[ReserveData]) -> bool:
+        """ 予約を変更する """
+        return self.__invalidateIfSucceeded(await super().sendChgReserve(reserve_list), NotifyUpdate.RESERVE_INFO)
+
+    async def sendDelReserve(self, reserve_id_list: list[int]) -> bool:
+        """ 予約を削除する """
+        return self.__invalidateIfSucceeded(await super().sendDelReserve(reserve_id_list), NotifyUpdate.RESERVE_INFO)
+
+    async def sendEnumAutoAdd(self) -> list[AutoAddDataRequired] | None:
+        """ 自動予約登録情報一覧を取得する (自動予約登録情報が更新されるまでキャッシュする) """
+        return await self.__getOrFetch(NotifyUpdate.AUTOADD_EPG, ('EnumAutoAdd',), super().sendEnumAutoAdd)
+
+    async def sendAddAutoAdd(self, data_list: list[AutoAddData]) -> bool:
+        """ 自動予約登録情報を追加する """
+        return self.__invalidateIfSucceeded(await super().sendAddAutoAdd(data_list), NotifyUpdate.AUTOADD_EPG, NotifyUpdate.RESERVE_INFO)
+
+    async def sendChgAutoAdd(self, data_list: list[AutoAddData]) -> bool:
+        """ 自動予約登録情報を変更する """
+        return self.__invalidateIfSucceeded(await super().sendChgAutoAdd(data_list), NotifyUpdate.AUTOADD_EPG, NotifyUpdate.RESERVE_INFO)
+
+    async def sendDelAutoAdd(self, id_list: list[int]) -> bool:
+        """ 自動予約登録情報を削除する """
+        return self.__invalidateIfSucceeded(await super().sendDelAutoAdd(id_list), NotifyUpdate.AUTOADD_EPG, NotifyUpdate.RESERVE_INFO)
+
+    async def sendEnumManualAdd(self) -> list[ManualAutoAddData] | None:
+        """ 自動予約 (プログラム) 登録情報一覧を取得する (自動予約 (プログラム) 登録情報が更新されるまでキャッシュする) """
+        return await self.__getOrFetch(NotifyUpdate.AUTOADD_MANUAL, ('EnumManualAdd',), super().sendEnumManualAdd)
+
+    async def sendAddManualAdd(self, data_list: list[ManualAutoAddData]) -> bool:
+        """ 自動予約 (プログラム) 登録情報を追加する """
+        return self.__invalidateIfSucceeded(await super().sendAddManualAdd(data_list), NotifyUpdate.AUTOADD_MANUAL, NotifyUpdate.RESERVE_INFO)
+
+    async def sendChgManualAdd(self, data_list: list[ManualAutoAddData]) -> bool:
+        """ 自動予約 (プログラム) 登録情報を変更する """
+        return self.__invalidateIfSucceeded(await super().sendChgManualAdd(data_list), NotifyUpdate.AUTOADD_MANUAL, NotifyUpdate.RESERVE_INFO)
+
+    async def sendDelManualAdd(self, id_list: list[int]) -> bool:
+        """ 自動予約 (プログラム) 登録情報を削除する """
+        return self.__invalidateIfSucceeded(await super().sendDelManualAdd(id_list), NotifyUpdate.AUTOADD_MANUAL, NotifyUpdate.RESERVE_INFO)
+
+    async def __getOrFetch(self, notify_id: NotifyUpdate, key: Hashable, fetch: Callable[[], Awaitable[T | None]]) -> T | None:
+        """ キャッシュがあればキャッシュから、なければ EDCB から応答を取得してキャッシュする """
+        if self.__is_cacheable is False or EDCBNotifyWatcher.isWatching() is False:
+            return await fetch()
+        cached = EDCBNotifyWatcher.getCache(notify_id, key)
+        if cached is not None:
+            return cached
+        generation = EDCBNotifyWatcher.getGeneration()
+        result = await fetch()
+        if result is not None:
+            EDCBNotifyWatcher.setCache(notify_id, key, result, generation)
+        return result
+
+    @staticmethod
+    def __invalidateIfSucceeded(result: bool, *notify_ids: NotifyUpdate) -> bool:
+        """ コマンドが成功した場合に、通知の到着を待たずに対応するキャッシュを破棄する """
+        if result is True:
+            EDCBNotifyWatcher.invalidate(*notify_ids)
+        return result
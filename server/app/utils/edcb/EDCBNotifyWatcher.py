@@ -0,0 +1,267 @@
+
+import asyncio
+import os
+import pickle
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any, ClassVar
+
+from app import logging
+from app.utils.edcb import NotifyUpdate
+from app.utils.edcb.CtrlCmdUtil import CtrlCmdUtil
+
+
+class EDCBNotifyWatcher:
+    """
+    EDCB (EpgTimerSrv) の通知 (NotifyUpdate) をロングポーリングで監視し、CtrlCmd の応答のキャッシュを管理するクラス
+    予約一覧や番組情報などの取得結果を通知の種類ごとにキャッシュし、対応する更新通知を受け取るまで使い回す
+    通知を監視できている間だけキャッシュが有効になり、EDCB に接続できなくなった場合はすべてのキャッシュを破棄する
+    実際に CtrlCmd の応答をキャッシュするのは CachedCtrlCmdUtil で、このクラスはキャッシュの保持と破棄を担う
+    """
+
+    # ロングポーリングで通知を待つ最大秒数
+    ## EDCB は新しい通知が発生するまで応答を返さないため、タイムアウトした場合は接続を確認してから待ち直す
+    LONG_POLLING_TIMEOUT: ClassVar[float] = 60.0
+
+    # 通知を待たずに応答が返ってきた場合 (名前付きパイプ・UNIX ドメインソケットモード) に、次に通知を確認するまでの秒数
+    POLLING_INTERVAL: ClassVar[float] = 1.0
+
+    # EDCB に接続できなかった場合に、次に接続を試みるまでの秒数
+    RETRY_INTERVAL: ClassVar[float] = 5.0
+
+    # キャッシュする応答の最大数
+    ## 番組情報は検索範囲ごとにキャッシュされるため、際限なく増えないようにする
+    MAX_CACHE_ENTRIES: ClassVar[int] = 256
+
+    # 通知の種類ごとに、受け取った際に破棄するキャッシュの種類
+    ## EPG データや自動予約登録情報の更新に伴って予約情報も変わることがあるため、念のため予約情報のキャッシュも破棄する
+    INVALIDATION_TARGETS: ClassVar[dict[int, tuple[NotifyUpdate, ...]]] = {
+        NotifyUpdate.EPGDATA: (NotifyUpdate.EPGDATA, NotifyUpdate.RESERVE_INFO),
+        NotifyUpdate.RESERVE_INFO: (NotifyUpdate.RESERVE_INFO,),
+        NotifyUpdate.REC_INFO: (NotifyUpdate.REC_INFO,),
+        NotifyUpdate.AUTOADD_EPG: (NotifyUpdate.AUTOADD_EPG, NotifyUpdate.RESERVE_INFO),
+        NotifyUpdate.AUTOADD_MANUAL: (NotifyUpdate.AUTOADD_MANUAL, NotifyUpdate.RESERVE_INFO),
+        NotifyUpdate.PROFILE: tuple(NotifyUpdate),
+    }
+
+    # 通知を監視するバックグラウンドタスク
+    __task: ClassVar[asyncio.Task[None] | None] = None
+
+    # 通知を監視しているプロセスの ID (通知を監視できていない間は None)
+    ## マルチプロセスで実行される処理にクラスの状態が引き継がれても、キャッシュを使わないようにするため
+    __watching_pid: ClassVar[int | None] = None
+
+    # (通知の種類, キャッシュのキー) をキーとした、pickle でシリアライズした CtrlCmd の応答
+    ## 呼び出し元で応答の辞書が書き換えられてもキャッシュに影響しないよう、取り出す度にデシリアライズして新しいオブジェクトを返す
+    __cache: ClassVar[OrderedDict[tuple[int, Hashable], bytes]] = OrderedDict()
+
+    # キャッシュを破棄する度に加算される世代番号
+    ## 応答の取得中にキャッシュが破棄された場合に、古い応答をキャッシュしてしまわないようにする
+    __generation: ClassVar[int] = 0
+
+    # 通知を受け取った際に呼び出すコールバック関数
+    __listeners: ClassVar[dict[int, list[Callable[[], Any]]]] = {}
+
+
+    @classmethod
+    def start(cls) -> None:
+        """
+        EDCB の通知の監視を開始する (既に監視している場合は何もしない)
+        """
+
+        if cls.__task is not None and not cls.__task.done():
+            return
+        cls.__task = asyncio.create_task(cls.__watch())
+
+
+    @classmethod
+    async def stop(cls) -> None:
+        """
+        EDCB の通知の監視を終了し、すべてのキャッシュを破棄する
+        """
+
+        if cls.__task is not None:
+            cls.__task.cancel()
+            try:
+                await cls.__task
+            except asyncio.CancelledError:
+                pass
+            cls.__task = None
+        cls.__watching_pid = None
+        cls.invalidate(*NotifyUpdate)
+
+
+    @classmethod
+    def isWatching(cls) -> bool:
+        """
+        現在 EDCB の通知を監視できているかどうか (キャッシュを利用できるかどうか) を返す
+
+        Returns:
+            bool: 通知を監視できていれば True
+        """
+
+        return cls.__watching_pid == os.getpid()
+
+
+    @classmethod
+    def addListener(cls, notify_id: NotifyUpdate, callback: Callable[[], Any]) -> None:
+        """
+        指定された種類の通知を受け取った際に呼び出すコールバック関数を登録する
+
+        Args:
+            notify_id (NotifyUpdate): 通知の種類
+            callback (Callable[[], Any]): 通知を受け取った際に呼び出すコールバック関数
+        """
+
+        cls.__listeners.setdefault(notify_id, []).append(callback)
+
+
+    @classmethod
+    def getGeneration(cls) -> int:
+        """
+        現在のキャッシュの世代番号を返す
+        応答を取得する前に世代番号を控えておき、setCache() に渡す
+
+        Returns:
+            int: 現在のキャッシュの世代番号
+        """
+
+        return cls.__generation
+
+
+    @classmethod
+    def getCache(cls, notify_id: NotifyUpdate, key: Hashable) -> Any | None:
+        """
+        キャッシュされた CtrlCmd の応答を取得する
+
+        Args:
+            notify_id (NotifyUpdate): 応答の内容が更新された際に送られる通知の種類
+            key (Hashable): キャッシュのキー (コマンドと引数の組み合わせ)
+
+        Returns:
+            Any | None: キャッシュされた応答 (キャッシュがない場合は None)
+        """
+
+        if cls.isWatching() is False:
+            return None
+        serialized = cls.__cache.get((notify_id, key))
+        if serialized is None:
+            return None
+        cls.__cache.move_to_end((notify_id, key))
+        return pickle.loads(serialized)
+
+
+    @classmethod
+    def setCache(cls, notify_id: NotifyUpdate, key: Hashable, value: Any, generation: int) -> None:
+        """
+        CtrlCmd の応答をキャッシュする
+        応答の取得中にキャッシュが破棄された (世代番号が変わった) 場合や、通知を監視できていない場合はキャッシュしない
+
+        Args:
+            notify_id (NotifyUpdate): 応答の内容が更新された際に送られる通知の種類
+            key (Hashable): キャッシュのキー (コマンドと引数の組み合わせ)
+            value (Any): キャッシュする応答
+            generation (int): 応答を取得する前に getGeneration() で取得した世代番号
+        """
+
+        if cls.isWatching() is False or generation != cls.__generation:
+            return
+        cls.__cache[(notify_id, key)] = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        cls.__cache.move_to_end((notify_id, key))
+        while len(cls.__cache) > cls.MAX_CACHE_ENTRIES:
+            cls.__cache.popitem(last=False)
+
+
+    @classmethod
+    def invalidate(cls, *notify_ids: NotifyUpdate) -> None:
+        """
+        指定された種類の通知に対応するキャッシュを破棄する
+        EDCB に変更を加えた直後に、通知の到着を待たずにキャッシュを破棄する際にも利用する
+
+        Args:
+            *notify_ids (NotifyUpdate): 通知の種類
+        """
+
+        cls.__generation += 1
+        for cache_key in [cache_key for cache_key in cls.__cache if cache_key[0] in notify_ids]:
+            del cls.__cache[cache_key]
+
+
+    @classmethod
+    def __onNotify(cls, notify_id: int) -> None:
+        """
+        EDCB から通知を受け取った際に、対応するキャッシュを破棄してコールバック関数を呼び出す
+
+        Args:
+            notify_id (int): 通知の種類
+        """
+
+        invalidation_targets = cls.INVALIDATION_TARGETS.get(notify_id)
+        if invalidation_targets is not None:
+            cls.invalidate(*invalidation_targets)
+        for callback in cls.__listeners.get(notify_id, []):
+            try:
+                callback()
+            except Exception as ex:
+                logging.error(f'[EDCBNotifyWatcher] Failed to call the listener for notify {notify_id}:', exc_info=ex)
+
+
+    @classmethod
+    async def __watch(cls) -> None:
+        """
+        EDCB の通知をロングポーリングで監視し続ける
+        """
+
+        edcb = CtrlCmdUtil()
+        target_count: int | None = None
+
+        while True:
+            try:
+                # 通知の監視を始める前に、EDCB に接続できるかを確認して現在の通知カウントを取得する
+                if target_count is None:
+                    edcb.setConnectTimeOutSec(5)  # 5秒後にタイムアウト
+                    status = await edcb.sendGetNotifySrvStatus()
+                    if status is None:
+                        await asyncio.sleep(cls.RETRY_INTERVAL)
+                        continue
+                    target_count = status['count']
+                    # 接続できなかった間の変更を反映するため、すべての種類の通知を受け取ったものとして扱う
+                    for notify_id in cls.INVALIDATION_TARGETS:
+                        cls.__onNotify(notify_id)
+                    cls.__watching_pid = os.getpid()
+                    logging.info('[EDCBNotifyWatcher] Started watching EDCB notifications.')
+
+                # target_count より新しい通知が発生するまで待つ
+                edcb.setConnectTimeOutSec(cls.LONG_POLLING_TIMEOUT)
+                start_time = time.monotonic()
+                notify_info = await edcb.sendGetNotifySrvInfo(target_count)
+
+                # 通知を受け取れなかった場合、ロングポーリングがタイムアウトしただけか EDCB に接続できなくなったかを確認する
+                if notify_info is None:
+                    edcb.setConnectTimeOutSec(5)  # 5秒後にタイムアウト
+                    if await edcb.sendGetNotifySrvStatus() is None:
+                        logging.warning('[EDCBNotifyWatcher] Lost connection to EDCB. Disabled the response cache until reconnected.')
+                        cls.__watching_pid = None
+                        cls.invalidate(*NotifyUpdate)
+                        target_count = None
+                        await asyncio.sleep(cls.RETRY_INTERVAL)
+                    # ロングポーリングに対応していない接続方法では即座に応答が返るため、一定間隔で確認する
+                    elif time.monotonic() - start_time < cls.POLLING_INTERVAL:
+                        await asyncio.sleep(cls.POLLING_INTERVAL)
+                    continue
+
+                # 通知カウントが飛んでいる場合は EDCB 側で通知の履歴が失われているため、すべてのキャッシュを破棄する
+                if notify_info['count'] > target_count + 1:
+                    cls.invalidate(*NotifyUpdate)
+                cls.__onNotify(notify_info['notify_id'])
+                target_count = notify_info['count']
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logging.error('[EDCBNotifyWatcher] Failed to watch EDCB notifications:', exc_info=ex)
+                cls.__watching_pid = None
+                cls.invalidate(*NotifyUpdate)
+                target_count = None
+                await asyncio.sleep(cls.RETRY_INTERVAL)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Usage: poetry run python -m misc.KeyFrameIndexerBenchmark
+
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import typer
+
+from app.constants import LIBRARY_PATH
+from app.utils.TSKeyFrameIndexer import TSKeyFrameIndexer
+
+
+app = typer.Typer()
+
+PACKET_SIZE = 188
+PMT_PID = 0x1F0
+VIDEO_PID = 0x100
+AUDIO_PID = 0x110
+
+
+def crc32_mpeg2(data: bytes) -> int:
+    """ PSI セクションの CRC32 (MPEG-2) を算出する """
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) & 0xFFFFFFFF if crc & 0x80000000 else (crc << 1) & 0xFFFFFFFF
+    return crc
+
+
+def build_section_packet(pid: int, section_without_crc: bytes, continuity_counter: int) -> bytes:
+    """ 1つの TS パケットに収まる PSI セクションを TS パケット化する """
+    section = section_without_crc + crc32_mpeg2(section_without_crc).to_bytes(4, 'big')
+    header = bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10 | (continuity_counter & 0x0F), 0x00])
+    return (header + section).ljust(PACKET_SIZE, b'\xFF')
+
+
+def build_pat_pmt(continuity_counter: int) -> bytes:
+    """ PAT と PMT (H.264 映像 + AAC 音声) の TS パケットを生成する """
+    pat = bytes([0x00, 0xB0, 13, 0x00, 0x01, 0xC1, 0x00, 0x00, 0x04, 0x00, 0xE0 | (PMT_PID >> 8), PMT_PID & 0xFF])
+    pmt_body = bytes([0x04, 0x00, 0xC1, 0x00, 0x00, 0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00])
+    pmt_body += bytes([0x1B, 0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00])
+    pmt_body += bytes([0x0F, 0xE0 | (AUDIO_PID >> 8), AUDIO_PID & 0xFF, 0xF0, 0x00])
+    pmt = bytes([0x02, 0xB0 | ((len(pmt_body) + 4) >> 8), (len(pmt_body) + 4) & 0xFF]) + pmt_body
+    return build_section_packet(0x00, pat, continuity_counter) + build_section_packet(PMT_PID, pmt, continuity_counter)
+
+
+def encode_timestamp(prefix: int, timestamp: int) -> bytes:
+    """ PES ヘッダーの PTS / DTS を 5 バイトにエンコードする """
+    timestamp &= (1 << 33) - 1
+    return bytes([
+        (prefix << 4) | (((timestamp >> 30) & 0x07) << 1) | 1,
+        (timestamp >> 22) & 0xFF,
+        (((timestamp >> 15) & 0x7F) << 1) | 1,
+        (timestamp >> 7) & 0xFF,
+        ((timestamp & 0x7F) << 1) | 1,
+    ])
+
+
+def packetize_pes(pid: int, pes: bytes, continuity_counter: int, is_random_access: bool) -> tuple[bytes, int]:
+    """ PES を TS パケット化する (最後のパケットはアダプテーションフィールドで埋める) """
+    packets = bytearray()
+    position = 0
+    is_first = True
+    while position < len(pes):
+        header = bytearray([0x47, (0x40 if is_first else 0x00) | (pid >> 8), pid & 0xFF, 0x00])
+        adaptation_field = b''
+        if is_first and is_random_access:
+            adaptation_field = bytes([0x01, 0x40])
+        remaining = PACKET_SIZE - 4 - len(adaptation_field)
+        chunk = pes[position:position + remaining]
+        if len(chunk) < remaining:
+            # スタッフィングで埋める
+            stuffing_length = remaining - len(chunk)
+            if len(adaptation_field) == 0:
+                adaptation_field = bytes([stuffing_length - 1]) + (bytes([0x00]) + b'\xFF' * (stuffing_length - 2) if stuffing_length >= 2 else b'')
+            else:
+                adaptation_field = bytes([adaptation_field[0] + stuffing_length, adaptation_field[1]]) + b'\xFF' * stuffing_length
+        header[3] = (0x30 if len(adaptation_field) > 0 else 0x10) | (continuity_counter & 0x0F)
+        packets += header + adaptation_field + chunk
+        continuity_counter += 1
+        position += len(chunk)
+        is_first = False
+    return bytes(packets), continuity_counter
+
+
+def generate_synthetic_ts(path: Path, duration: float, bitrate_mbps: float, gop_frames: int) -> int:
+    """
+    H.264 映像 (29.97fps) と音声を模した擬似的な MPEG-TS ファイルを生成する
+
+    Returns:
+        int: 生成したキーフレームの数
+    """
+    frame_count = int(duration * 30000 / 1001)
+    frame_size = int(bitrate_mbps * 1e6 / 8 / (30000 / 1001))
+    frame_duration = 3003  # 90kHz
+    random_bytes = random.Random(0).randbytes(frame_size * 2)
+    video_cc = audio_cc = psi_cc = 0
+    key_frame_count = 0
+    start_dts = (1 << 33) - 90000 * 60  # 1分後に 33bit ラップアラウンドが発生する
+    with open(path, 'wb') as file:
+        for frame_index in range(frame_count):
+            is_key_frame = frame_index % gop_frames == 0
+            if is_key_frame:
+                key_frame_count += 1
+                file.write(build_pat_pmt(psi_cc))
+                psi_cc += 1
+            dts = start_dts + frame_index * frame_duration
+            es = b'\x00\x00\x00\x01\x09\xF0'
+            if is_key_frame:
+                es += b'\x00\x00\x00\x01\x67\x64\x00\x28' + b'\x00\x00\x00\x01\x68\xEE\x3C\x80' + b'\x00\x00\x01\x65'
+            else:
+                es += b'\x00\x00\x01\x41'
+            offset = (frame_index * 7919) % frame_size
+            es += random_bytes[offset:offset + frame_size].replace(b'\x00\x00\x01', b'\x00\x00\x03')
+            pes_header = b'\x00\x00\x01\xE0\x00\x00\x80\xC0\x0A' + encode_timestamp(0x3, dts + 6006) + encode_timestamp(0x1, dts)
+            packets, video_cc = packetize_pes(VIDEO_PID, pes_header + es, video_cc, is_key_frame)
+            file.write(packets)
+            # 音声 PES (映像 1 フレームあたり 1 つ)
+            audio_pes = b'\x00\x00\x01\xC0\x00\x00\x80\x80\x05' + encode_timestamp(0x2, dts) + random_bytes[:600]
+            packets, audio_cc = packetize_pes(AUDIO_PID, audio_pes, audio_cc, False)
+            file.write(packets)
+    return key_frame_count
+
+
+@app.command()
+def main(
+    duration: float = typer.Option(600.0, help='Synthetic recording duration (seconds).'),
+    bitrate_mbps: float = typer.Option(16.0, help='Synthetic video bitrate (Mbps).'),
+    gop_frames: int = typer.Option(15, help='Keyframe interval (frames).'),
+    keep_file: bool = typer.Option(False, help='Keep the generated synthetic TS file.'),
+):
+    """
+    擬似的な MPEG-TS ファイルを生成し、TSKeyFrameIndexer と ffprobe -show_packets -of json によるキーフレーム解析を比較する。
+    """
+
+    fd, temp_path = tempfile.mkstemp(suffix='.ts')
+    os.close(fd)
+    path = Path(temp_path)
+    try:
+        print(f'Generating synthetic TS ({duration} seconds, {bitrate_mbps} Mbps)...')
+        expected_key_frame_count = generate_synthetic_ts(path, duration, bitrate_mbps, gop_frames)
+        print(f'Generated: {path} ({path.stat().st_size / 1e6:.1f} MB, {expected_key_frame_count} keyframes)')
+
+        # TSKeyFrameIndexer
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        key_frames = list(TSKeyFrameIndexer(str(path)).iterKeyFrames())
+        elapsed_time = time.perf_counter() - start_time
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'TSKeyFrameIndexer: {elapsed_time:.2f}s / peak Python heap {peak_memory / 1e6:.1f} MB / '
+              f'{len(key_frames)} keyframes (including the last frame)')
+
+        # ffprobe (従来の方式)
+        if Path(LIBRARY_PATH['FFprobe']).exists() is False:
+            print('ffprobe is not available, skipping comparison.')
+            return
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        result = subprocess.run([
+            LIBRARY_PATH['FFprobe'], '-i', str(path), '-select_streams', 'v:0', '-show_packets',
+            '-show_entries', 'packet=pos,dts,flags', '-of', 'json',
+        ], capture_output=True, check=True)
+        packets = json.loads(result.stdout.decode('utf-8'))['packets']
+        ffprobe_key_frames = [
+            {'offset': int(packet['pos']), 'dts': int(packet['dts'])}
+            for packet in packets if 'K' in packet['flags'] or packet is packets[-1]
+        ]
+        elapsed_time = time.perf_counter() - start_time
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'ffprobe (JSON):    {elapsed_time:.2f}s / peak Python heap {peak_memory / 1e6:.1f} MB / '
+              f'{len(ffprobe_key_frames)} keyframes (stdout {len(result.stdout) / 1e6:.1f} MB)')
+        print(f'Results match: {key_frames == ffprobe_key_frames}')
+    finally:
+        if keep_file is False:
+            path.unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    app()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Usage: poetry run python -m misc.LiveWriterBenchmark
+
+import asyncio
+import time
+
+import typer
+from biim.mpeg2ts import ts
+
+from app.utils.TSPacketReader import TSPacketReader
+
+
+app = typer.Typer()
+
+@app.command()
+def main(
+    bitrate_mbps: float = typer.Option(13.0, help='Simulated encoder output bitrate (Mbps).'),
+    duration: float = typer.Option(60.0, help='Simulated stream duration (seconds).'),
+    feed_size: int = typer.Option(65536, help='Size of each write to the simulated encoder stdout pipe (bytes).'),
+):
+    """
+    LiveEncodingTask の Writer のイベントループ上での CPU 時間を、
+    従来の 188 bytes ずつの readexactly() と TSPacketReader によるブロック単位の読み取りで比較する。
+    """
+
+    # 擬似的なエンコーダーの出力 (TS パケットの羅列) を生成する
+    total_size = int(bitrate_mbps * 1e6 / 8 * duration)
+    packet = ts.SYNC_BYTE + bytes(ts.PACKET_SIZE - 1)
+    feed_data = packet * (feed_size // ts.PACKET_SIZE)
+    feed_count = max(total_size // len(feed_data), 1)
+
+    async def feed(reader: asyncio.StreamReader) -> None:
+        for _ in range(feed_count):
+            reader.feed_data(feed_data)
+            await asyncio.sleep(0)
+        reader.feed_eof()
+
+    async def run_readexactly() -> int:
+        reader = asyncio.StreamReader(limit=2 ** 32)
+        feeder = asyncio.create_task(feed(reader))
+        writer_lock = asyncio.Lock()
+        chunk_buffer = bytearray()
+        flushed = 0
+        while True:
+            try:
+                chunk = await reader.readexactly(ts.PACKET_SIZE)
+            except asyncio.IncompleteReadError:
+                break
+            async with writer_lock:
+                chunk_buffer += chunk
+                if len(chunk_buffer) >= 65536:
+                    flushed += len(bytes(chunk_buffer))
+                    chunk_buffer = bytearray()
+        await feeder
+        return flushed + len(chunk_buffer)
+
+    async def run_ts_packet_reader() -> int:
+        reader = asyncio.StreamReader(limit=2 ** 32)
+        feeder = asyncio.create_task(feed(reader))
+        ts_packet_reader = TSPacketReader(reader)
+        writer_lock = asyncio.Lock()
+        chunk_buffer = bytearray()
+        flushed = 0
+        while True:
+            packets = await ts_packet_reader.read()
+            if len(packets) == 0:
+                break
+            async with writer_lock:
+                chunk_buffer += packets
+                if len(chunk_buffer) >= 65536:
+                    flushed += len(bytes(chunk_buffer))
+                    chunk_buffer = bytearray()
+        await feeder
+        return flushed + len(chunk_buffer)
+
+    print(f'Simulating {bitrate_mbps} Mbps x {duration} seconds ({feed_count * len(feed_data) / 1e6:.1f} MB)')
+    for name, func in [('readexactly(188)', run_readexactly), ('TSPacketReader', run_ts_packet_reader)]:
+        start_cpu_time = time.process_time()
+        start_time = time.perf_counter()
+        written = asyncio.run(func())
+        cpu_time = time.process_time() - start_cpu_time
+        elapsed_time = time.perf_counter() - start_time
+        print(f'{name:>18}: cpu {cpu_time:.3f}s / wall {elapsed_time:.3f}s / '
+              f'{cpu_time / duration * 100:.2f}% of one core per stream ({written / 1e6:.1f} MB)')
+
+
+if __name__ == '__main__':
+    app()